@@ -0,0 +1,115 @@
+"""
+Micro-benchmark of the process-wide Vega and filter library caches
+
+Times the first (cold) and repeated (cached) reads of the Vega fluxes,
+the filter curves interpolated on a wavelength grid and the photometric
+operator, using synthetic reference files.
+
+    python -m beast.benchmarks.reference_cache --nfilters 8 --nlamb 20000
+"""
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from beast.observationmodel import phot, vega
+from beast.benchmarks.synthetic import make_filter_library, make_vega_file
+
+__all__ = ["benchmark_reference_cache"]
+
+
+def _clear_caches():
+    """ Empty the process-wide reference caches """
+    phot._filter_curves.clear()
+    phot._interp_filters.clear()
+    phot._photometric_operators.clear()
+    vega._vega_tables.clear()
+
+
+def _time_call(func, repeat):
+    """ Time of the first call and mean time of the repeated calls """
+    t0 = time.perf_counter()
+    func()
+    first = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(repeat):
+        func()
+    return first, (time.perf_counter() - t0) / repeat
+
+
+def benchmark_reference_cache(nfilters=6, nlamb=10000, repeat=20, workdir=None):
+    """
+    Time cold and cached reads of the reference files
+
+    Parameters
+    ----------
+    nfilters : int, optional
+        number of filters
+
+    nlamb : int, optional
+        number of wavelengths of the spectra
+
+    repeat : int, optional
+        number of repeated (cached) calls
+
+    workdir : str, optional
+        directory for the synthetic files, default is a temporary directory
+
+    Returns
+    -------
+    dict
+        for each operation, the time [s] of the first call ("first"), the
+        mean time of the repeated calls ("repeat") and their ratio
+        ("speedup")
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if workdir is None:
+            workdir = tmpdir
+        filter_names = [f"SYNTH_F{k:02d}" for k in range(nfilters)]
+        filterLib = os.path.join(workdir, "filters.hd5")
+        vega_fname = os.path.join(workdir, "vega.hd5")
+        make_filter_library(filterLib, filter_names)
+        make_vega_file(vega_fname, filter_names)
+        lamb = np.logspace(3.0, np.log10(3e4), nlamb)
+
+        _clear_caches()
+        operations = {
+            "vega_flux": lambda: vega.Vega(source=vega_fname).getFlux(filter_names),
+            "load_filters": lambda: phot.load_filters(
+                filter_names, lamb=lamb, filterLib=filterLib
+            ),
+            "photometric_operator": lambda: phot.get_photometric_operator(
+                filter_names, lamb, filterLib=filterLib
+            ),
+        }
+        results = {}
+        for name, func in operations.items():
+            first, rep = _time_call(func, repeat)
+            results[name] = {"first": first, "repeat": rep, "speedup": first / rep}
+        _clear_caches()
+
+    return results
+
+
+if __name__ == "__main__":  # pragma: no cover
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nfilters", type=int, default=6, help="number of filters")
+    parser.add_argument(
+        "--nlamb", type=int, default=10000, help="number of wavelengths"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="number of repeated calls"
+    )
+    args = parser.parse_args()
+
+    results = benchmark_reference_cache(
+        nfilters=args.nfilters, nlamb=args.nlamb, repeat=args.repeat
+    )
+    print(f"{'operation':25s} {'first [ms]':>12s} {'repeat [ms]':>12s} {'speedup':>9s}")
+    for name, res in results.items():
+        print(
+            f"{name:25s} {1e3 * res['first']:12.3f} {1e3 * res['repeat']:12.3f}"
+            f" {res['speedup']:9.1f}"
+        )
@@ -0,0 +1,415 @@
+"""
+Benchmarks of the core BEAST hot paths on synthetic inputs
+
+Each stage is timed on deterministic synthetic grids, noise models, AST
+tables and catalogs generated locally (no network, no data downloads)
+for several grid sizes.  Only the hot call is timed, not the generation
+of the inputs.
+
+The throughput is given in models x stars per second:
+
+- likelihood, likelihood_packed, pdf1d, pdf2d, trim_models: models in
+  the grid times observed stars
+- make_extinguished_grid: models generated (1 star)
+- fit_bins: artificial stars (1 star)
+- merge_pdf1d_stats: subgrids times stars merged (scale / 100 stars)
+
+and bytes_per_model is the size of the inputs (or outputs for
+make_extinguished_grid) of the stage per model.
+
+    python -m beast.benchmarks.suite --scales 1e4 1e5 1e6 --nstars 100
+"""
+import os
+import time
+import argparse
+import tempfile
+from collections import OrderedDict
+from contextlib import redirect_stdout
+
+import numpy as np
+from astropy.table import Table
+
+from beast.physicsmodel import creategrid
+from beast.physicsmodel.dust import extinction
+from beast.fitting.fit import save_pdf1d, save_stats
+from beast.fitting.fit_metrics.likelihood import (
+    N_covar_logLikelihood,
+    N_covar_chi2_packed,
+    pack_icov,
+)
+from beast.fitting.pdf1d import pdf1d
+from beast.fitting.pdf2d import pdf2d
+from beast.fitting.trim_grid import trim_models
+from beast.observationmodel.observations import Observations
+from beast.observationmodel.noisemodel.toothpick import MultiFilterASTs
+from beast.observationmodel.vega import Vega
+from beast.tools.subgridding_tools import merge_pdf1d_stats
+from beast.benchmarks.synthetic import (
+    make_filter_library,
+    make_vega_file,
+    make_spectral_grid,
+    make_sed_grid,
+    make_noise_model,
+    make_catalog,
+    make_ast_table,
+)
+
+__all__ = ["run_benchmarks", "benchmarks"]
+
+
+def _nbytes(*arrays):
+    """ Total size of arrays or tables """
+    return sum(np.asarray(arr).nbytes for arr in arrays)
+
+
+def bench_likelihood(env, n_models, n_stars):
+    """ Full covariance likelihood of each star against all the models """
+    sedgrid, noisemodel = env.grid(n_models)
+    fluxmod_wbias = np.asfortranarray(sedgrid.seds + noisemodel["bias"])
+    two_icov_offdiag = 2.0 * noisemodel["icov_offdiag"]
+    obs = sedgrid.seds[env.rng.integers(0, n_models, n_stars)]
+
+    t0 = time.perf_counter()
+    for sed in obs:
+        N_covar_logLikelihood(
+            sed,
+            fluxmod_wbias,
+            noisemodel["q_norm"],
+            noisemodel["icov_diag"],
+            two_icov_offdiag,
+            lnp_threshold=40.0,
+        )
+    dtime = time.perf_counter() - t0
+
+    nbytes = _nbytes(
+        fluxmod_wbias,
+        noisemodel["q_norm"],
+        noisemodel["icov_diag"],
+        two_icov_offdiag,
+    )
+    return dtime, n_models, n_stars, nbytes
+
+
+def bench_likelihood_packed(env, n_models, n_stars):
+    """ Covariance chi2 of all the stars at once with the packed icov """
+    sedgrid, noisemodel = env.grid(n_models)
+    fluxmod_wbias = np.asfortranarray(sedgrid.seds + noisemodel["bias"])
+    icov_packed = pack_icov(noisemodel["icov_diag"], 2.0 * noisemodel["icov_offdiag"])
+    obs = sedgrid.seds[env.rng.integers(0, n_models, n_stars)]
+
+    t0 = time.perf_counter()
+    N_covar_chi2_packed(obs, fluxmod_wbias, icov_packed)
+    dtime = time.perf_counter() - t0
+
+    nbytes = _nbytes(fluxmod_wbias, icov_packed)
+    return dtime, n_models, n_stars, nbytes
+
+
+def _star_weights(env, n_models, n_stars):
+    """ Random sparse likelihoods (10% of the models) of stars """
+    nsel = max(n_models // 10, 1)
+    for k in range(n_stars):
+        gindxs = env.rng.choice(n_models, nsel, replace=False)
+        weights = env.rng.random(nsel)
+        yield gindxs, weights / weights.sum()
+
+
+def bench_pdf1d(env, n_models, n_stars):
+    """ 1D PDFs of the stars on 50 bins """
+    sedgrid, _ = env.grid(n_models)
+    gridvals = np.array(sedgrid["M_ini"])
+    pdf = pdf1d(gridvals, 50, logspacing=True)
+    stars = list(_star_weights(env, n_models, n_stars))
+
+    t0 = time.perf_counter()
+    for gindxs, weights in stars:
+        pdf.gen1d(gindxs, weights)
+    dtime = time.perf_counter() - t0
+
+    return dtime, n_models, n_stars, _nbytes(gridvals)
+
+
+def bench_pdf2d(env, n_models, n_stars):
+    """ 2D PDFs of the stars on (number of ages) x 50 bins """
+    sedgrid, _ = env.grid(n_models)
+    gridvals_p1 = np.array(sedgrid["logA"])
+    gridvals_p2 = np.array(sedgrid["M_ini"])
+    nbins_p1 = min(len(np.unique(gridvals_p1)), 50)
+    pdf = pdf2d(gridvals_p1, gridvals_p2, nbins_p1, 50, logspacing_p2=True)
+    stars = list(_star_weights(env, n_models, n_stars))
+
+    t0 = time.perf_counter()
+    for gindxs, weights in stars:
+        pdf.gen2d(gindxs, weights)
+    dtime = time.perf_counter() - t0
+
+    return dtime, n_models, n_stars, _nbytes(gridvals_p1, gridvals_p2)
+
+
+def bench_make_extinguished_grid(env, n_models, n_stars):
+    """ Extinguished SED grid from a spectral grid (8 dust points) """
+    avs = np.array([0.0, 1.0])
+    rvs = np.array([2.5, 3.1, 4.0])
+    fAs = np.array([0.5, 1.0])
+    n_dust = len(creategrid.valid_dust_points(avs, rvs, fAs))
+    specgrid = make_spectral_grid(max(n_models // n_dust, 1), ranseed=env.ranseed)
+    extLaw = extinction.Gordon16_RvFALaw()
+
+    t0 = time.perf_counter()
+    with redirect_stdout(None):
+        for g in creategrid.make_extinguished_grid(
+            specgrid,
+            env.filters,
+            extLaw,
+            avs,
+            rvs,
+            fAs,
+            filterLib=env.filterLib,
+        ):
+            pass
+    dtime = time.perf_counter() - t0
+
+    nout = len(g.seds)
+    nbytes = _nbytes(g.seds) + sum(_nbytes(g.grid[cname]) for cname in g.grid.colnames)
+    return dtime, nout, 1, nbytes
+
+
+def bench_trim_models(env, n_models, n_stars):
+    """ Trimming of the models that cannot fit the catalog """
+    sedgrid, noisemodel = env.grid(n_models)
+    cat = make_catalog(n_stars, sedgrid, noisemodel, env.vega_flux, ranseed=env.ranseed)
+    obsdata = Observations(
+        cat,
+        env.filters,
+        obs_colnames=[cname.split("_")[-1] + "_RATE" for cname in env.filters],
+        vega_fname=env.vega_fname,
+    )
+
+    t0 = time.perf_counter()
+    with redirect_stdout(None):
+        trim_models(
+            sedgrid,
+            noisemodel,
+            obsdata,
+            os.path.join(env.workdir, "trim_seds.grid.hd5"),
+            os.path.join(env.workdir, "trim_noisemodel.grid.hd5"),
+            n_detected=len(env.filters),
+        )
+    dtime = time.perf_counter() - t0
+
+    nbytes = _nbytes(
+        sedgrid.seds,
+        noisemodel["bias"],
+        noisemodel["error"],
+        noisemodel["completeness"],
+    )
+    return dtime, n_models, n_stars, nbytes
+
+
+def bench_fit_bins(env, n_models, n_stars):
+    """ Toothpick noise model binning of the ASTs """
+    astfile = os.path.join(env.workdir, "asts.fits")
+    make_ast_table(astfile, n_models, env.filters, ranseed=env.ranseed)
+    model = MultiFilterASTs(astfile, env.filters, vega_fname=env.vega_fname)
+    model.set_data_mappings(in_pair=("in", "in"), out_pair=("out", "rate"))
+
+    t0 = time.perf_counter()
+    model.fit_bins(nbins=50, progress=False)
+    dtime = time.perf_counter() - t0
+
+    nbytes = sum(_nbytes(model.data[cname]) for cname in model.data.colnames)
+    return dtime, n_models, 1, nbytes
+
+
+def bench_merge_pdf1d_stats(env, n_models, n_stars):
+    """ Merge of the 1D PDFs and stats of 4 subgrids """
+    nsubs = 4
+    nobs = max(n_models // 100, 2)
+    qnames = ["Av", "M_ini", "logA", "Z", "distance"]
+    nbins = 50
+    pers = [16.0, 50.0, 84.0]
+    pdf1d_fnames, stats_fnames = [], []
+    for i in range(nsubs):
+        pdf1d_vals = []
+        for qname in qnames:
+            vals = env.rng.random((nobs + 1, nbins))
+            vals[-1] = np.linspace(0.0, 1.0, nbins)
+            pdf1d_vals.append(vals)
+        pdf1d_fnames.append(os.path.join(env.workdir, f"sub{i}_pdf1d.fits"))
+        save_pdf1d(pdf1d_fnames[-1], pdf1d_vals, qnames)
+
+        nq = len(qnames)
+        stats_fnames.append(os.path.join(env.workdir, f"sub{i}_stats.fits"))
+        save_stats(
+            stats_fnames[-1],
+            {"Name": np.array([f"star{k}" for k in range(nobs)])},
+            env.rng.random((nobs, nq)),
+            env.rng.random((nobs, nq)),
+            np.sort(env.rng.random((nobs, nq, len(pers))), axis=2),
+            env.rng.random(nobs),
+            env.rng.integers(0, 100, nobs),
+            -env.rng.random(nobs),
+            env.rng.integers(0, 100, nobs),
+            env.rng.integers(0, 100, nobs),
+            -env.rng.random(nobs),
+            qnames,
+            pers,
+            env.filters,
+            np.logspace(3.2, 4.3, len(env.filters)),
+        )
+
+    t0 = time.perf_counter()
+    with redirect_stdout(None):
+        merge_pdf1d_stats(
+            pdf1d_fnames,
+            stats_fnames,
+            re_run=True,
+            output_fname_base=os.path.join(env.workdir, "merged"),
+        )
+    dtime = time.perf_counter() - t0
+
+    nbytes = nsubs * len(qnames) * (nobs + 1) * nbins * 8
+    return dtime, nsubs, nobs, nbytes
+
+
+benchmarks = OrderedDict(
+    [
+        ("likelihood", bench_likelihood),
+        ("likelihood_packed", bench_likelihood_packed),
+        ("pdf1d", bench_pdf1d),
+        ("pdf2d", bench_pdf2d),
+        ("make_extinguished_grid", bench_make_extinguished_grid),
+        ("trim_models", bench_trim_models),
+        ("fit_bins", bench_fit_bins),
+        ("merge_pdf1d_stats", bench_merge_pdf1d_stats),
+    ]
+)
+
+
+class _Environment(object):
+    """ Synthetic reference files and grids shared by the benchmarks """
+
+    def __init__(self, workdir, n_filters, ranseed):
+        self.workdir = workdir
+        self.ranseed = ranseed
+        self.rng = np.random.default_rng(ranseed)
+        self.filters = [f"SYNTH_F{k:02d}" for k in range(n_filters)]
+        self.filterLib = os.path.join(workdir, "filters.hd5")
+        self.vega_fname = os.path.join(workdir, "vega.hd5")
+        make_filter_library(self.filterLib, self.filters)
+        make_vega_file(self.vega_fname, self.filters)
+        _, self.vega_flux, _ = Vega(source=self.vega_fname).getFlux(self.filters)
+        self._grid = None
+
+    def grid(self, n_models):
+        """ SED grid and noise model, kept for the current scale """
+        if self._grid is None or len(self._grid[0].seds) != n_models:
+            self._grid = None
+            sedgrid = make_sed_grid(n_models, self.filters, ranseed=self.ranseed)
+            noisemodel = make_noise_model(sedgrid, ranseed=self.ranseed)
+            self._grid = (sedgrid, noisemodel)
+        return self._grid
+
+
+def run_benchmarks(
+    scales=(1e4, 1e5), n_stars=100, n_filters=6, stages=None, workdir=None, ranseed=0
+):
+    """
+    Time the benchmark stages at several scales
+
+    Parameters
+    ----------
+    scales : list of floats, optional
+        numbers of models of the synthetic grids
+
+    n_stars : int, optional
+        number of observed stars
+
+    n_filters : int, optional
+        number of filters
+
+    stages : list of str, optional
+        stages to run (keys of `benchmarks`), default is all
+
+    workdir : str, optional
+        directory for the synthetic files, default is a temporary directory
+
+    ranseed : int, optional
+        seed of the random number generator
+
+    Returns
+    -------
+    astropy Table
+        stage, n_models, n_stars, time [s], throughput [models x stars / s]
+        and bytes_per_model for each stage and scale
+    """
+    if stages is None:
+        stages = list(benchmarks)
+    for stage in stages:
+        if stage not in benchmarks:
+            raise ValueError(f"unknown benchmark stage {stage}")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = _Environment(workdir or tmpdir, n_filters, ranseed)
+        for scale in scales:
+            n_models = int(scale)
+            for stage in stages:
+                dtime, nmod, nstar, nbytes = benchmarks[stage](env, n_models, n_stars)
+                rows.append(
+                    (
+                        stage,
+                        nmod,
+                        nstar,
+                        dtime,
+                        nmod * nstar / dtime,
+                        nbytes / nmod,
+                    )
+                )
+
+    return Table(
+        rows=rows,
+        names=[
+            "stage",
+            "n_models",
+            "n_stars",
+            "time",
+            "throughput",
+            "bytes_per_model",
+        ],
+    )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--scales",
+        type=float,
+        nargs="+",
+        default=[1e4, 1e5, 1e6],
+        help="numbers of models of the synthetic grids",
+    )
+    parser.add_argument("--nstars", type=int, default=100, help="number of stars")
+    parser.add_argument("--nfilters", type=int, default=6, help="number of filters")
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        default=None,
+        choices=list(benchmarks),
+        help="stages to run (default all)",
+    )
+    parser.add_argument("--output", default=None, help="file to save the results")
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        scales=args.scales,
+        n_stars=args.nstars,
+        n_filters=args.nfilters,
+        stages=args.stages,
+    )
+    results["time"].format = "{:.4f}"
+    results["throughput"].format = "{:.4g}"
+    results["bytes_per_model"].format = "{:.1f}"
+    results.pprint_all()
+    if args.output is not None:
+        results.write(args.output, overwrite=True)
@@ -0,0 +1,297 @@
+"""
+Synthetic reference files for the benchmarks
+
+Everything is generated locally and deterministically (no downloads).
+"""
+import numpy as np
+import tables
+from astropy.table import Table
+
+from beast.physicsmodel.grid import SpectralGrid, SEDGrid
+
+__all__ = [
+    "make_filter_library",
+    "make_vega_file",
+    "make_spectral_grid",
+    "make_sed_grid",
+    "make_noise_model",
+    "make_catalog",
+    "make_ast_table",
+]
+
+
+def make_filter_library(fname, filter_names, lamb_range=(1000.0, 30000.0), npts=500):
+    """
+    Write a filter library with gaussian filters in the beast format
+
+    Parameters
+    ----------
+    fname : str
+        name of the hd5 file to create
+
+    filter_names : list of str
+        names of the filters, evenly spaced in log wavelength
+
+    lamb_range : 2 floats, optional
+        wavelength range [Angstrom] covered by the filters
+
+    npts : int, optional
+        number of wavelengths of each filter curve
+    """
+    cwaves = np.logspace(
+        np.log10(lamb_range[0]) + 0.1,
+        np.log10(lamb_range[1]) - 0.1,
+        len(filter_names),
+    )
+    with tables.open_file(fname, "w") as ffile:
+        group = ffile.create_group("/", "filters")
+        content = ffile.create_table(
+            "/", "content", {"TABLENAME": tables.StringCol(40, pos=0)}
+        )
+        for cname, cwave in zip(filter_names, cwaves):
+            flamb = np.linspace(0.8 * cwave, 1.2 * cwave, npts)
+            transmit = np.exp(-0.5 * ((flamb - cwave) / (0.05 * cwave)) ** 2)
+            desc = {
+                "WAVELENGTH": tables.Float64Col(pos=0),
+                "THROUGHPUT": tables.Float64Col(pos=1),
+            }
+            ftab = ffile.create_table(group, cname, desc)
+            ftab.append(list(zip(flamb, transmit)))
+            content.append([(cname.encode(),)])
+
+
+def make_vega_file(fname, filter_names):
+    """
+    Write a vega reference file with fluxes and magnitudes for filters
+
+    Parameters
+    ----------
+    fname : str
+        name of the hd5 file to create
+
+    filter_names : list of str
+        names of the filters
+    """
+    desc = {
+        "FNAME": tables.StringCol(40, pos=0),
+        "LUM": tables.Float64Col(pos=1),
+        "MAG": tables.Float64Col(pos=2),
+        "CWAVE": tables.Float64Col(pos=3),
+    }
+    with tables.open_file(fname, "w") as vfile:
+        vtable = vfile.create_table("/", "sed", desc)
+        for k, cname in enumerate(filter_names):
+            lum = 10 ** (-9.0 - 0.2 * k)
+            vtable.append([(cname.encode(), lum, 0.03, 1e3 * (k + 1))])
+
+
+def _grid_table(n_models, rng):
+    """ Physical parameters and weights of synthetic models """
+    gtable = Table(
+        {
+            "logA": rng.integers(0, 40, n_models) * 0.1 + 6.0,
+            "M_ini": 10 ** rng.uniform(-0.5, 1.5, n_models),
+            "Z": rng.choice([0.004, 0.008, 0.0152], n_models),
+            "distance": np.full(n_models, 7.76e5),
+        }
+    )
+    for ckey in ["weight", "grid_weight", "prior_weight"]:
+        gtable[ckey] = rng.uniform(0.1, 1.0, n_models)
+    return gtable
+
+
+def make_spectral_grid(n_models, nlamb=200, lamb_range=(1000.0, 30000.0), ranseed=0):
+    """
+    Spectral grid of black bodies with random temperatures and luminosities
+
+    Parameters
+    ----------
+    n_models : int
+        number of spectra
+
+    nlamb : int, optional
+        number of wavelengths
+
+    lamb_range : 2 floats, optional
+        wavelength range [Angstrom]
+
+    ranseed : int, optional
+        seed of the random number generator
+
+    Returns
+    -------
+    SpectralGrid
+        grid with the memory backend
+    """
+    rng = np.random.default_rng(ranseed)
+    lamb = np.logspace(np.log10(lamb_range[0]), np.log10(lamb_range[1]), nlamb)
+    teff = 10 ** rng.uniform(3.5, 4.5, n_models)
+    scale = 10 ** rng.uniform(-30.0, -25.0, n_models)
+    x = 1.4388e8 / (lamb[None, :] * teff[:, None])
+    seds = scale[:, None] / lamb[None, :] ** 5 / np.expm1(np.minimum(x, 700.0))
+    gtable = _grid_table(n_models, rng)
+    gtable["logT"] = np.log10(teff)
+    return SpectralGrid(lamb, seds=seds, grid=gtable, backend="memory")
+
+
+def make_sed_grid(n_models, filter_names, ranseed=0):
+    """
+    SED grid with correlated fluxes in the filters
+
+    Parameters
+    ----------
+    n_models : int
+        number of models
+
+    filter_names : list of str
+        names of the filters
+
+    ranseed : int, optional
+        seed of the random number generator
+
+    Returns
+    -------
+    SEDGrid
+        grid with the memory backend, including dust parameters and the
+        index to the spectral grid
+    """
+    rng = np.random.default_rng(ranseed)
+    n_filters = len(filter_names)
+    lamb = np.logspace(3.2, 4.3, n_filters)
+    base = rng.uniform(-20.0, -15.0, n_models)
+    color = rng.normal(0.0, 0.3, n_models)
+    logflux = base[:, None] + color[:, None] * np.linspace(-1.0, 1.0, n_filters)
+    seds = 10 ** logflux
+    gtable = _grid_table(n_models, rng)
+    gtable["Av"] = rng.integers(0, 20, n_models) * 0.5
+    gtable["Rv"] = rng.choice([2.5, 3.1, 4.0, 5.0], n_models)
+    gtable["f_A"] = rng.choice([0.0, 0.5, 1.0], n_models)
+    gtable["specgrid_indx"] = np.arange(n_models)
+    sedgrid = SEDGrid(lamb, seds=seds, grid=gtable, backend="memory")
+    sedgrid.header["filters"] = " ".join(filter_names)
+    return sedgrid
+
+
+def make_noise_model(sedgrid, full_cov=True, ranseed=0):
+    """
+    Noise model (bias, error, completeness and optionally the inverse
+    covariance matrices) of a SED grid
+
+    Parameters
+    ----------
+    sedgrid : SEDGrid
+        model grid
+
+    full_cov : bool, optional
+        set to include the q_norm, icov_diag and icov_offdiag terms
+
+    ranseed : int, optional
+        seed of the random number generator
+
+    Returns
+    -------
+    dict
+        noise model arrays, as returned by `get_noisemodelcat`
+    """
+    rng = np.random.default_rng(ranseed)
+    seds = sedgrid.seds
+    n_models, n_filters = seds.shape
+    error = seds * rng.uniform(0.02, 0.3, seds.shape) + 1e-21
+    noisemodel = {
+        "bias": seds * rng.normal(0.0, 0.05, seds.shape),
+        "error": error,
+        "completeness": rng.uniform(0.05, 1.0, seds.shape),
+    }
+    if full_cov:
+        # diagonal covariance with small correlations
+        icov_diag = 1.0 / error ** 2
+        n_offdiag = n_filters * (n_filters - 1) // 2
+        k1, k2 = np.triu_indices(n_filters, k=1)
+        rho = rng.uniform(-0.05, 0.05, (n_models, n_offdiag))
+        noisemodel["q_norm"] = -0.5 * np.sum(np.log(2.0 * np.pi * error ** 2), axis=1)
+        noisemodel["icov_diag"] = icov_diag
+        noisemodel["icov_offdiag"] = (
+            -rho * np.sqrt(icov_diag[:, k1] * icov_diag[:, k2])
+        )
+    return noisemodel
+
+
+def make_catalog(n_stars, sedgrid, noisemodel, vega_flux, ranseed=0):
+    """
+    Catalog of observations simulated from a SED grid and noise model
+
+    Parameters
+    ----------
+    n_stars : int
+        number of stars
+
+    sedgrid : SEDGrid
+        model grid
+
+    noisemodel : dict
+        noise model of the grid
+
+    vega_flux : ndarray
+        vega fluxes of the filters, the catalog fluxes are vega normalized
+
+    ranseed : int, optional
+        seed of the random number generator
+
+    Returns
+    -------
+    astropy Table
+        catalog with RA, DEC and a <band>_RATE column for each filter
+    """
+    rng = np.random.default_rng(ranseed)
+    indx = rng.integers(0, len(sedgrid.seds), n_stars)
+    cat = Table()
+    cat["RA"] = rng.uniform(10.0, 10.1, n_stars)
+    cat["DEC"] = rng.uniform(40.0, 40.1, n_stars)
+    for k, cname in enumerate(sedgrid.filters):
+        flux = (
+            sedgrid.seds[indx, k]
+            + noisemodel["bias"][indx, k]
+            + rng.normal(0.0, noisemodel["error"][indx, k])
+        )
+        cat[cname.split("_")[-1] + "_RATE"] = flux / vega_flux[k]
+    return cat
+
+
+def make_ast_table(fname, n_asts, filter_names, mag_range=(18.0, 30.0), ranseed=0):
+    """
+    Write a table of artificial star tests in the PHAT-like format
+
+    Parameters
+    ----------
+    fname : str
+        name of the FITS file to create
+
+    n_asts : int
+        number of artificial stars
+
+    filter_names : list of str
+        names of the filters
+
+    mag_range : 2 floats, optional
+        range of the input vega magnitudes
+
+    ranseed : int, optional
+        seed of the random number generator
+    """
+    rng = np.random.default_rng(ranseed)
+    ast = Table()
+    recovered = np.ones(n_asts, dtype=bool)
+    for cname in filter_names:
+        band = cname.split("_")[-1].lower()
+        mag_in = rng.uniform(mag_range[0], mag_range[1], n_asts)
+        flux_in = 10 ** (-0.4 * mag_in)
+        flux_out = flux_in * (1.0 + rng.normal(0.0, 0.05, n_asts))
+        flux_out += rng.normal(0.0, 10 ** (-0.4 * (mag_range[1] - 1.0)), n_asts)
+        # fainter stars are less often recovered
+        recovered &= rng.random(n_asts) > (mag_in - mag_range[0]) / (
+            mag_range[1] - mag_range[0]
+        )
+        ast[band + "_in"] = mag_in
+        ast[band + "_rate"] = flux_out
+    ast["CUT_FLAG"] = (~recovered).astype(int)
+    ast.write(fname, overwrite=True)
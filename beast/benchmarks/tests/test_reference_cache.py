@@ -0,0 +1,8 @@
+from beast.benchmarks.reference_cache import benchmark_reference_cache
+
+
+def test_reference_cache():
+    results = benchmark_reference_cache(nfilters=2, nlamb=500, repeat=2)
+    assert set(results) == {"vega_flux", "load_filters", "photometric_operator"}
+    for res in results.values():
+        assert res["first"] > 0 and res["repeat"] > 0
@@ -0,0 +1,18 @@
+import numpy as np
+
+from beast.benchmarks.suite import run_benchmarks, benchmarks
+
+
+def test_run_benchmarks(tmp_path):
+    results = run_benchmarks(
+        scales=[1000, 2000], n_stars=3, n_filters=4, workdir=str(tmp_path)
+    )
+    assert len(results) == 2 * len(benchmarks)
+    assert list(results["stage"][: len(benchmarks)]) == list(benchmarks)
+    assert np.all(results["time"] > 0)
+    assert np.all(results["throughput"] > 0)
+    assert np.all(results["bytes_per_model"] > 0)
+
+    likelihood = results[results["stage"] == "likelihood"]
+    assert list(likelihood["n_models"]) == [1000, 2000]
+    assert list(likelihood["n_stars"]) == [3, 3]
@@ -17,14 +17,20 @@ from astropy.table import Table
 from tqdm import tqdm
 
 from beast.physicsmodel import grid
+from beast.physicsmodel.grid_and_prior_weights import compute_distance_weights
 from beast.tools.symlog import symlog
 from beast.fitting.fit_metrics.likelihood import (
     N_covar_logLikelihood,
     N_logLikelihood_NM,
+    N_covar_logLikelihood_scaled,
+    N_logLikelihood_NM_scaled,
 )
 from beast.fitting.fit_metrics import expectation, percentile
 from beast.fitting.pdf1d import pdf1d
-from beast.fitting.pdf2d import pdf2d
+from beast.fitting.pdf2d import pdf2d, SparsePDF2D
+from beast.fitting.profiling import StageProfiler, profile_fname
+from beast.fitting.output_writer import BackgroundWriter
+from beast.fitting.grid_index import GridIndex
 
 __all__ = [
     "summary_table_memory",
@@ -162,8 +168,10 @@ def save_pdf2d(pdf2d_outname, save_pdf2d_vals, qname_pairs):
     ----------
     pdf2d_outname : str
         output filename
-    save_pdf2d_vals : list of np.array
-        list of 3D nparrays giving the 2D PDFs for each pair of parameters
+    save_pdf2d_vals : list of np.array or SparsePDF2D
+        list of 3D nparrays giving the 2D PDFs for each pair of parameters,
+        or `~beast.fitting.pdf2d.SparsePDF2D` objects to save the PDFs in
+        the sparse format
     qname_pairs : list
         list of `str` giving the parameter pairs
 
@@ -173,15 +181,87 @@ def save_pdf2d(pdf2d_outname, save_pdf2d_vals, qname_pairs):
     """
 
     # write a small primary header
-    fits.writeto(pdf2d_outname, np.zeros((2, 2)), overwrite=True)
+    hdul = fits.HDUList([fits.PrimaryHDU(np.zeros((2, 2)))])
 
     # write the 2D PDFs for all the objects, 1 set per extension
+    #   sparse PDFs use 2 extensions (entries and bin values)
     for k, qname_pair in enumerate(qname_pairs):
-        hdu = fits.PrimaryHDU(save_pdf2d_vals[k])
-        pheader = hdu.header
-        pheader.set("XTENSION", "IMAGE")
-        pheader.set("EXTNAME", qname_pair)
-        fits.append(pdf2d_outname, save_pdf2d_vals[k], header=pheader)
+        if isinstance(save_pdf2d_vals[k], SparsePDF2D):
+            hdul.extend(save_pdf2d_vals[k].to_hdus(qname_pair))
+        else:
+            hdu = fits.ImageHDU(save_pdf2d_vals[k])
+            hdu.header.set("EXTNAME", qname_pair)
+            hdul.append(hdu)
+    hdul.writeto(pdf2d_outname, overwrite=True)
+
+
+def _resume_pdf2d(hdulist, qname_pair, new_vals, start_pos, threshold):
+    """
+    2D PDFs of a partially complete run, in the format of the new run
+
+    Parameters
+    ----------
+    hdulist : `~astropy.io.fits.HDUList`
+        2D PDF file of the partially complete run (dense or sparse format)
+    qname_pair : str
+        parameter pair (e.g., "Av+M_ini")
+    new_vals : np.array or SparsePDF2D
+        empty 2D PDFs of the new run, giving the format and the bins
+    start_pos : int
+        index of the first star that still needs to be fit
+    threshold : float
+        pdf2d_threshold of the new run for the sparse format
+
+    Returns
+    -------
+    np.array or SparsePDF2D
+        PDFs of the stars before start_pos in the format of new_vals
+    """
+    fname = hdulist.filename()
+    if qname_pair not in hdulist:
+        raise KeyError(f"{qname_pair} 2D PDFs not in {fname}, cannot resume")
+    hdu = hdulist[qname_pair]
+    if hdu.header.get("PDF2DFMT", "DENSE") == "SPARSE":
+        old_vals = SparsePDF2D.from_hdus(hdu, hdulist[qname_pair + "_BINS"])
+        old_vals.remove_stars(start_pos)
+        old_shape = old_vals.shape
+    else:
+        old_vals = np.array(hdu.data)
+        old_shape = (old_vals.shape[0] - 2,) + old_vals.shape[1:]
+
+    if isinstance(new_vals, SparsePDF2D):
+        new_shape = new_vals.shape
+    else:
+        new_shape = (new_vals.shape[0] - 2,) + new_vals.shape[1:]
+    if old_shape != new_shape:
+        raise ValueError(
+            f"{qname_pair} 2D PDFs in {fname} have the shape {old_shape} "
+            f"(stars, bins, bins), expected {new_shape}"
+        )
+
+    if isinstance(old_vals, SparsePDF2D):
+        if isinstance(new_vals, SparsePDF2D):
+            if old_vals.threshold != threshold:
+                raise ValueError(
+                    f"{fname} was saved with pdf2d_threshold="
+                    f"{old_vals.threshold}, resume with the same threshold"
+                )
+            return old_vals
+        print(f"converting the sparse {qname_pair} 2D PDFs to the dense format")
+        new_vals[:start_pos] = old_vals.todense(np.arange(start_pos))
+        return new_vals
+
+    if isinstance(new_vals, SparsePDF2D):
+        print(f"converting the dense {qname_pair} 2D PDFs to the sparse format")
+        spdf = SparsePDF2D.from_dense(
+            old_vals[:-2],
+            new_vals.bin_vals_p1,
+            new_vals.bin_vals_p2,
+            threshold=threshold,
+        )
+        spdf.remove_stars(start_pos)
+        return spdf
+    return old_vals
 
 
 def save_lnp(lnp_outname, save_lnp_vals):
@@ -277,7 +357,7 @@ def setup_param_bins(qname, max_nbins, g0, full_model_flux, filters, grid_info_d
         n_uniq = grid_info_dict[qname]["num_unique"]
         uniqvals = grid_info_dict[qname]["unique_vals"]
     else:
-        uniqvals = np.unique(qname_vals)
+        uniqvals = _unique_values(qname_vals)
         n_uniq = len(uniqvals)
 
     if n_uniq > max_nbins:
@@ -309,6 +389,223 @@ def setup_param_bins(qname, max_nbins, g0, full_model_flux, filters, grid_info_d
     return qname_vals, nbins, logspacing, minval, maxval, uniqvals
 
 
+class _DistanceColumn(object):
+    """
+    Column of the grid with a set of distances applied, computed from the
+    values at a single distance for the models indexed only
+
+    Parameters
+    ----------
+    func : function
+        values of the models, func(dist_indxs, model_indxs) with the indices
+        of the distances and of the models at a single distance
+    n_distances, n_models : int
+        numbers of distances and of models at a single distance
+    axis : str, optional
+        "models" or "distances" if the values only depend on the models or on
+        the distances, None if they depend on both
+    """
+
+    def __init__(self, func, n_distances, n_models, axis=None):
+        self._func = func
+        self.n_distances = n_distances
+        self.n_models = n_models
+        self.axis = axis
+
+    def __len__(self):
+        return self.n_distances * self.n_models
+
+    def __getitem__(self, indxs):
+        dist_indxs, model_indxs = np.divmod(indxs, self.n_models)
+        return self._func(dist_indxs, model_indxs)
+
+    def __array__(self, dtype=None, copy=None):
+        # all the values, only used to setup the bins of the PDFs that
+        #   depend on both the models and the distances
+        model_indxs = np.arange(self.n_models)
+        vals = np.concatenate(
+            [self._func(k, model_indxs) for k in range(self.n_distances)]
+        )
+        if dtype is not None:
+            vals = vals.astype(dtype, copy=False)
+        return vals
+
+    def axis_values(self):
+        """
+        Values of the models at a single distance or of the distances if the
+        column only depends on them, all the values otherwise
+        """
+        if self.axis == "models":
+            return self._func(0, np.arange(self.n_models))
+        elif self.axis == "distances":
+            return self._func(
+                np.arange(self.n_distances), np.zeros(self.n_distances, dtype=int)
+            )
+        return np.asarray(self)
+
+
+class _DistanceFluxes(object):
+    """
+    Symlog of the model fluxes plus the noise model bias of the grid with a
+    set of distances applied.  Indexed as the (ndistances * nmodels,
+    nfilters) array, full_model_flux[:, i] gives a column of
+    `_DistanceColumn` so that only the fluxes of the models indexed are
+    computed.
+    """
+
+    def __init__(self, dgrid, seds, bias):
+        self.dgrid = dgrid
+        self.seds = seds
+        self.bias = bias
+
+    def _flux_func(self, i):
+        def flux(dist_indxs, model_indxs):
+            if np.ndim(self.bias) == 3:
+                bias = self.bias[dist_indxs, model_indxs, i]
+            else:
+                bias = self.bias[model_indxs, i]
+            return symlog(
+                self.dgrid.scales[dist_indxs] * self.seds[model_indxs, i] + bias
+            )
+
+        return flux
+
+    def __getitem__(self, key):
+        _, i = key
+        return _DistanceColumn(
+            self._flux_func(i), len(self.dgrid.distances), self.dgrid.n_models
+        )
+
+
+class _DistanceGrid(object):
+    """
+    Grid computed at a single distance seen as the grid with a set of
+    distances applied: the columns are repeated for each distance, model i
+    at distance k has index k * nmodels + i as in
+    `~beast.physicsmodel.creategrid.apply_distance_grid`.  The columns
+    are `_DistanceColumn` computing the values of the models indexed only.
+
+    Attributes
+    ----------
+    distances : ndarray
+        distances [pc]
+    scales : ndarray
+        flux scaling factors of the distances
+    weights : ndarray
+        grid times prior weights of the distances
+    """
+
+    def __init__(self, g0, distances, distance_prior_model={"name": "flat"}):
+        self.g0 = g0
+        self.seds = g0.seds
+        self.lamb = g0.lamb
+        self.filters = g0.filters
+        self.n_models = len(g0["weight"])
+
+        if hasattr(distances, "unit"):
+            distances = distances.to(ap_units.pc).value
+        self.distances = np.atleast_1d(np.asarray(distances, dtype=float))
+
+        # the seds default to 10 pc
+        if "distance" in g0.keys():
+            ref_dist = np.unique(g0["distance"])
+            if len(ref_dist) > 1:
+                raise ValueError("the grid already has more than one distance")
+            ref_dist = ref_dist[0]
+        else:
+            ref_dist = 10.0
+        self.scales = (ref_dist / self.distances) ** 2
+
+        # same weights as a grid with the distances, the weights of the
+        #   age-mass-metallicity grid of each distance sum to 1/ndistances
+        n_dist = len(self.distances)
+        if n_dist > 1:
+            grid_weights, prior_weights = compute_distance_weights(
+                self.distances, distance_prior_model=distance_prior_model
+            )
+            self.weights = grid_weights * prior_weights / n_dist
+        else:
+            self.weights = np.ones(1)
+
+        self._cols = {}
+
+    def keys(self):
+        keys = list(self.g0.keys())
+        if "distance" not in keys:
+            keys.append("distance")
+        return keys
+
+    def __getitem__(self, key):
+        if key not in self._cols:
+            if key == "distance":
+                axis = "distances"
+
+                def func(dist_indxs, model_indxs):
+                    return self.distances[
+                        np.broadcast_to(dist_indxs, np.shape(model_indxs))
+                    ]
+
+            else:
+                axis = "models"
+                vals = np.asarray(self.g0[key])
+
+                def func(dist_indxs, model_indxs):
+                    return vals[model_indxs]
+
+            self._cols[key] = _DistanceColumn(
+                func, len(self.distances), self.n_models, axis=axis
+            )
+        return self._cols[key]
+
+
+def _unique_values(vals):
+    """ Unique values of a grid column, without all the distances if possible """
+    if isinstance(vals, _DistanceColumn):
+        return np.unique(vals.axis_values())
+    return np.unique(vals)
+
+
+def _pdf_grid_values(*cols):
+    """
+    Values of the grid columns the PDFs are computed on
+
+    With the distances applied on the fly, columns that only depend on the
+    models (or on the distances) are given for the models at a single
+    distance (or for the distances), the weights are then summed over the
+    other axis (see `_reduce_distance_weights`).
+
+    Returns
+    -------
+    vals : list of ndarray
+        values of each column
+    axis : str
+        axis of the values ("models" or "distances"), None for the grid
+    """
+    axes = set(col.axis if isinstance(col, _DistanceColumn) else None for col in cols)
+    if len(axes) == 1 and None not in axes:
+        return [col.axis_values() for col in cols], axes.pop()
+    return [np.asarray(col) for col in cols], None
+
+
+def _reduce_distance_weights(gindxs, weights, n_models, axis):
+    """
+    Sum of the weights of the grid with the distances applied over the
+    distances (axis="models") or over the models (axis="distances")
+
+    Returns
+    -------
+    indxs, weights : ndarray
+        indices of the models at a single distance (or of the distances) and
+        their summed weights
+    """
+    dist_indxs, model_indxs = np.divmod(gindxs, n_models)
+    if axis == "models":
+        indxs, inverse = np.unique(model_indxs, return_inverse=True)
+    else:
+        indxs, inverse = np.unique(dist_indxs, return_inverse=True)
+    return indxs, np.bincount(inverse, weights=weights)
+
+
 def Q_all_memory(
     prev_result,
     obs,
@@ -322,6 +619,8 @@ def Q_all_memory(
     pdf1d_outname=None,
     pdf2d_outname=None,
     pdf2d_param_list=None,
+    pdf2d_sparse=False,
+    pdf2d_threshold=0.0,
     grid_info_dict=None,
     lnp_outname=None,
     lnp_npts=None,
@@ -330,6 +629,13 @@ def Q_all_memory(
     resume=False,
     use_full_cov_matrix=True,
     do_not_normalize=False,
+    model_weights=None,
+    profiler=None,
+    background_io=False,
+    writer_queue_size=2,
+    distances=None,
+    distance_prior_model={"name": "flat"},
+    grid_search="full",
 ):
     """
     Fit each star, calculate various fit statistics, and output them to files.
@@ -371,6 +677,12 @@ def Q_all_memory(
         set to output the 2D PDFs into a FITS file with extensions
     pdf2d_param_list : list of strs or None
         set to the parameters for which to make the 2D PDFs
+    pdf2d_sparse : bool
+        set to save the 2D PDFs in the sparse format (only the non-zero bins,
+        see `~beast.fitting.pdf2d.SparsePDF2D`)
+    pdf2d_threshold : float
+        for the sparse format, bins with values <= pdf2d_threshold times the
+        peak of the PDF are not saved
     grid_info_dict : dict
         Set to override the mins/maxes of the 1dpdfs, and the number of
         unique values
@@ -386,43 +698,111 @@ def Q_all_memory(
         should have no effect on the final outcome when using only a
         single grid, but is essential when using the subgridding
         approach.
+    model_weights : ndarray
+        set to use these model weights (grid times prior weights) instead of
+        the weight column of the grid, e.g., to test different priors
+        (see `~beast.physicsmodel.grid_and_prior_weights.reweight_sedgrid_priors`)
+    profiler : `~beast.fitting.profiling.StageProfiler`
+        set to record the time and memory spent in each stage of the fitting
+        (setup, likelihood, normalization, lnp, stats, pdf1d, pdf2d, io)
+    background_io : bool
+        set to save the outputs in a background thread while the fitting
+        continues (see `~beast.fitting.output_writer.BackgroundWriter`)
+    writer_queue_size : int
+        maximum number of saves waiting for the background thread, the
+        fitting waits when the queue is full
+    distances : list of float or astropy Quantity
+        set to fit a grid computed at a single distance (distance column or
+        10 pc) at these distances [pc], instead of a grid with the distances
+        applied (see `~beast.physicsmodel.creategrid.apply_distance_grid`).
+        The models are scaled on the fly and the distance weights applied
+        to the likelihoods, giving the same results as the grid with the
+        distances.  The noise model is given on the grid without distances
+        for each distance (ndistances, nmodels, nfilters).  A noise model
+        shared by all the distances (nmodels, nfilters) is only accepted if
+        it does not depend on the distance, i.e., it is the same for all
+        the models.  The flux dependent quantities (symlog fluxes with bias)
+        and the grid columns at all the distances are not stored, they are
+        computed from the scales of the distances for the models used by
+        each star.  The PDFs of the parameters that only depend on the models
+        (or on the distance) are binned on the models at a single distance
+        (or on the distances), the weights of each star being summed over the
+        other axis.  The model indices in the outputs are those of the grid
+        with the distances applied.  What still scales with ndistances *
+        nmodels: the model weights, the likelihood computation and the lnp
+        and chi2 arrays of each star, and, for the PDFs of the symlog fluxes
+        and the 2D PDFs of the distance with another parameter, the bin
+        indices, the work of each star and the values computed once to set
+        up the bins.
+    distance_prior_model : dict
+        distance prior model used with distances
+    grid_search : str
+        "full" to compute the likelihoods of all the models or
+        "hierarchical" to only compute them for the models that can be above
+        the threshold using a coarse-to-fine search of the grid
+        (see `~beast.fitting.grid_index.GridIndex`), the results are the
+        same.  Only for the noise model without covariances.
 
     Returns
     -------
     N/A
     """
+    if grid_search not in ["full", "hierarchical"]:
+        raise ValueError(f"grid_search {grid_search} not supported")
+    if grid_search == "hierarchical" and distances is not None:
+        raise ValueError("hierarchical grid search not supported with distances")
+
+    if profiler is None:
+        profiler = StageProfiler(enabled=False)
+    profiler.start()
 
     if isinstance(sedgrid, str):
         g0 = grid.SEDGrid(sedgrid, backend=gridbackend)
     else:
         g0 = sedgrid
 
+    if model_weights is None:
+        model_weights = g0["weight"]
+    else:
+        model_weights = np.asarray(model_weights, dtype=float)
+        if len(model_weights) != len(g0["weight"]):
+            raise ValueError(
+                "model_weights has {} values, the grid has {} models".format(
+                    len(model_weights), len(g0["weight"])
+                )
+            )
+
+    # get the model SEDs
+    if hasattr(g0.seds, "read"):
+        _seds = g0.seds.read()
+    else:
+        _seds = g0.seds
+
+    # distances applied on the fly, the weights of the distances applied
+    #   as for a grid with the distances
+    if distances is not None:
+        g0 = _DistanceGrid(g0, distances, distance_prior_model)
+        model_weights = np.outer(g0.weights, model_weights).ravel()
+
     # remove weights that are less than zero
-    (g0_indxs,) = np.where(g0["weight"] > 0.0)
+    (g0_indxs,) = np.where(model_weights > 0.0)
 
     for i, cfilter in enumerate(sedgrid.filters):
-        (incomp_indxs,) = np.where(obsmodel["completeness"][:, i] <= 0.0)
-        if len(incomp_indxs) > 0:
+        if np.any(obsmodel["completeness"][..., i] <= 0.0):
             raise ValueError(
                 "models with zero completeness present in the observation model"
             )
 
-    g0_weights = np.log(g0["weight"][g0_indxs])
+    g0_weights = np.log(model_weights[g0_indxs])
     if not do_not_normalize:
         # this variable used on the next line, so is used regardless of what flake8 says
-        g0_weights_sum = np.log(g0["weight"][g0_indxs].sum())  # noqa: F841
+        g0_weights_sum = np.log(model_weights[g0_indxs].sum())  # noqa: F841
         g0_weights = numexpr.evaluate("g0_weights - g0_weights_sum")
 
-    if len(g0["weight"]) != len(g0_indxs):
-        print("orig/g0_indxs", len(g0["weight"]), len(g0_indxs))
+    if len(model_weights) != len(g0_indxs):
+        print("orig/g0_indxs", len(model_weights), len(g0_indxs))
         warnings.warn("some zero weight models exist")
 
-    # get the model SEDs
-    if hasattr(g0.seds, "read"):
-        _seds = g0.seds.read()
-    else:
-        _seds = g0.seds
-
     # links to errors and biases
     ast_error = obsmodel["error"]
     ast_bias = obsmodel["bias"]
@@ -447,6 +827,26 @@ def Q_all_memory(
     else:
         print("not using full covariance matrix")
 
+    # a noise model without a distance axis is only valid at all the
+    #   distances if it is the same for all the models (no flux dependence)
+    if distances is not None and np.ndim(ast_bias) == 2 and np.any(g0.scales != 1):
+        if full_cov_mat:
+            noise_keys = ["bias", "q_norm", "icov_diag", "icov_offdiag"]
+        else:
+            noise_keys = ["bias", "error"]
+        for ckey in noise_keys:
+            cvals = np.asarray(obsmodel[ckey])
+            if np.any(cvals != cvals[0]):
+                raise ValueError(
+                    "the noise model depends on the model fluxes, it is needed "
+                    "for each distance (ndistances, nmodels, nfilters)"
+                )
+
+    if grid_search == "hierarchical" and full_cov_mat:
+        raise ValueError(
+            "hierarchical grid search needs the noise model without covariances"
+        )
+
     # number of observed SEDs to fit
     nobs = len(obs)
 
@@ -459,9 +859,20 @@ def Q_all_memory(
 
     # create the full model fluxes for later use
     #   save as symmetric log, since the fluxes can be negative
-    model_seds_with_bias = np.asfortranarray(_seds + ast_bias)
     # full_model_flux = np.sign(logtempseds) * np.log10(1 + np.abs(logtempseds * math.log(10)))
-    full_model_flux = symlog(model_seds_with_bias)
+    if distances is None:
+        model_seds_with_bias = np.asfortranarray(_seds + ast_bias)
+        full_model_flux = symlog(model_seds_with_bias)
+    else:
+        # fluxes at all the distances computed from the scales of the
+        #   distances, only for the models used
+        full_model_flux = _DistanceFluxes(g0, _seds, ast_bias)
+
+    # index of the grid for the coarse-to-fine search
+    if grid_search == "hierarchical":
+        grid_index = GridIndex.from_sedgrid(
+            g0, model_seds_with_bias, ast_ivar, g0_weights, models=g0_indxs
+        )
 
     # setup the arrays to temp store the results
     n_qnames = len(qnames)
@@ -481,6 +892,7 @@ def Q_all_memory(
 
     # setup the mapping for the 1D PDFs
     fast_pdf1d_objs = []
+    pdf1d_axes = []
     save_pdf1d_vals = []
 
     # make 1D PDF objects
@@ -492,6 +904,8 @@ def Q_all_memory(
         )
 
         # generate the fast 1d pdf mapping
+        (qname_vals,), pdf1d_axis = _pdf_grid_values(qname_vals)
+        pdf1d_axes.append(pdf1d_axis)
         _tpdf1d = pdf1d(
             qname_vals,
             nbins,
@@ -513,7 +927,7 @@ def Q_all_memory(
         _pdf2d_params = [
             qname
             for qname in qnames
-            if qname in pdf2d_param_list and len(np.unique(g0[qname])) > 1
+            if qname in pdf2d_param_list and len(_unique_values(g0[qname])) > 1
         ]
         _n_params = len(_pdf2d_params)
         pdf2d_qname_pairs = [
@@ -522,6 +936,7 @@ def Q_all_memory(
             for j in range(i + 1, _n_params)
         ]
         fast_pdf2d_objs = []
+        pdf2d_axes = []
         save_pdf2d_vals = []
 
         # make 2D PDF objects
@@ -551,6 +966,10 @@ def Q_all_memory(
             )
 
             # make 2D PDF
+            (qname_vals_p1, qname_vals_p2), pdf2d_axis = _pdf_grid_values(
+                qname_vals_p1, qname_vals_p2
+            )
+            pdf2d_axes.append(pdf2d_axis)
             _tpdf2d = pdf2d(
                 qname_vals_p1,
                 qname_vals_p2,
@@ -565,6 +984,16 @@ def Q_all_memory(
             )
             fast_pdf2d_objs.append(_tpdf2d)
             # arrays for the PDFs and bins
+            if pdf2d_sparse:
+                save_pdf2d_vals.append(
+                    SparsePDF2D(
+                        _tpdf2d.bin_vals_p1,
+                        _tpdf2d.bin_vals_p2,
+                        nobs,
+                        threshold=pdf2d_threshold,
+                    )
+                )
+                continue
             save_pdf2d_vals.append(np.zeros((nobs + 2, nbins_p1, nbins_p2)))
             save_pdf2d_vals[-1][-2, :, :] = np.tile(
                 _tpdf2d.bin_vals_p1, (nbins_p2, 1)
@@ -606,11 +1035,18 @@ def Q_all_memory(
                     save_pdf1d_vals[k] = hdulist[k + 1].data
 
         # read in the already computed 2D PDFs
+        #   files in the other (dense or sparse) format are converted
         if pdf2d_outname is not None:
             print("restoring the already computed 2D PDFs from " + pdf2d_outname)
             with fits.open(pdf2d_outname) as hdulist:
-                for k in range(len(pdf2d_qname_pairs)):
-                    save_pdf2d_vals[k] = hdulist[k + 1].data
+                for k, qname_pair in enumerate(pdf2d_qname_pairs):
+                    save_pdf2d_vals[k] = _resume_pdf2d(
+                        hdulist,
+                        qname_pair,
+                        save_pdf2d_vals[k],
+                        start_pos,
+                        pdf2d_threshold,
+                    )
 
     else:
         start_pos = 0
@@ -628,155 +1064,34 @@ def Q_all_memory(
     g0_specgrid_indx = g0["specgrid_indx"]
     _p = np.asarray(p, dtype=float)
 
-    it = tqdm(
-        islice(obs.enumobs(), int(start_pos), None),
-        total=len(obs) - start_pos,
-        desc="Calculating Lnp/Stats",
-    )
-    for e, obj in it:
-        # calculate the full nD posterior
-        (sed) = obj
-
-        cur_mask = sed == 0
-        # need an alternate way to generate the mask as zeros can be
-        # valid values in the observed SED (KDG 29 Jan 2016)
-        # currently, set mask to False always
-        cur_mask[:] = False
-
-        if full_cov_mat:
-            (lnp, chi2) = N_covar_logLikelihood(
-                sed,
-                model_seds_with_bias,
-                ast_q_norm,
-                ast_icov_diag,
-                two_ast_icov_offdiag,
-                lnp_threshold=abs(threshold),
-            )
-        else:
-            (lnp, chi2) = N_logLikelihood_NM(
-                sed,
-                model_seds_with_bias,
-                ast_ivar,
-                mask=cur_mask,
-                lnp_threshold=abs(threshold),
-            )
+    # saves of the outputs, run in a background thread if requested
+    #   snapshots of the values still filled by the loop are saved
+    writer = BackgroundWriter(maxsize=writer_queue_size, enabled=background_io)
 
-        lnp = lnp[g0_indxs]
-        chi2 = chi2[g0_indxs]
-        # lnp = numexpr.evaluate('lnp + g0_weights')
-        lnp += g0_weights  # multiply by the prior weights (sum in log space)
-
-        (indx,) = np.where((lnp - max(lnp[np.isfinite(lnp)])) > threshold)
-
-        # now generate the sparse likelihood (remove later if this works
-        #       by updating code below)
-        #   checked if changing to the full likelihood speeds things up
-        #       - the answer is no
-        #   and is likely related to the switch here to the sparse
-        #       likelihood for the weight calculation
-        lnps = lnp[indx]
-        chi2s = chi2[indx]
-
-        # log_norm = np.log(getNorm_lnP(lnps))
-        # if not np.isfinite(log_norm):
-        #    log_norm = lnps.max()
-        log_norm = lnps.max()
-        weights = np.exp(lnps - log_norm)
-
-        # normalize the weights make sure they sum to one
-        #   needed for np.random.choice
-        weight_sum = np.sum(weights)
-        weights /= weight_sum
-
-        # save the current set of lnps
-        if lnp_outname is not None:
-            if lnp_npts is not None:
-                if lnp_npts < len(indx):
-                    rindx = np.random.choice(indx, size=lnp_npts, replace=False)
-                if lnp_npts >= len(indx):
-                    rindx = indx
-            else:
-                rindx = indx
-            save_lnp_vals.append(
-                [
-                    e,
-                    np.array(g0_indxs[rindx], dtype=np.int64),
-                    np.array(lnp[rindx], dtype=np.float32),
-                    np.array(chi2[rindx], dtype=np.float32),
-                    np.array([sed]).T,
-                ]
+    def save_outputs():
+        # save the 1D PDFs
+        if pdf1d_outname is not None:
+            writer.submit(
+                save_pdf1d, pdf1d_outname, writer.snapshot(save_pdf1d_vals), qnames
             )
 
-        # To merge the stats for different subgrids, we need the total
-        # weight of a grid, which is sum(exp(lnps)). Since sum(exp(lnps
-        # - log_norm - log(weight_sum))) = 1, the relative weight of
-        # each subgrid will be exp(log_norm + log(weight_sum)).
-        # Therefore, we also store the following quantity:
-        total_log_norm[e] = log_norm + np.log(weight_sum)
-
-        # index to the full model grid for the best fit values
-        best_full_indx = g0_indxs[indx[weights.argmax()]]
-
-        # index to the spectral grid
-        best_specgrid_indx[e] = g0_specgrid_indx[best_full_indx]
-
-        # goodness of fit quantities
-        chi2_vals[e] = chi2s.min()
-        chi2_indx[e] = g0_indxs[indx[chi2s.argmin()]]
-        lnp_vals[e] = lnps.max()
-        lnp_indx[e] = best_full_indx
-
-        # calculate quantities for individual parameters:
-        # best value, expectation value, 1D PDF, percentiles
-        for k, qname in enumerate(qnames):
-            if "_bias" in qname:
-                fname = (qname.replace("_wd_bias", "")).replace("symlog", "")
-                q = full_model_flux[:, filters.index(fname)]
-            else:
-                q = g0[qname]
-
-            # best value
-            best_vals[e, k] = q[best_full_indx]
-
-            # expectation value
-            exp_vals[e, k] = expectation(q[g0_indxs[indx]], weights=weights)
-
-            # percentile values
-            pdf1d_bins, pdf1d_vals = fast_pdf1d_objs[k].gen1d(g0_indxs[indx], weights)
-
-            save_pdf1d_vals[k][e, :] = pdf1d_vals
-            if pdf1d_vals.max() > 0:
-                # remove normalization to allow for post processing with
-                #   different distance runs (needed for the SMIDGE-SMC)
-                # pdf1d_vals /= pdf1d_vals.max()
-                per_vals[e, k, :] = percentile(pdf1d_bins, _p, weights=pdf1d_vals)
-            else:
-                per_vals[e, k, :] = [0.0, 0.0, 0.0]
-
-        # calculate 2D PDFs for the subset of parameter pairs
+        # save the 2D PDFs
         if pdf2d_outname is not None:
-            for k in range(len(pdf2d_qname_pairs)):
-                save_pdf2d_vals[k][e, :, :] = fast_pdf2d_objs[k].gen2d(
-                    g0_indxs[indx], weights
-                )
+            writer.submit(
+                save_pdf2d,
+                pdf2d_outname,
+                writer.snapshot(save_pdf2d_vals),
+                pdf2d_qname_pairs,
+            )
 
-        # incremental save (useful if job dies early to recover most
-        #    of the computations)
-        if save_every_npts is not None:
-            if (e > 0) & (e % save_every_npts == 0):
-                # save the 1D PDFs
-                if pdf1d_outname is not None:
-                    save_pdf1d(pdf1d_outname, save_pdf1d_vals, qnames)
-
-                # save the 2D PDFs
-                if pdf2d_outname is not None:
-                    save_pdf2d(pdf2d_outname, save_pdf2d_vals, pdf2d_qname_pairs)
-
-                # save the stats/catalog
-                if stats_outname is not None:
-                    save_stats(
-                        stats_outname,
-                        prev_result,
+        # save the stats/catalog
+        if stats_outname is not None:
+            writer.submit(
+                save_stats,
+                stats_outname,
+                prev_result,
+                *writer.snapshot(
+                    [
                         best_vals,
                         exp_vals,
                         per_vals,
@@ -786,50 +1101,225 @@ def Q_all_memory(
                         lnp_indx,
                         best_specgrid_indx,
                         total_log_norm,
-                        qnames,
-                        p,
-                        sedgrid.filters,
-                        sedgrid.lamb,
+                    ]
+                ),
+                qnames,
+                p,
+                sedgrid.filters,
+                sedgrid.lamb,
+            )
+
+    profiler.lap("setup")
+
+    # the submitted saves are finished and the writer stopped even if the
+    #   fit fails, without hiding its error
+    with writer:
+        it = tqdm(
+            islice(obs.enumobs(), int(start_pos), None),
+            total=len(obs) - start_pos,
+            desc="Calculating Lnp/Stats",
+        )
+        for e, obj in it:
+            # calculate the full nD posterior
+            (sed) = obj
+            profiler.star(e)
+
+            cur_mask = sed == 0
+            # need an alternate way to generate the mask as zeros can be
+            # valid values in the observed SED (KDG 29 Jan 2016)
+            # currently, set mask to False always
+            cur_mask[:] = False
+
+            if grid_search == "hierarchical":
+                # only the models that can be above the threshold, the
+                #   prior weights are included
+                (lnp, chi2) = grid_index.search(sed, threshold)
+            elif distances is not None:
+                # all the distances of each model at once
+                if full_cov_mat:
+                    (lnp, chi2) = N_covar_logLikelihood_scaled(
+                        sed,
+                        _seds,
+                        ast_bias,
+                        ast_q_norm,
+                        ast_icov_diag,
+                        two_ast_icov_offdiag,
+                        g0.scales,
+                        lnp_threshold=abs(threshold),
                     )
+                else:
+                    (lnp, chi2) = N_logLikelihood_NM_scaled(
+                        sed,
+                        _seds,
+                        ast_bias,
+                        ast_ivar,
+                        g0.scales,
+                        lnp_threshold=abs(threshold),
+                    )
+                lnp = lnp.ravel()
+                chi2 = chi2.ravel()
+            elif full_cov_mat:
+                (lnp, chi2) = N_covar_logLikelihood(
+                    sed,
+                    model_seds_with_bias,
+                    ast_q_norm,
+                    ast_icov_diag,
+                    two_ast_icov_offdiag,
+                    lnp_threshold=abs(threshold),
+                )
+            else:
+                (lnp, chi2) = N_logLikelihood_NM(
+                    sed,
+                    model_seds_with_bias,
+                    ast_ivar,
+                    mask=cur_mask,
+                    lnp_threshold=abs(threshold),
+                )
 
-                # save the lnps
-                if lnp_outname is not None:
-                    save_lnp(lnp_outname, save_lnp_vals)
-                    save_lnp_vals = []
+            if grid_search != "hierarchical":
+                lnp = lnp[g0_indxs]
+                chi2 = chi2[g0_indxs]
+                # lnp = numexpr.evaluate('lnp + g0_weights')
+                lnp += g0_weights  # multiply by the prior weights (sum in log space)
+            profiler.lap("likelihood")
+
+            (indx,) = np.where((lnp - max(lnp[np.isfinite(lnp)])) > threshold)
+
+            # now generate the sparse likelihood (remove later if this works
+            #       by updating code below)
+            #   checked if changing to the full likelihood speeds things up
+            #       - the answer is no
+            #   and is likely related to the switch here to the sparse
+            #       likelihood for the weight calculation
+            lnps = lnp[indx]
+            chi2s = chi2[indx]
+
+            # log_norm = np.log(getNorm_lnP(lnps))
+            # if not np.isfinite(log_norm):
+            #    log_norm = lnps.max()
+            log_norm = lnps.max()
+            weights = np.exp(lnps - log_norm)
+
+            # normalize the weights make sure they sum to one
+            #   needed for np.random.choice
+            weight_sum = np.sum(weights)
+            weights /= weight_sum
+            profiler.lap("normalization")
+
+            # save the current set of lnps
+            if lnp_outname is not None:
+                if lnp_npts is not None:
+                    if lnp_npts < len(indx):
+                        rindx = np.random.choice(indx, size=lnp_npts, replace=False)
+                    if lnp_npts >= len(indx):
+                        rindx = indx
+                else:
+                    rindx = indx
+                save_lnp_vals.append(
+                    [
+                        e,
+                        np.array(g0_indxs[rindx], dtype=np.int64),
+                        np.array(lnp[rindx], dtype=np.float32),
+                        np.array(chi2[rindx], dtype=np.float32),
+                        np.array([sed]).T,
+                    ]
+                )
+                profiler.lap("lnp")
+
+            # To merge the stats for different subgrids, we need the total
+            # weight of a grid, which is sum(exp(lnps)). Since sum(exp(lnps
+            # - log_norm - log(weight_sum))) = 1, the relative weight of
+            # each subgrid will be exp(log_norm + log(weight_sum)).
+            # Therefore, we also store the following quantity:
+            total_log_norm[e] = log_norm + np.log(weight_sum)
+
+            # index to the full model grid for the best fit values
+            best_full_indx = g0_indxs[indx[weights.argmax()]]
+
+            # index to the spectral grid
+            best_specgrid_indx[e] = g0_specgrid_indx[best_full_indx]
+
+            # goodness of fit quantities
+            chi2_vals[e] = chi2s.min()
+            chi2_indx[e] = g0_indxs[indx[chi2s.argmin()]]
+            lnp_vals[e] = lnps.max()
+            lnp_indx[e] = best_full_indx
+
+            # weights of the models for the PDFs, summed over the distances
+            #   (or the models) for the parameters only depending on the
+            #   models (or the distances) with the distances applied on the fly
+            pdf_weights = {None: (g0_indxs[indx], weights)}
+            if distances is not None:
+                for axis in ["models", "distances"]:
+                    pdf_weights[axis] = _reduce_distance_weights(
+                        g0_indxs[indx], weights, g0.n_models, axis
+                    )
 
-    # do the final save of everything (or the last set for the lnp values)
+            # calculate quantities for individual parameters:
+            # best value, expectation value, 1D PDF, percentiles
+            for k, qname in enumerate(qnames):
+                if "_bias" in qname:
+                    fname = (qname.replace("_wd_bias", "")).replace("symlog", "")
+                    q = full_model_flux[:, filters.index(fname)]
+                else:
+                    q = g0[qname]
+
+                # best value
+                best_vals[e, k] = q[best_full_indx]
+
+                # expectation value
+                exp_vals[e, k] = expectation(q[g0_indxs[indx]], weights=weights)
+                profiler.lap("stats")
+
+                # percentile values
+                pdf1d_bins, pdf1d_vals = fast_pdf1d_objs[k].gen1d(
+                    *pdf_weights[pdf1d_axes[k]]
+                )
 
-    # save the 1D PDFs
-    if pdf1d_outname is not None:
-        save_pdf1d(pdf1d_outname, save_pdf1d_vals, qnames)
+                save_pdf1d_vals[k][e, :] = pdf1d_vals
+                profiler.lap("pdf1d")
+                if pdf1d_vals.max() > 0:
+                    # remove normalization to allow for post processing with
+                    #   different distance runs (needed for the SMIDGE-SMC)
+                    # pdf1d_vals /= pdf1d_vals.max()
+                    per_vals[e, k, :] = percentile(pdf1d_bins, _p, weights=pdf1d_vals)
+                else:
+                    per_vals[e, k, :] = [0.0, 0.0, 0.0]
+                profiler.lap("stats")
+
+            # calculate 2D PDFs for the subset of parameter pairs
+            if pdf2d_outname is not None:
+                for k in range(len(pdf2d_qname_pairs)):
+                    _vals_2d = fast_pdf2d_objs[k].gen2d(*pdf_weights[pdf2d_axes[k]])
+                    if pdf2d_sparse:
+                        save_pdf2d_vals[k].add(e, _vals_2d)
+                    else:
+                        save_pdf2d_vals[k][e, :, :] = _vals_2d
+                profiler.lap("pdf2d")
 
-    # save the 2D PDFs
-    if pdf2d_outname is not None:
-        save_pdf2d(pdf2d_outname, save_pdf2d_vals, pdf2d_qname_pairs)
+            # incremental save (useful if job dies early to recover most
+            #    of the computations)
+            if save_every_npts is not None:
+                if (e > 0) & (e % save_every_npts == 0):
+                    save_outputs()
 
-    # save the stats/catalog
-    if stats_outname is not None:
-        save_stats(
-            stats_outname,
-            prev_result,
-            best_vals,
-            exp_vals,
-            per_vals,
-            chi2_vals,
-            chi2_indx,
-            lnp_vals,
-            lnp_indx,
-            best_specgrid_indx,
-            total_log_norm,
-            qnames,
-            p,
-            sedgrid.filters,
-            sedgrid.lamb,
-        )
+                    # save the lnps, the saved values are not kept
+                    if lnp_outname is not None:
+                        writer.submit(save_lnp, lnp_outname, save_lnp_vals)
+                        save_lnp_vals = []
+                    profiler.lap("io")
+
+        profiler.end_stars()
+        profiler.start()
+
+        # do the final save of everything (or the last set for the lnp values)
+
+        save_outputs()
 
-    # save the lnps
-    if lnp_outname is not None:
-        save_lnp(lnp_outname, save_lnp_vals)
+        # save the lnps
+        if lnp_outname is not None:
+            writer.submit(save_lnp, lnp_outname, save_lnp_vals)
+    profiler.lap("io")
 
 
 def IAU_names_and_extra_info(obsdata, surveyname="PHAT", extraInfo=False):
@@ -924,12 +1414,19 @@ def summary_table_memory(
     pdf1d_outname=None,
     pdf2d_outname=None,
     pdf2d_param_list=None,
+    pdf2d_sparse=False,
+    pdf2d_threshold=0.0,
     grid_info_dict=None,
     lnp_outname=None,
     use_full_cov_matrix=True,
     surveyname="PHAT",
     extraInfo=False,
     do_not_normalize=False,
+    profile=False,
+    background_io=False,
+    distances=None,
+    distance_prior_model={"name": "flat"},
+    grid_search="full",
 ):
     """
     Do the fitting in memory
@@ -966,6 +1463,11 @@ def summary_table_memory(
         set to output the 2D PDFs into a FITS file with extensions
     pdf2d_param_list : list of strings or None
         set to the parameters for which to make the 2D PDFs
+    pdf2d_sparse : bool
+        set to save the 2D PDFs in the sparse format
+    pdf2d_threshold : float
+        for the sparse format, bins with values <= pdf2d_threshold times the
+        peak of the PDF are not saved
     grid_info_dict : dict
         Set to override the mins/maxes of the 1dpdfs, and the number of
         unique values.
@@ -985,6 +1487,21 @@ def summary_table_memory(
         should have no effect on the final outcome when using only a
         single grid, but is essential when using the subgridding
         approach.
+    profile : bool
+        set to record the time and memory spent in each stage of the fitting
+        and save them as a JSON report next to the stats file
+        (see `~beast.fitting.profiling.StageProfiler`)
+    background_io : bool
+        set to save the outputs in a background thread while the fitting
+        continues (see `~beast.fitting.output_writer.BackgroundWriter`)
+    distances : list of float or astropy Quantity
+        set to fit the grid, computed at a single distance, at these
+        distances applied on the fly (see `Q_all_memory`)
+    distance_prior_model : dict
+        distance prior model used with distances
+    grid_search : str
+        "full" or "hierarchical" to only compute the likelihoods of the
+        models that can be above the threshold (see `Q_all_memory`)
 
     Returns
     -------
@@ -997,15 +1514,19 @@ def summary_table_memory(
     else:
         g0 = sedgrid
 
+    grid_keys = list(g0.keys())
+    if distances is not None and "distance" not in grid_keys:
+        grid_keys.append("distance")
+
     if keys is None:
-        keys = list(g0.keys())
+        keys = grid_keys
 
     # make sure keys are real keys
     skip_keys = "osl keep weight grid_weight prior_weight fullgrid_idx stage specgrid_indx".split()
     keys = [k for k in keys if k not in skip_keys]
 
     for key in keys:
-        if not (key in list(g0.keys())):
+        if not (key in grid_keys):
             raise KeyError('Key "{0}" not recognized'.format(key))
 
     # make sure there are 2D PDF params if needed
@@ -1015,6 +1536,13 @@ def summary_table_memory(
     # generate an IAU complient name for each source and add other inform
     res = IAU_names_and_extra_info(obs, surveyname=surveyname, extraInfo=False)
 
+    if profile:
+        if stats_outname is None:
+            raise ValueError("stats_outname needed to save the profile report")
+        profiler = StageProfiler()
+    else:
+        profiler = None
+
     Q_all_memory(
         res,
         obs,
@@ -1031,8 +1559,18 @@ def summary_table_memory(
         pdf1d_outname=pdf1d_outname,
         pdf2d_outname=pdf2d_outname,
         pdf2d_param_list=pdf2d_param_list,
+        pdf2d_sparse=pdf2d_sparse,
+        pdf2d_threshold=pdf2d_threshold,
         grid_info_dict=grid_info_dict,
         lnp_outname=lnp_outname,
         use_full_cov_matrix=use_full_cov_matrix,
         do_not_normalize=do_not_normalize,
+        profiler=profiler,
+        background_io=background_io,
+        distances=distances,
+        distance_prior_model=distance_prior_model,
+        grid_search=grid_search,
     )
+
+    if profile:
+        profiler.write(profile_fname(stats_outname))
@@ -7,16 +7,26 @@ python/numpy version.
 
 N_logLikelihood   Computes a normal likelihood (default, symmetric errors)
 SN_logLikelihood  Computes a Split Normal likelihood (asymmetric errors)
+*_scaled          Likelihoods of flux scaled models (e.g., distances)
+*_packed          Covariance chi2 with the packed inverse covariance matrices
 getNorm_lnP       Compute the norm of a log-likelihood (overflow robust)
 """
 import numpy as np
 
+# size of the flux differences computed at once by the covariance chi2
+#   (cache sized blocks of models)
+_BLOCK_BYTES = 2 ** 18
+
 __all__ = [
     "N_chi2_NM",
     "N_covar_chi2",
+    "N_covar_chi2_packed",
+    "pack_icov",
     "N_logLikelihood_NM",
     "N_covar_logLikelihood",
     "N_covar_logLikelihood_cholesky",
+    "N_logLikelihood_NM_scaled",
+    "N_covar_logLikelihood_scaled",
     "getNorm_lnP",
 ]
 
@@ -55,17 +65,86 @@ def N_chi2_NM(flux, fluxmod_wbias, ivar, mask=None):
     return np.einsum("ij,ij,ij->i", temp, temp, _ie)
 
 
-def N_covar_chi2(flux, fluxmod_wbias, icov_diag, two_icov_offdiag):
+def _blocked_covar_chi2(flux, fluxmod_wbias, kernel, icov_terms, block_size=None):
+    """
+    chi2 of one or several stars computed on blocks of models, only the
+    flux differences of a block are stored
+
+    kernel(fluxdiff, *icov_blocks) gives the chi2 of the (nstars, nblock,
+    nfilters) flux differences, the icov_terms are split in the same blocks
+    """
+    flux = np.asarray(flux)
+    fluxes = np.atleast_2d(flux)
+    n_models, n_filters = fluxmod_wbias.shape
+    if block_size is None:
+        block_size = max(_BLOCK_BYTES // (8 * n_filters * len(fluxes)), 64)
+
+    chisqr = np.empty((len(fluxes), n_models))
+    for start in range(0, n_models, block_size):
+        end = start + block_size
+        fluxdiff = fluxes[:, None, :] - fluxmod_wbias[None, start:end, :]
+        chisqr[:, start:end] = kernel(
+            fluxdiff, *[icov[start:end] for icov in icov_terms]
+        )
+
+    if flux.ndim == 1:
+        return chisqr[0]
+    return chisqr
+
+
+def _covar_chi2_kernel(fluxdiff, icov_diag, two_icov_offdiag):
+    """ chi2 of a block of flux differences (nstars, nmodels, nfilters) """
+    n_filters = fluxdiff.shape[2]
+
+    # diagonal terms
+    chisqr = np.einsum("sij,sij,ij->si", fluxdiff, fluxdiff, icov_diag)
+
+    # off-diagonal terms
+    m_start = 0
+    for k in range(n_filters - 1):
+        m_end = m_start + n_filters - k - 1
+        tchisqr = np.einsum(
+            "ij,sij->si", two_icov_offdiag[:, m_start:m_end], fluxdiff[:, :, k + 1 :]
+        )
+        tchisqr *= fluxdiff[:, :, k]
+        chisqr += tchisqr
+        m_start = m_end
+
+    return chisqr
+
+
+def _packed_chi2_kernel(fluxdiff, icov_packed):
+    """ chi2 of a block of flux differences with the packed icov """
+    n_filters = fluxdiff.shape[2]
+
+    # row k of the upper triangle: icov[k, k:] (with the off-diagonal
+    #   terms doubled) times the flux differences of filters k:
+    chisqr = np.zeros(fluxdiff.shape[:2])
+    m_start = 0
+    for k in range(n_filters):
+        m_end = m_start + n_filters - k
+        tchisqr = np.einsum(
+            "ij,sij->si", icov_packed[:, m_start:m_end], fluxdiff[:, :, k:]
+        )
+        tchisqr *= fluxdiff[:, :, k]
+        chisqr += tchisqr
+        m_start = m_end
+
+    return chisqr
+
+
+def N_covar_chi2(flux, fluxmod_wbias, icov_diag, two_icov_offdiag, block_size=None):
     """ compute the non-reduced chi2 between data and model using
     the full covariance matrix information computed from ASTs.
 
     Parameters
     ----------
-    flux:    np.ndarray[float, ndim=1]
-        array of fluxes
+    flux:    np.ndarray[float, ndim=1 or 2]
+        array of fluxes (nfilters), or of the fluxes of several stars
+        (nstars, nfilters)
 
     fluxmod_wbias: np.ndarray[float, ndim=2]
-        array of modeled fluxes (nfilters , nmodels)
+        array of modeled fluxes (nmodels, nfilters)
 
     icov_diag: np.ndarray[float, ndim=2]
         array giving the diagnonal terms of the covariance matrix inverse
@@ -73,37 +152,86 @@ def N_covar_chi2(flux, fluxmod_wbias, icov_diag, two_icov_offdiag):
     two_icov_offdiag: np.ndarray[float, ndim=2]
         array giving 2x the off diagonal terms of the covariance matrix inverse
 
+    block_size: int
+        number of models computed at once, default gives cache sized
+        temporary arrays
+
     Returns
     -------
-    chi2:    np.ndarray[float, ndim=1]
-        array of chi2 values (nmodels)
+    chi2:    np.ndarray[float, ndim=1 or 2]
+        array of chi2 values (nmodels), or (nstars, nmodels) for several stars
 
     Note
     ----
     Mask removed as it cannot be used with a precomputed inverse
     covariance matrix.  (KDG 29 Jan 2016)
     """
-    # get the number of models and filters
-    n_models, n_filters = fluxmod_wbias.shape
+    return _blocked_covar_chi2(
+        flux,
+        fluxmod_wbias,
+        _covar_chi2_kernel,
+        (icov_diag, two_icov_offdiag),
+        block_size=block_size,
+    )
 
-    # compute the difference in fluxes
-    fluxdiff = flux[None, :] - fluxmod_wbias
 
-    # diagonal terms
-    chisqr = np.einsum("ij,ij,ij->i", fluxdiff, fluxdiff, icov_diag)
+def pack_icov(icov_diag, two_icov_offdiag):
+    """ Pack the terms of the inverse covariance matrices in a single array
 
-    # off-diagonal terms
-    m_start = 0
-    for k in range(n_filters - 1):
-        m_end = m_start + n_filters - k - 1
-        tchisqr = np.einsum(
-            "ij,ij->i", two_icov_offdiag[:, m_start:m_end], fluxdiff[:, k + 1 :]
-        )
-        tchisqr *= fluxdiff[:, k]
-        chisqr += tchisqr
-        m_start = m_end
+    Parameters
+    ----------
+    icov_diag: np.ndarray[float, ndim=2]
+        array giving the diagnonal terms of the covariance matrix inverse
+        (nmodels, nfilters)
 
-    return chisqr
+    two_icov_offdiag: np.ndarray[float, ndim=2]
+        array giving 2x the off diagonal terms of the covariance matrix
+        inverse (nmodels, nfilters * (nfilters - 1) / 2)
+
+    Returns
+    -------
+    icov_packed: np.ndarray[float, ndim=2]
+        upper triangles of the inverse covariance matrices, row by row,
+        with the off diagonal terms doubled
+        (nmodels, nfilters * (nfilters + 1) / 2)
+    """
+    n_models, n_filters = icov_diag.shape
+    k1, k2 = np.triu_indices(n_filters)
+    icov_packed = np.empty((n_models, len(k1)), dtype=icov_diag.dtype)
+    icov_packed[:, k1 == k2] = icov_diag
+    icov_packed[:, k1 != k2] = two_icov_offdiag
+    return icov_packed
+
+
+def N_covar_chi2_packed(flux, fluxmod_wbias, icov_packed, block_size=None):
+    """ compute the non-reduced chi2 between data and model using
+    the packed inverse covariance matrices (see `pack_icov`).
+
+    Parameters
+    ----------
+    flux:    np.ndarray[float, ndim=1 or 2]
+        array of fluxes (nfilters), or of the fluxes of several stars
+        (nstars, nfilters)
+
+    fluxmod_wbias: np.ndarray[float, ndim=2]
+        array of modeled fluxes (nmodels, nfilters)
+
+    icov_packed: np.ndarray[float, ndim=2]
+        packed upper triangles of the inverse covariance matrices
+        (nmodels, nfilters * (nfilters + 1) / 2)
+
+    block_size: int
+        number of models computed at once, default gives cache sized
+        temporary arrays
+
+    Returns
+    -------
+    chi2:    np.ndarray[float, ndim=1 or 2]
+        array of chi2 values (nmodels), or (nstars, nmodels) for several stars
+    """
+    return _blocked_covar_chi2(
+        flux, fluxmod_wbias, _packed_chi2_kernel, (icov_packed,), block_size=block_size
+    )
 
 
 def N_logLikelihood_NM(flux, fluxmod_wbias, ivar, mask=None, lnp_threshold=1000.0):
@@ -175,8 +303,8 @@ def N_covar_logLikelihood(
 
     Parameters
     ----------
-    flux: np.ndarray[float, ndim=1]
-        array of fluxes
+    flux: np.ndarray[float, ndim=1 or 2]
+        array of fluxes, or of the fluxes of several stars (nstars, nfilters)
 
     fluxmod_wbias: np.ndarray[float, ndim=2]
         array of modeled fluxes + ast-derived biases (nfilters , nmodels)
@@ -197,10 +325,10 @@ def N_covar_logLikelihood(
     Returns
     -------
     (lnp, chi2)
-    lnP:    np.ndarray[float, ndim=1]
-            array of ln(P) values (Nmodels)
-    chi2:    np.ndarray[float, ndim=1]
-            array of chi-squared values (Nmodels)
+    lnP:    np.ndarray[float, ndim=1 or 2]
+            array of ln(P) values (Nmodels), or (Nstars, Nmodels)
+    chi2:    np.ndarray[float, ndim=1 or 2]
+            array of chi-squared values (Nmodels), or (Nstars, Nmodels)
     """
     n_models, n_filters = np.shape(fluxmod_wbias)
 
@@ -218,6 +346,178 @@ def N_covar_logLikelihood(
     return (lnP, _chi2)
 
 
+def _scaled_chi2(scales, a_term, b_term, c_term):
+    """ chi2 = a - 2 s b + s^2 c for all the scales (nscales, nmodels) """
+    scales = np.asarray(scales, dtype=float)[:, None]
+    chi2 = a_term[None, :] - 2.0 * scales * b_term[None, :]
+    chi2 += scales ** 2 * c_term[None, :]
+    return chi2
+
+
+def _covar_bilinear(x, y, icov_diag, two_icov_offdiag):
+    """ x^T icov y for each model, with the icov given by its terms """
+    n_filters = x.shape[1]
+    prod = np.einsum("ij,ij,ij->i", x, y, icov_diag)
+    m_start = 0
+    for k in range(n_filters - 1):
+        m_end = m_start + n_filters - k - 1
+        offdiag = two_icov_offdiag[:, m_start:m_end]
+        prod += 0.5 * (
+            np.einsum("ij,ij->i", offdiag, y[:, k + 1 :]) * x[:, k]
+            + np.einsum("ij,ij->i", offdiag, x[:, k + 1 :]) * y[:, k]
+        )
+        m_start = m_end
+    return prod
+
+
+def N_logLikelihood_NM_scaled(flux, fluxmod, bias, ivar, scales, lnp_threshold=1000.0):
+    r""" Computes the log of the chi2 likelihood between data and models
+    scaled by a set of factors (e.g., distances) taking into account the
+    noise model.  The scaled models (scales * fluxmod + bias) are not
+    computed.
+
+    Parameters
+    ----------
+    flux: np.ndarray[float, ndim=1]
+        array of fluxes
+
+    fluxmod: np.ndarray[float, ndim=2]
+        array of unscaled modeled fluxes (nmodels, nfilters)
+
+    bias: np.ndarray[float, ndim=2 or 3]
+        array of ast-derived biases, either shared by all the scales
+        (nmodels, nfilters) or for each scale (nscales, nmodels, nfilters)
+
+    ivar: np.ndarray[float, ndim=2 or 3]
+        array of ast-derived inverse variances, same shape as bias
+
+    scales: np.ndarray[float, ndim=1]
+        flux scaling factors (nscales)
+
+    lnp_threshold:  float
+        cut the values outside -x, x in lnp
+
+    Returns
+    -------
+    (lnp, chi2)
+    lnP:    np.ndarray[float, ndim=2]
+            array of ln(P) values (nscales, nmodels)
+    chi2:    np.ndarray[float, ndim=2]
+            array of chi-squared values (nscales, nmodels)
+
+    .. math::
+
+        \chi ^ 2(s) = \sum_{k} (flux_{obs,k} - \mu_k - s flux_{pred,k}) ^ 2 /
+                       \sigma^2_{pred,k} = A - 2 s B + s^2 C
+
+    with a noise model shared by all the scales, so the cost of each scale
+    is independent of the number of filters.
+    """
+    if np.ndim(bias) == 3:
+        # noise model of each scale
+        lnP = np.zeros((len(scales), fluxmod.shape[0]))
+        _chi2 = np.zeros(lnP.shape)
+        for k, scale in enumerate(scales):
+            lnP[k], _chi2[k] = N_logLikelihood_NM(
+                flux, scale * fluxmod + bias[k], ivar[k]
+            )
+        return (lnP, _chi2)
+
+    n = fluxmod.shape[1]
+    lnQ = n * 0.5 * np.log(2.0 * np.pi) - 0.5 * np.sum(np.log(ivar), axis=1)
+
+    fluxdiff = flux[None, :] - bias
+    _chi2 = _scaled_chi2(
+        scales,
+        np.einsum("ij,ij,ij->i", fluxdiff, fluxdiff, ivar),
+        np.einsum("ij,ij,ij->i", fluxmod, fluxdiff, ivar),
+        np.einsum("ij,ij,ij->i", fluxmod, fluxmod, ivar),
+    )
+    lnP = -lnQ[None, :] - 0.5 * _chi2
+
+    return (lnP, _chi2)
+
+
+def N_covar_logLikelihood_scaled(
+    flux,
+    fluxmod,
+    bias,
+    q_norm,
+    icov_diag,
+    two_icov_offdiag,
+    scales,
+    lnp_threshold=1000.0,
+):
+    """ Computes the log of the chi2 likelihood between data and models
+    scaled by a set of factors (e.g., distances) using the full covariance
+    matrix information computed from ASTs.  The scaled models
+    (scales * fluxmod + bias) are not computed.
+
+    Parameters
+    ----------
+    flux: np.ndarray[float, ndim=1]
+        array of fluxes
+
+    fluxmod: np.ndarray[float, ndim=2]
+        array of unscaled modeled fluxes (nmodels, nfilters)
+
+    bias: np.ndarray[float, ndim=2 or 3]
+        array of ast-derived biases, either shared by all the scales
+        (nmodels, nfilters) or for each scale (nscales, nmodels, nfilters)
+
+    q_norm: np.ndarray[float, ndim=1 or 2]
+        array giving the q normalization of the likelihood, shared by all
+        the scales (nmodels) or for each scale (nscales, nmodels)
+
+    icov_diag: np.ndarray[float, ndim=2 or 3]
+        array giving the diagnonal terms of the covariance matrix inverse
+
+    two_icov_offdiag: np.ndarray[float, ndim=2 or 3]
+        array giving 2x the off diagonal terms of the covariance matrix inverse
+
+    scales: np.ndarray[float, ndim=1]
+        flux scaling factors (nscales)
+
+    lnp_threshold:  float
+        cut the values outside -x, x in lnp
+
+    Returns
+    -------
+    (lnp, chi2)
+    lnP:    np.ndarray[float, ndim=2]
+            array of ln(P) values (nscales, nmodels)
+    chi2:    np.ndarray[float, ndim=2]
+            array of chi-squared values (nscales, nmodels)
+    """
+    if np.ndim(bias) == 3:
+        # noise model of each scale
+        lnP = np.zeros((len(scales), fluxmod.shape[0]))
+        _chi2 = np.zeros(lnP.shape)
+        for k, scale in enumerate(scales):
+            lnP[k], _chi2[k] = N_covar_logLikelihood(
+                flux,
+                scale * fluxmod + bias[k],
+                q_norm[k],
+                icov_diag[k],
+                two_icov_offdiag[k],
+            )
+        return (lnP, _chi2)
+
+    n_filters = fluxmod.shape[1]
+    pi_term = -0.5 * n_filters * np.log(2.0 * np.pi)
+
+    fluxdiff = flux[None, :] - bias
+    _chi2 = _scaled_chi2(
+        scales,
+        _covar_bilinear(fluxdiff, fluxdiff, icov_diag, two_icov_offdiag),
+        _covar_bilinear(fluxmod, fluxdiff, icov_diag, two_icov_offdiag),
+        _covar_bilinear(fluxmod, fluxmod, icov_diag, two_icov_offdiag),
+    )
+    lnP = pi_term + q_norm[None, :] - (0.5 * _chi2)
+
+    return (lnP, _chi2)
+
+
 def N_covar_logLikelihood_cholesky(flux, inv_cholesky_covar, lnQ, bias, fluxmod):
     """
     Compute the log-likelihood given data, a covariance matrix,
@@ -0,0 +1,277 @@
+"""
+Coarse-to-fine search of the models with significant likelihoods
+
+The posterior of a star is concentrated in a small region of the model
+grid.  The index groups the models in nested cells of neighbouring
+parameter values (age, mass, metallicity, dust and distance): a cell of
+level l spans 2**l consecutive grid values of each parameter.  Each cell
+stores bounds on the model fluxes (with the noise model bias), on the
+inverse variances and on the likelihood normalization plus prior weight,
+from which an upper bound of the lnp of its models is computed for a
+star.  Starting from the coarsest level, only the cells that can still
+reach the lnp threshold relative to the best model are refined, and the
+likelihoods are only computed for the models of the remaining finest
+cells.
+
+The pruning is exact: a skipped model has a lnp below the best lnp plus
+the threshold, so the models kept by the fitting (lnp - max(lnp) >
+threshold) are the same as with the full grid evaluation.
+"""
+import numpy as np
+
+__all__ = ["GridIndex", "INDEX_PARAMS"]
+
+# grid parameters used to group the models
+INDEX_PARAMS = ["logA", "M_ini", "Z", "Av", "Rv", "f_A", "distance"]
+
+
+def _ranges(starts, ends):
+    """ Concatenation of np.arange(start, end) for all the ranges """
+    lens = ends - starts
+    offsets = np.repeat(starts - np.cumsum(lens) + lens, lens)
+    return offsets + np.arange(np.sum(lens))
+
+
+def _cell_ids(ranks):
+    """ Index of the unique rows of the (nmodels, nparams) ranks """
+    cid = np.zeros(len(ranks), dtype=np.int64)
+    for k in range(ranks.shape[1]):
+        radix = int(ranks[:, k].max()) + 1
+        # renumber the cells if the combined index could overflow
+        if (int(cid.max()) + 1) * radix >= 2 ** 62:
+            cid = np.unique(cid, return_inverse=True)[1].reshape(-1)
+        cid = cid * radix + ranks[:, k]
+    return np.unique(cid, return_inverse=True)[1].reshape(-1)
+
+
+class _Level(object):
+    """
+    Cells of one level, in the order of the sorted models
+
+    Attributes
+    ----------
+    start, end : ndarray
+        range of each cell in the sorted models (leaf level) or in the
+        cells of the next finer level
+    first : ndarray
+        first sorted model of each cell
+    flux_min, flux_max, ivar_min : ndarray
+        (ncells, nfilters) bounds of the model fluxes and inverse variances
+    norm_max : ndarray
+        maximum of the likelihood normalization plus prior weight
+    """
+
+    def __init__(self, start, end, first, flux_min, flux_max, ivar_min, norm_max):
+        self.start = start
+        self.end = end
+        self.first = first
+        self.flux_min = flux_min
+        self.flux_max = flux_max
+        self.ivar_min = ivar_min
+        self.norm_max = norm_max
+
+    def __len__(self):
+        return len(self.start)
+
+
+class GridIndex(object):
+    """
+    Multi-resolution index of a model grid for the coarse-to-fine search
+    of the models with significant likelihoods::
+
+        index = GridIndex.from_sedgrid(sedgrid, seds_with_bias, ivar, lnp_weights)
+        lnp, chi2 = index.search(sed, threshold=-40.0)
+
+    Attributes
+    ----------
+    models : ndarray
+        indices of the indexed models in the flux and ivar arrays
+    levels : list of `_Level`
+        cell levels, from the finest (leaf) to the coarsest
+    n_evaluated : int
+        number of models with the likelihood computed in the last search
+    """
+
+    def __init__(
+        self,
+        params,
+        fluxes,
+        ivar,
+        log_weights,
+        models=None,
+        leaf_size=4,
+        max_top_cells=64,
+        n_representatives=4,
+    ):
+        """
+        Parameters
+        ----------
+        params : ndarray
+            (nmodels, nparams) grid parameter values of the indexed models
+        fluxes : ndarray
+            (ngrid, nfilters) model fluxes including the noise model bias
+        ivar : ndarray
+            (ngrid, nfilters) inverse variances of the noise model
+        log_weights : ndarray
+            log of the model (grid times prior) weights of the indexed models
+        models : ndarray, optional
+            indices of the indexed models in fluxes and ivar, default is
+            all the models
+        leaf_size : int, optional
+            the finest level is the first one with this mean number of
+            models per cell
+        max_top_cells : int, optional
+            the coarsest level is the first one with at most this number
+            of cells
+        n_representatives : int, optional
+            number of cells with the highest bounds whose first model is
+            computed at each level to update the best lnp
+        """
+        params = np.asarray(params)
+        if params.ndim == 1:
+            params = params[:, None]
+        n_models = len(params)
+        if models is None:
+            models = np.arange(n_models)
+        self.models = np.asarray(models)
+        self.fluxes = fluxes
+        self.ivar = ivar
+        self.n_representatives = n_representatives
+        self.n_evaluated = 0
+
+        # likelihood normalization (-lnQ) as for N_logLikelihood_NM
+        n_filters = fluxes.shape[1]
+        mivar = ivar[self.models]
+        lnq = n_filters * (0.5 * np.log(2.0 * np.pi))
+        self.lnq_norm = -(lnq - 0.5 * np.sum(np.log(mivar), axis=1))
+        self.log_weights = np.asarray(log_weights, dtype=float)
+
+        # rank of the models along each parameter
+        ranks = np.zeros(params.shape, dtype=np.int64)
+        for k in range(params.shape[1]):
+            ranks[:, k] = np.unique(params[:, k], return_inverse=True)[1].reshape(-1)
+        nbits = int(np.ceil(np.log2(ranks.max() + 1))) if n_models > 0 else 0
+
+        # cells of each level: neighbouring ranks merged
+        cells = [_cell_ids(ranks >> level) for level in range(nbits + 1)]
+        ncells = [cell.max() + 1 if n_models > 0 else 0 for cell in cells]
+        leaf = next(
+            (k for k, n in enumerate(ncells) if n_models >= leaf_size * n), nbits
+        )
+        top = next((k for k, n in enumerate(ncells) if n <= max_top_cells), nbits)
+        top = max(top, leaf)
+
+        # models sorted by cell, the cells of each level are contiguous
+        self.order = np.lexsort(cells[leaf : top + 1])
+        sflux = fluxes[self.models[self.order]]
+        sivar = mivar[self.order]
+        snorm = (self.lnq_norm + self.log_weights)[self.order]
+
+        self.levels = []
+        prev_starts = None
+        for level in range(leaf, top + 1):
+            scell = cells[level][self.order]
+            starts = np.flatnonzero(np.r_[True, scell[1:] != scell[:-1]])
+            if prev_starts is None:
+                # leaf: ranges of sorted models
+                cstart = starts
+                cend = np.r_[starts[1:], n_models]
+                sub = (sflux, sflux, sivar, snorm)
+            else:
+                # ranges of the cells of the finer level
+                cstart = np.searchsorted(prev_starts, starts)
+                cend = np.r_[cstart[1:], len(prev_starts)]
+                fine = self.levels[-1]
+                sub = (fine.flux_min, fine.flux_max, fine.ivar_min, fine.norm_max)
+            self.levels.append(
+                _Level(
+                    cstart,
+                    cend,
+                    starts,
+                    np.minimum.reduceat(sub[0], cstart, axis=0),
+                    np.maximum.reduceat(sub[1], cstart, axis=0),
+                    np.minimum.reduceat(sub[2], cstart, axis=0),
+                    np.maximum.reduceat(sub[3], cstart),
+                )
+            )
+            prev_starts = starts
+
+    @classmethod
+    def from_sedgrid(cls, sedgrid, fluxes, ivar, log_weights, models=None, **kwargs):
+        """
+        Index of a SED grid using the grid parameters in `INDEX_PARAMS`
+
+        Parameters
+        ----------
+        sedgrid : SEDGrid
+            model grid
+        fluxes, ivar, log_weights, models
+            see `GridIndex`
+        **kwargs
+            passed to `GridIndex`
+        """
+        if models is None:
+            models = np.arange(len(fluxes))
+        keys = [key for key in INDEX_PARAMS if key in sedgrid.keys()]
+        params = np.column_stack([np.asarray(sedgrid[key])[models] for key in keys])
+        return cls(params, fluxes, ivar, log_weights, models=models, **kwargs)
+
+    def _lnp(self, flux, spos):
+        """ lnp and chi2 of sorted models as in N_logLikelihood_NM """
+        imodels = self.order[spos]
+        rows = self.models[imodels]
+        fluxdiff = flux - self.fluxes[rows]
+        chi2 = np.einsum("ij,ij,ij->i", fluxdiff, fluxdiff, self.ivar[rows])
+        lnp = self.lnq_norm[imodels] - 0.5 * chi2
+        lnp += self.log_weights[imodels]
+        return lnp, chi2
+
+    def _upper_bound(self, flux, level, cells):
+        """ Upper bound of the lnp of the models in the cells """
+        dist = np.maximum(level.flux_min[cells] - flux, flux - level.flux_max[cells])
+        dist = np.maximum(dist, 0.0)
+        chi2_min = np.einsum("ij,ij,ij->i", dist, dist, level.ivar_min[cells])
+        return level.norm_max[cells] - 0.5 * chi2_min
+
+    def search(self, flux, threshold):
+        """
+        Likelihoods of the models that can be above the threshold
+
+        Parameters
+        ----------
+        flux : ndarray
+            observed fluxes of the star
+        threshold : float
+            (negative) log difference to the best lnp, the models below are
+            not needed
+
+        Returns
+        -------
+        lnp, chi2 : ndarray
+            lnp (including the log weights) and chi2 of the indexed models,
+            -inf and inf for the skipped models
+        """
+        best = -np.inf
+        cells = np.arange(len(self.levels[-1]))
+        for k in range(len(self.levels) - 1, -1, -1):
+            level = self.levels[k]
+            ubound = self._upper_bound(flux, level, cells)
+
+            # exact lnp of the first model of the most promising cells
+            reps = cells[np.argsort(ubound)[-self.n_representatives :]]
+            best = max(best, np.max(self._lnp(flux, level.first[reps])[0]))
+
+            # small margin for the rounding errors of the bounds
+            cut = best + threshold - 1e-8 * (1.0 + abs(best))
+            cells = cells[ubound > cut]
+            if k > 0:
+                cells = _ranges(level.start[cells], level.end[cells])
+
+        leaf = self.levels[0]
+        spos = _ranges(leaf.start[cells], leaf.end[cells])
+        self.n_evaluated = len(spos)
+
+        lnp = np.full(len(self.models), -np.inf)
+        chi2 = np.full(len(self.models), np.inf)
+        lnp[self.order[spos]], chi2[self.order[spos]] = self._lnp(flux, spos)
+        return lnp, chi2
@@ -0,0 +1,144 @@
+"""
+Background writing of the fitting outputs
+
+Saving the stats, PDFs and sparse likelihoods at each checkpoint blocks
+the fitting loop for the time of the FITS/HDF5 writes.  The writer runs
+the saves in a thread, in the order they are submitted, while the main
+thread continues with the next stars.  The queue of pending saves is
+bounded: when it is full, `submit` waits for the writer to catch up so
+that at most a few copies of the outputs are held in memory.
+"""
+import queue
+import threading
+
+__all__ = ["BackgroundWriter"]
+
+# marks the end of the jobs for the writer thread
+_STOP = object()
+
+
+class BackgroundWriter(object):
+    """
+    Run the output saves in a background thread::
+
+        with BackgroundWriter(maxsize=2) as writer:
+            for ...:
+                writer.submit(save_pdf1d, fname, writer.snapshot(vals), qnames)
+        # all the saves are done here
+
+    An error raised by a save is raised again in the main thread by the
+    next call of `submit`, `flush` or `close`, the saves submitted after
+    the failed one are skipped.
+
+    Attributes
+    ----------
+    enabled : bool
+        if False, the saves are run directly by `submit`
+    maxsize : int
+        maximum number of saves waiting in the queue
+    """
+
+    def __init__(self, maxsize=2, enabled=True):
+        self.enabled = enabled
+        self.maxsize = maxsize
+        self._error = None
+        self._thread = None
+        if enabled:
+            self._queue = queue.Queue(maxsize=maxsize)
+            self._thread = threading.Thread(
+                target=self._run, name="beast-output-writer", daemon=True
+            )
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # do not hide the original error
+            try:
+                self.close()
+            except Exception:
+                pass
+        return False
+
+    def _run(self):
+        """ Writer thread: run the saves until the stop marker """
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                if self._error is None:
+                    func, args, kwargs = job
+                    try:
+                        func(*args, **kwargs)
+                    except BaseException as err:
+                        self._error = err
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        """ Raise the error of a failed save in the calling thread """
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise RuntimeError("background save of the outputs failed") from err
+
+    def snapshot(self, vals):
+        """
+        Copy of values still modified by the main thread, needed for the
+        saves run in the background
+
+        Parameters
+        ----------
+        vals : object or list of objects with a `copy` method
+            values (e.g., ndarrays or `~beast.fitting.pdf2d.SparsePDF2D`)
+
+        Returns
+        -------
+        object or list
+            copy of the values, or the values themselves if the writer is
+            not enabled
+        """
+        if not self.enabled:
+            return vals
+        if isinstance(vals, list):
+            return [self.snapshot(cval) for cval in vals]
+        return vals.copy()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a save, waits if the queue is full
+
+        Parameters
+        ----------
+        func : function
+            save function, called as func(*args, **kwargs)
+        """
+        if not self.enabled:
+            func(*args, **kwargs)
+            return
+        if self._thread is None:
+            raise ValueError("writer is closed")
+        self._raise_error()
+        self._queue.put((func, args, kwargs))
+
+    def flush(self):
+        """
+        Wait until all the submitted saves are done
+        """
+        if self._thread is not None:
+            self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """
+        Wait until all the submitted saves are done and stop the thread
+        """
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
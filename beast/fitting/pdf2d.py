@@ -2,6 +2,11 @@
 #  spare or full nD likelihoods on the same grid of models
 import math
 import numpy as np
+from scipy import sparse
+
+from astropy.io import fits
+
+__all__ = ["pdf2d", "SparsePDF2D", "read_pdf2d"]
 
 
 class pdf2d:
@@ -146,3 +151,326 @@ class pdf2d:
                     _vals_2d[i, j] = np.sum(_tgrid[self.pdf_bin_indxs[i][j]])
 
         return _vals_2d
+
+
+class SparsePDF2D:
+    """
+    Sparse (coordinate list) storage of the 2D PDFs of many stars for one
+    pair of parameters.
+
+    Only the bins with values above a threshold relative to the peak of
+    each star's PDF are kept.  The values are stored as float32.  With the
+    default threshold of 0, all the non-zero bins are kept.
+    """
+
+    def __init__(self, bin_vals_p1, bin_vals_p2, nstars, threshold=0.0):
+        """
+        Parameters
+        ----------
+        bin_vals_p1, bin_vals_p2 : ndarray
+            1D `float` arrays with the bin values for the two parameters
+        nstars : int
+            number of stars
+        threshold : float, optional
+            bins with values <= threshold * max(pdf) are not stored
+        """
+        self.bin_vals_p1 = np.asarray(bin_vals_p1)
+        self.bin_vals_p2 = np.asarray(bin_vals_p2)
+        self.nstars = nstars
+        self.threshold = threshold
+        self._parts = []
+        self._coo = None
+
+    @property
+    def shape(self):
+        """ Shape of the equivalent dense array (nstars, nbins_p1, nbins_p2) """
+        return (self.nstars, len(self.bin_vals_p1), len(self.bin_vals_p2))
+
+    @property
+    def bins(self):
+        """
+        Bin values in the dense file layout: (2, nbins_p1, nbins_p2)
+        """
+        bins = np.zeros((2,) + self.shape[1:])
+        bins[0, :, :] = self.bin_vals_p1[:, None]
+        bins[1, :, :] = self.bin_vals_p2[None, :]
+        return bins
+
+    def add(self, star, vals_2d):
+        """
+        Store the 2D PDF of one star
+
+        Parameters
+        ----------
+        star : int
+            index of the star
+        vals_2d : ndarray
+            2D `float` array (nbins_p1, nbins_p2) with the PDF
+        """
+        vmax = vals_2d.max()
+        if vmax <= 0:
+            return
+        i1, i2 = np.nonzero(vals_2d > self.threshold * vmax)
+        self._parts.append(
+            (
+                np.full(len(i1), star, dtype=np.int32),
+                i1.astype(np.int16),
+                i2.astype(np.int16),
+                vals_2d[i1, i2].astype(np.float32),
+            )
+        )
+        self._coo = None
+
+    @classmethod
+    def from_dense(cls, pdfs, bin_vals_p1, bin_vals_p2, threshold=0.0):
+        """
+        Create from dense 2D PDFs
+
+        Parameters
+        ----------
+        pdfs : ndarray
+            (nstars, nbins_p1, nbins_p2) array with the PDFs
+        bin_vals_p1, bin_vals_p2 : ndarray
+            1D `float` arrays with the bin values for the two parameters
+        threshold : float, optional
+            bins with values <= threshold * max(pdf) are not stored
+
+        Returns
+        -------
+        spdf : SparsePDF2D
+        """
+        spdf = cls(bin_vals_p1, bin_vals_p2, len(pdfs), threshold=threshold)
+        vmax = pdfs.max(axis=(1, 2))[:, None, None]
+        star, i1, i2 = np.nonzero((pdfs > threshold * vmax) & (vmax > 0))
+        spdf._coo = (
+            star.astype(np.int32),
+            i1.astype(np.int16),
+            i2.astype(np.int16),
+            pdfs[star, i1, i2].astype(np.float32),
+        )
+        spdf._parts = [spdf._coo]
+        return spdf
+
+    def coo(self):
+        """
+        Stored entries, sorted by star
+
+        Returns
+        -------
+        star, i_p1, i_p2, prob : ndarrays
+            star index, bin indices and PDF values of the stored entries
+        """
+        if self._coo is None:
+            if len(self._parts) == 0:
+                self._coo = (
+                    np.zeros(0, dtype=np.int32),
+                    np.zeros(0, dtype=np.int16),
+                    np.zeros(0, dtype=np.int16),
+                    np.zeros(0, dtype=np.float32),
+                )
+            else:
+                cols = [np.concatenate(c) for c in zip(*self._parts)]
+                order = np.argsort(cols[0], kind="stable")
+                self._coo = tuple(c[order] for c in cols)
+                self._parts = [self._coo]
+        return self._coo
+
+    def remove_stars(self, start):
+        """
+        Remove the stored entries of the stars with index >= start
+
+        Parameters
+        ----------
+        start : int
+            first star to remove
+        """
+        keep = self.coo()[0] < start
+        self._coo = tuple(c[keep] for c in self._coo)
+        self._parts = [self._coo]
+
+    def copy(self):
+        """
+        Copy that is not changed by adding stars to this object
+
+        The stored entry arrays are never modified in place, they are
+        shared by both objects.
+
+        Returns
+        -------
+        SparsePDF2D
+            copy of the object
+        """
+        new = SparsePDF2D(
+            self.bin_vals_p1, self.bin_vals_p2, self.nstars, threshold=self.threshold
+        )
+        new._parts = list(self._parts)
+        new._coo = self._coo
+        return new
+
+    def tocsr(self):
+        """
+        PDFs as a sparse matrix with one row per star
+
+        Returns
+        -------
+        pdfs : scipy.sparse.csr_matrix
+            (nstars, nbins_p1 * nbins_p2) matrix
+        """
+        star, i1, i2, prob = self.coo()
+        nbins_p2 = self.shape[2]
+        return sparse.csr_matrix(
+            (
+                prob.astype(float),
+                (star, i1.astype(np.int64) * nbins_p2 + i2),
+            ),
+            shape=(self.nstars, self.shape[1] * nbins_p2),
+        )
+
+    def todense(self, stars=None):
+        """
+        PDFs as a dense array
+
+        Parameters
+        ----------
+        stars : int or array-like, optional
+            indices of the stars to return (default is all the stars)
+
+        Returns
+        -------
+        pdfs : ndarray
+            (nstars, nbins_p1, nbins_p2) array, or (nbins_p1, nbins_p2)
+            if stars is an int
+        """
+        pdfs = self.tocsr()
+        if stars is not None:
+            pdfs = pdfs[np.atleast_1d(stars)]
+        pdfs = pdfs.toarray().reshape((-1,) + self.shape[1:])
+        if np.isscalar(stars):
+            pdfs = pdfs[0]
+        return pdfs
+
+    def to_hdus(self, name):
+        """
+        FITS extensions with the sparse PDFs and the bin values
+
+        Parameters
+        ----------
+        name : str
+            parameter pair name (e.g., "Av+M_ini")
+
+        Returns
+        -------
+        hdus : list
+            binary table with the PDF entries (EXTNAME = name) and image
+            with the concatenated bin values (EXTNAME = name + "_BINS")
+        """
+        star, i1, i2, prob = self.coo()
+        hdu = fits.BinTableHDU.from_columns(
+            [
+                fits.Column(name="star", format="J", array=star),
+                fits.Column(name="i_p1", format="I", array=i1),
+                fits.Column(name="i_p2", format="I", array=i2),
+                fits.Column(name="prob", format="E", array=prob),
+            ]
+        )
+        # set directly to keep the case of the parameter names
+        hdu.header["EXTNAME"] = name
+        hdu.header["PDF2DFMT"] = "SPARSE"
+        hdu.header["NSTARS"] = self.nstars
+        hdu.header["NBINS1"] = self.shape[1]
+        hdu.header["NBINS2"] = self.shape[2]
+        hdu.header["PTHRESH"] = self.threshold
+        bhdu = fits.ImageHDU(np.concatenate([self.bin_vals_p1, self.bin_vals_p2]))
+        bhdu.header["EXTNAME"] = name + "_BINS"
+        return [hdu, bhdu]
+
+    @classmethod
+    def from_hdus(cls, hdu, bhdu):
+        """
+        Create from the FITS extensions written by `to_hdus`
+
+        Parameters
+        ----------
+        hdu : `~astropy.io.fits.BinTableHDU`
+            table with the PDF entries
+        bhdu : `~astropy.io.fits.ImageHDU`
+            image with the bin values
+
+        Returns
+        -------
+        spdf : SparsePDF2D
+        """
+        nbins_p1 = hdu.header["NBINS1"]
+        spdf = cls(
+            bhdu.data[:nbins_p1],
+            bhdu.data[nbins_p1:],
+            hdu.header["NSTARS"],
+            threshold=hdu.header["PTHRESH"],
+        )
+        data = hdu.data
+        spdf._coo = (
+            np.array(data["star"], dtype=np.int32),
+            np.array(data["i_p1"], dtype=np.int16),
+            np.array(data["i_p2"], dtype=np.int16),
+            np.array(data["prob"], dtype=np.float32),
+        )
+        spdf._parts = [spdf._coo]
+        return spdf
+
+
+def read_pdf2d(filename, qname_pairs=None, stars=None, as_sparse=False):
+    """
+    Read 2D PDFs saved in either the dense or the sparse format
+
+    Parameters
+    ----------
+    filename : str
+        name of the 2D PDF file
+    qname_pairs : list of str, optional
+        parameter pairs to read (e.g., ["Av+M_ini"]), default is all
+    stars : int or array-like, optional
+        indices of the stars to read, default is all
+    as_sparse : bool, optional
+        return the PDFs as a `scipy.sparse.csr_matrix` with shape
+        (nstars, nbins_p1 * nbins_p2) instead of a dense array
+
+    Returns
+    -------
+    pdf2d_data : dict
+        PDFs for each pair, dense arrays have the shape
+        (nstars, nbins_p1, nbins_p2), or (nbins_p1, nbins_p2) if stars is an int
+    pdf2d_bins : dict
+        bin values for each pair, shape (2, nbins_p1, nbins_p2)
+    """
+    pdf2d_data = {}
+    pdf2d_bins = {}
+    with fits.open(filename) as hdul:
+        for ext in hdul[1:]:
+            name = ext.name
+            if "+" not in name or name.endswith("_BINS"):
+                continue
+            if qname_pairs is not None and name not in qname_pairs:
+                continue
+
+            if ext.header.get("PDF2DFMT", "DENSE") == "SPARSE":
+                spdf = SparsePDF2D.from_hdus(ext, hdul[name + "_BINS"])
+                pdf2d_bins[name] = spdf.bins
+                if as_sparse:
+                    pdfs = spdf.tocsr()
+                    if stars is not None:
+                        pdfs = pdfs[np.atleast_1d(stars)]
+                else:
+                    pdfs = spdf.todense(stars)
+            else:
+                pdf2d_bins[name] = np.array(ext.data[-2:, :, :])
+                if stars is None:
+                    pdfs = np.array(ext.data[:-2, :, :])
+                else:
+                    pdfs = np.array(ext.data[stars, :, :])
+                if as_sparse:
+                    pdfs = sparse.csr_matrix(
+                        pdfs.reshape(-1, pdfs.shape[-2] * pdfs.shape[-1])
+                    )
+            pdf2d_data[name] = pdfs
+
+    return pdf2d_data, pdf2d_bins
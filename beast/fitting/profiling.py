@@ -0,0 +1,196 @@
+"""
+Per-stage timing and memory profiling of the fitting loop
+
+The fitting of each star goes through a sequence of stages (likelihood,
+normalization, lnp sparsification, stats, 1D and 2D PDFs, file output).
+The profiler measures the wall time between successive calls of `lap`,
+so the instrumented code is not restructured and a disabled profiler
+costs one method call per stage.  The memory recorded is the peak resident
+set size of the whole process so far (``process_peak_rss_mb``), as given
+by the operating system: it is cumulative and never decreases, a stage
+or chunk increasing it shows that the process reached a new peak there.
+"""
+import os
+import sys
+import json
+import time
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+__all__ = ["StageProfiler", "profile_fname"]
+
+
+def _process_peak_rss_mb():
+    """
+    Peak resident set size of the process since it started [MB], None if
+    unknown
+    """
+    if resource is None:  # pragma: no cover
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    if sys.platform == "darwin":  # pragma: no cover
+        return maxrss / 1024.0 ** 2
+    return maxrss / 1024.0
+
+
+def profile_fname(stats_outname):
+    """
+    Name of the profile report saved next to a stats file
+
+    Parameters
+    ----------
+    stats_outname : str
+        name of the stats file (e.g., proj/proj_stats.fits)
+
+    Returns
+    -------
+    str
+        name of the JSON report (e.g., proj/proj_stats_profile.json)
+    """
+    return os.path.splitext(stats_outname)[0] + "_profile.json"
+
+
+class StageProfiler(object):
+    """
+    Wall time and number of calls of the stages of a run, in total and
+    per chunk of stars, with the peak memory of the process::
+
+        prof = StageProfiler(chunk_size=1000)
+        prof.start()
+        ...                     # setup
+        prof.lap("setup")
+        for e in range(nstars):
+            prof.star(e)
+            ...                 # likelihood
+            prof.lap("likelihood")
+            ...
+        prof.write("proj_stats_profile.json")
+
+    Attributes
+    ----------
+    enabled : bool
+        if False, nothing is recorded
+    chunk_size : int
+        number of stars of the chunks
+    stages : OrderedDict
+        time [s], number of calls and peak RSS of the process [MB] at the
+        end of the last call of each stage
+    chunks : OrderedDict
+        first star, number of stars, time [s] per stage and peak RSS of
+        the process [MB] at the end of each chunk of stars
+    """
+
+    def __init__(self, enabled=True, chunk_size=1000):
+        self.enabled = enabled
+        self.chunk_size = chunk_size
+        self.stages = OrderedDict()
+        self.chunks = OrderedDict()
+        self._chunk = None
+        self._start = time.perf_counter()
+        self._last = self._start
+
+    def start(self):
+        """
+        Start (or restart) the clock of the next stage
+        """
+        if self.enabled:
+            self._last = time.perf_counter()
+
+    def star(self, star):
+        """
+        Start the stages of a star, the stars are grouped in chunks
+
+        Parameters
+        ----------
+        star : int
+            index of the star
+        """
+        if not self.enabled:
+            return
+        ichunk = star // self.chunk_size
+        chunk = self.chunks.get(ichunk)
+        if chunk is None:
+            chunk = {"first_star": star, "nstars": 0, "stages": OrderedDict()}
+            self.chunks[ichunk] = chunk
+        chunk["nstars"] += 1
+        self._chunk = chunk
+        self._last = time.perf_counter()
+
+    def end_stars(self):
+        """
+        Stages recorded after this are not part of a chunk of stars
+        """
+        self._chunk = None
+
+    def lap(self, name):
+        """
+        Record the time since the last call as spent in a stage
+
+        Parameters
+        ----------
+        name : str
+            name of the stage
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        dtime = now - self._last
+        self._last = now
+
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = {"time": 0.0, "calls": 0, "process_peak_rss_mb": None}
+            self.stages[name] = stage
+        stage["time"] += dtime
+        stage["calls"] += 1
+        stage["process_peak_rss_mb"] = _process_peak_rss_mb()
+
+        if self._chunk is not None:
+            chunk_stages = self._chunk["stages"]
+            chunk_stages[name] = chunk_stages.get(name, 0.0) + dtime
+            self._chunk["process_peak_rss_mb"] = stage["process_peak_rss_mb"]
+
+    def report(self):
+        """
+        Summary of the recorded stages and chunks
+
+        Returns
+        -------
+        dict
+            total time, stages (with the fraction of the total time) and
+            chunks (with their total time) in a JSON serializable form
+        """
+        total = sum(stage["time"] for stage in self.stages.values())
+        stages = OrderedDict()
+        for name, stage in self.stages.items():
+            stages[name] = dict(stage)
+            stages[name]["fraction"] = stage["time"] / total if total > 0 else 0.0
+        chunks = []
+        for ichunk, chunk in self.chunks.items():
+            cchunk = {"chunk": ichunk}
+            cchunk.update(chunk)
+            cchunk["time"] = sum(chunk["stages"].values())
+            chunks.append(cchunk)
+        return {
+            "total_time": total,
+            "chunk_size": self.chunk_size,
+            "stages": stages,
+            "chunks": chunks,
+        }
+
+    def write(self, fname):
+        """
+        Save the report as a JSON file
+
+        Parameters
+        ----------
+        fname : str
+            name of the file
+        """
+        with open(fname, "w") as f:
+            json.dump(self.report(), f, indent=2)
@@ -0,0 +1,371 @@
+"""
+On-demand access to the BEAST fitting outputs
+
+The stats, 1D PDF, 2D PDF and sparse likelihood (lnp) files are opened
+lazily and only the requested stars are read: the FITS files are memory
+mapped and read by sections of rows, the lnp HDF5 file is read per star.
+The decoded blocks of stars are kept in a least recently used cache so
+that looking at many stars close to each other does not read the files
+again.
+"""
+import os
+from bisect import bisect_left
+from collections import OrderedDict
+
+import numpy as np
+import h5py
+from astropy.io import fits
+from astropy.table import Table
+
+__all__ = ["BeastResults"]
+
+
+class BeastResults(object):
+    """
+    Lazy, per-star access to the outputs of a BEAST fitting run
+
+    Can be used as a context manager to close the files::
+
+        with BeastResults.from_filebase("proj/proj") as res:
+            bins, pdf = res.pdf1d("Av", 12345)
+            stats = res.stats(12345, columns=["Av_p50", "M_ini_p50"])
+
+    Attributes
+    ----------
+    block_size : int
+        number of stars read (and cached) together from the PDF files
+
+    cache_size : int
+        maximum number of blocks kept in memory, the least recently used
+        block is evicted when exceeded
+
+    hits, misses : int
+        number of block requests served from the cache and read from disk
+    """
+
+    def __init__(
+        self,
+        stats_fname=None,
+        pdf1d_fname=None,
+        pdf2d_fname=None,
+        lnp_fname=None,
+        block_size=64,
+        cache_size=32,
+    ):
+        """
+        Parameters
+        ----------
+        stats_fname, pdf1d_fname, pdf2d_fname, lnp_fname : str, optional
+            names of the stats, 1D PDF, 2D PDF (dense or sparse) and sparse
+            likelihood files, the files are only opened when first needed
+        block_size : int, optional
+            number of stars read together from the PDF files
+        cache_size : int, optional
+            maximum number of blocks kept in memory
+        """
+        self.fnames = {
+            "stats": stats_fname,
+            "pdf1d": pdf1d_fname,
+            "pdf2d": pdf2d_fname,
+            "lnp": lnp_fname,
+        }
+        self.block_size = block_size
+        self.cache_size = cache_size
+        self._files = {}
+        self._blocks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_filebase(cls, filebase, **kwargs):
+        """
+        Results from the standard file names of a run
+        ({filebase}_stats.fits, _pdf1d.fits, _pdf2d.fits and _lnp.hd5),
+        only the existing files are used
+
+        Parameters
+        ----------
+        filebase : str
+            base of the output file names (e.g., "project/project")
+        **kwargs
+            passed to the constructor
+        """
+        fnames = {}
+        for ftype, suffix in [
+            ("stats", "stats.fits"),
+            ("pdf1d", "pdf1d.fits"),
+            ("pdf2d", "pdf2d.fits"),
+            ("lnp", "lnp.hd5"),
+        ]:
+            fname = f"{filebase}_{suffix}"
+            fnames[f"{ftype}_fname"] = fname if os.path.isfile(fname) else None
+        return cls(**fnames, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        Close the open files and empty the cache
+        """
+        for cfile in self._files.values():
+            cfile.close()
+        self._files = {}
+        self._blocks.clear()
+
+    def _open(self, ftype):
+        """ Open file of a given type when first needed """
+        if ftype not in self._files:
+            fname = self.fnames[ftype]
+            if fname is None:
+                raise ValueError(f"no {ftype} file given")
+            if ftype == "lnp":
+                self._files[ftype] = h5py.File(fname, "r")
+            else:
+                self._files[ftype] = fits.open(fname, memmap=True)
+        return self._files[ftype]
+
+    def _cached(self, key, read_func):
+        """ Block from the cache, or read and stored in the cache """
+        if key in self._blocks:
+            self._blocks.move_to_end(key)
+            self.hits += 1
+            return self._blocks[key]
+        self.misses += 1
+        block = read_func()
+        self._blocks[key] = block
+        if len(self._blocks) > self.cache_size:
+            self._blocks.popitem(last=False)
+        return block
+
+    def _star_rows(self, kind, name, star, read_rows):
+        """
+        Rows of a star from the block of stars containing it
+
+        read_rows(k1, k2) returns the rows of the stars k1 to k2 - 1
+        """
+        star = int(star)
+        if star < 0:
+            raise IndexError("star index must be positive")
+        iblock = star // self.block_size
+        block = self._cached(
+            (kind, name, iblock),
+            lambda: read_rows(
+                iblock * self.block_size, (iblock + 1) * self.block_size
+            ),
+        )
+        return block[star - iblock * self.block_size]
+
+    @property
+    def nstars(self):
+        """ Number of stars in the outputs """
+        if self.fnames["stats"] is not None:
+            return self._open("stats")[1].header["NAXIS2"]
+        hdul = self._open("pdf1d")
+        if hdul[1].header["NAXIS"] == 2:
+            return hdul[1].header["NAXIS2"] - 1
+        return hdul[1].header["NAXIS3"]
+
+    # stats
+
+    @property
+    def stats_columns(self):
+        """ Names of the columns of the stats file """
+        return list(self._open("stats")[1].columns.names)
+
+    @property
+    def filter_info(self):
+        """
+        Filter names and wavelengths from the stats file, None for older
+        stats files without them
+        """
+        hdul = self._open("stats")
+        if len(hdul) < 3:
+            return None
+        return Table(hdul[2].data)
+
+    def stats(self, stars=None, columns=None):
+        """
+        Fit statistics of stars
+
+        Parameters
+        ----------
+        stars : int or array-like, optional
+            indices of the stars, default is all the stars
+        columns : list of str, optional
+            columns to read, default is all the columns
+
+        Returns
+        -------
+        stats : astropy Table
+            table with one row for each requested star
+        """
+        data = self._open("stats")[1].data
+        if columns is None:
+            columns = data.columns.names
+        if stars is None:
+            rows = slice(None)
+        else:
+            rows = np.atleast_1d(stars)
+        return Table({cname: np.array(data.field(cname)[rows]) for cname in columns})
+
+    # 1D PDFs
+
+    @property
+    def pdf1d_names(self):
+        """ Parameters with 1D PDFs """
+        return [ext.name for ext in self._open("pdf1d")[1:]]
+
+    def pdf1d(self, qname, star):
+        """
+        1D PDF of a star
+
+        Parameters
+        ----------
+        qname : str
+            parameter name
+        star : int
+            index of the star
+
+        Returns
+        -------
+        bins, vals : ndarray
+            bin values and PDF
+        """
+        hdu = self._open("pdf1d")[qname]
+        if hdu.header["NAXIS"] == 2:
+            nstars = hdu.header["NAXIS2"] - 1
+            if star >= nstars:
+                raise IndexError(f"star {star} not in the 1D PDFs ({nstars} stars)")
+            bins = self._cached(
+                ("pdf1d_bins", qname, 0), lambda: np.array(hdu.section[nstars, :])
+            )
+            vals = self._star_rows(
+                "pdf1d",
+                qname,
+                star,
+                lambda k1, k2: np.array(hdu.section[k1 : min(k2, nstars), :]),
+            )
+            return bins, vals
+        else:
+            # older format with the bins of each star
+            #   (nstars, nbins, 2) with the PDF and bin values
+            pdf = self._star_rows(
+                "pdf1d",
+                qname,
+                star,
+                lambda k1, k2: np.array(hdu.section[k1:k2, :, :]),
+            )
+            return pdf[:, 1], pdf[:, 0]
+
+    # 2D PDFs
+
+    @property
+    def pdf2d_names(self):
+        """ Parameter pairs with 2D PDFs """
+        return [
+            ext.name
+            for ext in self._open("pdf2d")[1:]
+            if "+" in ext.name and not ext.name.endswith("_BINS")
+        ]
+
+    def pdf2d(self, qname_pair, star):
+        """
+        2D PDF of a star, from the dense or sparse 2D PDF files
+
+        Parameters
+        ----------
+        qname_pair : str
+            parameter pair (e.g., "Av+M_ini")
+        star : int
+            index of the star
+
+        Returns
+        -------
+        bins : ndarray
+            (2, nbins_p1, nbins_p2) bin values of both parameters
+        vals : ndarray
+            (nbins_p1, nbins_p2) PDF
+        """
+        hdul = self._open("pdf2d")
+        hdu = hdul[qname_pair]
+        if hdu.header.get("PDF2DFMT", "DENSE") == "SPARSE":
+            return self._sparse_pdf2d(hdul, hdu, qname_pair, star)
+
+        nstars = hdu.header["NAXIS3"] - 2
+        if star >= nstars:
+            raise IndexError(f"star {star} not in the 2D PDFs ({nstars} stars)")
+        bins = self._cached(
+            ("pdf2d_bins", qname_pair, 0),
+            lambda: np.array(hdu.section[nstars : nstars + 2, :, :]),
+        )
+        vals = self._star_rows(
+            "pdf2d",
+            qname_pair,
+            star,
+            lambda k1, k2: np.array(hdu.section[k1 : min(k2, nstars), :, :]),
+        )
+        return bins, vals
+
+    def _sparse_pdf2d(self, hdul, hdu, qname_pair, star):
+        """ 2D PDF of a star from the sparse format """
+        nstars = hdu.header["NSTARS"]
+        if star >= nstars:
+            raise IndexError(f"star {star} not in the 2D PDFs ({nstars} stars)")
+        nbins_p1 = hdu.header["NBINS1"]
+        nbins_p2 = hdu.header["NBINS2"]
+
+        def read_bins():
+            bin_vals = np.array(hdul[qname_pair + "_BINS"].data)
+            bins = np.zeros((2, nbins_p1, nbins_p2))
+            bins[0, :, :] = bin_vals[:nbins_p1, None]
+            bins[1, :, :] = bin_vals[None, nbins_p1:]
+            return bins
+
+        def read_rows(k1, k2):
+            # the entries are sorted by star: binary search of the rows of
+            #   the block in the memory mapped star column
+            data = hdu.data
+            star_col = data.field("star")
+            r1 = bisect_left(star_col, k1)
+            r2 = bisect_left(star_col, k2, lo=r1)
+            stars = np.array(star_col[r1:r2]) - k1
+            i1 = np.array(data.field("i_p1")[r1:r2])
+            i2 = np.array(data.field("i_p2")[r1:r2])
+            prob = np.array(data.field("prob")[r1:r2], dtype=float)
+            pdfs = np.zeros((min(k2, nstars) - k1, nbins_p1, nbins_p2))
+            pdfs[stars, i1, i2] = prob
+            return pdfs
+
+        bins = self._cached(("pdf2d_bins", qname_pair, 0), read_bins)
+        vals = self._star_rows("pdf2d", qname_pair, star, read_rows)
+        return bins, vals
+
+    # sparse likelihoods
+
+    def lnp(self, star):
+        """
+        Sparse likelihood of a star
+
+        Parameters
+        ----------
+        star : int
+            index of the star
+
+        Returns
+        -------
+        lnp : dict
+            model grid indices (idx), log likelihoods (lnp) and chi2 values
+            (chi2) saved for the star
+        """
+        lnp_file = self._open("lnp")
+
+        def read_star():
+            sgroup = lnp_file[f"star_{int(star)}"]
+            return {ckey: np.array(sgroup[ckey]) for ckey in ["idx", "lnp", "chi2"]}
+
+        return self._cached(("lnp", None, int(star)), read_star)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from beast.fitting.fit_metrics.likelihood import (
+    N_covar_chi2,
+    N_covar_chi2_packed,
+    pack_icov,
+)
+
+
+def _icov_terms(rng, n_models, n_filters):
+    """ Random inverse covariance matrices and their diag/offdiag terms """
+    a = rng.normal(0.0, 1.0, (n_models, n_filters, n_filters))
+    icov = np.einsum("ijk,ilk->ijl", a, a) + n_filters * np.eye(n_filters)
+    k1, k2 = np.triu_indices(n_filters, k=1)
+    icov_diag = np.diagonal(icov, axis1=1, axis2=2).copy()
+    two_icov_offdiag = 2.0 * icov[:, k1, k2]
+    return icov, icov_diag, two_icov_offdiag
+
+
+@pytest.mark.parametrize("block_size", [None, 7])
+def test_covar_chi2(block_size):
+    rng = np.random.default_rng(1)
+    n_models, n_filters, n_stars = 50, 8, 3
+    icov, icov_diag, two_icov_offdiag = _icov_terms(rng, n_models, n_filters)
+    fluxmod = np.asfortranarray(rng.normal(1.0, 0.1, (n_models, n_filters)))
+    fluxes = rng.normal(1.0, 0.1, (n_stars, n_filters))
+
+    # explicit d^T C^-1 d
+    fluxdiff = fluxes[:, None, :] - fluxmod[None, :, :]
+    chi2 = np.einsum("sij,ijk,sik->si", fluxdiff, icov, fluxdiff)
+
+    icov_packed = pack_icov(icov_diag, two_icov_offdiag)
+    assert icov_packed.shape == (n_models, n_filters * (n_filters + 1) // 2)
+
+    # one star and a batch of stars
+    np.testing.assert_allclose(
+        N_covar_chi2(fluxes[0], fluxmod, icov_diag, two_icov_offdiag, block_size),
+        chi2[0],
+    )
+    np.testing.assert_allclose(
+        N_covar_chi2(fluxes, fluxmod, icov_diag, two_icov_offdiag, block_size), chi2
+    )
+    np.testing.assert_allclose(
+        N_covar_chi2_packed(fluxes[0], fluxmod, icov_packed, block_size), chi2[0]
+    )
+    np.testing.assert_allclose(
+        N_covar_chi2_packed(fluxes, fluxmod, icov_packed, block_size), chi2
+    )
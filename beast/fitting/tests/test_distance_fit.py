@@ -0,0 +1,173 @@
+import numpy as np
+import pytest
+from astropy import units
+from astropy.io import fits
+from astropy.table import Table
+
+from beast.physicsmodel.grid import SpectralGrid, SEDGrid
+from beast.physicsmodel.creategrid import apply_distance_grid
+from beast.physicsmodel.grid_and_prior_weights import compute_distance_weights
+from beast.fitting.fit import Q_all_memory
+from beast.tests.helpers import FitObservations
+
+
+def _noisemodel(rng, seds, scales, per_distance, covariance):
+    """ Noise model of the grid without distances and with the distances """
+    n_dist = len(scales)
+    n_models, n_filters = seds.shape
+    if per_distance:
+        fluxes = scales[:, None, None] * seds[None, :, :]
+        rshape = fluxes.shape
+    else:
+        # same noise for all the models, valid at all the distances
+        fluxes = np.tile(np.mean(scales) * np.median(seds, axis=0), (n_models, 1))
+        rshape = fluxes.shape[1:]
+    noise = {
+        "bias": 0.02 * fluxes * rng.normal(size=rshape),
+        "error": 0.1 * fluxes,
+        "completeness": np.ones(fluxes.shape),
+    }
+    if covariance:
+        npairs = n_filters * (n_filters - 1) // 2
+        noise["icov_diag"] = 1.0 / noise["error"] ** 2
+        noise["icov_offdiag"] = (
+            0.1
+            * rng.random(rshape[:-1] + (npairs,))
+            * np.min(noise["icov_diag"], axis=-1)[..., None]
+        )
+        noise["q_norm"] = np.broadcast_to(
+            rng.normal(size=rshape[:-1]), fluxes.shape[:-1]
+        ).copy()
+
+    # same noise model for the grid with the distances applied
+    full_noise = {}
+    for ckey, cvals in noise.items():
+        if per_distance:
+            full_noise[ckey] = cvals.reshape((n_dist * n_models,) + cvals.shape[2:])
+        else:
+            full_noise[ckey] = np.concatenate([cvals] * n_dist)
+    return noise, full_noise
+
+
+@pytest.mark.parametrize("covariance", [False, True])
+@pytest.mark.parametrize("per_distance", [False, True])
+def test_distance_fit(tmp_path, per_distance, covariance):
+    rng = np.random.default_rng(3)
+    n_models, nstars = 400, 6
+    filters = ["F1", "F2", "F3"]
+    lamb = np.arange(1.0, 4.0)
+    base = Table(
+        {
+            "Av": rng.integers(0, 10, n_models) * 0.5,
+            "logA": rng.integers(0, 20, n_models) * 0.1 + 7.0,
+            "M_ini": 10 ** rng.uniform(0, 1, n_models),
+            "weight": rng.random(n_models),
+            "specgrid_indx": np.arange(n_models),
+        }
+    )
+    # seds at 10 pc
+    seds = 10 ** rng.uniform(-8, -6, (n_models, len(filters)))
+
+    # grid with the distances applied and their weights
+    distances = np.array([40e3, 50e3, 60e3, 70e3]) * units.pc
+    dist_prior = {
+        "name": "absexponential",
+        "dist0": 55 * units.kpc,
+        "tau": 5 * units.kpc,
+        "amp": 1.0,
+    }
+    specgrid = apply_distance_grid(
+        SpectralGrid(lamb, seds=seds, grid=base, backend="memory"), distances
+    )
+    grid_weights, prior_weights = compute_distance_weights(
+        distances.value, distance_prior_model=dist_prior
+    )
+    specgrid.grid["weight"] = np.tile(base["weight"], len(distances)) * np.repeat(
+        grid_weights * prior_weights / len(distances), n_models
+    )
+    fullgrid = SEDGrid(lamb, seds=specgrid.seds, grid=specgrid.grid, backend="memory")
+    fullgrid.header["filters"] = " ".join(filters)
+    grid = SEDGrid(lamb, seds=seds, grid=base, backend="memory")
+    grid.header["filters"] = " ".join(filters)
+
+    scales = (10.0 / distances.value) ** 2
+    noise, full_noise = _noisemodel(rng, seds, scales, per_distance, covariance)
+    istars = rng.integers(0, len(fullgrid.seds), nstars)
+    obs = FitObservations(
+        fullgrid.seds[istars] * (1 + 0.1 * rng.normal(size=(nstars, 3))), filters
+    )
+
+    # same results from the grid with the distances and the distances
+    #   applied on the fly
+    fly_kwargs = {"distances": distances, "distance_prior_model": dist_prior}
+    for base_name, cgrid, cnoise, kwargs in [
+        ("full", fullgrid, full_noise, {}),
+        ("fly", grid, noise, fly_kwargs),
+    ]:
+        out = str(tmp_path / base_name)
+        Q_all_memory(
+            {"Name": np.array([f"star{k}" for k in range(nstars)])},
+            obs,
+            cgrid,
+            cnoise,
+            ["Av", "logA", "M_ini", "distance"],
+            stats_outname=f"{out}_stats.fits",
+            pdf1d_outname=f"{out}_pdf1d.fits",
+            pdf2d_outname=f"{out}_pdf2d.fits",
+            pdf2d_param_list=["Av", "logA", "distance"],
+            **kwargs,
+        )
+
+    full_stats = Table.read(str(tmp_path / "full_stats.fits"), hdu=1)
+    fly_stats = Table.read(str(tmp_path / "fly_stats.fits"), hdu=1)
+    assert full_stats.colnames == fly_stats.colnames
+    for cname in full_stats.colnames:
+        if cname.endswith("_indx") or cname == "Name":
+            np.testing.assert_array_equal(full_stats[cname], fly_stats[cname])
+        else:
+            np.testing.assert_allclose(full_stats[cname], fly_stats[cname], rtol=1e-7)
+    assert len(np.unique(fly_stats["distance_Best"])) > 1
+
+    for suffix in ["pdf1d", "pdf2d"]:
+        with fits.open(str(tmp_path / f"full_{suffix}.fits")) as full_hdul, fits.open(
+            str(tmp_path / f"fly_{suffix}.fits")
+        ) as fly_hdul:
+            assert len(full_hdul) == len(fly_hdul)
+            for full_hdu, fly_hdu in zip(full_hdul, fly_hdul):
+                np.testing.assert_allclose(
+                    full_hdu.data, fly_hdu.data, rtol=1e-7, atol=1e-12
+                )
+
+
+def test_distance_fit_shared_noise():
+    rng = np.random.default_rng(5)
+    n_models, nstars = 50, 2
+    filters = ["F1", "F2", "F3"]
+    lamb = np.arange(1.0, 4.0)
+    base = Table(
+        {
+            "Av": rng.integers(0, 10, n_models) * 0.5,
+            "weight": rng.random(n_models),
+            "specgrid_indx": np.arange(n_models),
+        }
+    )
+    seds = 10 ** rng.uniform(-8, -6, (n_models, len(filters)))
+    grid = SEDGrid(lamb, seds=seds, grid=base, backend="memory")
+    grid.header["filters"] = " ".join(filters)
+    obs = FitObservations(seds[:nstars] * 1e-7, filters)
+
+    # noise model depending on the model fluxes, not valid at other distances
+    noise = {
+        "bias": 0.02 * seds,
+        "error": 0.1 * seds,
+        "completeness": np.ones(seds.shape),
+    }
+    with pytest.raises(ValueError, match="for each distance"):
+        Q_all_memory(
+            {"Name": np.array([f"star{k}" for k in range(nstars)])},
+            obs,
+            grid,
+            noise,
+            ["Av"],
+            distances=[30e3, 40e3],
+        )
@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+import h5py
+from astropy.io import fits
+from astropy.table import Table
+
+from beast.physicsmodel.grid import SEDGrid
+from beast.fitting.fit import Q_all_memory
+from beast.fitting.fit_metrics.likelihood import N_logLikelihood_NM
+from beast.fitting.grid_index import GridIndex
+from beast.tests.helpers import FitObservations
+
+
+@pytest.fixture
+def fit_inputs():
+    """
+    Grid with fluxes depending on the parameters, noise model and stars
+    """
+    rng = np.random.default_rng(8)
+    filters = ["F1", "F2", "F3", "F4"]
+    logA, M_ini, Av, Z = np.meshgrid(
+        np.arange(6.0, 10.0, 0.25),
+        np.linspace(0.5, 30.0, 40),
+        np.arange(0.0, 4.0, 0.5),
+        [0.004, 0.008, 0.02],
+        indexing="ij",
+    )
+    logA, M_ini, Av, Z = [x.ravel() for x in [logA, M_ini, Av, Z]]
+    n_models = len(logA)
+    gtable = Table(
+        {
+            "logA": logA,
+            "M_ini": M_ini,
+            "Av": Av,
+            "Z": Z,
+            "weight": rng.uniform(0.5, 1.0, n_models),
+            "specgrid_indx": np.arange(n_models),
+        }
+    )
+    # brighter for massive, young and less extinguished stars, redder
+    #   for older and more extinguished stars
+    color = 0.3 * (logA - 8.0) + 0.2 * Av
+    logflux = (
+        -17.0
+        + 2.5 * np.log10(M_ini)[:, None]
+        - 0.4 * (logA - 6.0)[:, None]
+        - 0.3 * Av[:, None]
+        + color[:, None] * np.linspace(-0.5, 0.5, len(filters))
+        + 10 * Z[:, None]
+    )
+    seds = 10 ** logflux
+    sedgrid = SEDGrid(np.arange(1.0, 5.0), seds=seds, grid=gtable, backend="memory")
+    sedgrid.header["filters"] = " ".join(filters)
+    noisemodel = {
+        "bias": 0.01 * seds,
+        "error": 0.05 * seds + 1e-19,
+        "completeness": np.ones_like(seds),
+    }
+    istars = rng.integers(0, n_models, 8)
+    obs = FitObservations(
+        seds[istars] * (1 + 0.05 * rng.normal(size=(8, len(filters)))), filters
+    )
+    return sedgrid, noisemodel, obs
+
+
+def test_grid_index_search(fit_inputs):
+    sedgrid, noisemodel, obs = fit_inputs
+    fluxes = sedgrid.seds + noisemodel["bias"]
+    ivar = 1.0 / noisemodel["error"] ** 2
+    models = np.arange(0, len(fluxes), 2)
+    log_weights = np.log(sedgrid["weight"][models])
+    index = GridIndex.from_sedgrid(
+        sedgrid, fluxes, ivar, log_weights, models=models, leaf_size=4, max_top_cells=8
+    )
+    assert len(index.levels) == 4
+    assert len(index.levels[0]) < len(models)
+
+    threshold = -10.0
+    for k, sed in obs.enumobs():
+        lnp_full, chi2_full = N_logLikelihood_NM(sed, fluxes, ivar)
+        lnp_full = lnp_full[models] + log_weights
+        chi2_full = chi2_full[models]
+
+        lnp, chi2 = index.search(sed, threshold)
+        assert index.n_evaluated < len(models) / 2
+
+        # same selected models with the same likelihoods
+        (indx_full,) = np.where(lnp_full - lnp_full.max() > threshold)
+        (indx,) = np.where(lnp - lnp.max() > threshold)
+        np.testing.assert_array_equal(indx, indx_full)
+        np.testing.assert_allclose(lnp[indx], lnp_full[indx], rtol=1e-12)
+        np.testing.assert_allclose(chi2[indx], chi2_full[indx], rtol=1e-12)
+
+        # skipped models are below the threshold
+        skipped = ~np.isfinite(lnp)
+        assert np.all(lnp_full[skipped] - lnp_full.max() <= threshold)
+
+
+def test_hierarchical_fit(fit_inputs, tmp_path):
+    sedgrid, noisemodel, obs = fit_inputs
+    nstars = len(obs)
+    for grid_search in ["full", "hierarchical"]:
+        out = str(tmp_path / grid_search)
+        Q_all_memory(
+            {"Name": np.array([f"star{k}" for k in range(nstars)])},
+            obs,
+            sedgrid,
+            noisemodel,
+            ["logA", "Av", "Z"],
+            stats_outname=f"{out}_stats.fits",
+            pdf1d_outname=f"{out}_pdf1d.fits",
+            lnp_outname=f"{out}_lnp.hd5",
+            threshold=-20.0,
+            grid_search=grid_search,
+        )
+
+    full_stats = Table.read(str(tmp_path / "full_stats.fits"), hdu=1)
+    stats = Table.read(str(tmp_path / "hierarchical_stats.fits"), hdu=1)
+    for cname in full_stats.colnames:
+        if cname.endswith("_indx") or cname == "Name":
+            np.testing.assert_array_equal(stats[cname], full_stats[cname])
+        else:
+            np.testing.assert_allclose(stats[cname], full_stats[cname], rtol=1e-10)
+
+    with fits.open(str(tmp_path / "full_pdf1d.fits")) as full_hdul, fits.open(
+        str(tmp_path / "hierarchical_pdf1d.fits")
+    ) as hdul:
+        for full_hdu, hdu in zip(full_hdul, hdul):
+            np.testing.assert_allclose(hdu.data, full_hdu.data, rtol=1e-10)
+
+    with h5py.File(str(tmp_path / "full_lnp.hd5"), "r") as full_lnp, h5py.File(
+        str(tmp_path / "hierarchical_lnp.hd5"), "r"
+    ) as lnp:
+        for k in range(nstars):
+            cfull, cstar = full_lnp[f"star_{k}"], lnp[f"star_{k}"]
+            np.testing.assert_array_equal(cstar["idx"], cfull["idx"])
+            np.testing.assert_allclose(cstar["lnp"], cfull["lnp"], rtol=1e-6)
+            np.testing.assert_allclose(cstar["chi2"], cfull["chi2"], rtol=1e-6)
+
+    # not available with the covariances
+    noisemodel = dict(noisemodel)
+    n_models, n_filters = sedgrid.seds.shape
+    noisemodel["q_norm"] = np.zeros(n_models)
+    noisemodel["icov_diag"] = 1.0 / noisemodel["error"] ** 2
+    noisemodel["icov_offdiag"] = np.zeros((n_models, n_filters * (n_filters - 1) // 2))
+    with pytest.raises(ValueError, match="without covariances"):
+        Q_all_memory(
+            {"Name": np.array([f"star{k}" for k in range(nstars)])},
+            obs,
+            sedgrid,
+            noisemodel,
+            ["logA"],
+            grid_search="hierarchical",
+        )
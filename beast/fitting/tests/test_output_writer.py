@@ -0,0 +1,137 @@
+import threading
+
+import numpy as np
+import pytest
+import h5py
+from astropy.io import fits
+
+from beast.fitting.fit import Q_all_memory
+from beast.fitting.profiling import StageProfiler
+from beast.fitting.output_writer import BackgroundWriter
+from beast.tests.helpers import random_fit_inputs
+
+
+@pytest.mark.parametrize("pdf2d_sparse", [False, True])
+def test_background_io_outputs(tmp_path, pdf2d_sparse):
+    nstars = 11
+    sedgrid, noisemodel, obs = random_fit_inputs(5, nstars=nstars)
+
+    # same outputs saved directly and in the background
+    for background_io in [False, True]:
+        base = str(tmp_path / f"bg{int(background_io)}")
+        Q_all_memory(
+            {"Name": np.array([f"star{k}" for k in range(nstars)])},
+            obs,
+            sedgrid,
+            noisemodel,
+            ["Av", "logA"],
+            stats_outname=f"{base}_stats.fits",
+            pdf1d_outname=f"{base}_pdf1d.fits",
+            pdf2d_outname=f"{base}_pdf2d.fits",
+            pdf2d_param_list=["Av", "logA"],
+            pdf2d_sparse=pdf2d_sparse,
+            lnp_outname=f"{base}_lnp.hd5",
+            save_every_npts=2,
+            background_io=background_io,
+            writer_queue_size=1,
+        )
+
+    for suffix in ["stats", "pdf1d", "pdf2d"]:
+        with fits.open(str(tmp_path / f"bg0_{suffix}.fits")) as hdul0, fits.open(
+            str(tmp_path / f"bg1_{suffix}.fits")
+        ) as hdul1:
+            assert len(hdul0) == len(hdul1)
+            for hdu0, hdu1 in zip(hdul0, hdul1):
+                assert hdu0.name == hdu1.name
+                if isinstance(hdu0, fits.BinTableHDU):
+                    for cname in hdu0.columns.names:
+                        np.testing.assert_array_equal(
+                            hdu0.data[cname], hdu1.data[cname]
+                        )
+                else:
+                    np.testing.assert_array_equal(hdu0.data, hdu1.data)
+
+    with h5py.File(str(tmp_path / "bg0_lnp.hd5"), "r") as lnp0, h5py.File(
+        str(tmp_path / "bg1_lnp.hd5"), "r"
+    ) as lnp1:
+        assert sorted(lnp0.keys()) == sorted(lnp1.keys())
+        for k in range(nstars):
+            for ckey in ["idx", "lnp", "chi2"]:
+                np.testing.assert_array_equal(
+                    lnp0[f"star_{k}"][ckey], lnp1[f"star_{k}"][ckey]
+                )
+
+
+def test_background_io_fit_error(tmp_path):
+    nstars = 11
+    sedgrid, noisemodel, obs = random_fit_inputs(5, nstars=nstars)
+
+    # the fit fails at the 6th star
+    class FailingProfiler(StageProfiler):
+        def star(self, star):
+            if star == 5:
+                raise ValueError("fit failed")
+            super().star(star)
+
+    stats_fname = str(tmp_path / "stats.fits")
+    with pytest.raises(ValueError, match="fit failed"):
+        Q_all_memory(
+            {"Name": np.array([f"star{k}" for k in range(nstars)])},
+            obs,
+            sedgrid,
+            noisemodel,
+            ["Av"],
+            stats_outname=stats_fname,
+            save_every_npts=2,
+            background_io=True,
+            profiler=FailingProfiler(enabled=False),
+        )
+
+    # the saves submitted before the error are done and the writer stopped
+    assert "beast-output-writer" not in [t.name for t in threading.enumerate()]
+    with fits.open(stats_fname) as hdul:
+        assert len(hdul[1].data) == nstars
+
+
+def test_background_writer():
+    # saves run in order, with snapshots of the values
+    saved = []
+    vals = np.zeros(3)
+    with BackgroundWriter(maxsize=1) as writer:
+        for k in range(5):
+            vals[k % 3] = k + 1
+            writer.submit(saved.append, writer.snapshot(vals))
+    assert len(saved) == 5
+    np.testing.assert_array_equal(saved[0], [1, 0, 0])
+    np.testing.assert_array_equal(saved[-1], [4, 5, 3])
+
+    # backpressure: submit waits when the queue is full
+    release = threading.Event()
+    writer = BackgroundWriter(maxsize=1)
+    writer.submit(release.wait)
+    writer.submit(saved.append, 1)
+    blocked = threading.Thread(target=writer.submit, args=(saved.append, 2))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+    release.set()
+    blocked.join()
+    writer.close()
+    assert saved[-2:] == [1, 2]
+
+    # errors are raised in the main thread, the later saves are skipped
+    def fail():
+        raise IOError("disk full")
+
+    writer = BackgroundWriter(maxsize=2)
+    writer.submit(fail)
+    writer.submit(saved.append, 3)
+    with pytest.raises(RuntimeError, match="background save"):
+        writer.close()
+    assert saved[-1] == 2
+
+    # disabled writer saves directly
+    writer = BackgroundWriter(enabled=False)
+    writer.submit(saved.append, vals)
+    assert saved[-1] is vals
+    assert writer.snapshot(vals) is vals
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+from astropy.table import Table
+
+from beast.fitting.fit import save_pdf2d, Q_all_memory
+from beast.fitting.pdf2d import pdf2d, SparsePDF2D, read_pdf2d
+from beast.tools.star_type_probability import ext_O_star
+from beast.tests.helpers import random_fit_inputs
+
+
+def test_sparse_pdf2d_roundtrip(tmp_path):
+    rng = np.random.default_rng(42)
+    n_models, nstars = 1000, 5
+    av = rng.uniform(0.0, 5.0, n_models)
+    mass = 10 ** rng.uniform(-1.0, 2.0, n_models)
+    fast_pdf2d = pdf2d(av, mass, 20, 15, logspacing_p2=True)
+
+    dense = np.zeros((nstars + 2, 20, 15))
+    dense[-2, :, :] = np.tile(fast_pdf2d.bin_vals_p1, (15, 1)).T
+    dense[-1, :, :] = np.tile(fast_pdf2d.bin_vals_p2, (20, 1))
+    spdf = SparsePDF2D(fast_pdf2d.bin_vals_p1, fast_pdf2d.bin_vals_p2, nstars)
+    for e in range(nstars):
+        gindxs = rng.choice(n_models, size=50, replace=False)
+        weights = rng.uniform(size=50)
+        vals = fast_pdf2d.gen2d(gindxs, weights / weights.sum())
+        dense[e, :, :] = vals
+        spdf.add(e, vals)
+
+    dense_file = str(tmp_path / "dense_pdf2d.fits")
+    sparse_file = str(tmp_path / "sparse_pdf2d.fits")
+    save_pdf2d(dense_file, [dense], ["Av+M_ini"])
+    save_pdf2d(sparse_file, [spdf], ["Av+M_ini"])
+
+    d_data, d_bins = read_pdf2d(dense_file)
+    s_data, s_bins = read_pdf2d(sparse_file)
+    np.testing.assert_allclose(s_data["Av+M_ini"], d_data["Av+M_ini"], rtol=1e-6)
+    np.testing.assert_allclose(s_bins["Av+M_ini"], d_bins["Av+M_ini"])
+
+    # single star and sparse matrix access
+    s_star, _ = read_pdf2d(sparse_file, stars=3)
+    np.testing.assert_allclose(s_star["Av+M_ini"], dense[3], rtol=1e-6)
+    s_csr, _ = read_pdf2d(sparse_file, as_sparse=True)
+    np.testing.assert_allclose(
+        ext_O_star(s_csr, s_bins, min_M_ini=3.0),
+        ext_O_star(d_data, d_bins, min_M_ini=3.0),
+        rtol=1e-6,
+    )
+
+
+@pytest.mark.parametrize("sparse_in, sparse_out", [(False, True), (True, False)])
+def test_resume_pdf2d_format(tmp_path, sparse_in, sparse_out):
+    nstars, n_done = 9, 4
+    sedgrid, noisemodel, obs = random_fit_inputs(13, nstars=nstars)
+    # bins below the threshold of a sparse partial run are lost
+    kwargs = {
+        "pdf2d_param_list": ["Av", "logA"],
+        "pdf2d_threshold": 1e-3 if sparse_out else 0.0,
+    }
+
+    def fit(base, pdf2d_sparse, resume=False):
+        Q_all_memory(
+            {"Name": np.array([f"star{k}" for k in range(nstars)])},
+            obs,
+            sedgrid,
+            noisemodel,
+            ["Av", "logA"],
+            stats_outname=f"{base}_stats.fits",
+            pdf2d_outname=f"{base}_pdf2d.fits",
+            pdf2d_sparse=pdf2d_sparse,
+            resume=resume,
+            **kwargs,
+        )
+
+    ref = str(tmp_path / "ref")
+    fit(ref, sparse_out)
+
+    # partial run in the other format: only the first stars are done
+    part = str(tmp_path / "part")
+    fit(part, sparse_in)
+    stats = Table.read(f"{part}_stats.fits", hdu=1)
+    stats["Pmax"][n_done:] = 0.0
+    stats.write(f"{part}_stats.fits", overwrite=True)
+    fit(part, sparse_out, resume=True)
+
+    ref_data, ref_bins = read_pdf2d(f"{ref}_pdf2d.fits")
+    res_data, res_bins = read_pdf2d(f"{part}_pdf2d.fits")
+    with fits.open(f"{part}_pdf2d.fits") as hdul:
+        fmt = hdul["Av+logA"].header.get("PDF2DFMT", "DENSE")
+    assert fmt == ("SPARSE" if sparse_out else "DENSE")
+    np.testing.assert_allclose(res_data["Av+logA"], ref_data["Av+logA"], rtol=1e-6)
+    np.testing.assert_allclose(res_bins["Av+logA"], ref_bins["Av+logA"])
+
+    # sparse runs are resumed with the same threshold
+    if sparse_out:
+        kwargs["pdf2d_threshold"] = 1e-2
+        with pytest.raises(ValueError, match="pdf2d_threshold"):
+            fit(part, True, resume=True)
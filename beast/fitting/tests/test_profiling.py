@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+
+from beast.fitting.fit import Q_all_memory
+from beast.fitting.profiling import StageProfiler, profile_fname
+from beast.tests.helpers import random_fit_inputs
+
+
+def test_fit_profiler(tmp_path):
+    nstars = 7
+    sedgrid, noisemodel, obs = random_fit_inputs(11, nstars=nstars)
+
+    stats_fname = str(tmp_path / "proj_stats.fits")
+    profiler = StageProfiler(chunk_size=3)
+    Q_all_memory(
+        {"Name": np.array([f"star{k}" for k in range(nstars)])},
+        obs,
+        sedgrid,
+        noisemodel,
+        ["Av", "logA"],
+        stats_outname=stats_fname,
+        pdf1d_outname=str(tmp_path / "proj_pdf1d.fits"),
+        pdf2d_outname=str(tmp_path / "proj_pdf2d.fits"),
+        pdf2d_param_list=["Av", "logA"],
+        lnp_outname=str(tmp_path / "proj_lnp.hd5"),
+        save_every_npts=4,
+        profiler=profiler,
+    )
+    profiler.write(profile_fname(stats_fname))
+
+    with open(str(tmp_path / "proj_stats_profile.json")) as f:
+        report = json.load(f)
+    stages = report["stages"]
+    assert list(stages) == [
+        "setup",
+        "likelihood",
+        "normalization",
+        "lnp",
+        "stats",
+        "pdf1d",
+        "pdf2d",
+        "io",
+    ]
+    assert stages["likelihood"]["calls"] == nstars
+    # 5 parameters: Av, logA and the 3 fluxes
+    assert stages["pdf1d"]["calls"] == 5 * nstars
+    assert stages["io"]["calls"] == 2
+    np.testing.assert_allclose(sum(s["fraction"] for s in stages.values()), 1.0)
+    assert [c["nstars"] for c in report["chunks"]] == [3, 3, 1]
+    assert report["chunks"][1]["stages"]["io"] > 0
+    assert stages["setup"]["process_peak_rss_mb"] > 0
+    # cumulative peak of the process
+    assert stages["io"]["process_peak_rss_mb"] >= stages["setup"]["process_peak_rss_mb"]
+
+
+def test_disabled_profiler():
+    profiler = StageProfiler(enabled=False)
+    profiler.star(0)
+    profiler.lap("likelihood")
+    assert profiler.report()["stages"] == {}
@@ -0,0 +1,77 @@
+import numpy as np
+from astropy.table import Table
+from astropy.io import fits
+
+from beast.fitting.fit import save_pdf1d, save_pdf2d, save_lnp
+from beast.fitting.pdf2d import SparsePDF2D
+from beast.fitting.results import BeastResults
+
+
+def test_beast_results(tmp_path):
+    rng = np.random.default_rng(7)
+    nstars, nbins, nbins_p1, nbins_p2 = 150, 12, 8, 6
+    filebase = str(tmp_path / "proj")
+
+    # stats
+    stats = Table({"Av_p50": rng.random(nstars), "M_ini_p50": rng.random(nstars)})
+    stats.write(f"{filebase}_stats.fits")
+
+    # 1D PDFs, last row is the bins
+    pdf1d = rng.random((nstars + 1, nbins))
+    save_pdf1d(f"{filebase}_pdf1d.fits", [pdf1d], ["Av"])
+
+    # dense and sparse 2D PDFs, some stars without PDF
+    bins_p1, bins_p2 = np.arange(nbins_p1), np.arange(nbins_p2) * 0.5
+    pdf2d = rng.random((nstars, nbins_p1, nbins_p2))
+    pdf2d *= rng.random((nstars, 1, 1)) > 0.2
+    pdf2d[pdf2d < 0.5] = 0.0
+    dense = np.zeros((nstars + 2, nbins_p1, nbins_p2))
+    dense[:nstars] = pdf2d
+    dense[-2] = bins_p1[:, None]
+    dense[-1] = bins_p2[None, :]
+    spdf = SparsePDF2D(bins_p1, bins_p2, nstars)
+    for k in rng.permutation(nstars):
+        spdf.add(k, pdf2d[k])
+    save_pdf2d(f"{filebase}_pdf2d.fits", [dense, spdf], ["Av+M_ini", "Av+logA"])
+
+    # sparse likelihoods
+    lnps = [
+        [k, np.arange(k % 5 + 1), rng.random(k % 5 + 1), rng.random(k % 5 + 1), [k]]
+        for k in range(nstars)
+    ]
+    save_lnp(f"{filebase}_lnp.hd5", lnps)
+
+    with BeastResults.from_filebase(filebase, block_size=16, cache_size=16) as res:
+        assert res.nstars == nstars
+        assert res.filter_info is None
+        assert [name.upper() for name in res.pdf1d_names] == ["AV"]
+        assert res.pdf2d_names == ["Av+M_ini", "Av+logA"]
+
+        for star in [0, 17, 149, 18]:
+            cstats = res.stats(star, columns=["M_ini_p50"])
+            assert cstats["M_ini_p50"][0] == stats["M_ini_p50"][star]
+
+            bins, vals = res.pdf1d("Av", star)
+            np.testing.assert_array_equal(bins, pdf1d[-1])
+            np.testing.assert_array_equal(vals, pdf1d[star])
+
+            for pair in ["Av+M_ini", "Av+logA"]:
+                bins, vals = res.pdf2d(pair, star)
+                np.testing.assert_array_equal(bins, dense[-2:])
+                np.testing.assert_allclose(vals, pdf2d[star], rtol=1e-6)
+
+            clnp = res.lnp(star)
+            np.testing.assert_array_equal(clnp["idx"], lnps[star][1])
+            np.testing.assert_array_equal(clnp["lnp"], lnps[star][2])
+
+        # stars 17 and 18 share the same blocks
+        assert res.hits > 0
+        assert len(res._blocks) <= 16
+
+        assert len(res.stats(np.arange(10, 20))) == 10
+
+    # stats file with the filter information
+    filter_info = Table({"filternames": ["F475W", "F814W"], "wavelengths": [0.5, 0.8]})
+    fits.append(f"{filebase}_stats.fits", fits.table_to_hdu(filter_info).data)
+    with BeastResults(stats_fname=f"{filebase}_stats.fits") as res:
+        assert list(res.filter_info["filternames"]) == ["F475W", "F814W"]
@@ -1,6 +1,7 @@
 import os
 import warnings
 import numpy as np
+from numpy.random import default_rng
 from astropy.io import ascii
 from astropy.table import Table
 from astropy.table import Column
@@ -56,6 +57,60 @@ def mag_limits(seds, faint_cut, Nfilter=1, bright_cut=None):
     return idx
 
 
+def _toothpick_fluxbins(mags, bin_maxs, N_fluxes):
+    """
+    Find in which flux bin each model belongs, for each filter
+
+    Parameters
+    ----------
+    mags : ndarray
+        (N models, N filters) magnitudes
+
+    bin_maxs : ndarray
+        (N fluxes, N filters) upper edges of the bins
+
+    N_fluxes : int
+        number of flux bins
+
+    Returns
+    -------
+    fluxbins : ndarray
+        (N models, N filters) bin indices
+    """
+    fluxbins = np.zeros(mags.shape, dtype=int)
+    for fltr in range(mags.shape[1]):
+        fluxbins[:, fltr] = np.digitize(mags[:, fltr], bin_maxs[:, fltr])
+
+    # Clip in place (models of which the flux is equal to the max
+    # are assigned bin nr N_fluxes. Move these down to bin nr
+    # N_fluxes - 1)
+    np.clip(fluxbins, a_min=0, a_max=N_fluxes - 1, out=fluxbins)
+    return fluxbins
+
+
+def _rank_in_group(values):
+    """
+    Number of previous elements with the same value for each element
+
+    Parameters
+    ----------
+    values : ndarray
+        1D integer array
+
+    Returns
+    -------
+    rank : ndarray
+        for values[i], the number of j < i with values[j] == values[i]
+    """
+    order = np.argsort(values, kind="stable")
+    svals = values[order]
+    starts = np.r_[True, svals[1:] != svals[:-1]]
+    group_start = np.maximum.accumulate(np.where(starts, np.arange(len(svals)), 0))
+    rank = np.empty(len(values), dtype=int)
+    rank[order] = np.arange(len(svals)) - group_start
+    return rank
+
+
 def pick_models_toothpick_style(
     sedgrid_fname,
     filters,
@@ -65,6 +120,7 @@ def pick_models_toothpick_style(
     outfile_params=None,
     bins_outfile=None,
     bright_cut=None,
+    ranseed=None,
 ):
     """
     Creates a fake star catalog from a BEAST model grid. The chosen seds
@@ -104,6 +160,9 @@ def pick_models_toothpick_style(
         List of magnitude limits for each filter (won't sample model
         SEDs that are too bright)
 
+    ranseed : int
+        used to set the seed to make the results reproducable
+
     Returns
     -------
     sedsMags: astropy Table
@@ -150,65 +209,72 @@ def pick_models_toothpick_style(
         raise AssertionError()
 
     bin_count = np.zeros((N_fluxes, Nf))
-    chosen_idxs = []
-    counter = 0
+    chosen_pos = []
     successes = 0
-    include_mask = np.full(idxs.shape, True, dtype=bool)
+    n_sampled = 0
     chunksize = 100000
-    while True:
-        counter += 1
-        # pick some random models
-        rand_idx = np.random.choice(idxs[include_mask], size=chunksize)
-        randomseds = sedsMags[rand_idx, :]
-
-        # Find in which bin each model belongs, for each filter
-        fluxbins = np.zeros(randomseds.shape, dtype=int)
-        for fltr in range(Nf):
-            fluxbins[:, fltr] = np.digitize(randomseds[:, fltr], bin_maxs[:, fltr])
-
-        # Clip in place (models of which the flux is equal to the max
-        # are assigned bin nr N_fluxes. Move these down to bin nr
-        # N_fluxes - 1)
-        np.clip(fluxbins, a_min=0, a_max=N_fluxes - 1, out=fluxbins)
-
-        add_these = np.full((len(rand_idx)), False, dtype=bool)
-        for r in range(len(rand_idx)):
-            # If any of the flux bins that this model falls into does
-            # not have enough samples yet, add it to the list of model
-            # spectra to be output
-            if (bin_count[fluxbins[r, :], range(Nf)] < min_N_per_flux).any():
-                bin_count[fluxbins[r, :], range(Nf)] += 1
-                successes += 1
-                add_these[r] = True
-
-            # If all these bins are full...
-            else:
-                # ... do not include this model again, since we will reject it
-                # anyway.
-                include_mask[idxs == rand_idx[r]] = False
-
-        # Add the approved models
-        chosen_idxs.extend(rand_idx[add_these])
-
-        # If some of the randomly picked models were not added
-        if not add_these.any():
-            # ... check if we have enough samples everywhere, or if all
-            # the models have been exhausted (and hence the bins are
-            # impossible to fill).
+    rangen = default_rng(ranseed)
+
+    # positions in sedsMags of the models that can still be picked
+    #   models are only removed when rejected as all their bins are full,
+    #   they would be rejected again as the bin counts only increase
+    candidates = np.arange(len(idxs))
+    enough_samples = False
+    while not enough_samples and len(candidates) > 0:
+        # go through the candidate models once in random order
+        # (models accepted in this pass stay candidates for the next pass)
+        order = rangen.permutation(candidates)
+        keep_candidate = np.full(len(sedsMags), False, dtype=bool)
+        n_added = 0
+        for k in range(0, len(order), chunksize):
+            rand_pos = order[k : k + chunksize]
+            fluxbins = _toothpick_fluxbins(sedsMags[rand_pos, :], bin_maxs, N_fluxes)
+
+            # A model is added if any of the flux bins it falls into does not
+            # have enough samples yet, counting the models earlier in this
+            # chunk.  This is the same as adding the models one at a time as
+            # a model is only rejected if all its bins are already full.
+            add_these = np.full(len(rand_pos), False, dtype=bool)
+            for fltr in range(Nf):
+                counts = bin_count[fluxbins[:, fltr], fltr] + _rank_in_group(
+                    fluxbins[:, fltr]
+                )
+                add_these |= counts < min_N_per_flux
+
+            # update the bin counts with all the approved models at once
+            for fltr in range(Nf):
+                bin_count[:, fltr] += np.bincount(
+                    fluxbins[add_these, fltr], minlength=N_fluxes
+                )
+
+            # Add the approved models
+            chosen_pos.extend(rand_pos[add_these])
+            keep_candidate[rand_pos[add_these]] = True
+            n_added += np.sum(add_these)
+            successes += np.sum(add_these)
+            n_sampled += len(rand_pos)
+
             enough_samples = (bin_count.flatten() >= min_N_per_flux).all()
-            still_models_left = include_mask.any()
-            if enough_samples or not still_models_left:
+            if enough_samples:
                 break
 
-        if not counter % 10:
-            print(
-                "Sampled {} models. {} successfull seds. Ratio = {}".format(
-                    counter * chunksize, successes, successes / counter / chunksize
-                )
+        # stop if the remaining models cannot fill the bins anymore
+        if n_added == 0:
+            break
+        candidates = np.where(keep_candidate)[0]
+
+    if n_sampled > 0:
+        print(
+            "Sampled {} models. {} successfull seds. Ratio = {}".format(
+                n_sampled, successes, successes / n_sampled
             )
+        )
+
+    chosen_pos = np.array(chosen_pos, dtype=int)
+    chosen_idxs = idxs[chosen_pos]
 
     # Gather the selected model seds in a table
-    sedsMags = Table(sedsMags[chosen_idxs, :], names=filters)
+    sedsMags = Table(sedsMags[chosen_pos, :], names=filters)
 
     if outfile is not None:
         ascii.write(
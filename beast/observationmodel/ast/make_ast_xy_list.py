@@ -404,6 +404,23 @@ def pick_positions_from_map(
     tile_ra_min, tile_dec_min = bdm.min_ras_decs()
     tile_ra_delta, tile_dec_delta = bdm.delta_ras_decs()
 
+    # boundaries the AST positions must be within
+    # if we can't convert to x/y, do everything in RA/Dec
+    if ref_wcs is None:
+        boundaries = [catalog_boundary_radec]
+        if set_coord_boundary is not None:
+            boundaries.append(coord_boundary_radec)
+        if region_from_filters is not None:
+            boundaries.append(filt_reg_boundary_radec)
+        boundaries = [b for b in boundaries if b]
+    # if we can convert to x/y, do everything in x/y
+    else:
+        boundaries = [catalog_boundary_xy]
+        if (set_coord_boundary is not None) and coord_boundary_xy:
+            boundaries.append(coord_boundary_xy)
+        if (region_from_filters is not None) and filt_reg_boundary_xy:
+            boundaries.append(filt_reg_boundary_xy)
+
     for bin_index, tile_set in enumerate(
         tqdm(
             tile_sets,
@@ -413,75 +430,22 @@ def pick_positions_from_map(
         start = bin_index * Nseds_per_region
         stop = start + Nseds_per_region
         bin_indices[start:stop] = bin_index
-        for i in range(Nseds_per_region):
-
-            # keep track of whether we're still looking for valid coordinates
-            x = None
-            y = None
-
-            while (x is None) or (y is None):
-                # Pick a random tile in this tile set
-                tile = np.random.choice(tile_set)
-                # Within this tile, pick a random ra and dec
-                ra = tile_ra_min[tile] + np.random.random_sample() * tile_ra_delta[tile]
-                dec = (
-                    tile_dec_min[tile]
-                    + np.random.random_sample() * tile_dec_delta[tile]
-                )
 
-                # if we can't convert this to x/y, do everything in RA/Dec
-                if ref_wcs is None:
-                    x, y = ra, dec
-
-                    # check that this x/y is within the catalog footprint
-                    if catalog_boundary_radec:
-                        # N,2 array of AST X and Y positions
-                        inbounds = catalog_boundary_radec.contains_points([[x, y]])[0]
-
-                        if not inbounds:
-                            x = None
-
-                    # check that this x/y is with any input boundary
-                    if set_coord_boundary is not None:
-                        if coord_boundary_radec:
-                            inbounds = coord_boundary_radec.contains_points([[x, y]])[0]
-                            if not inbounds:
-                                x = None
-                    if region_from_filters is not None:
-                        if filt_reg_boundary_radec:
-                            # fmt: off
-                            inbounds = filt_reg_boundary_radec.contains_points([[x, y]])[0]
-                            # fmt: on
-                            if not inbounds:
-                                x = None
-
-                # if we can convert to x/y, do everything in x/y
-                else:
-                    [x], [y] = ref_wcs.all_world2pix(
-                        np.array([ra]), np.array([dec]), wcs_origin
-                    )
+        x, y = _sample_positions_in_tiles(
+            Nseds_per_region,
+            tile_set,
+            tile_ra_min,
+            tile_dec_min,
+            tile_ra_delta,
+            tile_dec_delta,
+            boundaries,
+            ref_wcs=ref_wcs,
+            wcs_origin=wcs_origin,
+        )
 
-                    # check that this x/y is within the catalog footprint
-                    # N,2 array of AST X and Y positions
-                    inbounds = catalog_boundary_xy.contains_points([[x, y]])[0]
-                    if not inbounds:
-                        x = None
-
-                    # check that this x/y is with any input boundary
-                    if set_coord_boundary is not None:
-                        if coord_boundary_xy:
-                            inbounds = coord_boundary_xy.contains_points([[x, y]])[0]
-                            if not inbounds:
-                                x = None
-                    if region_from_filters is not None:
-                        if filt_reg_boundary_xy:
-                            inbounds = filt_reg_boundary_xy.contains_points([[x, y]])[0]
-                            if not inbounds:
-                                x = None
-
-            j = bin_index + i * len(tile_sets)
-            ast_x_list[j] = x
-            ast_y_list[j] = y
+        # models are interleaved between the bins
+        ast_x_list[bin_index :: len(tile_sets)] = x
+        ast_y_list[bin_index :: len(tile_sets)] = y
 
     # I'm just mimicking the format that is produced by the examples
     cs = []
@@ -508,6 +472,97 @@ def pick_positions_from_map(
     return out_table
 
 
+def _sample_positions_in_tiles(
+    n_pos,
+    tile_set,
+    tile_ra_min,
+    tile_dec_min,
+    tile_ra_delta,
+    tile_dec_delta,
+    boundaries,
+    ref_wcs=None,
+    wcs_origin=1,
+    oversample=1.2,
+    max_block=1000000,
+):
+    """
+    Draw random positions uniformly within a set of tiles, rejecting those
+    outside of the boundaries.
+
+    Candidates are drawn in blocks sized from the acceptance rate found so far
+    and tested all at once, until enough positions are accepted.
+
+    Parameters
+    ----------
+    n_pos : int
+        number of positions to draw
+
+    tile_set : ndarray
+        indices of the tiles to draw the positions in
+
+    tile_ra_min, tile_dec_min, tile_ra_delta, tile_dec_delta : ndarray
+        corners and sizes of all the tiles
+
+    boundaries : list of Path objects
+        the positions must be inside all of them (in pixels if ref_wcs is
+        given, RA/Dec otherwise)
+
+    ref_wcs : astropy.wcs.WCS (default=None)
+        if given, the positions are converted to pixels
+
+    wcs_origin : 0 or 1 (default=1)
+        origin of the pixel coordinates
+
+    oversample : float (default=1.2)
+        factor applied on the expected number of candidates needed
+
+    max_block : int (default=1000000)
+        maximum number of candidates drawn at once
+
+    Returns
+    -------
+    x, y : ndarrays
+        positions (pixels if ref_wcs is given, RA/Dec otherwise)
+    """
+    x = np.zeros(n_pos)
+    y = np.zeros(n_pos)
+    n_found = 0
+    n_drawn = 0
+    while n_found < n_pos:
+        # scale the block by the acceptance rate (assume 1 for the first one)
+        acceptance = max(n_found, 1) / max(n_drawn, 1)
+        n_block = int(np.ceil((n_pos - n_found) * oversample / acceptance))
+        n_block = min(max(n_block, 1), max_block)
+
+        # Pick random tiles in this tile set
+        # and within these tiles, pick random ras and decs
+        tiles = np.random.choice(tile_set, n_block)
+        ra = tile_ra_min[tiles] + (
+            np.random.random_sample(n_block) * tile_ra_delta[tiles]
+        )
+        dec = tile_dec_min[tiles] + (
+            np.random.random_sample(n_block) * tile_dec_delta[tiles]
+        )
+        if ref_wcs is None:
+            cx, cy = ra, dec
+        else:
+            cx, cy = ref_wcs.all_world2pix(ra, dec, wcs_origin)
+
+        # check that the positions are within all the boundaries
+        inbounds = np.full(n_block, True)
+        xy = np.column_stack([cx, cy])
+        for boundary in boundaries:
+            inbounds &= boundary.contains_points(xy)
+
+        n_keep = min(int(np.sum(inbounds)), n_pos - n_found)
+        x[n_found : n_found + n_keep] = cx[inbounds][:n_keep]
+        y[n_found : n_found + n_keep] = cy[inbounds][:n_keep]
+        n_found += n_keep
+        n_drawn += n_block
+
+    return x, y
+
+
 def erode_path(path_object, erode_amount):
     """
     Returns the original Path object, but eroded by the defined amount.
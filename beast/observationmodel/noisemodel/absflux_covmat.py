@@ -10,8 +10,36 @@ from beast.observationmodel import phot
 from beast.config import __ROOT__
 
 
+def _interp_weights(x, xp):
+    """ Linear interpolation indices and weights equivalent to np.interp
+
+    Parameters
+    ----------
+    x : ndarray
+        coordinates to interpolate at
+    xp : ndarray
+        increasing coordinates of the data points
+
+    Returns
+    -------
+    (i1, i2, w) : tuple of ndarrays
+        interpolated values are given by `fp[..., i1] * (1 - w) + fp[..., i2] * w`
+    """
+    i2 = np.clip(np.searchsorted(xp, x, side="right"), 1, len(xp) - 1)
+    i1 = i2 - 1
+    w = (x - xp[i1]) / (xp[i2] - xp[i1])
+    # values outside of xp are set to the closest end point
+    w = np.clip(w, 0.0, 1.0)
+    return i1, i2, w
+
+
 def hst_frac_matrix(
-    filters, spectrum=None, progress=True, hst_fname=None, filterLib=None
+    filters,
+    spectrum=None,
+    progress=True,
+    hst_fname=None,
+    filterLib=None,
+    chunksize=500,
 ):
     """ Uses the Bohlin et al. (2013) provided spectroscopic
     absolute flux covariance matrix to generate the covariance matrix
@@ -29,10 +57,14 @@ def hst_frac_matrix(
                (wave, sed)
                wave = 1D numpy array with wavelengths in XX units
                spectrum = 1D numpy array with flux in ergs...
+               or 2D numpy array (n_models, n_waves) for many models
     hst_fname : str
                 file with hst absflux covariance matrix
     filterLib:  str
         full filename to the filter library hd5 file
+    chunksize: int, optional
+        number of models processed at once (sets the memory used by the
+        temporary (chunksize, n_waves, n_filters) arrays)
 
 
     Returns
@@ -40,6 +72,15 @@ def hst_frac_matrix(
     2D numpy array giving the fractional covariance matrix
       (must be multiplied by the SED flux (x2) to get the
        true covariance matrix)
+      or 3D numpy array (n_models, n_filters, n_filters) for many models
+
+    .. note::
+
+        For each model, the covariance between bands i and j is the
+        quadratic form (t_j s)^T C (t_i s) normalized by sum(t_i s) sum(t_j s)
+        where s is the spectrum, t the filter responses and C the
+        spectroscopic covariance matrix.  It is computed for a chunk of models
+        at once with matrix products.
 
     ToDos:
     ------
@@ -54,7 +95,7 @@ def hst_frac_matrix(
     hst_data = getdata(hst_fname, 1)
 
     waves = hst_data["WAVE"][0]
-    frac_spec_covar = hst_data["COVAR"][0]
+    frac_spec_covar = np.asarray(hst_data["COVAR"][0], dtype=float)
     n_waves = len(waves)
 
     # define a flat spectrum if it does not exist
@@ -64,65 +105,56 @@ def hst_frac_matrix(
     # read in the filter response functions
     flist = phot.load_filters(filters, filterLib=filterLib, interp=True, lamb=waves)
 
-    # setup multiplication images to make it easy to compute the results
+    # (n_waves, n_filters) filter responses
     n_filters = len(filters)
-    mult_image = np.zeros((n_waves, n_waves, n_filters))
-    mult_image_spec = np.zeros((n_waves, n_waves, n_filters))
-    image_ones = np.full((n_waves, n_waves), 1.0)
-    # band_ones = np.full((n_filters, n_filters), 1.0)
-
-    for i in range(n_filters):
-        mult_image[:, :, i] = image_ones * flist[i].transmit
+    transmit = np.array([flist[i].transmit for i in range(n_filters)]).T
 
     # handle single spectrum or many spectra
-    if len(spectrum[1].shape) > 1:
-        n_models = spectrum[1].shape[0]
-        results = np.zeros((n_models, n_filters, n_filters))
-    else:
-        n_models = 1
+    seds = np.atleast_2d(spectrum[1])
+    n_models = seds.shape[0]
+    single = len(spectrum[1].shape) == 1
+    if single:
         progress = False
 
+    # spectra are interpolated on the covariance matrix wavelengths
+    i1, i2, w = _interp_weights(waves, np.asarray(spectrum[0]))
+
     # setup the progress bar
+    chunks = list(range(0, n_models, chunksize))
     if progress is True:
-        it = tqdm(list(range(n_models)), desc="Calculating absolute flux covariance matrices")
-    else:
-        it = list(range(n_models))
-
-    frac_covar_bands = np.zeros((n_filters, n_filters))
-    for k in it:
-        if n_models == 1:
-            interp_spectrum = np.interp(waves, spectrum[0], spectrum[1])
-        else:
-            interp_spectrum = np.interp(waves, spectrum[0], spectrum[1][k, :])
-
-        for i in range(n_filters):
-            mult_image_spec[:, :, i] = mult_image[:, :, i] * interp_spectrum
-
-        for i in range(n_filters):
-            for j in range(i, n_filters):
-                frac_covar_bands[i, j] = np.sum(
-                    frac_spec_covar
-                    * mult_image_spec[:, :, i]
-                    * mult_image_spec[:, :, j].T
-                )
-                frac_covar_bands[i, j] /= np.sum(
-                    mult_image_spec[:, :, i] * mult_image_spec[:, :, j].T
-                )
+        chunks = tqdm(chunks, desc="Calculating absolute flux covariance matrices")
+
+    # only the upper triangle is computed as in the band by band sums,
+    # the lower triangle is its mirror
+    triu = np.triu(np.full((n_filters, n_filters), True))
+
+    results = np.zeros((n_models, n_filters, n_filters))
+    for k in chunks:
+        interp_spectra = seds[k : k + chunksize, i1] * (1.0 - w) + (
+            seds[k : k + chunksize, i2] * w
+        )
+
+        # (n_chunk, n_waves, n_filters) responses times spectra
+        resp = interp_spectra[:, :, None] * transmit[None, :, :]
+
+        # numerator[m, i, j] = sum_ab C[a, b] resp[m, b, i] resp[m, a, j]
+        numer = np.matmul(
+            np.matmul(frac_spec_covar, resp).transpose(0, 2, 1), resp
+        )
+        sums = resp.sum(axis=1)
+        frac_covar_bands = numer / (sums[:, :, None] * sums[:, None, :])
 
         # fill in the symmetric terms
-        for i in range(n_filters):
-            for j in range(0, i):
-                frac_covar_bands[i, j] = frac_covar_bands[j, i]
+        frac_covar_bands = np.where(
+            triu, frac_covar_bands, frac_covar_bands.transpose(0, 2, 1)
+        )
 
         # add the term accounting for the uncertainty in the overall
         #  zero point of the flux scale
         #  (e.g., uncertainty in Vega at 5555 A)
-        frac_covar_bands += 4.9e-5
-
-        if n_models > 1:
-            results[k, :, :] = frac_covar_bands
+        results[k : k + chunksize] = frac_covar_bands + 4.9e-5
 
-    if n_models == 1:
-        return frac_covar_bands
+    if single:
+        return results[0]
     else:
         return results
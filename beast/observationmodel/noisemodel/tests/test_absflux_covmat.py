@@ -0,0 +1,127 @@
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+from beast.observationmodel import phot
+from beast.observationmodel.noisemodel import absflux_covmat
+from beast.physicsmodel.creategrid import make_extinguished_grid
+from beast.physicsmodel.dust import extinction
+from beast.benchmarks.synthetic import make_filter_library, make_spectral_grid
+
+
+def _write_hst_covar(fname, nwaves=120):
+    """ Spectroscopic fractional covariance matrix in the HST file format """
+    waves = np.logspace(3.1, 4.4, nwaves)
+    # smooth positive definite covariance
+    dist = np.log10(waves)[:, None] - np.log10(waves)[None, :]
+    covar = 1e-4 * np.exp(-0.5 * (dist / 0.1) ** 2) + 1e-6 * np.eye(nwaves)
+    tab = Table()
+    tab["WAVE"] = waves[None, :]
+    tab["COVAR"] = covar[None, :, :]
+    fits.BinTableHDU(tab).writeto(fname, overwrite=True)
+
+
+def _hst_frac_matrix_loop(filters, spectrum, hst_fname, filterLib):
+    """ Per model and per band pair sums of the original implementation """
+    hst_data = fits.getdata(hst_fname, 1)
+    waves = hst_data["WAVE"][0]
+    frac_spec_covar = hst_data["COVAR"][0]
+    n_waves = len(waves)
+    flist = phot.load_filters(filters, filterLib=filterLib, interp=True, lamb=waves)
+
+    n_filters = len(filters)
+    mult_image = np.zeros((n_waves, n_waves, n_filters))
+    mult_image_spec = np.zeros((n_waves, n_waves, n_filters))
+    for i in range(n_filters):
+        mult_image[:, :, i] = np.full((n_waves, n_waves), 1.0) * flist[i].transmit
+
+    n_models = spectrum[1].shape[0]
+    results = np.zeros((n_models, n_filters, n_filters))
+    for k in range(n_models):
+        interp_spectrum = np.interp(waves, spectrum[0], spectrum[1][k, :])
+        for i in range(n_filters):
+            mult_image_spec[:, :, i] = mult_image[:, :, i] * interp_spectrum
+        for i in range(n_filters):
+            for j in range(i, n_filters):
+                results[k, i, j] = np.sum(
+                    frac_spec_covar
+                    * mult_image_spec[:, :, i]
+                    * mult_image_spec[:, :, j].T
+                ) / np.sum(mult_image_spec[:, :, i] * mult_image_spec[:, :, j].T)
+                results[k, j, i] = results[k, i, j]
+    return results + 4.9e-5
+
+
+def test_hst_frac_matrix_matches_loop(tmp_path):
+    filters = ["F1", "F2", "F3", "F4"]
+    filterLib = str(tmp_path / "filters.hd5")
+    make_filter_library(filterLib, filters, lamb_range=(1500.0, 20000.0))
+    hst_fname = str(tmp_path / "covar.fits")
+    _write_hst_covar(hst_fname)
+
+    specgrid = make_spectral_grid(11, nlamb=300, lamb_range=(1000.0, 30000.0))
+    spectrum = (specgrid.lamb, specgrid.seds)
+
+    ref = _hst_frac_matrix_loop(filters, spectrum, hst_fname, filterLib)
+    res = absflux_covmat.hst_frac_matrix(
+        filters,
+        spectrum=spectrum,
+        progress=False,
+        hst_fname=hst_fname,
+        filterLib=filterLib,
+        chunksize=4,
+    )
+    np.testing.assert_allclose(res, ref, rtol=1e-10)
+
+    # single spectrum
+    res1 = absflux_covmat.hst_frac_matrix(
+        filters,
+        spectrum=(specgrid.lamb, specgrid.seds[3]),
+        hst_fname=hst_fname,
+        filterLib=filterLib,
+    )
+    np.testing.assert_allclose(res1, ref[3], rtol=1e-10)
+
+
+def test_extinguished_grid_absflux_cov(tmp_path, monkeypatch):
+    """ Regression test: absflux_cov=True used to fail on a float shape """
+    filters = ["F1", "F2", "F3"]
+    filterLib = str(tmp_path / "filters.hd5")
+    make_filter_library(filterLib, filters, lamb_range=(1500.0, 20000.0))
+    _write_hst_covar(str(tmp_path / "hst_whitedwarf_frac_covar.fits"))
+    monkeypatch.setattr(absflux_covmat, "__ROOT__", str(tmp_path))
+
+    specgrid = make_spectral_grid(5, nlamb=300, lamb_range=(1000.0, 30000.0))
+    (g,) = make_extinguished_grid(
+        specgrid,
+        filters,
+        extinction.Gordon16_RvFALaw(),
+        np.array([0.0, 1.0]),
+        np.array([3.1, 4.0]),
+        fAs=np.array([0.5, 1.0]),
+        absflux_cov=True,
+        filterLib=filterLib,
+    )
+
+    n_models = len(g.grid)
+    assert np.all(g.grid["Av"][:5] == 0.0)
+    assert g.cov_diag.shape == (n_models, 3)
+    assert g.cov_offdiag.shape == (n_models, 3)
+
+    # packed terms are the fractional covariances scaled by the fluxes
+    frac = absflux_covmat.hst_frac_matrix(
+        filters,
+        spectrum=(specgrid.lamb, specgrid.seds),
+        hst_fname=str(tmp_path / "hst_whitedwarf_frac_covar.fits"),
+        filterLib=filterLib,
+    )
+    seds = g.seds[:5]
+    np.testing.assert_allclose(
+        g.cov_diag[:5], frac[:, [0, 1, 2], [0, 1, 2]] * seds ** 2, rtol=1e-10
+    )
+    np.testing.assert_allclose(
+        g.cov_offdiag[:5, 0], frac[:, 0, 1] * seds[:, 0] * seds[:, 1], rtol=1e-10
+    )
+    np.testing.assert_allclose(
+        g.cov_offdiag[:5, 2], frac[:, 1, 2] * seds[:, 1] * seds[:, 2], rtol=1e-10
+    )
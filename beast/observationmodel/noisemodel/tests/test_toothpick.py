@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from beast.observationmodel.noisemodel.toothpick import MultiFilterASTs
+
+
+def _sigma_bins_loop(flux_in, flux_out, nbins, min_flux, max_flux, compute_stddev):
+    """ Statistics computed bin by bin on the ASTs of each bin """
+    delta_flux = (max_flux - min_flux) / float(nbins)
+    bin_min_vals = min_flux + np.arange(nbins) * delta_flux
+    bin_max_vals = 10 ** (bin_min_vals + delta_flux)
+    bin_min_vals = 10 ** bin_min_vals
+
+    std_bias, ave_bias, compl = [], [], []
+    for i in range(nbins):
+        (bindxs,) = np.where((flux_in >= bin_min_vals[i]) & (flux_in < bin_max_vals[i]))
+        bin_flux_out = flux_out[bindxs]
+        (g_bindxs,) = np.where(bin_flux_out != 0.0)
+        if len(g_bindxs) > 10:
+            bias = bin_flux_out[g_bindxs] - flux_in[bindxs][g_bindxs]
+            if compute_stddev:
+                ave_bias.append(np.mean(bias))
+                std_bias.append(np.std(bias))
+            else:
+                percent = np.percentile(bias, [16.0, 50.0, 84.0])
+                ave_bias.append(percent[1])
+                std_bias.append((percent[2] - percent[0]) / 2.0)
+            compl.append(len(g_bindxs) / float(len(bindxs)))
+    return np.array(std_bias), np.array(ave_bias), np.array(compl)
+
+
+@pytest.mark.parametrize("compute_stddev", [False, True])
+def test_compute_sigma_bins(compute_stddev):
+    rng = np.random.default_rng(42)
+    n_asts = 20000
+    mag_in = rng.uniform(18.0, 30.0, n_asts)
+    flux_in = 10 ** (-0.4 * mag_in)
+    flux_out = flux_in * (1.0 + rng.normal(0.0, 0.2, n_asts))
+    flux_out[rng.random(n_asts) < 0.2] = 0.0
+    cut_flag = (rng.random(n_asts) < 0.1).astype(int)
+
+    d = MultiFilterASTs._compute_sigma_bins(
+        None, mag_in, flux_out.copy(), cut_flag, nbins=40, compute_stddev=compute_stddev
+    )
+
+    # same input preparation as in _compute_sigma_bins
+    flux_out[cut_flag > 0] = 0.0
+    flux_out[flux_out / flux_in > 2.0] = 0.0
+    min_flux = np.log10(np.amin(flux_in))
+    max_flux = np.log10(np.amax(flux_in) * 1.000001)
+    std_bias, ave_bias, compl = _sigma_bins_loop(
+        flux_in, flux_out, 40, min_flux, max_flux, compute_stddev
+    )
+
+    # identical to the bin by bin computation
+    np.testing.assert_array_equal(d["FLUX_STD"], std_bias)
+    np.testing.assert_array_equal(d["FLUX_BIAS"], ave_bias)
+    np.testing.assert_array_equal(d["COMPLETENESS"], compl)
@@ -223,11 +223,11 @@ class MultiFilterASTs(NoiseModel):
         #  add a very small value to the max to make sure all the data is
         #  included
         if min_flux is None:
-            min_flux = math.log10(min(flux_in))
+            min_flux = math.log10(np.amin(flux_in))
         else:
             min_flux = math.log10(min_flux)
         if max_flux is None:
-            max_flux = math.log10(max(flux_in) * 1.000001)
+            max_flux = math.log10(np.amax(flux_in) * 1.000001)
         else:
             max_flux = math.log10(max_flux)
         delta_flux = (max_flux - min_flux) / float(nbins)
@@ -240,34 +240,73 @@ class MultiFilterASTs(NoiseModel):
         bin_max_vals = 10 ** bin_max_vals
         bin_ave_vals = 10 ** bin_ave_vals
 
-        for i in range(nbins):
-            (bindxs,) = np.where(
-                (flux_in >= bin_min_vals[i]) & (flux_in < bin_max_vals[i])
-            )
-            n_bindxs = len(bindxs)
-            if n_bindxs > 0:
-                bin_flux_in = flux_in[bindxs]
-                bin_flux_out = flux_out[bindxs]
-                # compute completeness
-                (g_bindxs,) = np.where(bin_flux_out != 0.0)
-                n_g_bindxs = len(g_bindxs)
-                completeness[i] = n_g_bindxs / float(n_bindxs)
-                if n_g_bindxs > min_per_bin:
-                    good_bins[i] = 1
-                    ave_flux_in[i] = np.mean(bin_flux_in)
-                    bin_bias_flux = bin_flux_out[g_bindxs] - bin_flux_in[g_bindxs]
-                    if compute_stddev:
-                        # compute sigma via mean/stddev
-                        ave_bias[i] = np.mean(bin_bias_flux)
-                        std_bias[i] = np.std(bin_bias_flux)
-                    else:
-                        # compute sigma via percentiles
-                        # ave = 50th; std = (84th-16th)/2
-                        flux_percent_out = np.percentile(
-                            bin_bias_flux, [16.0, 50.0, 84.0]
-                        )
-                        ave_bias[i] = flux_percent_out[1]
-                        std_bias[i] = (flux_percent_out[2] - flux_percent_out[0]) / 2.0
+        # assign the ASTs to the bins in a single pass: an AST is in the last
+        #   bin starting below its flux, unless it is above the end of the bin
+        #   (the bin edges are computed separately).  The bin computed from
+        #   the log flux is corrected for the rounding errors.
+        bin_indxs = np.floor((np.log10(flux_in) - min_flux) / delta_flux)
+        bin_indxs = np.clip(bin_indxs, 0, nbins - 1).astype(int)
+        bin_indxs -= flux_in < bin_min_vals[bin_indxs]
+        next_bins = np.minimum(bin_indxs + 1, nbins - 1)
+        bin_indxs += (bin_indxs + 1 < nbins) & (flux_in >= bin_min_vals[next_bins])
+        (ast_indxs,) = np.where(
+            (bin_indxs >= 0) & (flux_in < bin_max_vals[np.maximum(bin_indxs, 0)])
+        )
+        bin_indxs = bin_indxs[ast_indxs]
+
+        # adjacent bins can overlap by a rounding error, the ASTs in the
+        #   overlap are also in the previous bin
+        prev_bins = bin_indxs - 1
+        (oindxs,) = np.where(
+            (prev_bins >= 0)
+            & (flux_in[ast_indxs] < bin_max_vals[np.maximum(prev_bins, 0)])
+        )
+
+        if len(oindxs) > 0:
+            ast_indxs = np.concatenate([ast_indxs, ast_indxs[oindxs]])
+            bin_indxs = np.concatenate([bin_indxs, prev_bins[oindxs]])
+
+        # compute completeness
+        n_bin = np.bincount(bin_indxs, minlength=nbins)
+        recovered = flux_out[ast_indxs] != 0.0
+        n_good_bin = np.bincount(bin_indxs[recovered], minlength=nbins)
+        (nindxs,) = np.where(n_bin > 0)
+        completeness[nindxs] = n_good_bin[nindxs] / n_bin[nindxs].astype(float)
+
+        # sort by bin, the ASTs of each bin are contiguous and in the order
+        #   of the table so that the statistics are the same as computed
+        #   bin by bin on the ASTs of the bin
+        if len(oindxs) > 0:
+            sindxs = np.lexsort((ast_indxs, bin_indxs))
+        elif nbins < 2 ** 15:
+            # stable sort of small integers (radix sort)
+            sindxs = np.argsort(bin_indxs.astype(np.int16), kind="stable")
+        else:
+            sindxs = np.argsort(bin_indxs, kind="stable")
+        ast_indxs = ast_indxs[sindxs]
+        recovered = recovered[sindxs]
+        sorted_flux_in = flux_in[ast_indxs]
+        sorted_flux_out = flux_out[ast_indxs]
+
+        bin_starts = np.cumsum(n_bin) - n_bin
+        for i in np.where(n_good_bin > min_per_bin)[0]:
+            bin_slice = slice(bin_starts[i], bin_starts[i] + n_bin[i])
+            bin_flux_in = sorted_flux_in[bin_slice]
+            bin_flux_out = sorted_flux_out[bin_slice]
+            g_bindxs = recovered[bin_slice]
+            good_bins[i] = 1
+            ave_flux_in[i] = np.mean(bin_flux_in)
+            bin_bias_flux = bin_flux_out[g_bindxs] - bin_flux_in[g_bindxs]
+            if compute_stddev:
+                # compute sigma via mean/stddev
+                ave_bias[i] = np.mean(bin_bias_flux)
+                std_bias[i] = np.std(bin_bias_flux)
+            else:
+                # compute sigma via percentiles
+                # ave = 50th; std = (84th-16th)/2
+                flux_percent_out = np.percentile(bin_bias_flux, [16.0, 50.0, 84.0])
+                ave_bias[i] = flux_percent_out[1]
+                std_bias[i] = (flux_percent_out[2] - flux_percent_out[0]) / 2.0
 
         # only pass back the bins with non-zero results
         (gindxs,) = np.where(good_bins == 1)
@@ -4,13 +4,13 @@ Defines a generic interface to observation catalog
 import numpy as np
 from numpy.random import default_rng
 
-from astropy.table import Table, Column
+from astropy.table import Table
 
 from beast.observationmodel.vega import Vega
 from beast.physicsmodel.priormodel import PriorAgeModel, PriorMassModel
 from beast.physicsmodel.grid_weights import compute_bin_boundaries
 
-__all__ = ["Observations", "gen_SimObs_from_sedgrid"]
+__all__ = ["Observations", "gen_SimObs_from_sedgrid", "iter_SimObs_from_sedgrid"]
 
 
 class Observations(object):
@@ -210,75 +210,173 @@ class Observations(object):
             yield k, self.getObs(k)
 
 
-def gen_SimObs_from_sedgrid(
+def _take_rows(arr, indxs, nblock=1000000):
+    """
+    Rows of a numpy or hdf5 (h5py/pytables) array for the given indices
+
+    Arrays stored on disk are read in blocks of nblock rows, only reading
+    the blocks with requested rows.
+    """
+    if isinstance(arr, np.ndarray):
+        return arr[indxs]
+    uindxs, inv = np.unique(indxs, return_inverse=True)
+    rows = np.empty((len(uindxs),) + arr.shape[1:], dtype=arr.dtype)
+    block_bounds = np.searchsorted(uindxs, np.arange(0, arr.shape[0] + nblock, nblock))
+    for k, (k1, k2) in enumerate(zip(block_bounds[:-1], block_bounds[1:])):
+        if k2 > k1:
+            block = arr[k * nblock : (k + 1) * nblock]
+            rows[k1:k2] = block[uindxs[k1:k2] - k * nblock]
+    return rows[inv.reshape(-1)]
+
+
+def _select_sim_models(
     sedgrid,
-    sedgrid_noisemodel,
+    model_compl,
+    goodobsmod,
+    rangen,
     nsim=100,
-    compl_filter="max",
-    complcut=None,
-    magcut=None,
-    ranseed=None,
-    vega_fname=None,
     weight_to_use="weight",
     age_prior_model=None,
     mass_prior_model=None,
 ):
     """
-    Generate simulated observations using the physics and observation grids.
-    The priors are sampled as they give the ensemble model for the stellar
-    and dust distributions (IMF, Av distribution etc.).
-    The physics model gives the SEDs based on the priors.
-    The observation model gives the noise, bias, and completeness all of
-    which are used in simulating the observations.
+    Pick the models of the simulated observations
 
-    Currently written to only work for the toothpick noisemodel.
+    See :func:`gen_SimObs_from_sedgrid` for the parameters.
 
-    Parameters
-    ----------
-    sedgrid: grid.SEDgrid instance
-        model grid
+    Returns
+    -------
+    sim_indx : ndarray
+        indices of the models of the simulated observations
+    """
+    n_models = len(goodobsmod)
+    model_indx = np.arange(n_models)
 
-    sedgrid_noisemodel: beast noisemodel instance
-        noise model data
+    # if the age and mass prior models are given, use them to determine the
+    # total number of stars to simulate
+    if (age_prior_model is not None) and (mass_prior_model is not None):
+        nsim = 0
+        grid_masses = np.asarray(sedgrid["M_ini"])
+        mass_range = [min(grid_masses), max(grid_masses)]
 
-    nsim : int
-        number of observations to simulate
+        # compute the total mass and average mass of a star given the mass_prior_model
+        nmass = 100
+        masspts = np.logspace(np.log10(mass_range[0]), np.log10(mass_range[1]), nmass)
+        mass_prior = PriorMassModel(mass_prior_model)
+        massprior = mass_prior(masspts)
+        totmass = np.trapezoid(massprior, masspts)
+        avemass = np.trapezoid(masspts * massprior, masspts) / totmass
 
-    compl_filter : str
-        Filter to use for completeness (required for toothpick model).
-        Set to max to use the max value in all filters.
+        # compute the mass of the remaining stars at each age and
+        # simulate the stars assuming everything is complete
+        gridweights = np.asarray(sedgrid[weight_to_use])
+        gridweights = gridweights / np.sum(gridweights)
 
-    complcut : float (defualt=None)
-        completeness cut for only including model seds above the cut
-        where the completeness cut ranges between 0 and 1.
+        # group the models by age in a single pass, models of each age
+        # stay in the grid order
+        grid_ages, age_inv = np.unique(np.asarray(sedgrid["logA"]), return_inverse=True)
+        age_order = np.argsort(age_inv.reshape(-1), kind="stable")
+        age_bounds = np.concatenate(([0], np.cumsum(np.bincount(age_inv.reshape(-1)))))
+        age_min_mass = np.minimum.reduceat(grid_masses[age_order], age_bounds[:-1])
+        age_max_mass = np.maximum.reduceat(grid_masses[age_order], age_bounds[:-1])
 
-    magcut : float (defualt=None)
-        faint-end magnitude cut for only including model seds brighter
-        than the given magnitude in compl_filter.
+        age_prior = PriorAgeModel(age_prior_model)
+        ageprior = age_prior(grid_ages)
+        bin_boundaries = compute_bin_boundaries(grid_ages)
+        bin_widths = np.diff(10 ** (bin_boundaries))
 
-    ranseed : int
-        used to set the seed to make the results reproducable,
-        useful for testing
+        # number of stars to simulate at each age
+        nsim_ages = np.zeros(len(grid_ages), dtype=int)
+        for k, (cwidth, cprior) in enumerate(zip(bin_widths, ageprior)):
+            gmass = (masspts >= age_min_mass[k]) & (masspts <= age_max_mass[k])
+            totcurmass = np.trapezoid(massprior[gmass], masspts[gmass])
 
-    vega_fname : string
-        filename for the vega info, useful for testing
+            # compute the mass remaining at each age -> this is the mass to simulate
+            simmass = cprior * cwidth * totcurmass / totmass
+            nsim_ages[k] = int(round(simmass / avemass))
 
-    weight_to_use : string (default='weight')
-        Set to either 'weight' (prior+grid), 'prior_weight', 'grid_weight',
-        or 'uniform' (this option is valid only when nsim is supplied) to
-        choose the weighting for SED selection.
+        # simulate the stars at each age
+        totsim_indx = []
+        for k, nsim_curage in enumerate(nsim_ages):
+            gmods = age_order[age_bounds[k] : age_bounds[k + 1]]
+            curweights = gridweights[gmods]
+            if np.sum(curweights) > 0:
+                curweights /= np.sum(curweights)
+                totsim_indx.append(
+                    rangen.choice(model_indx[gmods], size=nsim_curage, p=curweights)
+                )
+                nsim += nsim_curage
+        totsim_indx = np.concatenate(totsim_indx + [np.array([], dtype=int)])
 
-    age_prior_model : dict
-        age prior model in the BEAST dictonary format
+        totsimmass = np.sum(grid_masses[totsim_indx])
+        print(f"number total simulated stars = {nsim}; mass = {totsimmass}")
+        compl_choice = rangen.random(nsim)
+        compl_indx = model_compl[totsim_indx] >= compl_choice
+        sim_indx = totsim_indx[compl_indx]
+        totcompsimmass = np.sum(grid_masses[sim_indx])
+        print(
+            f"number of simulated stars w/ completeness = {len(sim_indx)}; "
+            f"mass = {totcompsimmass}"
+        )
 
-    mass_prior_model : dict
-        mass prior model in the BEAST dictonary format
+    else:  # total number of stars to simulate set by command line input
 
-    Returns
-    -------
+        if weight_to_use == "uniform":
+            # sample to get the indices of the picked models
+            sim_indx = rangen.choice(model_indx[goodobsmod], nsim)
+
+        else:
+            gridweights = (
+                np.asarray(sedgrid[weight_to_use])[goodobsmod]
+                * model_compl[goodobsmod]
+            )
+            gridweights = gridweights / np.sum(gridweights)
+
+            # sample to get the indexes of the picked models
+            sim_indx = rangen.choice(model_indx[goodobsmod], size=nsim, p=gridweights)
+
+        print(f"number of simulated stars = {nsim}")
+
+    return sim_indx
+
+
+def iter_SimObs_from_sedgrid(
+    sedgrid,
+    sedgrid_noisemodel,
+    nsim=100,
+    compl_filter="max",
+    complcut=None,
+    magcut=None,
+    ranseed=None,
+    vega_fname=None,
+    weight_to_use="weight",
+    age_prior_model=None,
+    mass_prior_model=None,
+    chunksize=1000000,
+):
+    """
+    Generate simulated observations using the physics and observation grids
+    in chunks of simulated observations.
+
+    The models are picked first, then the SEDs, noise model values and grid
+    parameters are only read for the models of each chunk and the noise of all
+    the filters of a chunk is drawn in one operation.  This allows simulating
+    large numbers of observations with the SED grid and noise model on disk
+    (e.g., SEDGrid with the disk backend and h5py datasets).
+
+    See :func:`gen_SimObs_from_sedgrid` for the details and other parameters.
+
+    Parameters
+    ----------
+    chunksize : int (default=1000000)
+        maximum number of simulated observations in each chunk,
+        set to None for a single chunk
+
+    Yields
+    ------
     simtable : astropy Table
         table giving the simulated observed fluxes as well as the
-        physics model parmaeters
+        physics model parmaeters for a chunk of the simulated observations
     """
     n_models, n_filters = sedgrid.seds.shape
     flux = sedgrid.seds
@@ -286,11 +384,6 @@ def gen_SimObs_from_sedgrid(
     # get the vega fluxes for the filters
     _, vega_flux, _ = Vega(source=vega_fname).getFlux(sedgrid.filters)
 
-    # cache the noisemodel values
-    model_bias = sedgrid_noisemodel["bias"]
-    model_unc = np.fabs(sedgrid_noisemodel["error"])
-    model_compl = sedgrid_noisemodel["completeness"]
-
     # only use models that have non-zero completeness in all filters
     # zero completeness means the observation model is not defined for that filters/flux
     # if complcut is provided, only use models above that completeness cut
@@ -299,15 +392,11 @@ def gen_SimObs_from_sedgrid(
     else:
         finalcomplcut = 0.0
 
-    ast_defined = model_compl > finalcomplcut
-    sum_ast_defined = np.sum(ast_defined, axis=1)
-    goodobsmod = sum_ast_defined >= n_filters
-
     # completeness from toothpick model so n band completeness values
     # require only 1 completeness value for each model
     # max picked to best "simulate" how the photometry detection is done
     if compl_filter.lower() == "max":
-        model_compl = np.max(model_compl, axis=1)
+        filter_k = None
     else:
         short_filters = [
             filter.split(sep="_")[-1].upper() for filter in sedgrid.filters
@@ -322,134 +411,169 @@ def gen_SimObs_from_sedgrid(
 
         filter_k = short_filters.index(compl_filter.upper())
         print("Completeness from %s" % sedgrid.filters[filter_k])
-        model_compl = model_compl[:, filter_k]
+
+    # process the noise model completeness in blocks of models to avoid
+    # full size temporary arrays
+    goodobsmod = np.zeros(n_models, dtype=bool)
+    model_compl = np.zeros(n_models, dtype=float)
+    nblock = 1000000
+    for k1 in range(0, n_models, nblock):
+        k2 = min(k1 + nblock, n_models)
+        block_compl = np.asarray(sedgrid_noisemodel["completeness"][k1:k2])
+        goodobsmod[k1:k2] = np.all(block_compl > finalcomplcut, axis=1)
+        if filter_k is None:
+            model_compl[k1:k2] = np.max(block_compl, axis=1)
+        else:
+            model_compl[k1:k2] = block_compl[:, filter_k]
 
     # if magcut is provided, only use models brighter than the magnitude cut
     # in addition to the non-zero completeness criterion
     if magcut is not None:
+        if filter_k is None:
+            raise ValueError("magcut requires a single compl_filter")
         fluxcut_compl_filter = 10 ** (-0.4 * magcut) * vega_flux[filter_k]
         goodobsmod = (goodobsmod) & (flux[:, filter_k] >= fluxcut_compl_filter)
 
     # initialize the random number generator
     rangen = default_rng(ranseed)
 
-    # if the age and mass prior models are given, use them to determine the
-    # total number of stars to simulate
-    model_indx = np.arange(n_models)
-    if (age_prior_model is not None) and (mass_prior_model is not None):
-        nsim = 0
-        # logage_range = [min(sedgrid["logA"]), max(sedgrid["logA"])]
-        mass_range = [min(sedgrid["M_ini"]), max(sedgrid["M_ini"])]
+    sim_indx = _select_sim_models(
+        sedgrid,
+        model_compl,
+        goodobsmod,
+        rangen,
+        nsim=nsim,
+        weight_to_use=weight_to_use,
+        age_prior_model=age_prior_model,
+        mass_prior_model=mass_prior_model,
+    )
+    del model_compl, goodobsmod
 
-        # compute the total mass and average mass of a star given the mass_prior_model
-        nmass = 100
-        masspts = np.logspace(np.log10(mass_range[0]), np.log10(mass_range[1]), nmass)
-        mass_prior = PriorMassModel(mass_prior_model)
-        massprior = mass_prior(masspts)
-        totmass = np.trapezoid(massprior, masspts)
-        avemass = np.trapezoid(masspts * massprior, masspts) / totmass
+    qnames = list(sedgrid.keys())
+    bnames = [filter.split(sep="_")[-1].upper() for filter in sedgrid.filters]
+    n_sim = len(sim_indx)
+    if chunksize is None or chunksize <= 0:
+        chunksize = max(n_sim, 1)
+
+    for k1 in range(0, max(n_sim, 1), chunksize):
+        cindx = sim_indx[k1 : k1 + chunksize]
+
+        # simulated data (all filters at once)
+        cflux = _take_rows(flux, cindx)
+        simflux_wbias = cflux + _take_rows(sedgrid_noisemodel["bias"], cindx)
+        model_unc = np.fabs(_take_rows(sedgrid_noisemodel["error"], cindx))
+        simflux = rangen.normal(loc=simflux_wbias.T, scale=model_unc.T).T
+
+        cols = {}
+        for k, bname in enumerate(bnames):
+            # simulated fluxes and the physical model values in a form
+            # similar to the output simulated (physics+obs models) values
+            # useful if using the simulated data to interpolate ASTs
+            #   (e.g. for MATCH)
+            for prefix, cvals in [("", simflux[:, k]), ("_INPUT", cflux[:, k])]:
+                crate = cvals / vega_flux[k]
+                cmag = crate.copy()
+                pindxs = crate > 0.0
+                cmag[pindxs] = -2.5 * np.log10(crate[pindxs])
+                cmag[crate <= 0.0] = 99.999
+                cols[f"{bname}{prefix}_FLUX"] = cvals
+                cols[f"{bname}{prefix}_RATE"] = crate
+                cols[f"{bname}{prefix}_VEGA"] = cmag
+
+        # model parmaeters
+        if isinstance(sedgrid.grid, Table):
+            for qname in qnames:
+                cols[qname] = sedgrid[qname][cindx]
+        else:
+            grid_rows = _take_rows(sedgrid.grid, cindx)
+            for qname in qnames:
+                cols[qname] = grid_rows[qname]
 
-        # compute the mass of the remaining stars at each age and
-        # simulate the stars assuming everything is complete
-        gridweights = sedgrid[weight_to_use]
-        gridweights = gridweights / np.sum(gridweights)
+        yield Table(cols)
 
-        grid_ages = np.unique(sedgrid["logA"])
-        age_prior = PriorAgeModel(age_prior_model)
-        ageprior = age_prior(grid_ages)
-        bin_boundaries = compute_bin_boundaries(grid_ages)
-        bin_widths = np.diff(10 ** (bin_boundaries))
-        totsim_indx = np.array([], dtype=int)
-        for cage, cwidth, cprior in zip(grid_ages, bin_widths, ageprior):
-            gmods = sedgrid["logA"] == cage
-            cur_mass_range = [
-                min(sedgrid["M_ini"][gmods]),
-                max(sedgrid["M_ini"][gmods]),
-            ]
-            gmass = (masspts >= cur_mass_range[0]) & (masspts <= cur_mass_range[1])
-            curmasspts = masspts[gmass]
-            curmassprior = massprior[gmass]
-            totcurmass = np.trapezoid(curmassprior, curmasspts)
 
-            # compute the mass remaining at each age -> this is the mass to simulate
-            simmass = cprior * cwidth * totcurmass / totmass
-            nsim_curage = int(round(simmass / avemass))
+def gen_SimObs_from_sedgrid(
+    sedgrid,
+    sedgrid_noisemodel,
+    nsim=100,
+    compl_filter="max",
+    complcut=None,
+    magcut=None,
+    ranseed=None,
+    vega_fname=None,
+    weight_to_use="weight",
+    age_prior_model=None,
+    mass_prior_model=None,
+):
+    """
+    Generate simulated observations using the physics and observation grids.
+    The priors are sampled as they give the ensemble model for the stellar
+    and dust distributions (IMF, Av distribution etc.).
+    The physics model gives the SEDs based on the priors.
+    The observation model gives the noise, bias, and completeness all of
+    which are used in simulating the observations.
 
-            # simluate the stars at the current age
-            curweights = gridweights[gmods]
-            if np.sum(curweights) > 0:
-                curweights /= np.sum(curweights)
-                cursim_indx = rangen.choice(
-                    model_indx[gmods], size=nsim_curage, p=curweights
-                )
+    Currently written to only work for the toothpick noisemodel.
 
-                totsim_indx = np.concatenate((totsim_indx, cursim_indx))
+    Parameters
+    ----------
+    sedgrid: grid.SEDgrid instance
+        model grid
 
-                nsim += nsim_curage
-            # totsimcurmass = np.sum(sedgrid["M_ini"][cursim_indx])
-            # print(cage, totcurmass / totmass, simmass, totsimcurmass, nsim_curage)
+    sedgrid_noisemodel: beast noisemodel instance
+        noise model data
 
-        totsimmass = np.sum(sedgrid["M_ini"][totsim_indx])
-        print(f"number total simulated stars = {nsim}; mass = {totsimmass}")
-        compl_choice = rangen.random(nsim)
-        compl_indx = model_compl[totsim_indx] >= compl_choice
-        sim_indx = totsim_indx[compl_indx]
-        totcompsimmass = np.sum(sedgrid["M_ini"][sim_indx])
-        print(f"number of simulated stars w/ completeness = {len(sim_indx)}; mass = {totcompsimmass}")
+    nsim : int
+        number of observations to simulate
 
-    else:  # total number of stars to simulate set by command line input
+    compl_filter : str
+        Filter to use for completeness (required for toothpick model).
+        Set to max to use the max value in all filters.
 
-        if weight_to_use == "uniform":
-            # sample to get the indices of the picked models
-            sim_indx = rangen.choice(model_indx[goodobsmod], nsim)
+    complcut : float (defualt=None)
+        completeness cut for only including model seds above the cut
+        where the completeness cut ranges between 0 and 1.
 
-        else:
-            gridweights = sedgrid[weight_to_use][goodobsmod] * model_compl[goodobsmod]
-            gridweights = gridweights / np.sum(gridweights)
+    magcut : float (defualt=None)
+        faint-end magnitude cut for only including model seds brighter
+        than the given magnitude in compl_filter.
 
-            # sample to get the indexes of the picked models
-            sim_indx = rangen.choice(model_indx[goodobsmod], size=nsim, p=gridweights)
+    ranseed : int
+        used to set the seed to make the results reproducable,
+        useful for testing
 
-        print(f"number of simulated stars = {nsim}")
+    vega_fname : string
+        filename for the vega info, useful for testing
 
-    # setup the output table
-    ot = Table()
-    qnames = list(sedgrid.keys())
-    # simulated data
-    for k, filter in enumerate(sedgrid.filters):
-        simflux_wbias = flux[sim_indx, k] + model_bias[sim_indx, k]
-
-        simflux = rangen.normal(loc=simflux_wbias, scale=model_unc[sim_indx, k])
-
-        bname = filter.split(sep="_")[-1].upper()
-        fluxname = f"{bname}_FLUX"
-        colname = f"{bname}_RATE"
-        magname = f"{bname}_VEGA"
-        ot[fluxname] = Column(simflux)
-        ot[colname] = Column(ot[fluxname] / vega_flux[k])
-        pindxs = ot[colname] > 0.0
-        nindxs = ot[colname] <= 0.0
-        ot[magname] = Column(ot[colname])
-        ot[magname][pindxs] = -2.5 * np.log10(ot[colname][pindxs])
-        ot[magname][nindxs] = 99.999
-
-        # add in the physical model values in a form similar to
-        # the output simulated (physics+obs models) values
-        # useful if using the simulated data to interpolate ASTs
-        #   (e.g. for MATCH)
-        fluxname = f"{bname}_INPUT_FLUX"
-        ratename = f"{bname}_INPUT_RATE"
-        magname = f"{bname}_INPUT_VEGA"
-        ot[fluxname] = Column(flux[sim_indx, k])
-        ot[ratename] = Column(ot[fluxname] / vega_flux[k])
-        pindxs = ot[ratename] > 0.0
-        nindxs = ot[ratename] <= 0.0
-        ot[magname] = Column(ot[ratename])
-        ot[magname][pindxs] = -2.5 * np.log10(ot[ratename][pindxs])
-        ot[magname][nindxs] = 99.999
-
-    # model parmaeters
-    for qname in qnames:
-        ot[qname] = Column(sedgrid[qname][sim_indx])
-
-    return ot
+    weight_to_use : string (default='weight')
+        Set to either 'weight' (prior+grid), 'prior_weight', 'grid_weight',
+        or 'uniform' (this option is valid only when nsim is supplied) to
+        choose the weighting for SED selection.
+
+    age_prior_model : dict
+        age prior model in the BEAST dictonary format
+
+    mass_prior_model : dict
+        mass prior model in the BEAST dictonary format
+
+    Returns
+    -------
+    simtable : astropy Table
+        table giving the simulated observed fluxes as well as the
+        physics model parmaeters
+    """
+    (simtable,) = iter_SimObs_from_sedgrid(
+        sedgrid,
+        sedgrid_noisemodel,
+        nsim=nsim,
+        compl_filter=compl_filter,
+        complcut=complcut,
+        magcut=magcut,
+        ranseed=ranseed,
+        vega_fname=vega_fname,
+        weight_to_use=weight_to_use,
+        age_prior_model=age_prior_model,
+        mass_prior_model=mass_prior_model,
+        chunksize=None,
+    )
+    return simtable
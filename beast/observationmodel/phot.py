@@ -15,7 +15,11 @@ This also include functions to keep libraries up to date
     comparison to the uncertainties induced by trapeze integration.
 """
 
+import os
 import sys
+import copy
+import hashlib
+from collections import OrderedDict
 import numpy
 
 import tables
@@ -37,6 +41,8 @@ __all__ = [
     "load_Integrationfilters",
     "extractPhotometry",
     "extractSEDs",
+    "PhotometricOperator",
+    "get_photometric_operator",
     "STmag_to_flux",
     "STmag_from_flux",
     "fluxToMag",
@@ -308,9 +314,111 @@ def load_all_filters(interp=True, lamb=None, filterLib=None):
     return filters
 
 
+# filter curves already read from the filter libraries, only for the
+#   current version of each library
+#   keyed by (filter library, modification time, filter name)
+_filter_curves = {}
+
+# filters interpolated on wavelength grids, least recently used first
+#   keyed by (filter library, modification time, filter name, wavelengths)
+_interp_filters = OrderedDict()
+_max_interp_filters = 256
+
+
+def _file_mtime(fname):
+    """Modification time of a file, None if it does not exist"""
+    try:
+        return os.stat(fname).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _lamb_digest(lamb):
+    """Digest of a wavelength grid, the same in all the processes"""
+    return hashlib.sha1(lamb.tobytes()).hexdigest()
+
+
+def _read_filter_curves(names, filterLib):
+    """Read filter definitions from the library
+
+    The library is only opened for filters not already read by this process
+    (or if the library file changed since).
+
+    Parameters
+    ----------
+    names: list[str]
+        normalized names according to filtersLib
+
+    filterLib: path
+        path to the filter library hd5 file
+
+    Returns
+    -------
+    curves: list[tuple]
+        (wavelength, throughput, name) of each filter
+    """
+    mtime = _file_mtime(filterLib)
+    missing = [
+        fname for fname in names if (filterLib, mtime, fname) not in _filter_curves
+    ]
+    if len(missing) > 0:
+        # drop the curves of the previous versions of the library
+        for ckey in [
+            ckey
+            for ckey in _filter_curves
+            if ckey[0] == filterLib and ckey[1] != mtime
+        ]:
+            del _filter_curves[ckey]
+        with tables.open_file(filterLib, "r") as ftab:
+            for fname in missing:
+                fnode = ftab.get_node("/filters/" + fname)
+                flamb = fnode[:]["WAVELENGTH"]
+                transmit = fnode[:]["THROUGHPUT"]
+                flamb.setflags(write=False)
+                transmit.setflags(write=False)
+                _filter_curves[(filterLib, mtime, fname)] = (
+                    flamb,
+                    transmit,
+                    fnode.name,
+                )
+    return [_filter_curves[(filterLib, mtime, fname)] for fname in names]
+
+
+def _interp_filter(filterLib, flamb, transmit, fname, lamb):
+    """Filter interpolated on a wavelength grid
+
+    The interpolated filters are kept for the duration of the process, a
+    shallow copy sharing the read-only throughput is returned.
+    """
+    key = (
+        filterLib,
+        _file_mtime(filterLib),
+        fname,
+        lamb.shape,
+        _lamb_digest(lamb),
+    )
+    filt = _interp_filters.get(key)
+    if filt is None:
+        lamb = lamb.copy()
+        lamb.setflags(write=False)
+        ifT = numpy.interp(lamb, flamb, transmit, left=0.0, right=0.0)
+        ifT.setflags(write=False)
+        filt = Filter(lamb, ifT, name=fname)
+        _interp_filters[key] = filt
+        if len(_interp_filters) > _max_interp_filters:
+            _interp_filters.popitem(last=False)
+    else:
+        _interp_filters.move_to_end(key)
+    return copy.copy(filt)
+
+
 def load_filters(names, interp=True, lamb=None, filterLib=None):
     """load a limited set of filters
 
+    The filter curves (and their interpolations on `lamb`) are read once
+    per process and shared as read-only arrays between the returned
+    filters.
+
     Parameters
     ----------
     names: list[str]
@@ -332,8 +440,14 @@ def load_filters(names, interp=True, lamb=None, filterLib=None):
     """
     if filterLib is None:
         filterLib = __default__
-    with tables.open_file(filterLib, "r") as ftab:
-        filters = [__load__(fname, ftab, interp=interp, lamb=lamb) for fname in names]
+    if interp & (lamb is not None):
+        lamb = numpy.ascontiguousarray(lamb, dtype=float)
+    filters = []
+    for flamb, transmit, fname in _read_filter_curves(names, filterLib):
+        if interp & (lamb is not None):
+            filters.append(_interp_filter(filterLib, flamb, transmit, fname, lamb))
+        else:
+            filters.append(Filter(flamb.copy(), transmit.copy(), name=fname))
     return filters
 
 
@@ -447,6 +561,161 @@ def extractSEDs(g0, flist, absFlux=True):
     return cls, seds, g0.grid
 
 
+class PhotometricOperator(object):
+    """Linear operator extracting integrated fluxes from spectra
+
+    The trapezoid integration of lamb * T(lamb) * spectrum done by
+    :func:`extractSEDs` for each filter is precomputed as a
+    (n_lambda, n_filters) weights matrix.  The SEDs of many spectra are then
+    given by a single matrix product.
+
+    Attributes
+    ----------
+    lamb: ndarray[float, ndim=1]
+        wavelength definition of the spectra
+
+    names: list[str]
+        filter names
+
+    cls: ndarray[float, ndim=1]
+        filters central wavelength
+
+    matrix: ndarray[float, ndim=2]
+        (n_lambda, n_filters) integration weights, including the
+        normalization by the integral of lambda T dlambda
+    """
+
+    def __init__(self, lamb, flist):
+        """Constructor
+
+        Parameters
+        ----------
+        lamb: ndarray[float, ndim=1]
+            wavelength definition of the spectra
+
+        flist: sequence(filter)
+            list of filter object instances defined on lamb
+        """
+        self.lamb = numpy.asarray(lamb, dtype=float)
+        self.names = [k.name for k in flist]
+        self.cls = numpy.array([k.cl for k in flist], dtype=float)
+        self.matrix = numpy.zeros((len(self.lamb), len(flist)), dtype=float)
+        for e, k in enumerate(flist):
+            xl = numpy.where(k.transmit > 0.0)[0]
+            if len(xl) < 2:
+                continue
+            # trapezoid weights on the wavelengths inside the filter
+            x = self.lamb[xl]
+            dx = 0.5 * numpy.diff(x)
+            w = numpy.zeros(len(x), dtype=float)
+            w[:-1] += dx
+            w[1:] += dx
+            self.matrix[xl, e] = w * x * k.transmit[xl] / k.lT
+        self.matrix.setflags(write=False)
+
+    def getSEDs(self, spec, absFlux=True, chunksize=100000):
+        """Integrated fluxes of spectra
+
+        Parameters
+        ----------
+        spec: ndarray[float, ndim=2]
+            (n_spectra, n_lambda) spectra
+
+        absflux: bool
+            return SEDs in absolute fluxes if set
+
+        chunksize: int
+            number of spectra read and processed at once
+
+        Returns
+        -------
+        seds: ndarray[float, ndim=2]
+            (n_spectra, n_filters) integrated seds
+        """
+        n_spec = spec.shape[0]
+        seds = numpy.empty((n_spec, len(self.names)), dtype=float)
+        for k in range(0, n_spec, chunksize):
+            seds[k : k + chunksize] = numpy.dot(
+                numpy.asarray(spec[k : k + chunksize], dtype=float), self.matrix
+            )
+        if absFlux:
+            seds /= distc
+        return seds
+
+    def extractSEDs(self, g0, absFlux=True):
+        """Extract seds from a grid, equivalent to :func:`extractSEDs`
+
+        Parameters
+        ----------
+        g0: ModelGrid instance
+            initial spectral grid defined on self.lamb
+
+        absflux: bool
+            return SEDs in absolute fluxes if set
+
+        Returns
+        -------
+        cls: ndarray[float, ndim=1]
+            filters central wavelength
+
+        seds: ndarray[float, ndim=2]
+            integrated sed
+
+        grid: Table
+            SED grid properties table from g0 (g0.grid)
+        """
+        return self.cls, self.getSEDs(g0.seds, absFlux=absFlux), g0.grid
+
+
+# photometric operators already computed, least recently used first
+_photometric_operators = OrderedDict()
+_max_photometric_operators = 32
+
+
+def get_photometric_operator(names, lamb, filterLib=None):
+    """Photometric operator for a set of filters on a wavelength definition
+
+    Operators are kept for the duration of the process and reused when
+    requested again for the same filters, wavelengths, and filter library.
+
+    Parameters
+    ----------
+    names: list[str]
+        normalized names according to filtersLib
+
+    lamb: ndarray[float, ndim=1]
+        wavelength definition of the spectra
+
+    filterLib: path
+        path to the filter library hd5 file
+
+    Returns
+    -------
+    op: PhotometricOperator
+        the corresponding operator
+    """
+    if filterLib is None:
+        filterLib = __default__
+    _lamb = numpy.ascontiguousarray(lamb, dtype=float)
+    key = (
+        filterLib,
+        _file_mtime(filterLib),
+        tuple(names),
+        _lamb.shape,
+        _lamb_digest(_lamb),
+    )
+    op = _photometric_operators.get(key)
+    if op is None:
+        flist = load_filters(names, interp=True, lamb=_lamb, filterLib=filterLib)
+        op = PhotometricOperator(_lamb, flist)
+        _photometric_operators[key] = op
+        if len(_photometric_operators) > _max_photometric_operators:
+            _photometric_operators.popitem(last=False)
+    else:
+        _photometric_operators.move_to_end(key)
+    return op
+
+
 def STmag_to_flux(v):
     r"""
     Convert an ST magnitude to erg/s/cm2/AA (Flambda)
@@ -0,0 +1,128 @@
+from types import SimpleNamespace
+
+import numpy as np
+from astropy.table import Table
+from matplotlib.path import Path
+
+from beast.observationmodel.ast.make_ast_xy_list import (
+    pick_positions_from_map,
+    _sample_positions_in_tiles,
+)
+from beast.tools.cut_catalogs import convexhull_path
+from beast.tools.density_map import BinnedDensityMap
+
+
+def _density_map(n_ra=4, n_dec=4):
+    """ Map with low values for the first two RA columns, high ones after """
+    i_ra, i_dec = np.meshgrid(np.arange(n_ra), np.arange(n_dec), indexing="ij")
+    i_ra = i_ra.ravel()
+    i_dec = i_dec.ravel()
+    tab = Table(
+        {
+            "i_ra": i_ra,
+            "i_dec": i_dec,
+            "value": np.where(i_ra < 2, 1.0, 5.0),
+            "min_ra": i_ra.astype(float),
+            "max_ra": i_ra + 1.0,
+            "min_dec": i_dec.astype(float),
+            "max_dec": i_dec + 1.0,
+        }
+    )
+    tab.meta["ra_grid"] = np.arange(n_ra + 1, dtype=float)
+    tab.meta["dec_grid"] = np.arange(n_dec + 1, dtype=float)
+    return tab
+
+
+def _in_tiles(ra, dec, tiles, tab):
+    """ Tile of each position (-1 if not in any of the tiles) """
+    intile = np.full(len(ra), -1)
+    for t in tiles:
+        inside = (
+            (ra >= tab["min_ra"][t])
+            & (ra < tab["max_ra"][t])
+            & (dec >= tab["min_dec"][t])
+            & (dec < tab["max_dec"][t])
+        )
+        intile[inside] = t
+    return intile
+
+
+def test_sample_positions_in_tiles():
+    np.random.seed(3)
+    tab = _density_map()
+    tile_set = np.array([1, 2, 5, 6])
+    # boundary cutting through the tiles
+    boundary = Path([(0.5, 0.5), (3.5, 0.5), (3.5, 3.5), (0.5, 3.5)])
+    n_pos = 4000
+
+    ra, dec = _sample_positions_in_tiles(
+        n_pos,
+        tile_set,
+        np.asarray(tab["min_ra"]),
+        np.asarray(tab["min_dec"]),
+        np.asarray(tab["max_ra"] - tab["min_ra"]),
+        np.asarray(tab["max_dec"] - tab["min_dec"]),
+        [boundary],
+        oversample=1.0,
+    )
+
+    assert len(ra) == n_pos
+    assert np.all(boundary.contains_points(np.column_stack([ra, dec])))
+    intile = _in_tiles(ra, dec, tile_set, tab)
+    assert np.all(intile >= 0)
+
+    # tiles are picked uniformly, then positions outside of the boundary
+    # are rejected: tiles 1 and 2 (RA in [0, 1]) have half of their area
+    # inside the boundary, tiles 5 and 6 are fully inside
+    area = {1: 0.5, 2: 0.5, 5: 1.0, 6: 1.0}
+    counts = np.array([np.sum(intile == t) for t in tile_set])
+    expected = n_pos * np.array([area[t] for t in tile_set]) / sum(area.values())
+    np.testing.assert_allclose(counts, expected, rtol=0.15)
+
+
+def test_pick_positions_from_map(tmp_path):
+    np.random.seed(5)
+    tab = _density_map()
+    map_fname = str(tmp_path / "map.hd5")
+    tab.write(map_fname, format="hdf5", path="tile_data")
+
+    # catalog covering most of the map
+    rng = np.random.default_rng(1)
+    cat = Table({"RA": rng.uniform(0.2, 3.8, 200), "DEC": rng.uniform(0.2, 3.8, 200)})
+    catalog = SimpleNamespace(data=cat)
+
+    n_models = 3
+    n_realize = 4
+    chosen_seds = Table({"F1": np.arange(n_models) + 20.0})
+    out = pick_positions_from_map(
+        catalog,
+        chosen_seds,
+        map_fname,
+        "linear",
+        2,
+        None,
+        None,
+        n_realize,
+    )
+
+    bdm = BinnedDensityMap.create(map_fname, N_bins=2)
+    tile_sets = [ts for ts in bdm.tiles_foreach_bin() if len(ts)]
+    n_sets = len(tile_sets)
+    assert n_sets == 2
+    assert len(out) == n_models * n_realize * n_sets
+
+    ra = np.asarray(out["RA"])
+    dec = np.asarray(out["DEC"])
+    hull = convexhull_path(np.asarray(cat["RA"]), np.asarray(cat["DEC"]))
+    assert np.all(hull.contains_points(np.column_stack([ra, dec])))
+
+    # positions are interleaved between the bins, each model being placed
+    # n_realize times in each bin
+    for bin_index, tile_set in enumerate(tile_sets):
+        intile = _in_tiles(ra[bin_index::n_sets], dec[bin_index::n_sets], tile_set, tab)
+        assert np.all(intile >= 0)
+        models = np.asarray(out["F1"][bin_index::n_sets])
+        np.testing.assert_array_equal(
+            models, np.repeat(chosen_seds["F1"], n_realize)
+        )
+
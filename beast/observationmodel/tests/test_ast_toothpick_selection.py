@@ -0,0 +1,93 @@
+import numpy as np
+from astropy.table import Table
+
+from beast.observationmodel import vega
+from beast.observationmodel.ast.make_ast_input_list import (
+    _rank_in_group,
+    _toothpick_fluxbins,
+    pick_models_toothpick_style,
+)
+from beast.benchmarks.synthetic import make_sed_grid, make_vega_file
+
+
+def test_toothpick_bulk_acceptance():
+    rng = np.random.default_rng(1234)
+    n_fluxes, n_filters, min_n = 8, 3, 5
+    mags = rng.normal(size=(500, n_filters))
+    bin_maxs = np.linspace(-2.0, 2.0, n_fluxes)[:, None] * np.ones(n_filters)
+    fluxbins = _toothpick_fluxbins(mags, bin_maxs, n_fluxes)
+
+    # sequential reference: one model at a time
+    ref_count = np.zeros((n_fluxes, n_filters))
+    ref_add = np.full(len(mags), False)
+    for r in range(len(mags)):
+        if (ref_count[fluxbins[r], range(n_filters)] < min_n).any():
+            ref_count[fluxbins[r], range(n_filters)] += 1
+            ref_add[r] = True
+
+    # bulk version used in pick_models_toothpick_style
+    add = np.full(len(mags), False)
+    for fltr in range(n_filters):
+        add |= _rank_in_group(fluxbins[:, fltr]) < min_n
+    count = np.zeros((n_fluxes, n_filters))
+    for fltr in range(n_filters):
+        count[:, fltr] += np.bincount(fluxbins[add, fltr], minlength=n_fluxes)
+
+    np.testing.assert_array_equal(add, ref_add)
+    np.testing.assert_array_equal(count, ref_count)
+
+
+def test_pick_models_toothpick_style(tmp_path, monkeypatch):
+    filters = ["SYNTH_A", "SYNTH_B", "SYNTH_C"]
+    make_vega_file(str(tmp_path / "vega.hd5"), filters)
+    monkeypatch.setattr(vega, "__ROOT__", str(tmp_path))
+
+    sedgrid = make_sed_grid(3000, filters, ranseed=2)
+    sedgrid.grid["logL"] = np.full(len(sedgrid.grid), 1.0)
+    # models excluded from the selection
+    sedgrid.grid["logL"][:10] = -9.999
+    sedgrid_fname = str(tmp_path / "seds.grid.hd5")
+    sedgrid.write(sedgrid_fname)
+
+    n_fluxes, min_n = 20, 10
+    bins_fname = str(tmp_path / "bins.txt")
+    params_fname = str(tmp_path / "params.fits")
+    kwargs = {"bins_outfile": bins_fname, "ranseed": 1234}
+    chosen = pick_models_toothpick_style(
+        sedgrid_fname,
+        filters,
+        n_fluxes,
+        min_n,
+        outfile_params=params_fname,
+        **kwargs
+    )
+
+    # reproducible with the same seed
+    chosen2 = pick_models_toothpick_style(
+        sedgrid_fname, filters, n_fluxes, min_n, **kwargs
+    )
+    for cname in filters:
+        np.testing.assert_array_equal(chosen[cname], chosen2[cname])
+
+    params = Table.read(params_fname)
+    assert np.all(params["sedgrid_indx"] >= 10)
+    _, vega_flux, _ = vega.Vega().getFlux(filters)
+    mags = -2.5 * np.log10(sedgrid.seds[params["sedgrid_indx"]] / vega_flux)
+    for k, cname in enumerate(filters):
+        np.testing.assert_allclose(chosen[cname], mags[:, k])
+
+    # every bin is filled, up to the number of models it contains
+    allmags = -2.5 * np.log10(sedgrid.seds[10:] / vega_flux)
+    bins = Table.read(bins_fname, format="ascii")
+    for k, cname in enumerate(filters):
+        bin_maxs = np.asarray(bins["bin_maxs_" + cname])[:, None]
+        n_models = np.bincount(
+            _toothpick_fluxbins(allmags[:, [k]], bin_maxs, n_fluxes)[:, 0],
+            minlength=n_fluxes,
+        )
+        n_chosen = np.bincount(
+            _toothpick_fluxbins(mags[:, [k]], bin_maxs, n_fluxes)[:, 0],
+            minlength=n_fluxes,
+        )
+        np.testing.assert_array_equal(n_chosen, bins["bin_count_" + cname])
+        assert np.all(n_chosen >= np.minimum(n_models, min_n))
@@ -0,0 +1,34 @@
+import numpy as np
+
+from astropy.table import Table
+
+from beast.observationmodel import phot
+from beast.physicsmodel.grid import SpectralGrid
+
+
+def test_photometric_operator_matches_extractSEDs():
+    lamb = np.linspace(1000.0, 20000.0, 500)
+    # gaussian and top-hat filters with a gap in the transmission
+    flist = []
+    for k, cwave in enumerate([3000.0, 6000.0, 12000.0]):
+        transmit = np.exp(-0.5 * ((lamb - cwave) / (100.0 * (k + 3))) ** 2)
+        transmit[transmit < 1e-3] = 0.0
+        flist.append(phot.Filter(lamb, transmit, name=f"gauss{k}"))
+    transmit = ((lamb > 4000.0) & (lamb < 9000.0)).astype(float)
+    transmit[(lamb > 5000.0) & (lamb < 5500.0)] = 0.0
+    flist.append(phot.Filter(lamb, transmit, name="tophat"))
+
+    rng = np.random.default_rng(10)
+    specs = rng.uniform(0.1, 10.0, (20, len(lamb)))
+    g = SpectralGrid(lamb, seds=specs, grid=Table({"a": np.arange(20)}))
+
+    ref_cls, ref_seds, _ = phot.extractSEDs(g, flist)
+
+    op = phot.PhotometricOperator(lamb, flist)
+    cls, seds, _ = op.extractSEDs(g)
+
+    np.testing.assert_allclose(cls, ref_cls)
+    np.testing.assert_allclose(seds, ref_seds, rtol=1e-12)
+    np.testing.assert_allclose(
+        op.getSEDs(specs, absFlux=False, chunksize=7), ref_seds * phot.distc
+    )
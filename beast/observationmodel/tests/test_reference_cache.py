@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+
+from beast.observationmodel import phot, vega
+from beast.benchmarks.synthetic import make_filter_library, make_vega_file
+
+
+def test_filter_cache(tmp_path):
+    filter_names = ["SYNTH_A", "SYNTH_B", "SYNTH_C"]
+    filterLib = str(tmp_path / "filters.hd5")
+    make_filter_library(filterLib, filter_names)
+    lamb = np.linspace(1000.0, 30000.0, 2000)
+
+    # shared read-only curves, same values as without cache
+    flist1 = phot.load_filters(filter_names, lamb=lamb, filterLib=filterLib)
+    flist2 = phot.load_filters(filter_names, lamb=lamb, filterLib=filterLib)
+    for f1, f2 in zip(flist1, flist2):
+        assert f1 is not f2
+        assert f1.transmit is f2.transmit
+        assert not f1.transmit.flags.writeable
+    raw = phot.load_filters(filter_names, interp=False, filterLib=filterLib)
+    for f1, fraw in zip(flist1, raw):
+        np.testing.assert_array_equal(
+            f1.transmit,
+            np.interp(lamb, fraw.wavelength, fraw.transmit, left=0.0, right=0.0),
+        )
+
+    # changed library: read again, the previous curves are dropped
+    make_filter_library(filterLib, filter_names)
+    os.utime(filterLib, ns=(1, 1))
+    phot.load_filters(filter_names[:1], interp=False, filterLib=filterLib)
+    lib_keys = [key for key in phot._filter_curves if key[0] == filterLib]
+    assert lib_keys == [(filterLib, 1, filter_names[0])]
+
+
+def test_vega_cache(tmp_path):
+    filter_names = ["SYNTH_A", "SYNTH_B", "SYNTH_C"]
+    vega_fname = str(tmp_path / "vega.hd5")
+    make_vega_file(vega_fname, filter_names)
+
+    # read once, returned values can be modified
+    names, flux, cwave = vega.Vega(source=vega_fname).getFlux(filter_names[::-1])
+    assert [name.decode() for name in names] == filter_names[::-1]
+    flux *= 2
+    _, flux2, _ = vega.Vega(source=vega_fname).getFlux(filter_names[::-1])
+    np.testing.assert_array_equal(flux, 2 * flux2)
+
+    # changed files are read again
+    make_vega_file(vega_fname, filter_names[:1])
+    os.utime(vega_fname, ns=(1, 1))
+    names, _, _ = vega.Vega(source=vega_fname).getMag(filter_names[:1])
+    assert len(names) == 1
+    assert len([key for key in vega._vega_tables if key[0] == vega_fname]) == 1
@@ -0,0 +1,131 @@
+import numpy as np
+import h5py
+import tables
+import pytest
+from astropy.table import Table, vstack
+
+from beast.physicsmodel.grid import SEDGrid
+from beast.observationmodel.observations import (
+    gen_SimObs_from_sedgrid,
+    iter_SimObs_from_sedgrid,
+)
+from beast.observationmodel import vega
+from beast.tools.simulate_obs import _write_table_chunks, simulate_obs
+
+
+@pytest.fixture
+def simobs_inputs(tmp_path):
+    """
+    Small SED grid, noise model and vega file
+    """
+    rng = np.random.default_rng(1234)
+    n_models = 5000
+    filters = ["HST_WFC3_F275W", "HST_WFC3_F475W", "HST_WFC3_F814W"]
+    n_filters = len(filters)
+
+    gtable = Table(
+        {
+            "logA": rng.integers(0, 10, n_models) * 0.1 + 6.0,
+            "M_ini": 10 ** rng.uniform(-1, 2, n_models),
+            "Av": rng.uniform(0, 3, n_models),
+            "weight": rng.random(n_models),
+        }
+    )
+    seds = 10 ** rng.uniform(-20, -15, (n_models, n_filters))
+    sedgrid = SEDGrid(
+        np.arange(1.0, n_filters + 1), seds=seds, grid=gtable, backend="memory"
+    )
+    sedgrid.header["filters"] = " ".join(filters)
+    noisemodel = {
+        "bias": seds * rng.normal(0.0, 0.1, seds.shape),
+        "error": seds * rng.uniform(0.01, 0.5, seds.shape),
+        "completeness": rng.uniform(-0.1, 1.0, seds.shape),
+    }
+
+    vega_fname = str(tmp_path / "vega.hd5")
+    with tables.open_file(vega_fname, "w") as vfile:
+        desc = {
+            "FNAME": tables.StringCol(20, pos=0),
+            "LUM": tables.Float64Col(pos=1),
+            "MAG": tables.Float64Col(pos=2),
+            "CWAVE": tables.Float64Col(pos=3),
+        }
+        vtable = vfile.create_table("/", "sed", desc)
+        for k, cfilter in enumerate(filters):
+            vtable.append([(cfilter.encode(), 10 ** (-17 + 0.3 * k), 0.0, 1e3 * k)])
+
+    return sedgrid, noisemodel, vega_fname
+
+
+def test_simobs_chunks(simobs_inputs, tmp_path):
+    sedgrid, noisemodel, vega_fname = simobs_inputs
+    kwargs = {"nsim": 2000, "ranseed": 42, "vega_fname": vega_fname}
+
+    simtable = gen_SimObs_from_sedgrid(sedgrid, noisemodel, **kwargs)
+    chunks = list(
+        iter_SimObs_from_sedgrid(sedgrid, noisemodel, chunksize=300, **kwargs)
+    )
+    assert len(chunks) == 7
+    chunktable = vstack(chunks)
+    assert chunktable.colnames == simtable.colnames
+
+    # same models and input fluxes, noise drawn per chunk
+    for cname in simtable.colnames:
+        if "_INPUT_" in cname or cname in sedgrid.keys():
+            np.testing.assert_array_equal(chunktable[cname], simtable[cname])
+
+    # grid and noise model on disk give the same results
+    sedgrid_fname = str(tmp_path / "seds.grid.hd5")
+    sedgrid.write(sedgrid_fname)
+    noise_fname = str(tmp_path / "noisemodel.hd5")
+    with h5py.File(noise_fname, "w") as nfile:
+        for ckey, cvals in noisemodel.items():
+            nfile[ckey] = cvals
+    with h5py.File(noise_fname, "r") as nfile:
+        diskgrid = SEDGrid(sedgrid_fname, backend="disk")
+        diskchunks = list(
+            iter_SimObs_from_sedgrid(diskgrid, nfile, chunksize=300, **kwargs)
+        )
+    for cname in simtable.colnames:
+        np.testing.assert_array_equal(vstack(diskchunks)[cname], chunktable[cname])
+
+    # streamed outputs
+    for ext in ["fits", "hdf5"]:
+        out_fname = str(tmp_path / f"simobs.{ext}")
+        assert _write_table_chunks(iter(chunks), out_fname) == len(chunktable)
+        outtable = Table.read(out_fname)
+        assert outtable.colnames == chunktable.colnames
+        for cname in chunktable.colnames:
+            np.testing.assert_array_equal(outtable[cname], chunktable[cname])
+
+
+def test_simulate_obs_chunks(simobs_inputs, tmp_path, monkeypatch):
+    sedgrid, noisemodel, vega_fname = simobs_inputs
+    monkeypatch.setattr(vega, "__ROOT__", str(tmp_path))
+
+    sedgrid_fname = str(tmp_path / "seds.grid.hd5")
+    sedgrid.write(sedgrid_fname)
+    noise_fname = str(tmp_path / "noisemodel.hd5")
+    with h5py.File(noise_fname, "w") as nfile:
+        for ckey, cvals in noisemodel.items():
+            nfile[ckey] = cvals
+
+    # two subgrids, written at once or in chunks
+    outtables = []
+    for chunksize in [None, 300]:
+        out_fname = str(tmp_path / f"simobs_{chunksize}.fits")
+        simulate_obs(
+            [sedgrid_fname] * 2,
+            [noise_fname] * 2,
+            out_fname,
+            nsim=2000,
+            ranseed=42,
+            chunksize=chunksize,
+        )
+        outtables.append(Table.read(out_fname))
+
+    assert len(outtables[0]) == len(outtables[1])
+    assert outtables[0].colnames == outtables[1].colnames
+    for cname in outtables[0].colnames:
+        if "_INPUT_" in cname or cname in sedgrid.keys():
+            np.testing.assert_array_equal(outtables[0][cname], outtables[1][cname])
@@ -1,4 +1,5 @@
 """ Handle vega spec/mags/fluxes manipulations """
+import os
 from functools import wraps
 import numpy
 
@@ -30,38 +31,60 @@ class Vega(object):
         if source is None:
             source = "{0}/vega.hd5".format(__ROOT__)
         self.source = source
-        self.hdf = None
 
     def __enter__(self):
         """ Enter context """
-        if self.hdf is None:
-            self.hdf = tables.open_file(self.source)
         return self
 
     def __exit__(self, *exc_info):
         """ end context """
-        if self.hdf is not None:
-            self.hdf.close()
-            self.hdf = None
         return False
 
+    def _select(self, filters, colname):
+        """ Return the names, given column and central wavelengths of filters """
+        vtab = _read_vega_table(self.source)
+        FNAME = vtab["FNAME"]
+        idx = numpy.asarray([numpy.where(FNAME == k.encode("utf-8")) for k in filters])
+        return (
+            numpy.ravel(FNAME[idx]),
+            numpy.ravel(vtab[colname][idx]),
+            numpy.ravel(vtab["CWAVE"][idx]),
+        )
+
     def getFlux(self, filters):
         """ Return vega abs. fluxes in filters """
-        with self as s:
-            FNAME = s.hdf.root.sed.cols.FNAME[:]
-            LUM = s.hdf.root.sed.cols.LUM[:]
-            CWAVE = s.hdf.root.sed.cols.CWAVE[:]
-        idx = numpy.asarray([numpy.where(FNAME == k.encode("utf-8")) for k in filters])
-        return numpy.ravel(FNAME[idx]), numpy.ravel(LUM[idx]), numpy.ravel(CWAVE[idx])
+        return self._select(filters, "LUM")
 
     def getMag(self, filters):
         """ Return vega abs. magnitudes in filters """
-        with self as s:
-            FNAME = s.hdf.root.sed.cols.FNAME[:]
-            MAG = s.hdf.root.sed.cols.MAG[:]
-            CWAVE = s.hdf.root.sed.cols.CWAVE[:]
-        idx = numpy.asarray([numpy.where(FNAME == k.encode("utf-8")) for k in filters])
-        return numpy.ravel(FNAME[idx]), numpy.ravel(MAG[idx]), numpy.ravel(CWAVE[idx])
+        return self._select(filters, "MAG")
+
+
+# vega tables already read, keyed by (file name, modification time)
+_vega_tables = {}
+
+
+def _read_vega_table(source):
+    """
+    Columns of the vega table as read-only arrays
+
+    The file is only read once per process (or again if it changed).
+    """
+    key = (source, os.stat(source).st_mtime_ns)
+    vtab = _vega_tables.get(key)
+    if vtab is None:
+        with tables.open_file(source) as hdf:
+            vtab = {
+                cname: hdf.root.sed.col(cname)
+                for cname in ["FNAME", "LUM", "MAG", "CWAVE"]
+            }
+        for cvals in vtab.values():
+            cvals.setflags(write=False)
+        # only keep the current version of the file
+        for ckey in [ckey for ckey in _vega_tables if ckey[0] == source]:
+            del _vega_tables[ckey]
+        _vega_tables[key] = vtab
+    return vtab
 
 
 def xxtestUnit():
@@ -36,6 +36,7 @@ from beast.observationmodel.noisemodel import absflux_covmat
 __all__ = [
     "gen_spectral_grid_from_stellib_given_points",
     "make_extinguished_grid",
+    "valid_dust_points",
     "add_spectral_properties",
     "calc_absflux_cov_matrices",
 ]
@@ -146,6 +147,28 @@ def _make_dust_fA_valid_points_generator(it, min_Rv, max_Rv):
     return npts, pts
 
 
+def valid_dust_points(avs, rvs, fAs):
+    """
+    Dust parameter points of the grid that are valid in the R(V) versus
+    f_A plane
+
+    Parameters
+    ----------
+    avs, rvs, fAs: ndarray
+        sampled Av, Rv and f_A values
+        (see `~beast.physicsmodel.model_grid.dust_grid_values`)
+
+    Returns
+    -------
+    pts: list of tuples
+        (Av, Rv, f_A) of the valid points
+    """
+    _, pts = _make_dust_fA_valid_points_generator(
+        np.nditer(np.ix_(avs, rvs, fAs)), min(rvs), max(rvs)
+    )
+    return list(pts)
+
+
 def apply_distance_grid(specgrid, distances, redshift=0):
     """
     Distances are applied to the spectral grid by copying the grid and
@@ -385,7 +408,7 @@ def make_extinguished_grid(
         n_filters = len(filter_names)
         _seds = np.zeros((N, n_filters), dtype=float)
         if absflux_cov:
-            n_offdiag = ((n_filters**2) - n_filters) / 2
+            n_offdiag = ((n_filters**2) - n_filters) // 2
             _cov_diag = np.zeros((N, n_filters), dtype=float)
             _cov_offdiag = np.zeros((N, n_offdiag), dtype=float)
 
@@ -449,7 +472,7 @@ def make_extinguished_grid(
             # compute the fractional absflux covariance matrices
             if absflux_cov:
                 absflux_covmats = calc_absflux_cov_matrices(
-                    r, temp_results, filter_names
+                    r, temp_results, filter_names, filterLib=filterLib
                 )
                 _cov_diag[N0 * count : N0 * (count + 1)] = absflux_covmats[0]
                 _cov_offdiag[N0 * count : N0 * (count + 1)] = absflux_covmats[1]
@@ -591,7 +614,7 @@ def add_spectral_properties(
     return specgrid
 
 
-def calc_absflux_cov_matrices(specgrid, sedgrid, filter_names):
+def calc_absflux_cov_matrices(specgrid, sedgrid, filter_names, filterLib=None):
     """Calculate the absflux covariance matrices for each model
     Must be done on the full spectrum of each model to account for
     the changing combined spectral response due to the model SED and
@@ -605,6 +628,12 @@ def calc_absflux_cov_matrices(specgrid, sedgrid, filter_names):
     sedgrid: SpectralGrid instance
         instance of the spectral grid containing the band SED fluxes
 
+    filter_names: list
+        list of filter names according to the filter lib
+
+    filterLib:  str
+        full filename to the filter library hd5 file
+
     Returns
     -------
     absflux_covmat :
@@ -612,31 +641,20 @@ def calc_absflux_cov_matrices(specgrid, sedgrid, filter_names):
 
     # get the fractional absflux covariance matrix
     absflux_cov_mats = absflux_covmat.hst_frac_matrix(
-        filter_names, spectrum=(specgrid.lamb[:], specgrid.seds)
+        filter_names, spectrum=(specgrid.lamb[:], specgrid.seds), filterLib=filterLib
     )
 
-    # setup the output quantities
-    n_models = specgrid.seds.shape[0]
-    n_filters = len(filter_names)
-    n_offdiag = ((n_filters**2) - n_filters) / 2
-    cov_diag = np.zeros((n_models, n_filters), dtype=np.float64)
-    cov_offdiag = np.zeros((n_models, n_offdiag), dtype=np.float64)
-
     # pack the resulting covariance matrices into diganonal and
     # non-diagnonal terms
     #   much more efficient for use later in combining with AST results
     #     and fitting
     #   also convert from fractional to physical flux units
-    m = 0
-    cov_diag[:, n_filters - 1] = absflux_cov_mats[
-        :, n_filters - 1, n_filters - 1
-    ] * np.square(sedgrid.seds[:, n_filters - 1])
-    for k in range(n_filters - 1):
-        cov_diag[:, k] = absflux_cov_mats[:, k, k] * np.square(sedgrid.seds[:, k])
-        for ll in range(k + 1, n_filters):
-            cov_offdiag[:, m] = (
-                absflux_cov_mats[:, k, ll] * sedgrid.seds[:, k] * sedgrid.seds[:, ll]
-            )
-            m += 1
+    #   off diagonal terms are ordered by rows of the upper triangle
+    n_filters = len(filter_names)
+    seds = np.asarray(sedgrid.seds[:], dtype=np.float64)
+    diag = np.arange(n_filters)
+    cov_diag = absflux_cov_mats[:, diag, diag] * np.square(seds)
+    ik, jk = np.triu_indices(n_filters, k=1)
+    cov_offdiag = absflux_cov_mats[:, ik, jk] * seds[:, ik] * seds[:, jk]
 
     return (cov_diag, cov_offdiag)
@@ -1,6 +1,9 @@
 """
 Extinction Curves
 """
+import hashlib
+from collections import OrderedDict
+
 import numpy as np
 from scipy import interpolate
 
@@ -21,6 +24,8 @@ __all__ = [
     "Gordon16_RvFALaw",
     "Generalized_RvFALaw",
     "Generalized_DustExt",
+    "ExtinctionCurveCache",
+    "curve_cache",
 ]
 
 libdir = __ROOT__
@@ -669,3 +674,106 @@ class Generalized_DustExt(ExtinctionLaw):
             return extcurve_obj(_lamb * units.angstrom) * Av
         else:
             return extcurve_obj(_lamb * units.angstrom) * Av * (np.log(10.0) * 0.4)
+
+
+class ExtinctionCurveCache(object):
+    """
+    Cache of normalized extinction curves
+
+    The curves given by all the laws in this module scale linearly with A(V).
+    The curve is therefore evaluated once for A(V) = 1 for each combination of
+    law, wavelength grid, and other law parameters (e.g., R(V), f_A) and the
+    requested A(V) is applied by scaling the stored curve.
+
+    Attributes
+    ----------
+    maxsize : int
+        maximum number of curves stored, the least recently used curve is
+        evicted when exceeded
+
+    hits, misses : int
+        number of calls served from the cache and computed from the law
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._curves = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._curves)
+
+    def clear(self):
+        """
+        Remove all the stored curves and reset the counters
+        """
+        self._curves.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(extLaw, lamb, kwargs):
+        """
+        Key identifying a normalized curve
+
+        Returns None if the law parameters cannot be hashed
+        """
+        try:
+            params = tuple(sorted(kwargs.items()))
+            hash(params)
+        except TypeError:
+            return None
+        # digest of the wavelengths, the same in all the processes
+        lamb_digest = hashlib.sha1(lamb.tobytes()).hexdigest()
+        lamb_key = (lamb.shape, lamb.dtype.str, lamb_digest)
+        return (type(extLaw).__name__, extLaw.name, lamb_key, params)
+
+    def __call__(self, extLaw, lamb, Av=1.0, **kwargs):
+        """
+        Extinction curve for a given law, equivalent to
+        `extLaw.function(lamb, Av=Av, **kwargs)`
+
+        Parameters
+        ----------
+        extLaw : ExtinctionLaw
+            extinction law
+
+        lamb : float or ndarray(dtype=float)
+            wavelength [in Angstroms] at which to evaluate the law
+
+        Av : float
+            desired A(V) (default 1.0)
+
+        **kwargs
+            other parameters of the law (e.g., Rv, f_A, Alambda)
+
+        Returns
+        -------
+        r : ndarray(dtype=float)
+            attenuation as a function of wavelength
+        """
+        _lamb = np.ascontiguousarray(
+            units.Quantity(lamb, units.angstrom).value, dtype=float
+        )
+        key = self._key(extLaw, _lamb, kwargs)
+        if key is None:
+            return extLaw.function(_lamb, Av=Av, **kwargs)
+
+        curve = self._curves.get(key)
+        if curve is None:
+            self.misses += 1
+            curve = np.array(extLaw.function(_lamb, Av=1.0, **kwargs), dtype=float)
+            curve.setflags(write=False)
+            self._curves[key] = curve
+            if len(self._curves) > self.maxsize:
+                self._curves.popitem(last=False)
+        else:
+            self.hits += 1
+            self._curves.move_to_end(key)
+
+        return curve * Av
+
+
+# process wide cache used when applying extinction to spectral grids
+curve_cache = ExtinctionCurveCache()
@@ -213,3 +213,27 @@ def test_extinction_dustextpkg_datacomp(curve, origExtLaw):
 
     lam = np.linspace(2.0e3, 1.0e4, 10)
     np.testing.assert_allclose(tlaw(lam), olaw(lam), rtol=2e-03)
+
+
+@pytest.mark.parametrize(
+    "law", [extinction.Fitzpatrick99(), extinction.Gordon16_RvFALaw()]
+)
+def test_extinction_curve_cache(law):
+    cache = extinction.ExtinctionCurveCache(maxsize=2)
+    lam = np.linspace(2.0e3, 1.0e4, 10)
+
+    for Av in [0.0, 0.5, 2.0]:
+        np.testing.assert_allclose(
+            cache(law, lam, Av=Av, Rv=3.5, f_A=0.6),
+            law(lam, Av=Av, Rv=3.5, f_A=0.6),
+            rtol=1e-12,
+        )
+    assert cache.misses == 1
+    assert cache.hits == 2
+
+    # new parameters or wavelengths are new curves, oldest curve is evicted
+    cache(law, lam, Rv=4.0, f_A=0.6)
+    cache(law, lam[:-1], Rv=4.0, f_A=0.6)
+    assert len(cache) == 2
+    cache(law, lam, Av=2.0, Rv=3.5, f_A=0.6)
+    assert cache.misses == 4
@@ -248,25 +248,28 @@ class SpectralGrid(ModelGrid):
         memgrid : :class:`~beast.physicsmodel.helpers.grid.SEDGrid` instance
             grid info with memory backend
         """
+        # the filter integrations are done with a (cached) photometric
+        # operator: a single matrix product for all the spectra
         if isinstance(filter_names[0], str):
-            flist = phot.load_filters(
-                filter_names, interp=True, lamb=self.lamb, filterLib=filterLib
+            photop = phot.get_photometric_operator(
+                filter_names, self.lamb[:], filterLib=filterLib
             )
             _fnames = filter_names
         else:
             flist = phot.load_Integrationfilters(
                 filter_names, interp=True, lamb=self.lamb
             )
+            photop = phot.PhotometricOperator(self.lamb[:], flist)
             _fnames = [fk.name for fk in filter_names]
         if extLaw is not None:
             if not inplace:
                 r = self.applyExtinctionLaw(extLaw, inplace=inplace, **kwargs)
-                lamb, seds, grid = phot.extractSEDs(r, flist, absFlux=absFlux)
+                lamb, seds, grid = photop.extractSEDs(r, absFlux=absFlux)
             else:
                 self.applyExtinctionLaw(extLaw, inplace=inplace, **kwargs)
-                lamb, seds, grid = phot.extractSEDs(self, flist, absFlux=absFlux)
+                lamb, seds, grid = photop.extractSEDs(self, absFlux=absFlux)
         else:
-            lamb, seds, grid = phot.extractSEDs(self, flist, absFlux=absFlux)
+            lamb, seds, grid = photop.extractSEDs(self, absFlux=absFlux)
         memgrid = SEDGrid(lamb, seds, grid, backend=MemoryBackend)
 
         setattr(memgrid, "filters", _fnames)
@@ -295,7 +298,11 @@ class SpectralGrid(ModelGrid):
         """
         if not isinstance(extLaw, extinction.ExtinctionLaw):
             raise TypeError("Expecting ExtinctionLaw object got %s" % type(extLaw))
-        extCurve = np.exp(-1.0 * extLaw.function(self.lamb[:], **kwargs))
+        # normalized curves are cached as they only depend on the law
+        # parameters and scale linearly with A(V)
+        extCurve = np.exp(
+            -1.0 * extinction.curve_cache(extLaw, self.lamb[:], **kwargs)
+        )
         if not inplace:
             g = self.copy()
             g.seds = g.seds[:] * extCurve[None, :]
@@ -14,6 +14,7 @@ with prior weights.
 """
 
 import numpy as np
+from astropy.table import Table
 
 from beast.physicsmodel.grid_weights import compute_grid_weights
 
@@ -28,7 +29,9 @@ from beast.physicsmodel.priormodel import (
 __all__ = [
     "compute_age_mass_metallicity_weights",
     "compute_distance_age_mass_metallicity_weights",
+    "compute_distance_weights",
     "compute_av_rv_fA_prior_weights",
+    "reweight_sedgrid_priors",
 ]
 
 
@@ -81,11 +84,9 @@ def compute_distance_age_mass_metallicity_weights(
 
     if n_dist > 1:
         # get the distance weights
-        dist_grid_weights = compute_grid_weights(uniq_dists)
-        dist_grid_weights /= np.sum(dist_grid_weights)
-        dist_prior = PriorDistanceModel(distance_prior_model)
-        dist_prior_weights = dist_prior(uniq_dists)
-        dist_prior_weights /= np.sum(dist_prior_weights)
+        dist_grid_weights, dist_prior_weights = compute_distance_weights(
+            uniq_dists, distance_prior_model=distance_prior_model
+        )
         dist_weights = dist_grid_weights * dist_prior_weights
 
         # correct for any non-uniformity in the number size of the
@@ -106,6 +107,31 @@ def compute_distance_age_mass_metallicity_weights(
             _tgrid[dindxs]["weight"] *= dist_weights[i] * total_dist_weight[i]
 
 
+def compute_distance_weights(distances, distance_prior_model={"name": "flat"}):
+    """
+    Computes the grid and prior weights of the distances
+
+    Parameters
+    ----------
+    distances : vector
+        unique distance values [pc]
+    distance_prior_model : dict
+        dict including prior model name and parameters
+
+    Returns
+    -------
+    dist_grid_weights, dist_prior_weights : ndarray
+        grid and prior weights of the distances, each normalized to a sum of 1
+    """
+    distances = np.asarray(distances, dtype=float)
+    dist_grid_weights = compute_grid_weights(distances)
+    dist_grid_weights /= np.sum(dist_grid_weights)
+    dist_prior = PriorDistanceModel(distance_prior_model)
+    dist_prior_weights = dist_prior(distances)
+    dist_prior_weights /= np.sum(dist_prior_weights)
+    return dist_grid_weights, dist_prior_weights
+
+
 def compute_age_mass_metallicity_weights(
     _tgrid,
     indxs,
@@ -296,3 +322,115 @@ def compute_av_rv_fA_prior_weights(
     # dust_prior /= np.max(dust_prior)
 
     return dust_prior
+
+
+def reweight_sedgrid_priors(
+    sedgrid,
+    distance_prior_model={"name": "flat"},
+    age_prior_model={"name": "flat"},
+    mass_prior_model={"name": "kroupa"},
+    met_prior_model={"name": "flat"},
+    av_prior_model={"name": "flat"},
+    rv_prior_model={"name": "flat"},
+    fA_prior_model={"name": "flat"},
+):
+    """
+    Recompute the prior and total weights of an existing SED grid for
+    different prior models, without regenerating the grid.
+
+    The stellar prior weights are computed once for each unique stellar
+    model (distance and spectral grid model) and the dust prior weights
+    once for each unique dust model, then combined with the stored grid
+    weights.  The weights are computed in the same way as
+    :func:`~beast.physicsmodel.model_grid.add_stellar_priors` and
+    :func:`~beast.physicsmodel.model_grid.make_extinguished_sed_grid`.
+
+    Parameters
+    ----------
+    sedgrid : SEDGrid or astropy.table.Table
+        full (not trimmed) SED grid or its grid table, needs the
+        grid_weight column and the stellar and dust parameter columns
+    distance_prior_model, age_prior_model, mass_prior_model, met_prior_model: dict
+        dict including the stellar prior model names and parameters
+    av_prior_model, rv_prior_model, fA_prior_model : dict
+        dict including the dust prior model names and parameters
+
+    Returns
+    -------
+    prior_weight, weight : ndarray
+        new prior weights and total (grid times prior) weights of each model,
+        the weight can be given to :func:`~beast.fitting.fit.Q_all_memory`.
+        For trimmed grids, index these with the fullgrid_idx column of the
+        trimmed grid.
+    """
+    _tgrid = getattr(sedgrid, "grid", sedgrid)
+    n_models = len(_tgrid)
+    dists = np.asarray(_tgrid["distance"], dtype=float)
+
+    # unique stellar models
+    if "specgrid_indx" in _tgrid.colnames:
+        star_keys = [dists, np.asarray(_tgrid["specgrid_indx"])]
+    else:
+        star_keys = [dists] + [np.asarray(_tgrid[k]) for k in ["Z", "logA", "M_ini"]]
+    _, star_first, star_inv = np.unique(
+        np.rec.fromarrays(star_keys), return_index=True, return_inverse=True
+    )
+    star_inv = star_inv.reshape(-1)
+
+    # keep the order of the models in the spectral grid
+    sorder = np.argsort(star_first)
+    star_first = star_first[sorder]
+    star_inv = np.argsort(sorder)[star_inv]
+
+    stargrid = Table()
+    for ckey in ["distance", "logA", "M_ini", "Z"]:
+        stargrid[ckey] = np.asarray(_tgrid[ckey])[star_first]
+    for ckey in ["grid_weight", "prior_weight", "weight"]:
+        stargrid[ckey] = np.ones(len(star_first))
+    compute_distance_age_mass_metallicity_weights(
+        stargrid,
+        distance_prior_model=distance_prior_model,
+        age_prior_model=age_prior_model,
+        mass_prior_model=mass_prior_model,
+        met_prior_model=met_prior_model,
+    )
+
+    # dust prior weights for each unique dust model
+    Av = np.asarray(_tgrid["Av"], dtype=float)
+    Rv = np.asarray(_tgrid["Rv"], dtype=float)
+    if "f_A" in _tgrid.colnames:
+        f_A = np.asarray(_tgrid["f_A"], dtype=float)
+    else:
+        f_A = np.ones(n_models)
+    _, dust_inv = np.unique(np.rec.fromarrays([Av, Rv, f_A]), return_inverse=True)
+    dust_inv = dust_inv.reshape(-1)
+    dust_prior_weight = np.zeros(n_models)
+    for k in range(dust_inv.max() + 1):
+        (dindxs,) = np.where(dust_inv == k)
+        dust_prior_weight[dindxs] = compute_av_rv_fA_prior_weights(
+            Av[dindxs[0]],
+            Rv[dindxs[0]],
+            f_A[dindxs[0]],
+            dists[dindxs],
+            av_prior_model=av_prior_model,
+            rv_prior_model=rv_prior_model,
+            fA_prior_model=fA_prior_model,
+        )
+
+    prior_weight = np.asarray(stargrid["prior_weight"])[star_inv] * dust_prior_weight
+
+    # the dust grid weights are the part of the grid weights not
+    # coming from the stellar grid
+    star_grid_weight = np.asarray(stargrid["grid_weight"])[star_inv]
+    dust_grid_weight = np.zeros(n_models)
+    np.divide(
+        np.asarray(_tgrid["grid_weight"], dtype=float),
+        star_grid_weight,
+        out=dust_grid_weight,
+        where=star_grid_weight > 0,
+    )
+    weight = (
+        np.asarray(stargrid["weight"])[star_inv] * dust_prior_weight * dust_grid_weight
+    )
+
+    return prior_weight, weight
@@ -0,0 +1,363 @@
+"""
+Content-addressed cache for the stages of the physics model pipeline
+
+Each stage output file gets a manifest (``<output>.manifest.json``) with a
+key computed from the stage inputs: the settings used by the stage, the
+content of the upstream products (isochrone tables, grids) and the BEAST
+version.  An existing output is only reused if the key of the current
+inputs matches the one in its manifest, outputs without a manifest are
+recomputed.  As the downstream stages include
+the content of the upstream products in their keys, regenerating an
+upstream product only invalidates the downstream stages if its content
+changed.
+"""
+import os
+import re
+import json
+import types
+import hashlib
+
+import numpy as np
+from astropy import units
+from astropy.table import Table
+
+import beast
+
+__all__ = [
+    "file_digest",
+    "input_digest",
+    "stage_digests",
+    "stage_manifest_name",
+    "stage_is_current",
+    "write_stage_manifest",
+]
+
+# digests of the files already hashed, keyed by (path, size, mtime)
+_file_digests = {}
+
+
+def file_digest(fname):
+    """
+    sha256 digest of the content of a file
+
+    The digests are memorized for each (path, size, modification time)
+    to avoid hashing large files several times.
+
+    Parameters
+    ----------
+    fname : str
+        file name
+
+    Returns
+    -------
+    digest : str
+        hexadecimal digest
+    """
+    fstat = os.stat(fname)
+    fkey = (os.path.abspath(fname), fstat.st_size, fstat.st_mtime_ns)
+    if fkey not in _file_digests:
+        h = hashlib.sha256()
+        with open(fname, "rb") as f:
+            for block in iter(lambda: f.read(1 << 24), b""):
+                h.update(block)
+        _file_digests[fkey] = h.hexdigest()
+    return _file_digests[fkey]
+
+
+def _array_digest(arr):
+    """ digest of the shape, type and values of an array """
+    arr = np.ascontiguousarray(arr)
+    h = hashlib.sha256()
+    h.update(str((arr.shape, arr.dtype.str)).encode())
+    if arr.dtype.hasobject:
+        h.update(repr(arr.tolist()).encode())
+    else:
+        h.update(arr.view(np.uint8).reshape(-1).data)
+    return h.hexdigest()
+
+
+def _qualname(obj):
+    """ module and qualified name of a class or function """
+    return "{}.{}".format(
+        getattr(obj, "__module__", None),
+        getattr(obj, "__qualname__", getattr(obj, "__name__", None)),
+    )
+
+
+def _code_digest(code):
+    """ digest of the byte code, names and constants of a code object """
+    h = hashlib.sha256()
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            h.update(_code_digest(const).encode())
+        elif isinstance(const, frozenset):
+            h.update(repr(sorted(repr(c) for c in const)).encode())
+        else:
+            h.update(repr(const).encode())
+    return h.hexdigest()
+
+
+# repr of objects including their memory address, differs between processes
+_address_repr = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+def _canonical(obj, _seen=None):
+    """
+    Convert the stage inputs to a json serializable structure that only
+    depends on their content
+    """
+    if _seen is None:
+        _seen = set()
+
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, units.Quantity):
+        return {"quantity": _canonical(obj.value, _seen), "unit": str(obj.unit)}
+    if isinstance(obj, (units.UnitBase, units.FunctionUnitBase)):
+        return {"unit": str(obj)}
+    if isinstance(obj, np.ndarray):
+        return {"ndarray": _array_digest(obj)}
+    if isinstance(obj, Table):
+        return {
+            "table": [[name, _array_digest(obj[name])] for name in obj.colnames]
+        }
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v, _seen) for v in obj]
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v, _seen) for k, v in sorted(obj.items())}
+
+    # classes by name, functions by name and code
+    if isinstance(obj, type):
+        return {"type": _qualname(obj)}
+    if isinstance(obj, types.FunctionType):
+        return {
+            "function": _qualname(obj),
+            "code": _code_digest(obj.__code__),
+            "defaults": _canonical(obj.__defaults__, _seen),
+        }
+    if isinstance(obj, types.MethodType):
+        return {
+            "method": _canonical(obj.__func__, _seen),
+            "self": _canonical(obj.__self__, _seen),
+        }
+    if isinstance(obj, (types.BuiltinFunctionType, np.ufunc)):
+        return {"function": _qualname(obj)}
+
+    # avoid infinite recursion on self referencing objects
+    if id(obj) in _seen:
+        return {"class": type(obj).__qualname__}
+    _seen = _seen | {id(obj)}
+
+    cname = "{}.{}".format(type(obj).__module__, type(obj).__qualname__)
+
+    # grids: content of the grid
+    if hasattr(obj, "seds") and hasattr(obj, "grid") and hasattr(obj, "lamb"):
+        content = {
+            "lamb": _canonical(np.asarray(obj.lamb[:]), _seen),
+            "seds": _canonical(np.asarray(obj.seds[:]), _seen),
+            "grid": _canonical(obj.grid, _seen),
+        }
+        for cname_extra in ["cov_diag", "cov_offdiag"]:
+            val = getattr(obj, cname_extra, None)
+            if val is not None:
+                content[cname_extra] = _canonical(np.asarray(val[:]), _seen)
+        return {"class": cname, "content": content}
+
+    # libraries loaded from a file: content of the file
+    source = getattr(obj, "source", None)
+    if isinstance(source, str) and os.path.isfile(source):
+        return {
+            "class": cname,
+            "name": _canonical(getattr(obj, "name", None), _seen),
+            "source": file_digest(source),
+        }
+
+    # other objects: their attributes, or their repr if they have no
+    #   attributes and it does not depend on their memory address
+    if not hasattr(obj, "__dict__"):
+        orepr = repr(obj)
+        if _address_repr.search(orepr):
+            return {"class": cname}
+        return {"class": cname, "repr": orepr}
+    attrs = {k: v for k, v in vars(obj).items() if not k.startswith("__")}
+    return {"class": cname, "attrs": _canonical(attrs, _seen)}
+
+
+def input_digest(inputs):
+    """
+    Digest of the content of stage inputs
+
+    Parameters
+    ----------
+    inputs : object
+        inputs (numbers, strings, arrays, tables, grids, lists and dicts of
+        these, or other objects through their attributes).  Classes are
+        identified by their name and functions by their name and code.
+
+    Returns
+    -------
+    digest : str
+        hexadecimal digest
+    """
+    txt = json.dumps(_canonical(inputs), sort_keys=True)
+    return hashlib.sha256(txt.encode()).hexdigest()
+
+
+def stage_digests(inputs):
+    """
+    Digests of each of the inputs of a stage
+
+    The digests have to be computed before the stage is run as some
+    stages modify their inputs.
+
+    Parameters
+    ----------
+    inputs : dict
+        inputs of the stage, keyed by name
+
+    Returns
+    -------
+    digests : dict
+        digest of each input
+    """
+    return {k: input_digest(v) for k, v in sorted(inputs.items())}
+
+
+def stage_manifest_name(output_fname):
+    """
+    Name of the manifest file of a stage output
+    """
+    return output_fname + ".manifest.json"
+
+
+def _stage_key(stage, digests):
+    """
+    Key of a stage from the digests of its inputs and the code version
+    """
+    version = getattr(beast, "__version__", "unknown")
+    return input_digest({"stage": stage, "version": version, "inputs": digests})
+
+
+def _output_info(output_fname):
+    """ size, modification time and digest of an output file """
+    fstat = os.stat(output_fname)
+    return {
+        "size": fstat.st_size,
+        "mtime_ns": fstat.st_mtime_ns,
+        "digest": file_digest(output_fname),
+    }
+
+
+def write_stage_manifest(stage, output_fname, digests):
+    """
+    Write the manifest of a stage output
+
+    Parameters
+    ----------
+    stage : str
+        name of the stage
+
+    output_fname : str
+        stage output file
+
+    digests : dict
+        digests of the stage inputs (see :func:`stage_digests`)
+    """
+    key = _stage_key(stage, digests)
+    manifest = {
+        "stage": stage,
+        "key": key,
+        "version": getattr(beast, "__version__", "unknown"),
+        "inputs": digests,
+        "output": _output_info(output_fname),
+    }
+    with open(stage_manifest_name(output_fname), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def stage_is_current(stage, output_fname, digests, verbose=True, adopt=False):
+    """
+    Check if a stage output exists and was computed with the same inputs
+
+    Outputs without a manifest (e.g., produced by previous versions of the
+    code or provided by hand) are recomputed, as their inputs are unknown,
+    unless adopt is set.
+
+    Parameters
+    ----------
+    stage : str
+        name of the stage
+
+    output_fname : str
+        stage output file
+
+    digests : dict
+        digests of the stage inputs (see :func:`stage_digests`)
+
+    verbose : bool
+        set to print why the output has to be recomputed
+
+    adopt : bool
+        set to use outputs without a manifest as is, no manifest is written
+        for them as their inputs are not checked
+
+    Returns
+    -------
+    current : bool
+        True if the output can be reused, False if it needs to be
+        (re)computed
+    """
+    if not os.path.isfile(output_fname):
+        return False
+
+    manifest_fname = stage_manifest_name(output_fname)
+    if not os.path.isfile(manifest_fname):
+        if verbose:
+            if adopt:
+                print(
+                    "{} exists without a stage manifest, using it as is".format(
+                        output_fname
+                    )
+                )
+            else:
+                print(
+                    "{} exists without a stage manifest, recomputing it".format(
+                        output_fname
+                    )
+                )
+        return adopt
+
+    with open(manifest_fname, "r") as f:
+        manifest = json.load(f)
+
+    key = _stage_key(stage, digests)
+    if manifest.get("key") != key:
+        if verbose:
+            changed = [
+                k for k in digests if manifest.get("inputs", {}).get(k) != digests[k]
+            ]
+            if manifest.get("version") != getattr(beast, "__version__", "unknown"):
+                changed.append("code version")
+            print(
+                "{} stage inputs changed ({}), recomputing {}".format(
+                    stage, ", ".join(changed), output_fname
+                )
+            )
+        return False
+
+    # check the output has not been modified since it was made
+    output = manifest.get("output", {})
+    fstat = os.stat(output_fname)
+    if (output.get("size"), output.get("mtime_ns")) != (
+        fstat.st_size,
+        fstat.st_mtime_ns,
+    ) and output.get("digest") != file_digest(output_fname):
+        if verbose:
+            print("{} was modified, recomputing it".format(output_fname))
+        return False
+
+    return True
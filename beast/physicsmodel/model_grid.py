@@ -11,6 +11,11 @@ from beast.physicsmodel.dust import extinction
 from beast.physicsmodel.grid_and_prior_weights import (
     compute_distance_age_mass_metallicity_weights,
 )
+from beast.physicsmodel.helpers.stage_cache import (
+    stage_digests,
+    stage_is_current,
+    write_stage_manifest,
+)
 from beast.tools.beast_info import add_to_beast_info_file
 
 __all__ = [
@@ -18,6 +23,8 @@ __all__ = [
     "make_spectral_grid",
     "add_stellar_priors",
     "make_extinguished_sed_grid",
+    "dust_grid_values",
+    "save_dust_grid_info",
 ]
 
 
@@ -70,18 +77,31 @@ def make_iso_table(
 
     oiso: isochrone.Isochrone object
         contains the full isochrones information
+
+    Notes
+    -----
+    The isochrone table is only reused if its stage manifest shows it was
+    computed with the same inputs (see
+    :mod:`~beast.physicsmodel.helpers.stage_cache`).
     """
     if iso_fname is None:
         iso_fname = "%s/%s_iso.csv" % (project, project)
-    if not os.path.isfile(iso_fname):
-        if oiso is None:
-            oiso = isochrone.PadovaWeb()
+    if oiso is None:
+        oiso = isochrone.PadovaWeb()
+
+    input_digests = stage_digests(
+        {"oiso": oiso, "logt": [logtmin, logtmax, dlogt], "z": z}
+    )
+    if not stage_is_current("isochrones", iso_fname, input_digests):
+        if os.path.isfile(iso_fname):
+            os.remove(iso_fname)
 
         t = oiso._get_t_isochrones(max(5.0, logtmin), min(10.13, logtmax), dlogt, z)
         t.header["NAME"] = "{0} Isochrones".format("_".join(iso_fname.split("_")[:-1]))
         print("{0} Isochrones".format("_".join(iso_fname.split("_")[:-1])))
 
         t.write(iso_fname)
+        write_stage_manifest("isochrones", iso_fname, input_digests)
 
     # save info to the beast info file
     info = {"project": project, "logt_input": [logtmin, logtmax, dlogt], "z_input": z}
@@ -170,7 +190,24 @@ def make_spectral_grid(
     # remove the isochrone points with logL=-9.999
     oiso.data = oiso[oiso["logL"] > -9]
 
-    if not os.path.isfile(spec_fname):
+    # inputs are recorded before any of them is modified
+    input_digests = stage_digests(
+        {
+            "isochrones": oiso.data,
+            "osl": osl,
+            "bounds": bounds,
+            "distance": distance,
+            "distance_unit": str(distance_unit),
+            "redshift": redshift,
+            "filterLib": filterLib,
+            "add_spectral_properties_kwargs": add_spectral_properties_kwargs,
+            "extLaw": extLaw,
+        }
+    )
+    if not stage_is_current("spectral_grid", spec_fname, input_digests):
+        if os.path.isfile(spec_fname):
+            os.remove(spec_fname)
+
         osl = osl or stellib.Kurucz()
 
         # filter extrapolations of the grid with given sensitivities in
@@ -255,6 +292,7 @@ def make_spectral_grid(
             for gk in g:
                 gk = apply_distance_and_spectral_props(gk)
                 gk.write(spec_fname, append=True)
+        write_stage_manifest("spectral_grid", spec_fname, input_digests)
 
     g = SpectralGrid(spec_fname, backend="memory")
 
@@ -313,7 +351,20 @@ def add_stellar_priors(
     """
     if priors_fname is None:
         priors_fname = "%s/%s_spec_w_priors.grid.hd5" % (project, project)
-    if not os.path.isfile(priors_fname):
+
+    input_digests = stage_digests(
+        {
+            "specgrid": specgrid,
+            "distance_prior_model": distance_prior_model,
+            "age_prior_model": age_prior_model,
+            "mass_prior_model": mass_prior_model,
+            "met_prior_model": met_prior_model,
+            "kwargs": kwargs,
+        }
+    )
+    if not stage_is_current("stellar_priors", priors_fname, input_digests):
+        if os.path.isfile(priors_fname):
+            os.remove(priors_fname)
 
         if verbose:
             print("Make Prior Weights")
@@ -333,6 +384,7 @@ def add_stellar_priors(
         else:
             for gk in specgrid:
                 gk.write(priors_fname, append=True)
+        write_stage_manifest("stellar_priors", priors_fname, input_digests)
 
     # save info to the beast info file
     info = {
@@ -351,6 +403,92 @@ def add_stellar_priors(
     return (priors_fname, g)
 
 
+def dust_grid_values(av, rv, fA=None):
+    """
+    Dust parameter values sampled by the SED grid
+
+    Parameters
+    ----------
+    av: sequence
+        [min, max, step] of the Av values, with an optional 4th element
+        set to "log" for a logarithmic grid
+
+    rv: sequence
+        [min, max, step] of the Rv values
+
+    fA: sequence (optional)
+        [min, max, step] of the fA values
+
+    Returns
+    -------
+    avs, rvs, fAs: ndarray
+        sampled Av, Rv and fA values (fAs is [1.0] if fA is not given)
+    """
+    if len(av) > 3:
+        # check if a log grid is requested
+        if av[3] == "log":
+            print("generating a log av grid")
+            avs = 10 ** np.arange(np.log10(av[0]), np.log10(av[1]), av[2])
+        else:
+            print("generating a linear av grid")
+            avs = np.arange(av[0], av[1] + 0.5 * av[2], av[2])
+    else:
+        print("generating a linear av grid")
+        avs = np.arange(av[0], av[1] + 0.5 * av[2], av[2])
+    rvs = np.arange(rv[0], rv[1] + 0.5 * rv[2], rv[2])
+    if fA is not None:
+        fAs = np.arange(fA[0], fA[1] + 0.5 * fA[2], fA[2])
+    else:
+        fAs = [1.0]
+
+    return avs, rvs, fAs
+
+
+def save_dust_grid_info(
+    project,
+    av,
+    rv,
+    fA=None,
+    av_prior_model={"name": "flat"},
+    rv_prior_model={"name": "flat"},
+    fA_prior_model={"name": "flat"},
+    info_fname=None,
+):
+    """
+    Save the dust grid and priors to the beast info file
+
+    Parameters
+    ----------
+    project: str
+        project name
+
+    av, rv, fA: sequence
+        dust grid definitions (see :func:`dust_grid_values`)
+
+    av_prior_model, rv_prior_model, fA_prior_model: dict
+        dicts including prior model name and parameters
+
+    info_fname : str
+        Set to specify the filename to save beast info to, otherwise
+        saved to project/project_beast_info.asdf
+    """
+    avs, rvs, fAs = dust_grid_values(av, rv, fA)
+    info = {
+        "av_input": av,
+        "rv_input": rv,
+        "fA_input": fA,
+        "avs": avs,
+        "rvs": rvs,
+        "fAs": fAs,
+        "av_prior_model": av_prior_model,
+        "rv_prior_model": rv_prior_model,
+        "fA_prior_model": fA_prior_model,
+    }
+    if info_fname is None:
+        info_fname = f"{project}/{project}_beast_info.asdf"
+    add_to_beast_info_file(info_fname, info)
+
+
 def make_extinguished_sed_grid(
     project,
     specgrid,
@@ -368,6 +506,7 @@ def make_extinguished_sed_grid(
     seds_fname=None,
     filterLib=None,
     info_fname=None,
+    save_info=True,
     **kwargs,
 ):
 
@@ -425,6 +564,10 @@ def make_extinguished_sed_grid(
         Set to specify the filename to save beast info to, otherwise
         saved to project/project_beast_info.asdf
 
+    save_info : bool
+        Set to save the dust grid to the beast info file (default).
+        Subgrids generated in parallel leave it to the parent process.
+
     Returns
     -------
     fname: str
@@ -435,29 +578,34 @@ def make_extinguished_sed_grid(
     """
 
     # create the dust grid arrays
-    if len(av) > 3:
-        # check if a log grid is requested
-        if av[3] == "log":
-            print("generating a log av grid")
-            avs = 10 ** np.arange(np.log10(av[0]), np.log10(av[1]), av[2])
-        else:
-            print("generating a linear av grid")
-            avs = np.arange(av[0], av[1] + 0.5 * av[2], av[2])
-    else:
-        print("generating a linear av grid")
-        avs = np.arange(av[0], av[1] + 0.5 * av[2], av[2])
-    rvs = np.arange(rv[0], rv[1] + 0.5 * rv[2], rv[2])
-    if fA is not None:
-        fAs = np.arange(fA[0], fA[1] + 0.5 * fA[2], fA[2])
-    else:
-        fAs = [1.0]
+    avs, rvs, fAs = dust_grid_values(av, rv, fA)
 
     # create SED file name if needed
     if seds_fname is None:
         seds_fname = "%s/%s_seds.grid.hd5" % (project, project)
 
-    # generate extinguished grids if SED file doesn't exist
-    if not os.path.isfile(seds_fname):
+    # generate extinguished grids if the SED file doesn't exist or was
+    # computed with different inputs
+    input_digests = stage_digests(
+        {
+            "specgrid": specgrid,
+            "filters": filters,
+            "avs": avs,
+            "rvs": rvs,
+            "fAs": fAs,
+            "av_prior_model": av_prior_model,
+            "rv_prior_model": rv_prior_model,
+            "fA_prior_model": fA_prior_model,
+            "extLaw": extLaw,
+            "add_spectral_properties_kwargs": add_spectral_properties_kwargs,
+            "absflux_cov": absflux_cov,
+            "filterLib": filterLib,
+            "kwargs": kwargs,
+        }
+    )
+    if not stage_is_current("sed_grid", seds_fname, input_digests):
+        if os.path.isfile(seds_fname):
+            os.remove(seds_fname)
 
         extLaw = extLaw or extinction.Cardelli()
 
@@ -490,6 +638,7 @@ def make_extinguished_sed_grid(
                 rv_prior_model=rv_prior_model,
                 add_spectral_properties_kwargs=add_spectral_properties_kwargs,
                 absflux_cov=absflux_cov,
+                filterLib=filterLib,
             )
 
         # write to disk
@@ -498,22 +647,20 @@ def make_extinguished_sed_grid(
         else:
             for gk in g:
                 gk.write(seds_fname, append=True)
+        write_stage_manifest("sed_grid", seds_fname, input_digests)
 
     # save info to the beast info file
-    info = {
-        "av_input": av,
-        "rv_input": rv,
-        "fA_input": fA,
-        "avs": avs,
-        "rvs": rvs,
-        "fAs": fAs,
-        "av_prior_model": av_prior_model,
-        "rv_prior_model": rv_prior_model,
-        "fA_prior_model": fA_prior_model,
-    }
-    if info_fname is None:
-        info_fname = f"{project}/{project}_beast_info.asdf"
-    add_to_beast_info_file(info_fname, info)
+    if save_info:
+        save_dust_grid_info(
+            project,
+            av,
+            rv,
+            fA,
+            av_prior_model=av_prior_model,
+            rv_prior_model=rv_prior_model,
+            fA_prior_model=fA_prior_model,
+            info_fname=info_fname,
+        )
 
     g = SEDGrid(seds_fname, backend="memory")
 
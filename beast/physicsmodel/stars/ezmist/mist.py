@@ -335,7 +335,9 @@ def get_one_isochrone(age, FeH, age_scale="linear", ret_table=True, **kwargs):
         return r
 
 
-def get_t_isochrones(logt0, logt1, dlogt, age_scale="log10", ret_table=True, **kwargs):
+def get_t_isochrones(
+    logt0, logt1, dlogt, age_scale="log10", ret_table=True, fetch=None, **kwargs
+):
     """ get a sequence of isochrones at constant Z
 
     Parameters
@@ -352,6 +354,10 @@ def get_t_isochrones(logt0, logt1, dlogt, age_scale="log10", ret_table=True, **k
     ret_table: bool
         if set, return a eztable.Table object of the data
 
+    fetch: function
+        if set, called with the query arguments instead of querying the
+        website, returns the content of the data (e.g., from a local store)
+
     Returns
     -------
     r: Table or str
@@ -369,7 +375,10 @@ def get_t_isochrones(logt0, logt1, dlogt, age_scale="log10", ret_table=True, **k
 
     d = _get_url_args(**opts)
 
-    r = _query_website(d)
+    if fetch is None:
+        r = _query_website(d)
+    else:
+        r = fetch(d)
     if ret_table is True:
         return _read_mist_iso_filecontent(r)
     else:
@@ -35,6 +35,9 @@ with open(localpath) as f:
     map_isoc_val = _cfg["map_isoc_val"]
     webserver = _cfg.get("webserver", "http://stev.oapd.inaf.it")
 
+# version of the CMD web form used for the queries
+cmd_version = "cmd_3.1"
+
 
 def get_photometry_list():
     """ Try to extact photometric options directly from the website
@@ -247,7 +250,7 @@ def __query_website(d):
     print("Interrogating {0}...".format(webserver))
 
     # OPTION: Use fixed version for stability (CURRENT CHOICE)
-    url = webserver + "/cgi-bin/cmd_3.1"
+    url = webserver + "/cgi-bin/" + cmd_version
     # OPTION: Use current version for most recent models
     # url = webserver + '/cgi-bin/cmd'
 
@@ -427,7 +430,7 @@ def get_Z_isochrones(z0, z1, dz, age, ret_table=True, **kwargs):
         return r
 
 
-def get_t_isochrones(logt0, logt1, dlogt, metal, ret_table=True, **kwargs):
+def get_t_isochrones(logt0, logt1, dlogt, metal, ret_table=True, fetch=None, **kwargs):
     """ get a sequence of isochrones at constant Z
 
     Parameters
@@ -447,6 +450,10 @@ def get_t_isochrones(logt0, logt1, dlogt, metal, ret_table=True, **kwargs):
     ret_table: bool
         if set, return a eztable.Table object of the data
 
+    fetch: function
+        if set, called with the query arguments instead of querying the
+        website, returns the content of the data (e.g., from a local store)
+
     model: str
         select the type of model :func:`help_models`
 
@@ -481,7 +488,10 @@ def get_t_isochrones(logt0, logt1, dlogt, metal, ret_table=True, **kwargs):
     d["isoc_lage1"] = logt1
     d["isoc_dlage"] = dlogt
 
-    r = __query_website(d)
+    if fetch is None:
+        r = __query_website(d)
+    else:
+        r = fetch(d)
     if ret_table is True:
         return __convert_to_Table(r, d)
     else:
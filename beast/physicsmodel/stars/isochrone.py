@@ -18,6 +18,7 @@ from numpy.lib import recfunctions
 from beast.config import __ROOT__
 from beast.physicsmodel.stars.ezpadova import parsec
 from beast.physicsmodel.stars.ezmist import mist
+from beast.physicsmodel.stars import isochrone_store
 
 __all__ = ["Isochrone", "padova2010", "pegase", "ezIsoch", "PadovaWeb", "MISTWeb"]
 
@@ -592,6 +593,21 @@ class PadovaWeb(Isochrone):
 
         return iso_table
 
+    def _fetch_t_isochrones(
+        self, logtmin, logtmax, dlogt, Z, store=None, ret_table=True
+    ):
+        """ Query the isochrones of one metallicity, through the store if set """
+        fetch = None if store is None else store.fetch_function("parsec")
+        return parsec.get_t_isochrones(
+            max(6.0, logtmin),
+            min(10.13, logtmax),
+            dlogt,
+            Z,
+            ret_table=ret_table,
+            fetch=fetch,
+            model=self.modeltype,
+        )
+
     def _get_t_isochrones(self, logtmin, logtmax, dlogt, Z=0.0152):
         """ Generate a proper table directly from the PADOVA website
 
@@ -615,8 +631,8 @@ class PadovaWeb(Isochrone):
             the table of isochrones
         """
         if not hasattr(Z, "__iter__"):
-            iso_table = parsec.get_t_isochrones(
-                max(6.0, logtmin), min(10.13, logtmax), dlogt, Z, model=self.modeltype
+            iso_table = self._fetch_t_isochrones(
+                logtmin, logtmax, dlogt, Z, store=isochrone_store.default_store
             )
             iso_table.header["NAME"] = "PadovaCMD Isochrones: " + self.modeltype
             if "Z" not in iso_table:
@@ -730,6 +746,21 @@ class MISTWeb(Isochrone):
 
         return iso_table
 
+    def _fetch_t_isochrones(
+        self, logtmin, logtmax, dlogt, Z, store=None, ret_table=True
+    ):
+        """ Query the isochrones of one metallicity, through the store if set """
+        fetch = None if store is None else store.fetch_function("mist")
+        return mist.get_t_isochrones(
+            max(5.0, logtmin),
+            min(10.13, logtmax),
+            dlogt,
+            ret_table=ret_table,
+            fetch=fetch,
+            v_div_vcrit=self.rotation,
+            FeH_value=np.log10(Z / self.Zref),
+        )
+
     def _get_t_isochrones(self, logtmin, logtmax, dlogt, Z=0.0142):
         """ Generate a proper table directly from the PADOVA website
 
@@ -754,12 +785,8 @@ class MISTWeb(Isochrone):
         """
 
         if not hasattr(Z, "__iter__"):
-            iso_table = mist.get_t_isochrones(
-                max(5.0, logtmin),
-                min(10.13, logtmax),
-                dlogt,
-                v_div_vcrit=self.rotation,
-                FeH_value=np.log10(Z / self.Zref),
+            iso_table = self._fetch_t_isochrones(
+                logtmin, logtmax, dlogt, Z, store=isochrone_store.default_store
             )
             iso_table.header["NAME"] = "MESA/MIST Isochrones"
             if "Z" not in iso_table:
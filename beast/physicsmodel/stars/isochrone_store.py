@@ -0,0 +1,232 @@
+"""
+Local store of the isochrones downloaded from the web servers
+
+`PadovaWeb` and `MISTWeb` query the CMD and MIST servers for each sequence
+of isochrones.  The store saves the content returned by the server for
+each query on disk, indexed by the query (model, age grid, metallicity,
+photometric system) and the version of the server form, so that repeated
+requests are read from disk and the isochrones can be used on machines
+without network access.
+
+The queries that are not in the store are passed to a fetcher, by default
+`web_fetcher` that queries the servers.  `FileFetcher` reads the queries
+from a directory with the layout of a store instead (e.g., a copy of the
+store of another machine), which is also used as a local stand-in of the
+servers for the tests.
+
+The store used by the isochrone classes is `default_store`, in the
+``isochrones`` directory of the BEAST library directory or in the
+directory given by the ``BEAST_ISO_STORE`` environment variable.  It can be
+replaced or set to None to always query the servers::
+
+    from beast.physicsmodel.stars import isochrone_store
+    isochrone_store.default_store = isochrone_store.IsochroneStore(
+        "/data/isochrones", fetcher=isochrone_store.FileFetcher("/shared/isochrones")
+    )
+"""
+import os
+import json
+import hashlib
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from beast.config import __ROOT__
+from beast.physicsmodel.stars.ezpadova import parsec
+from beast.physicsmodel.stars.ezmist import mist
+
+__all__ = ["IsochroneStore", "FileFetcher", "web_fetcher", "default_store"]
+
+# version of the server forms, part of the store index
+_VERSIONS = {
+    "parsec": parsec.cmd_version,
+    "mist": mist._cfg["request_url"],
+}
+
+
+def web_fetcher(source, query):
+    """
+    Query the isochrone server
+
+    Parameters
+    ----------
+    source : str
+        'parsec' (CMD server) or 'mist'
+    query : dict or str
+        query arguments
+
+    Returns
+    -------
+    bytes
+        content returned by the server
+    """
+    if source == "parsec":
+        return parsec.__query_website(query)
+    elif source == "mist":
+        return mist._query_website(query)
+    raise ValueError("unknown isochrone source {}".format(source))
+
+
+class IsochroneStore(object):
+    """
+    Isochrone sequences saved on disk, indexed by the server query
+
+    Attributes
+    ----------
+    path : str
+        directory of the store, created when the first query is saved
+    fetcher : function
+        called as fetcher(source, query) for the queries not in the store,
+        if None these queries raise an error
+    """
+
+    def __init__(self, path, fetcher=web_fetcher):
+        self.path = path
+        self.fetcher = fetcher
+
+    def index(self, source, query):
+        """
+        Index of a query
+
+        Parameters
+        ----------
+        source : str
+            'parsec' or 'mist'
+        query : dict or str
+            query arguments
+
+        Returns
+        -------
+        dict
+            source, server form version and query
+        """
+        return {"source": source, "version": _VERSIONS[source], "query": query}
+
+    def fname(self, source, query):
+        """ Name of the file with the content of a query """
+        txt = json.dumps(self.index(source, query), sort_keys=True, default=str)
+        digest = hashlib.sha256(txt.encode()).hexdigest()
+        return os.path.join(self.path, source, digest + ".dat")
+
+    def __contains__(self, item):
+        source, query = item
+        return os.path.isfile(self.fname(source, query))
+
+    def put(self, source, query, content):
+        """
+        Save the content of a query
+
+        The content and the index are written through temporary files, so
+        that concurrent runs using the same store never read partial files.
+
+        Parameters
+        ----------
+        source : str
+            'parsec' or 'mist'
+        query : dict or str
+            query arguments
+        content : bytes
+            content returned by the server
+        """
+        fname = self.fname(source, query)
+        index_fname = fname[: -len(".dat")] + ".json"
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        tmp_ext = ".tmp{}".format(os.getpid())
+        with open(index_fname + tmp_ext, "w") as f:
+            json.dump(self.index(source, query), f, sort_keys=True, default=str)
+        os.replace(index_fname + tmp_ext, index_fname)
+        with open(fname + tmp_ext, "wb") as f:
+            f.write(content)
+        os.replace(fname + tmp_ext, fname)
+
+    def get(self, source, query):
+        """
+        Content of a query, from the store or from the fetcher
+
+        Parameters
+        ----------
+        source : str
+            'parsec' or 'mist'
+        query : dict or str
+            query arguments
+
+        Returns
+        -------
+        bytes
+            content returned by the server
+        """
+        fname = self.fname(source, query)
+        if os.path.isfile(fname):
+            with open(fname, "rb") as f:
+                return f.read()
+        if self.fetcher is None:
+            raise FileNotFoundError(
+                "isochrone query not in the store {}: {}".format(self.path, query)
+            )
+        content = self.fetcher(source, query)
+        self.put(source, query, content)
+        return content
+
+    def fetch_function(self, source):
+        """
+        Function returning the content of a query, for the `fetch` argument
+        of the `get_t_isochrones` functions of `parsec` and `mist`
+        """
+        return lambda query: self.get(source, query)
+
+    def prefetch(self, oiso, logtmin, logtmax, dlogt, Z, nthreads=4):
+        """
+        Fill the store with the isochrones of an age x metallicity block
+
+        The servers take one metallicity per sequence of ages, the
+        sequences missing from the store are requested in parallel.
+
+        Parameters
+        ----------
+        oiso : `~beast.physicsmodel.stars.isochrone.PadovaWeb` or `MISTWeb`
+            isochrone model
+        logtmin, logtmax, dlogt : float
+            log-age min, max and step, as for `make_iso_table`
+        Z : float or sequence
+            metallicities
+        nthreads : int, optional
+            maximum number of parallel requests
+        """
+        Z = [float(Zk) for Zk in np.atleast_1d(Z)]
+
+        def fetch_one(Zk):
+            oiso._fetch_t_isochrones(
+                max(5.0, logtmin),
+                min(10.13, logtmax),
+                dlogt,
+                Zk,
+                store=self,
+                ret_table=False,
+            )
+
+        with ThreadPool(max(1, min(nthreads, len(Z)))) as pool:
+            pool.map(fetch_one, Z)
+
+
+class FileFetcher(object):
+    """
+    Fetcher reading the queries from a directory with the layout of an
+    `IsochroneStore`, for machines without network access or as a local
+    stand-in of the servers
+
+    Attributes
+    ----------
+    path : str
+        directory with the content of the queries
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, source, query):
+        return IsochroneStore(self.path, fetcher=None).get(source, query)
+
+
+default_store = IsochroneStore(
+    os.environ.get("BEAST_ISO_STORE", os.path.join(__ROOT__, "isochrones"))
+)
@@ -8,6 +8,7 @@ The interpolation is implemented from the pegase.2 fortran converted algorithm.
 (this may not be pythonic though)
 """
 import numpy as np
+from scipy import sparse
 from scipy.interpolate import interp1d
 from numpy.lib import recfunctions
 from astropy import constants
@@ -285,6 +286,353 @@ def interp(T0, g0, Z0, L0, T, g, Z, dT_max=0.1, eps=1e-6, weight=1.0):
     return index[ind].astype(int), 10 ** L0 * weight * weights[ind]
 
 
+def _det3(Ta, ga, Tb, gb, Tc, gc):
+    """ determinant of [[Ta, Tb, Tc], [ga, gb, gc], [1, 1, 1]]
+    with the same operations as __det3x3__ """
+    return Ta * (gb - gc) - Tb * (ga - gc) + Tc * (ga - gb)
+
+
+def _interp_fixedZ_batch(T0, g0, T, g, dT_max=0.1, eps=1e-6):
+    """ Vectorized version of __interp__ for many points
+
+    Interpolation of the (T,g) grid at fixed Z for all the points at once.
+    The same 4 knots and weights as __interp__ are returned for each point.
+
+    The knots are found from the distances of the points to all the stars
+    of the library (brute force) rather than with a spatial index (e.g., a
+    KD-tree per Z): each knot is the closest star within one quadrant around
+    the point, which a nearest neighbor query does not give, and argmin
+    breaks the distance ties with the first star as __interp__ does.  The
+    libraries have at most a few thousand stars per Z and the points are
+    given in chunks (see `interp_batch`), which bounds the (chunk, n_lib)
+    distance arrays.
+
+    Parameters
+    ----------
+    T0: ndarray(float)
+        log(Teff) to obtain
+
+    g0: ndarray(float)
+        log(g) to obtain
+
+    T: ndarray(float)
+        log(Teff) of the grid
+
+    g: ndarray(float)
+        log(g) of the grid
+
+    dT_max: float
+        If, T2 (resp. T1) is too far from T compared to T1 (resp. T2),
+        i2 (resp. i1) is not used.
+
+    eps: float
+        temperature sensitivity under which points are considered to have
+        the same temperature
+
+    Returns
+    -------
+    idx: ndarray, dtype=int, shape=(n, 4)
+        4 star indexes per point, -1 if not used
+
+    w: ndarray, dtype=float, shape=(n, 4)
+        4 associated weights per point
+    """
+    kappa = 0.1
+    deltaT = T[None, :] - T0[:, None]
+    deltag = g[None, :] - g0[:, None]
+    dist = kappa * np.abs(deltag) + np.abs(deltaT)
+
+    # closest star in each of the 4 quadrants around the points
+    ind_dT = deltaT >= 0
+    ind_dg = deltag >= 0
+    quadrants = [ind_dT & ind_dg, ind_dT & ~ind_dg, ~ind_dT & ind_dg, ~ind_dT & ~ind_dg]
+    knots = []
+    for ind in quadrants:
+        ik = np.where(ind, dist, np.inf).argmin(axis=1)
+        knots.append(np.where(ind.any(axis=1), ik, -1))
+    i1, i2, i3, i4 = knots
+    exact = dist.min(axis=1) == 0
+    exact_idx = dist.argmin(axis=1)
+    del deltaT, deltag, dist, ind_dT, ind_dg, quadrants
+
+    if np.any(~exact & (i1 < 0) & (i2 < 0) & (i3 < 0) & (i4 < 0)):
+        raise ValueError("Interp. Error, could not find appropriate knots")
+
+    T1, T2, T3, T4 = T[i1], T[i2], T[i3], T[i4]
+    g1, g2, g3, g4 = g[i1], g[i2], g[i3], g[i4]
+
+    # If, T2 (resp. T1) is too far from T compared to T1
+    # (resp. T2), i2 (resp. i1) is not used.
+    # The same for i3 and i4.
+    both = (i1 > 0) & (i2 > 0)
+    drop = both & (T1 < T2 - dT_max)
+    i1 = np.where(both & ~drop & (T2 < T1 - dT_max), -1, i1)
+    i2 = np.where(drop, -1, i2)
+
+    both = (i3 > 0) & (i4 > 0)
+    drop = both & (T3 > T4 + dT_max)
+    i3 = np.where(both & ~drop & (T4 > T3 + dT_max), -1, i3)
+    i4 = np.where(drop, -1, i4)
+
+    if np.any(~exact & (i1 < 0) & (i2 < 0) & (i3 < 0) & (i4 < 0)):
+        raise ValueError("Interp. Error, could not find appropriate knots")
+
+    # Interpolation in the (T, g) plane between the used points
+    # (at least 1, at most 4), see __interp__ for the per case details
+    # code 0b0110 means that i1 = i4 = 0, i2 /=0 and i3 /= 0.
+    code = (
+        8 * (i1 >= 0).astype(int)
+        + 4 * (i2 >= 0).astype(int)
+        + 2 * (i3 >= 0).astype(int)
+        + (i4 >= 0).astype(int)
+    )
+    a1 = np.zeros(len(T0))
+    a2 = np.zeros(len(T0))
+    a3 = np.zeros(len(T0))
+    a4 = np.zeros(len(T0))
+
+    def _out(*alphas):
+        r = np.zeros(len(T0), dtype=bool)
+        for ak in alphas:
+            r |= (ak < 0.0) | (ak > 1.0)
+        return r
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f13 = np.where(T1 == T3, 0.5, (T0 - T3) / (T1 - T3))
+        f14 = np.where(T1 == T4, 0.5, (T0 - T4) / (T1 - T4))
+        f23 = np.where(T2 == T3, 0.5, (T0 - T3) / (T2 - T3))
+        f24 = np.where(T2 == T4, 0.5, (T0 - T4) / (T2 - T4))
+
+        # 0001, 0010, 0100, 1000
+        a4[code == 0b0001] = 1.0
+        a3[code == 0b0010] = 1.0
+        a2[code == 0b0100] = 1.0
+        a1[code == 0b1000] = 1.0
+
+        # 0011
+        sel = code == 0b0011
+        close = np.abs(T3 - T4) < eps
+        g34 = np.where(g3 == g4, 0.5, (g0 - g4) / (g3 - g4))
+        hot = T3 > T4
+        a3 = np.where(sel, np.where(close, g34, hot.astype(float)), a3)
+        a4 = np.where(sel, np.where(close, 1.0 - g34, (~hot).astype(float)), a4)
+        i4 = np.where(sel & ~close & hot, -1, i4)
+        i3 = np.where(sel & ~close & ~hot, -1, i3)
+
+        # 0101
+        sel = code == 0b0101
+        a2 = np.where(sel, f24, a2)
+        a4 = np.where(sel, 1.0 - f24, a4)
+
+        # 0110
+        sel = code == 0b0110
+        a2 = np.where(sel, f23, a2)
+        a3 = np.where(sel, 1.0 - f23, a3)
+
+        # 0111
+        sel = code == 0b0111
+        det0 = _det3(T2, g2, T3, g3, T4, g4)
+        t2 = _det3(T0, g0, T3, g3, T4, g4) / det0
+        t3 = _det3(T2, g2, T0, g0, T4, g4) / det0
+        t4 = _det3(T2, g2, T3, g3, T0, g0) / det0
+        out = sel & _out(t2, t3, t4)
+        a2 = np.where(sel, np.where(out, f23, t2), a2)
+        a3 = np.where(sel, np.where(out, 1.0 - f23, t3), a3)
+        a4 = np.where(sel, np.where(out, 0.0, t4), a4)
+        i4 = np.where(out, -1, i4)
+
+        # 1001
+        sel = code == 0b1001
+        a1 = np.where(sel, f14, a1)
+        a4 = np.where(sel, 1.0 - f14, a4)
+
+        # 1010
+        sel = code == 0b1010
+        a1 = np.where(sel, f13, a1)
+        a3 = np.where(sel, 1.0 - f13, a3)
+
+        # 1011
+        sel = code == 0b1011
+        det0 = _det3(T1, g1, T3, g3, T4, g4)
+        t1 = _det3(T0, g0, T3, g3, T4, g4) / det0
+        t3 = _det3(T1, g1, T0, g0, T4, g4) / det0
+        t4 = _det3(T1, g1, T3, g3, T0, g0) / det0
+        out = sel & _out(t1, t3, t4)
+        a1 = np.where(sel, np.where(out, f14, t1), a1)
+        a3 = np.where(sel, np.where(out, 0.0, t3), a3)
+        a4 = np.where(sel, np.where(out, 1.0 - f14, t4), a4)
+        i3 = np.where(out, -1, i3)
+
+        # 1100
+        sel = code == 0b1100
+        close = np.abs(T1 - T2) < eps
+        g12 = np.where(g1 == g2, 0.5, (g0 - g2) / (g1 - g2))
+        cool = T1 < T2
+        a1 = np.where(sel, np.where(close, g12, cool.astype(float)), a1)
+        a2 = np.where(sel, np.where(close, 1.0 - g12, (~cool).astype(float)), a2)
+        i2 = np.where(sel & ~close & cool, -1, i2)
+        i1 = np.where(sel & ~close & ~cool, -1, i1)
+
+        # 1101
+        sel = code == 0b1101
+        det0 = _det3(T1, g1, T2, g2, T4, g4)
+        t1 = _det3(T0, g0, T2, g2, T4, g4) / det0
+        t2 = _det3(T1, g1, T0, g0, T4, g4) / det0
+        t4 = _det3(T1, g1, T2, g2, T0, g0) / det0
+        out = sel & _out(t1, t2, t4)
+        a1 = np.where(sel, np.where(out, f14, t1), a1)
+        a2 = np.where(sel, np.where(out, 0.0, t2), a2)
+        a4 = np.where(sel, np.where(out, 1.0 - f14, t4), a4)
+        i2 = np.where(out, -1, i2)
+
+        # 1110
+        sel = code == 0b1110
+        det0 = _det3(T1, g1, T2, g2, T3, g3)
+        t1 = _det3(T0, g0, T2, g2, T3, g3) / det0
+        t2 = _det3(T1, g1, T0, g0, T3, g3) / det0
+        t3 = _det3(T1, g1, T2, g2, T0, g0) / det0
+        out = sel & _out(t1, t2, t3)
+        a1 = np.where(sel, np.where(out, 0.0, t1), a1)
+        a2 = np.where(sel, np.where(out, f23, t2), a2)
+        a3 = np.where(sel, np.where(out, 1.0 - f23, t3), a3)
+        i1 = np.where(out, -1, i1)
+
+        # 1111: all four points used.
+        sel = code == 0b1111
+        gprim = f13 * g1 + (1 - f13) * g3
+        gsec = f24 * g2 + (1 - f24) * g4
+        gamma = np.where(gprim != gsec, (g0 - gsec) / (gprim - gsec), 0.5)
+        a1 = np.where(sel, f13 * gamma, a1)
+        a2 = np.where(sel, f24 * (1 - gamma), a2)
+        a3 = np.where(sel, (1 - f13) * gamma, a3)
+        a4 = np.where(sel, (1 - f24) * (1 - gamma), a4)
+
+    idx = np.stack([i1, i2, i3, i4], axis=1)
+    w = np.stack([a1, a2, a3, a4], axis=1)
+
+    # exact matches only use the matching star
+    idx[exact] = -1
+    idx[exact, 0] = exact_idx[exact]
+    w[exact] = [1.0, 0.0, 0.0, 0.0]
+
+    return idx, w
+
+
+def interp_batch(
+    T0, g0, Z0, L0, T, g, Z, dT_max=0.1, eps=1e-6, weights=None, chunksize=5000
+):
+    """ Interpolation of the T,g,Z grid for many points at once
+
+    Vectorized equivalent of calling `interp` for each point.
+    The points are grouped by the library metallicities bracketing them and,
+    for each metallicity, the (T, g) knots of all the points are found at once
+    against the library stars with this metallicity.
+
+    Parameters
+    ----------
+    T0: ndarray(float)
+        log(Teff) to obtain
+
+    g0: ndarray(float)
+        log(g) to obtain
+
+    Z0: ndarray(float)
+        metallicity values
+
+    L0: float or ndarray(float)
+        log luminosity values
+
+    T: ndarray(float)
+        log(Teff) of the grid
+
+    g: ndarray(float)
+        log(g) of the grid
+
+    Z: ndarray(float)
+        metallicity of the grid
+
+    dT_max: float
+        If, T2 (resp. T1) is too far from T compared to T1 (resp. T2),
+        i2 (resp. i1) is not used.
+
+    eps: float
+        temperature sensitivity under which points are considered to
+        have the same temperature
+
+    weights: float or ndarray(float), optional
+        luminosity weights to apply after interpolation
+
+    chunksize: int
+        number of points searched at once for each metallicity
+        (sets the size of the temporary distance arrays)
+
+    Returns
+    -------
+    w: scipy.sparse.csr_matrix, shape=(n points, n library stars)
+        interpolation weights of each library star for each point,
+        the interpolated spectra are given by `w @ spectra`
+    """
+    T0 = np.atleast_1d(np.asarray(T0, dtype=float))
+    g0 = np.atleast_1d(np.asarray(g0, dtype=float))
+    Z0 = np.atleast_1d(np.asarray(Z0, dtype=float))
+    _T = np.asarray(T, dtype=float)
+    _g = np.asarray(g, dtype=float)
+    _Z = np.asarray(Z)
+    npts = len(T0)
+
+    scale = 10 ** np.broadcast_to(np.asarray(L0, dtype=float), (npts,))
+    if weights is not None:
+        scale = scale * np.broadcast_to(np.asarray(weights, dtype=float), (npts,))
+
+    # bracketing metallicities of each point (see interp)
+    Zv = np.unique(_Z)
+    pos = np.searchsorted(Zv, Z0, side="left")
+    Z_inf = Zv[np.maximum(pos - 1, 0)]
+    Z_sup = Zv[np.minimum(pos, len(Zv) - 1)]
+    match = (pos < len(Zv)) & (Z_sup == Z0)
+    inf_ok = ~match & (pos > 0) & (Z_inf > 0.0)
+    sup_ok = ~match & (pos < len(Zv)) & (Z_sup > 0.0)
+    both = inf_ok & sup_ok
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fz = np.where(both, (Z0 - Z_inf) / (Z_sup - Z_inf), 1.0)
+
+    rows, cols, vals = [], [], []
+    for zk, zval in enumerate(Zv):
+        # library stars at this metallicity and the points using them
+        zind = np.where(_Z == zval)[0]
+        m_pts = np.where(match & (pos == zk))[0]
+        i_pts = np.where(inf_ok & (pos - 1 == zk))[0]
+        s_pts = np.where(sup_ok & (pos == zk))[0]
+        pk = np.concatenate([m_pts, i_pts, s_pts])
+        zw = np.concatenate(
+            [
+                np.ones(len(m_pts)),
+                fz[i_pts],
+                np.where(both[s_pts], 1.0 - fz[s_pts], 1.0),
+            ]
+        )
+
+        for k in range(0, len(pk), chunksize):
+            ck = pk[k : k + chunksize]
+            idx, w = _interp_fixedZ_batch(
+                T0[ck], g0[ck], _T[zind], _g[zind], dT_max=dT_max, eps=eps
+            )
+            w = w * zw[k : k + chunksize, None]
+            keep = w > 0
+            rows.append(np.broadcast_to(ck[:, None], idx.shape)[keep])
+            cols.append(zind[idx[keep]])
+            vals.append((w * scale[ck, None])[keep])
+
+    if len(rows) > 0:
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        vals = np.concatenate(vals)
+
+    return sparse.csr_matrix(
+        (vals, (rows, cols)), shape=(npts, len(_T)), dtype=float
+    )
+
+
 class Stellib(object):
     """ Basic stellar library class """
 
@@ -428,6 +776,65 @@ class Stellib(object):
         del r, idx
         return np.asarray(list(d.items()))
 
+    def interpBatch(
+        self, T0, g0, Z0, L0, dT_max=0.1, eps=1e-6, weights=None, chunksize=5000
+    ):
+        """ Vectorized interpolation of the T,g grid for many points
+
+        Equivalent to calling interp for each point, but all the points are
+        processed at once (see `interp_batch`)
+
+        Parameters
+        ----------
+        T0: ndarray(float)
+            log(Teff) to obtain
+
+        g0: ndarray(float)
+            log(g) to obtain
+
+        Z0: ndarray(float)
+            metallicity values
+
+        L0: float or ndarray(float)
+            luminosity values
+
+        dT_max: float
+            If, T2 (resp. T1) is too far from T compared to T1 (resp. T2),
+            i2 (resp. i1) is not used.
+
+        eps: float
+            temperature sensitivity under which points are considered to
+            have the same temperature
+
+        weights: ndarray(float)
+            luminosity weigths to apply after interpolation
+
+        chunksize: int
+            number of points searched at once for each metallicity
+
+        returns
+        -------
+        w: scipy.sparse.csr_matrix
+            (n points, n library stars) interpolation weights,
+            spectra are given by `w @ self.spectra`
+        """
+        _Z = np.asarray(self.Z)
+        _T = np.asarray(self.grid["logT"], dtype=np.double)
+        _g = np.asarray(self.grid["logg"], dtype=np.double)
+        return interp_batch(
+            T0,
+            g0,
+            Z0,
+            L0,
+            _T,
+            _g,
+            _Z,
+            dT_max=dT_max,
+            eps=eps,
+            weights=weights,
+            chunksize=chunksize,
+        )
+
     def points_inside(self, xypoints, dlogT=0.1, dlogg=0.3):
         """
         Returns if a point is inside the polygon defined by the
@@ -601,7 +1008,7 @@ class Stellib(object):
         return (((self.spectra[_r[:, 0].astype(int)].T) * _r[:, 1])).sum(1)
 
     def gen_spectral_grid_from_given_points(
-        self, pts, bounds=dict(dlogT=0.1, dlogg=0.3)
+        self, pts, bounds=dict(dlogT=0.1, dlogg=0.3), chunksize=10000
     ):
         """
         Reinterpolate a given stellar spectral library on to an Isochrone grid
@@ -620,6 +1027,9 @@ class Stellib(object):
             sensitivity to extrapolation (see grid.get_stellib_boundaries)
             default: {dlogT:0.1, dlogg:0.3}
 
+        chunksize: int
+            number of points interpolated at once
+
         Returns
         -------
         g: SpectralGrid
@@ -689,16 +1099,16 @@ class Stellib(object):
         # Step 3: Interpolation
         # =====================
         # Do the actual interpolation, avoiding exptrapolations
-        for mk, (rT, rg, rZ) in enumerate(
-            tqdm(
-                zip(pts["logT"], pts["logg"], pts["Z"]),
-                total=ndata,
-                desc="Spectral grid",
-            )
-        ):
-            if bound_cond[mk]:
-                s = np.array(self.interp(rT, rg, rZ, 0.0)).T
-                specs[mk, :] = self.genSpectrum(s) * weights[mk]
+        # the spectra of a chunk of points are the product of the sparse
+        # interpolation weights with the library spectra
+        inside = np.where(bound_cond)[0]
+        logT = np.asarray(pts["logT"], dtype=float)
+        logg = np.asarray(pts["logg"], dtype=float)
+        Z = np.asarray(pts["Z"], dtype=float)
+        for k in tqdm(range(0, len(inside), chunksize), desc="Spectral grid"):
+            ck = inside[k : k + chunksize]
+            w = self.interpBatch(logT[ck], logg[ck], Z[ck], 0.0, weights=weights[ck])
+            specs[ck, :] = w @ self.spectra
 
         # Step 4: filter points without spectrum
         # ======================================
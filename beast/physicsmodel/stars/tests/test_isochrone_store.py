@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from beast.physicsmodel.stars import isochrone, isochrone_store
+
+
+class _StandInServer(object):
+    """ Local stand-in of the CMD server, counting the requests """
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, source, query):
+        self.requests.append(query)
+        z = query["isoc_zeta0"]
+        names = ["Zini", "Age", "Mini", "Mass", "logL", "logTe", "logg", "label", "Z"]
+        lines = ["# stand-in CMD output", "# " + "\t".join(names)]
+        for age in [1e6, 1.12e6]:
+            for mass in [0.5, 1.0, 2.0]:
+                vals = [z, age, mass, mass, 0.1 * mass, 3.7, 4.4, 1, z]
+                lines.append("\t".join(str(v) for v in vals))
+        return ("\n".join(lines) + "\n").encode()
+
+
+def test_isochrone_store(tmpdir, monkeypatch):
+    server = _StandInServer()
+    store = isochrone_store.IsochroneStore(str(tmpdir.join("store")), fetcher=server)
+    monkeypatch.setattr(isochrone_store, "default_store", store)
+
+    oiso = isochrone.PadovaWeb()
+    z = [0.0152, 0.008]
+    iso_table = oiso._get_t_isochrones(6.0, 6.05, 0.05, z)
+    assert len(server.requests) == 2
+    np.testing.assert_allclose(np.unique(iso_table["Z"]), sorted(z))
+
+    # repeated request from the store
+    iso_table2 = oiso._get_t_isochrones(6.0, 6.05, 0.05, z)
+    assert len(server.requests) == 2
+    for key in iso_table.keys():
+        np.testing.assert_array_equal(iso_table[key], iso_table2[key])
+
+    # new age grid: new requests
+    oiso._get_t_isochrones(6.0, 6.1, 0.05, z)
+    assert len(server.requests) == 4
+
+    # other store reading the first one without network access
+    store2 = isochrone_store.IsochroneStore(
+        str(tmpdir.join("store2")), fetcher=isochrone_store.FileFetcher(store.path)
+    )
+    monkeypatch.setattr(isochrone_store, "default_store", store2)
+    iso_table3 = oiso._get_t_isochrones(6.0, 6.05, 0.05, z)
+    assert len(server.requests) == 4
+    np.testing.assert_array_equal(iso_table["M_ini"], iso_table3["M_ini"])
+    with pytest.raises(FileNotFoundError):
+        oiso._get_t_isochrones(6.0, 6.05, 0.05, [0.004])
+
+
+def test_isochrone_store_prefetch(tmpdir, monkeypatch):
+    server = _StandInServer()
+    store = isochrone_store.IsochroneStore(str(tmpdir), fetcher=server)
+    monkeypatch.setattr(isochrone_store, "default_store", store)
+
+    oiso = isochrone.PadovaWeb()
+    z = [0.03, 0.0152, 0.008, 0.004]
+    store.prefetch(oiso, 6.0, 6.05, 0.05, z)
+    assert len(server.requests) == len(z)
+
+    # the whole block is in the store
+    iso_table = oiso._get_t_isochrones(6.0, 6.05, 0.05, z)
+    assert len(server.requests) == len(z)
+    assert len(iso_table) == 6 * len(z)
@@ -0,0 +1,35 @@
+import numpy as np
+
+from beast.physicsmodel.stars import stellib
+
+
+def _fake_library():
+    """
+    Regular (logT, logg) library with a few metallicities and a missing
+    corner to exercise the partial knot configurations
+    """
+    logT, logg, Z = np.meshgrid(
+        np.linspace(3.5, 4.5, 11), np.linspace(0.0, 5.0, 11), [0.004, 0.008, 0.02]
+    )
+    keep = ~((logT > 4.2) & (logg < 2.0))
+    return logT[keep], logg[keep], Z[keep]
+
+
+def test_interp_batch_matches_interp():
+    T, g, Z = _fake_library()
+
+    rng = np.random.default_rng(1234)
+    npts = 500
+    T0 = rng.uniform(3.5, 4.5, npts)
+    g0 = rng.uniform(0.0, 5.0, npts)
+    Z0 = rng.choice([0.002, 0.004, 0.006, 0.008, 0.014, 0.02, 0.03], npts)
+    L0 = rng.uniform(-1.0, 1.0, npts)
+
+    w = stellib.interp_batch(T0, g0, Z0, L0, T, g, Z, chunksize=64)
+
+    assert w.shape == (npts, len(T))
+    for k in range(npts):
+        idx, wk = stellib.interp(T0[k], g0[k], Z0[k], L0[k], T, g, Z)
+        ref = np.zeros(len(T))
+        np.add.at(ref, idx, wk)
+        np.testing.assert_allclose(w[k].toarray()[0], ref, rtol=1e-10, atol=1e-14)
@@ -0,0 +1,83 @@
+import numpy as np
+from astropy.table import Table
+
+from beast.physicsmodel.grid_weights import compute_grid_weights
+from beast.physicsmodel.grid_and_prior_weights import (
+    compute_distance_age_mass_metallicity_weights,
+    compute_av_rv_fA_prior_weights,
+    reweight_sedgrid_priors,
+)
+
+
+def _make_sedgrid(stellar_priors, dust_priors):
+    """
+    Mimic the weights computed by the model_grid stages on a small grid
+    """
+    # spectral grid: 2 distances x 2 metallicities x 3 ages x 4 masses
+    dists, Zs, logAs, masses = np.meshgrid(
+        [1e6, 2e6], [0.004, 0.0152], [7.0, 8.0, 9.0], [1.0, 2.0, 3.5, 6.0],
+        indexing="ij",
+    )
+    n0 = dists.size
+    specgrid = Table(
+        {
+            "distance": dists.ravel(),
+            "Z": Zs.ravel(),
+            "logA": logAs.ravel(),
+            "M_ini": masses.ravel(),
+            "specgrid_indx": np.tile(np.arange(n0 // 2), 2),
+        }
+    )
+    for ckey in ["grid_weight", "prior_weight", "weight"]:
+        specgrid[ckey] = np.ones(n0)
+    compute_distance_age_mass_metallicity_weights(specgrid, **stellar_priors)
+
+    # dust grid
+    avs = np.array([0.0, 0.5, 1.5])
+    rvs = np.array([3.1, 4.0])
+    cols = {k: [] for k in specgrid.colnames + ["Av", "Rv", "f_A"]}
+    for Av in avs:
+        for Rv in rvs:
+            dprior = compute_av_rv_fA_prior_weights(
+                Av, Rv, 1.0, specgrid["distance"].data, **dust_priors
+            )
+            for ckey in specgrid.colnames:
+                cols[ckey].append(np.array(specgrid[ckey]))
+            cols["weight"][-1] = cols["weight"][-1] * dprior
+            cols["prior_weight"][-1] = cols["prior_weight"][-1] * dprior
+            cols["Av"].append(np.full(n0, Av))
+            cols["Rv"].append(np.full(n0, Rv))
+            cols["f_A"].append(np.full(n0, 1.0))
+    sedgrid = Table({k: np.concatenate(v) for k, v in cols.items()})
+    for ckey, cvals in [("Av", avs), ("Rv", rvs)]:
+        for cval, gweight in zip(cvals, compute_grid_weights(cvals)):
+            gvals = sedgrid[ckey] == cval
+            sedgrid["weight"][gvals] *= gweight
+            sedgrid["grid_weight"][gvals] *= gweight
+    return sedgrid
+
+
+def test_reweight_sedgrid_priors():
+    priors_a = {
+        "age_prior_model": {"name": "flat"},
+        "mass_prior_model": {"name": "flat"},
+    }
+    priors_b = {
+        "age_prior_model": {"name": "flat_log"},
+        "mass_prior_model": {"name": "salpeter"},
+    }
+    dust_a = {"av_prior_model": {"name": "flat"}}
+    dust_b = {"av_prior_model": {"name": "lognormal", "mean": 0.5, "sigma": 0.5}}
+
+    sedgrid_a = _make_sedgrid(priors_a, dust_a)
+    sedgrid_b = _make_sedgrid(priors_b, dust_b)
+
+    # recover the original weights
+    prior_weight, weight = reweight_sedgrid_priors(sedgrid_a, **priors_a, **dust_a)
+    np.testing.assert_allclose(prior_weight, sedgrid_a["prior_weight"], rtol=1e-12)
+    np.testing.assert_allclose(weight, sedgrid_a["weight"], rtol=1e-12)
+
+    # weights for other priors without regenerating the grid
+    prior_weight, weight = reweight_sedgrid_priors(sedgrid_a, **priors_b, **dust_b)
+    np.testing.assert_allclose(prior_weight, sedgrid_b["prior_weight"], rtol=1e-12)
+    np.testing.assert_allclose(weight, sedgrid_b["weight"], rtol=1e-12)
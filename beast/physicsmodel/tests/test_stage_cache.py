@@ -0,0 +1,118 @@
+import os
+import sys
+import subprocess
+
+import numpy as np
+from astropy.table import Table
+
+import beast
+from beast.physicsmodel.grid import SEDGrid
+from beast.physicsmodel.dust import extinction
+from beast.physicsmodel.helpers.stage_cache import (
+    input_digest,
+    stage_digests,
+    stage_is_current,
+    stage_manifest_name,
+    write_stage_manifest,
+)
+
+
+def _make_grid(scale=1.0):
+    seds = np.arange(12, dtype=float).reshape(4, 3) * scale
+    gtable = Table({"Av": [0.0, 1.0, 2.0, 3.0], "Rv": [3.1, 3.1, 3.1, 3.1]})
+    return SEDGrid([1.0, 2.0, 3.0], seds=seds, grid=gtable, backend="memory")
+
+
+def test_input_digest_content():
+    """
+    Digests only depend on the content of the inputs
+    """
+    assert input_digest(_make_grid()) == input_digest(_make_grid())
+    assert input_digest(_make_grid()) != input_digest(_make_grid(scale=2.0))
+
+    assert input_digest(extinction.Gordon16_RvFALaw()) == input_digest(
+        extinction.Gordon16_RvFALaw()
+    )
+    assert input_digest(extinction.Gordon16_RvFALaw()) != input_digest(
+        extinction.Cardelli89()
+    )
+
+    assert input_digest({"a": 1, "b": [0.1, "x"]}) == input_digest(
+        {"b": [0.1, "x"], "a": 1}
+    )
+    assert input_digest(np.arange(3)) != input_digest(np.arange(3.0))
+
+    # classes by name, functions by name and code
+    assert input_digest(extinction.Gordon16_RvFALaw) != input_digest(
+        extinction.Cardelli89
+    )
+    assert input_digest(_make_grid) == input_digest(_make_grid)
+    assert input_digest(np.log10) != input_digest(np.log)
+    assert input_digest(lambda x: x + 1) != input_digest(lambda x: x + 2)
+
+
+_digest_script = """
+from beast.physicsmodel.dust.extinction import Generalized_RvFALaw, Generalized_DustExt
+from beast.physicsmodel.stars.isochrone import MISTWeb
+from beast.physicsmodel.helpers.stage_cache import input_digest
+
+law = Generalized_RvFALaw(
+    ALaw=Generalized_DustExt(curve="F19"), BLaw=Generalized_DustExt(curve="G03_SMCBar")
+)
+print(input_digest(law), input_digest(MISTWeb()))
+"""
+
+
+def test_input_digest_processes():
+    """
+    Digests are the same in different processes
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(beast.__file__)), env.get("PYTHONPATH", "")]
+    )
+    digests = []
+    for seed in ["1", "2"]:
+        env["PYTHONHASHSEED"] = seed
+        out = subprocess.run(
+            [sys.executable, "-c", _digest_script],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        digests.append(out.stdout.split())
+    assert len(digests[0]) == 2
+    assert digests[0] == digests[1]
+
+
+def test_stage_is_current(tmp_path):
+    """
+    Outputs are reused only when the inputs and the output are unchanged
+    """
+    fname = str(tmp_path / "stage_out.txt")
+    digests = stage_digests({"grid": _make_grid(), "av": [0.0, 5.0, 0.1]})
+
+    # no output yet
+    assert not stage_is_current("test", fname, digests)
+
+    with open(fname, "w") as f:
+        f.write("output")
+    write_stage_manifest("test", fname, digests)
+    assert stage_is_current("test", fname, digests)
+
+    # changed inputs
+    new_digests = stage_digests({"grid": _make_grid(), "av": [0.0, 4.0, 0.1]})
+    assert not stage_is_current("test", fname, new_digests)
+    assert not stage_is_current("other", fname, digests)
+
+    # modified output
+    with open(fname, "w") as f:
+        f.write("modified output")
+    assert not stage_is_current("test", fname, digests)
+
+    # outputs without manifest are recomputed, unless adopted
+    os.remove(stage_manifest_name(fname))
+    assert not stage_is_current("test", fname, new_digests)
+    assert stage_is_current("test", fname, new_digests, adopt=True)
+    assert not os.path.isfile(stage_manifest_name(fname))
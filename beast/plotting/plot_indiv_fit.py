@@ -9,9 +9,7 @@ from matplotlib.ticker import MaxNLocator
 from matplotlib.patches import Rectangle
 import matplotlib
 
-from astropy.table import Table
-from astropy.io import fits
-
+from beast.fitting.results import BeastResults
 from beast.plotting.beastplotlib import initialize_parser
 from beast.tools.symlog import inverse_symlog, symlog_linthreshold
 
@@ -19,11 +17,11 @@ from beast.tools.symlog import inverse_symlog, symlog_linthreshold
 __all__ = ["plot_indiv_fit"]
 
 
-def disp_str(stats, k, keyname):
+def disp_str(stats, keyname):
     dvals = [
-        stats[keyname + "_p50"][k],
-        stats[keyname + "_p84"][k],
-        stats[keyname + "_p16"][k],
+        stats[keyname + "_p50"],
+        stats[keyname + "_p84"],
+        stats[keyname + "_p16"],
     ]
     if keyname in ["M_ini", "Z"]:
         dvals = np.log10(dvals)
@@ -43,19 +41,12 @@ def disp_str(stats, k, keyname):
     return disp_str
 
 
-def plot_1dpdf(ax, pdf1d_hdu, tagname, xlabel, starnum, stats=None, logx=False):
-
-    pdf_data = pdf1d_hdu[tagname].data
+def plot_1dpdf(ax, results, tagname, xlabel, starnum, stats=None, logx=False):
 
-    if pdf_data.ndim == 2:
-        pdf = pdf_data[starnum, :]
-        xvals = pdf_data[-1, :]
-        n_objects, n_bins = pdf_data.shape
-        n_objects -= 1
-    elif pdf_data.ndim == 3:
-        pdf = pdf_data[starnum, :, 0]
-        xvals = pdf_data[starnum, :, 1]
-        n_bins = np.sum(~np.isnan(xvals))
+    # only the 1D PDF of the star is read
+    #   (older files with bins for each star have NaNs for the unused bins)
+    xvals, pdf = results.pdf1d(tagname, starnum)
+    n_bins = np.sum(~np.isnan(xvals))
 
     ax.text(0.95, 0.95, xlabel, transform=ax.transAxes, va="top", ha="right")
 
@@ -86,7 +77,7 @@ def plot_1dpdf(ax, pdf1d_hdu, tagname, xlabel, starnum, stats=None, logx=False):
     if ~np.isnan(xlim[0]):
         ax.set_xlim(xlim[0] - 0.05 * xlim_delta, xlim[1] + 0.05 * xlim_delta)
     else:
-        bestval = stats[tagname + "_Best"][starnum]
+        bestval = stats[tagname + "_Best"]
         if tagname == "distance":
             bestval /= 1000.0
         ax.set_xlim(0.95 * bestval, 1.05 * bestval)
@@ -98,7 +89,7 @@ def plot_1dpdf(ax, pdf1d_hdu, tagname, xlabel, starnum, stats=None, logx=False):
 
         y1 = ylim[0] + 0.5 * (ylim[1] - ylim[0])
         y2 = ylim[0] + 0.7 * (ylim[1] - ylim[0])
-        pval = stats[tagname + "_Best"][starnum]
+        pval = stats[tagname + "_Best"]
         if tagname == "distance":
             pval /= 1000.0
         if logx:
@@ -111,9 +102,9 @@ def plot_1dpdf(ax, pdf1d_hdu, tagname, xlabel, starnum, stats=None, logx=False):
         y2m = ylim[0] + 0.35 * (ylim[1] - ylim[0])
         ym = 0.5 * (y1 + y2)
         pvals = [
-            stats[tagname + "_p50"][starnum],
-            stats[tagname + "_p16"][starnum],
-            stats[tagname + "_p84"][starnum],
+            stats[tagname + "_p50"],
+            stats[tagname + "_p16"],
+            stats[tagname + "_p84"],
         ]
         if logx:
             pvals = np.log10(pvals)
@@ -154,18 +145,17 @@ def plot_indiv_fit(filebase, starnum=0, savefig=False, plotfig=True):
         stats_fname = filebase[0]
         pdf1d_fname = filebase[1]
 
-    # read in the stats
-    stats = Table.read(stats_fname, hdu=1)
-
-    # check how many extensions the stats file has
-    # determines how to get the filternames and wavelengths
-    with fits.open(stats_fname) as hdul:
-        nhdu = len(hdul)
-    if nhdu > 2:
-        filter_info = Table.read(stats_fname, hdu=2)
-        bfilters = filter_info["filternames"].data
-        waves = filter_info["wavelengths"].data
-        filters = [cfilter.decode("utf-8") for cfilter in bfilters]
+    # only the stats and 1D PDFs of the star are read
+    results = BeastResults(
+        stats_fname=stats_fname, pdf1d_fname=pdf1d_fname, block_size=1
+    )
+    stats = results.stats(starnum)[0]
+
+    # filternames and wavelengths from the stats file if it has them
+    filter_info = results.filter_info
+    if filter_info is not None:
+        filters = [str(cfilter) for cfilter in filter_info["filternames"]]
+        waves = np.array(filter_info["wavelengths"], dtype=float)
     else:  # PHAT values as default to support old stats files
         filters = [
             "HST_WFC3_F275W",
@@ -177,9 +167,6 @@ def plot_indiv_fit(filebase, starnum=0, savefig=False, plotfig=True):
         ]
         waves = np.asarray([2722.05, 3366.01, 4763.05, 8087.37, 11672.36, 15432.74])
 
-    # open 1D PDF file
-    pdf1d_hdu = fits.open(pdf1d_fname)
-
     fig, ax = plt.subplots(figsize=(8, 8))
 
     # setup the plot grid
@@ -222,28 +209,26 @@ def plot_indiv_fit(filebase, starnum=0, savefig=False, plotfig=True):
     mod_flux = np.zeros((n_filters, 3), dtype=float)
     mod_flux_nd = np.zeros((n_filters, 3), dtype=float)
     mod_flux_wbias = np.zeros((n_filters, 3), dtype=float)
-    k = starnum
-
-    corname = stats["Name"][k]
+    corname = stats["Name"]
 
     for i, cfilter in enumerate(filters):
-        obs_flux[i] = stats[cfilter][k]
+        obs_flux[i] = stats[cfilter]
         fluxname = "log" + cfilter
-        mod_flux[i, 0] = np.power(10.0, stats[fluxname + "_wd_p50"][k])
-        mod_flux[i, 1] = np.power(10.0, stats[fluxname + "_wd_p16"][k])
-        mod_flux[i, 2] = np.power(10.0, stats[fluxname + "_wd_p84"][k])
-        mod_flux_nd[i, 0] = np.power(10.0, stats[fluxname + "_nd_p50"][k])
-        mod_flux_nd[i, 1] = np.power(10.0, stats[fluxname + "_nd_p16"][k])
-        mod_flux_nd[i, 2] = np.power(10.0, stats[fluxname + "_nd_p84"][k])
+        mod_flux[i, 0] = np.power(10.0, stats[fluxname + "_wd_p50"])
+        mod_flux[i, 1] = np.power(10.0, stats[fluxname + "_wd_p16"])
+        mod_flux[i, 2] = np.power(10.0, stats[fluxname + "_wd_p84"])
+        mod_flux_nd[i, 0] = np.power(10.0, stats[fluxname + "_nd_p50"])
+        mod_flux_nd[i, 1] = np.power(10.0, stats[fluxname + "_nd_p16"])
+        mod_flux_nd[i, 2] = np.power(10.0, stats[fluxname + "_nd_p84"])
         if "sym" + fluxname + "_wd_bias_p50" in stats.colnames:
             mod_flux_wbias[i, 0] = inverse_symlog(
-                stats["sym" + fluxname + "_wd_bias_p50"][k]
+                stats["sym" + fluxname + "_wd_bias_p50"]
             )
             mod_flux_wbias[i, 1] = inverse_symlog(
-                stats["sym" + fluxname + "_wd_bias_p16"][k]
+                stats["sym" + fluxname + "_wd_bias_p16"]
             )
             mod_flux_wbias[i, 2] = inverse_symlog(
-                stats["sym" + fluxname + "_wd_bias_p84"][k]
+                stats["sym" + fluxname + "_wd_bias_p84"]
             )
 
     sed_ax = ax[index_sedplot]
@@ -307,12 +292,12 @@ def plot_indiv_fit(filebase, starnum=0, savefig=False, plotfig=True):
         sed_ax.text(
             tx[1],
             ty[i],
-            disp_str(stats, starnum, keys[i]),
+            disp_str(stats, keys[i]),
             ha="center",
             color="m",
             transform=sed_ax.transAxes,
         )
-        best_val = stats[keys[i] + "_Best"][k]
+        best_val = stats[keys[i] + "_Best"]
         if keys[i] in ["M_ini", "Z"]:
             best_val = np.log10(best_val)
         if keys[i] == "distance":
@@ -389,36 +374,37 @@ def plot_indiv_fit(filebase, starnum=0, savefig=False, plotfig=True):
     # plot the primary parameter 1D PDFs
     ax_iter = (ax[i] for i in indices_1dpdf)
     first_primary_ax = next(ax_iter)
-    plot_1dpdf(first_primary_ax, pdf1d_hdu, "Av", "A(V)", starnum, stats=stats)
+    plot_1dpdf(first_primary_ax, results, "Av", "A(V)", starnum, stats=stats)
     plot_1dpdf(
-        next(ax_iter), pdf1d_hdu, "M_ini", "log(M)", starnum, logx=True, stats=stats
+        next(ax_iter), results, "M_ini", "log(M)", starnum, logx=True, stats=stats
     )
-    plot_1dpdf(next(ax_iter), pdf1d_hdu, "logA", "log(t)", starnum, stats=stats)
+    plot_1dpdf(next(ax_iter), results, "logA", "log(t)", starnum, stats=stats)
     last_primary_ax = next(ax_iter)
-    plot_1dpdf(last_primary_ax, pdf1d_hdu, "distance", "d(kpc)", starnum, stats=stats)
+    plot_1dpdf(last_primary_ax, results, "distance", "d(kpc)", starnum, stats=stats)
 
     # plot the secondary parameter 1D PDFs
     first_secondary_ax = next(ax_iter)
-    plot_1dpdf(first_secondary_ax, pdf1d_hdu, "Rv", "R(V)", starnum, stats=stats)
+    plot_1dpdf(first_secondary_ax, results, "Rv", "R(V)", starnum, stats=stats)
     plot_1dpdf(
-        next(ax_iter), pdf1d_hdu, "f_A", r"f$_\mathcal{A}$", starnum, stats=stats
+        next(ax_iter), results, "f_A", r"f$_\mathcal{A}$", starnum, stats=stats
     )
     last_secondary_ax = next(ax_iter)
-    plot_1dpdf(last_secondary_ax, pdf1d_hdu, "Z", "log(Z)", starnum, logx=True, stats=stats)
+    plot_1dpdf(last_secondary_ax, results, "Z", "log(Z)", starnum, logx=True, stats=stats)
 
     # plot the derived parameter 1D PDFs
     first_derived_ax = next(ax_iter)
     plot_1dpdf(
         first_derived_ax,
-        pdf1d_hdu,
+        results,
         "logT",
         r"log(T$_\mathrm{eff})$",
         starnum,
         stats=stats,
     )
-    plot_1dpdf(next(ax_iter), pdf1d_hdu, "logg", "log(g)", starnum, stats=stats)
+    plot_1dpdf(next(ax_iter), results, "logg", "log(g)", starnum, stats=stats)
     last_derived_ax = next(ax_iter)
-    plot_1dpdf(last_derived_ax, pdf1d_hdu, "logL", "log(L)", starnum, stats=stats)
+    plot_1dpdf(last_derived_ax, results, "logL", "log(L)", starnum, stats=stats)
+    results.close()
 
     # A more manual version of tight_layout
     plt.subplots_adjust(
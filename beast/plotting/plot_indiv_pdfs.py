@@ -1,9 +1,10 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
-from astropy.io import fits
 import copy
 
+from beast.fitting.results import BeastResults
+
 __all__ = ["plot_indiv_pdfs"]
 
 
@@ -24,18 +25,19 @@ def plot_indiv_pdfs(pdf1d_file, pdf2d_file, starnum):
 
     """
 
-    with fits.open(pdf2d_file) as hdu_2d, fits.open(pdf1d_file) as hdu_1d:
+    # only the 1D and 2D PDFs (dense or sparse files) of the star are read
+    with BeastResults(
+        pdf1d_fname=pdf1d_file, pdf2d_fname=pdf2d_file, block_size=1
+    ) as results:
+        pdf2d_star = {
+            name: results.pdf2d(name, starnum)[1] for name in results.pdf2d_names
+        }
 
-        # start with the 2D PDF file to figure out which parameters to plot
+        # start with the 2D PDFs to figure out which parameters to plot
 
-        # list of extension names
-        # - skip the extension named "PRIMARY"
-        # - skip any extension with a dimension of 1 (means that param wasn't fit)
-        ext_list = [
-            hdu_2d[i].name
-            for i in range(len(hdu_2d))
-            if ("PRIMARY" not in hdu_2d[i].name) and (1 not in hdu_2d[i].data.shape)
-        ]
+        # list of parameter pairs
+        # - skip any pair with a dimension of 1 (means that param wasn't fit)
+        ext_list = [name for name in pdf2d_star if 1 not in pdf2d_star[name].shape]
 
         # grab the parameter names
         param_list_temp = [i for x in ext_list for i in x.split("+")]
@@ -50,6 +52,9 @@ def plot_indiv_pdfs(pdf1d_file, pdf2d_file, starnum):
         # total number of parameters
         n_params = len(param_list)
 
+        # 1D PDFs of the star, (bins, PDF) for each parameter
+        pdf1d_star = {p: results.pdf1d(p, starnum) for p in param_list}
+
         # figure
         fig = plt.figure(figsize=(4 * n_params, 4 * n_params))
 
@@ -72,15 +77,15 @@ def plot_indiv_pdfs(pdf1d_file, pdf2d_file, starnum):
 
                     # find the 2D PDF and make sure it's properly rotated
                     try:
-                        image = hdu_2d[pi + "+" + pj].data[starnum, :, :].T
+                        image = pdf2d_star[pi + "+" + pj].T
                     except KeyError:
-                        image = hdu_2d[pj + "+" + pi].data[starnum, :, :]
+                        image = pdf2d_star[pj + "+" + pi]
                     except Exception:
                         raise
 
                     # create axis/labels
-                    x_bins, x_label = setup_axis(pi, hdu_1d)
-                    y_bins, y_label = setup_axis(pj, hdu_1d)
+                    x_bins, x_label = setup_axis(pi, pdf1d_star[pi][0])
+                    y_bins, y_label = setup_axis(pj, pdf1d_star[pj][0])
 
                     # plot 2D PDF image
                     im = plt.imshow(
@@ -156,10 +161,10 @@ def plot_indiv_pdfs(pdf1d_file, pdf2d_file, starnum):
                     ax = plt.gca()
 
                     # create axis/labels
-                    x_bins, x_label = setup_axis(pi, hdu_1d)
+                    x_bins, x_label = setup_axis(pi, pdf1d_star[pi][0])
 
                     # make histogram
-                    _pdf = hdu_1d[pi].data[starnum, :]
+                    _pdf = pdf1d_star[pi][1]
                     plt.plot(
                         x_bins,
                         _pdf / np.max(_pdf),
@@ -206,7 +211,7 @@ def plot_indiv_pdfs(pdf1d_file, pdf2d_file, starnum):
     plt.close(fig)
 
 
-def setup_axis(param, pdf1d_hdu):
+def setup_axis(param, pdf1d_bins):
     """
     Set up the bins and labels for a parameter
 
@@ -215,8 +220,8 @@ def setup_axis(param, pdf1d_hdu):
     param : string
         name of the parameter we're binning/labeling
 
-    pdf1d_hdu : HDU object
-        the HDU for param (to get the bins)
+    pdf1d_bins : numpy array
+        the 1D PDF bins of param
 
     Returns
     -------
@@ -230,11 +235,11 @@ def setup_axis(param, pdf1d_hdu):
 
     # mass and metallicity get log spaced
     if ("M_" in param) or (param == "Z"):
-        bins = np.log10(pdf1d_hdu[param].data[-1, :])
+        bins = np.log10(pdf1d_bins)
         label = "log " + param
     # for all others, standard linear spacing is ok
     else:
-        bins = pdf1d_hdu[param].data[-1, :]
+        bins = pdf1d_bins
         label = copy.copy(param)
 
     return bins, label
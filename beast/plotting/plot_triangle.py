@@ -1,8 +1,9 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from astropy.io import fits
 import copy
 
+from beast.fitting.results import BeastResults
+
 
 def plot_triangle(
     beast_stats_file, param_list=["Av", "Rv", "logA", "f_A", "M_ini", "Z", "distance"],
@@ -23,9 +24,9 @@ def plot_triangle(
 
     n_params = len(param_list)
 
-    # read in data
-    with fits.open(beast_stats_file) as hdu:
-        stats_table = hdu[1].data
+    # read in data, only the plotted columns
+    with BeastResults(stats_fname=beast_stats_file) as results:
+        stats_table = results.stats(columns=[p + "_p50" for p in param_list])
 
     # figure
     fig = plt.figure(figsize=(4 * n_params, 4 * n_params))
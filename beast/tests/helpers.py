@@ -7,9 +7,19 @@ import h5py
 import tempfile
 
 from astropy.io import fits
+from astropy.table import Table
 from astropy.utils.data import download_file
 
-__all__ = ["download_rename", "compare_tables", "compare_fits", "compare_hdf5"]
+from beast.physicsmodel.grid import SEDGrid
+
+__all__ = [
+    "download_rename",
+    "compare_tables",
+    "compare_fits",
+    "compare_hdf5",
+    "FitObservations",
+    "random_fit_inputs",
+]
 
 
 def download_rename(filename, tmpdir=""):
@@ -154,3 +164,69 @@ def compare_hdf5(fname_cache, fname_new, ctype=None):
                         err_msg=err_msg,
                         rtol=1e-5,
                     )
+
+
+class FitObservations(object):
+    """
+    Minimal observation catalog with the methods used by the fitting
+    """
+
+    def __init__(self, fluxes, filters):
+        self.fluxes = fluxes
+        self.filters = filters
+
+    def __len__(self):
+        return len(self.fluxes)
+
+    def getFilters(self):
+        return self.filters
+
+    def enumobs(self):
+        for k in range(len(self.fluxes)):
+            yield k, self.fluxes[k]
+
+
+def random_fit_inputs(ranseed, n_models=500, nstars=7, filters=["F1", "F2", "F3"]):
+    """
+    Small random SED grid, noise model and observations for fitting tests.
+
+    Parameters
+    ----------
+    ranseed : int
+        seed of the random number generator
+    n_models : int
+        number of models in the grid
+    nstars : int
+        number of observed stars, picked from the models
+    filters : list of str
+        names of the filters
+
+    Returns
+    -------
+    sedgrid : SEDGrid
+        grid with the Av and logA parameters (memory backend)
+    noisemodel : dict
+        noise model with 10% errors and no bias or incompleteness
+    obs : FitObservations
+        fluxes of the stars
+    """
+    rng = np.random.default_rng(ranseed)
+    gtable = Table(
+        {
+            "Av": rng.integers(0, 10, n_models) * 0.5,
+            "logA": rng.integers(0, 20, n_models) * 0.1 + 7.0,
+            "weight": rng.random(n_models),
+            "specgrid_indx": np.arange(n_models),
+        }
+    )
+    seds = 10 ** rng.uniform(-18, -16, (n_models, len(filters)))
+    lamb = np.arange(1.0, len(filters) + 1.0)
+    sedgrid = SEDGrid(lamb, seds=seds, grid=gtable, backend="memory")
+    sedgrid.header["filters"] = " ".join(filters)
+    noisemodel = {
+        "bias": np.zeros_like(seds),
+        "error": 0.1 * seds,
+        "completeness": np.ones_like(seds),
+    }
+    obs = FitObservations(seds[rng.integers(0, n_models, nstars)], filters)
+    return sedgrid, noisemodel, obs
@@ -69,6 +69,12 @@ def condense_files(bricknum=None, filedir=None):
 
 
 def condense_stats_files(bname, cur_dir, out_dir):
+    """
+    Concatenate the stats files of a spatial region
+
+    All the rows and columns are copied, so the files are read as whole tables
+    rather than star by star with `~beast.fitting.results.BeastResults`.
+    """
 
     # get all the stats files
     stats_files = glob.glob(cur_dir + "*_stats.fits")
@@ -106,6 +112,12 @@ def condense_stats_files(bname, cur_dir, out_dir):
 
 
 def condense_pdf1d_files(bname, cur_dir, out_dir, n_sources):
+    """
+    Concatenate the 1D PDFs of the files of a spatial region
+
+    All the stars are copied, so the files are read by extension rather than
+    star by star with `~beast.fitting.results.BeastResults`.
+    """
 
     # useful default for the "failure" case of all negative values and log spacing requested
     # n_bins_default = 50
@@ -18,11 +18,13 @@ import math
 import matplotlib.pyplot as plt
 from matplotlib.patches import Polygon
 from matplotlib.collections import PatchCollection
+from matplotlib.path import Path
 import numpy as np
-import photutils as pu
+from photutils import aperture as pu
 from beast.tools.density_map import DensityMap
 from beast.tools import cut_catalogs
 import itertools as it
+from multiprocessing import Pool
 import os
 from shapely import geometry
 
@@ -101,6 +103,12 @@ def main():  # pragma: no cover
         default=None,
         help="catalog entries with FILTER_VEGA > MAG will not be masked",
     )
+    background_parser.add_argument(
+        "--nprocs",
+        type=int,
+        default=1,
+        help="number of parallel processes for the background measurements",
+    )
 
     # arguments unique to sourceden map
     sourceden_parser.add_argument(
@@ -233,24 +241,24 @@ def main_make_map(args):
             ann_width=args.ann_width,
             cat_filter=args.cat_filter,
             output_base=output_base,
+            nprocs=args.nprocs,
         )
 
     # Save a file describing the properties of the bins in a handy format
+    #   (same row order as xyrange)
+    i_x, i_y = [a.ravel() for a in np.meshgrid(range(n_x), range(n_y), indexing="ij")]
     bin_details = astropy.table.Table(
-        names=["i_ra", "i_dec", "value", "min_ra", "max_ra", "min_dec", "max_dec"]
+        [
+            i_x.astype(float),
+            i_y.astype(float),
+            map_values_array[i_x, i_y],
+            ra_grid[i_x],
+            ra_grid[i_x + 1],
+            dec_grid[i_y],
+            dec_grid[i_y + 1],
+        ],
+        names=["i_ra", "i_dec", "value", "min_ra", "max_ra", "min_dec", "max_dec"],
     )
-    for x, y in xyrange(n_x, n_y):
-        bin_details.add_row(
-            [
-                x,
-                y,
-                map_values_array[x, y],
-                ra_grid[x],
-                ra_grid[x + 1],
-                dec_grid[y],
-                dec_grid[y + 1],
-            ]
-        )
 
     # Add the ra and dec grids as metadata
     bin_details.meta["ra_grid"] = ra_grid
@@ -287,7 +295,15 @@ def main_plot(args):
 
 
 def make_background_map(
-    cat, ra_grid, dec_grid, ref_im, mask_radius, ann_width, cat_filter, output_base
+    cat,
+    ra_grid,
+    dec_grid,
+    ref_im,
+    mask_radius,
+    ann_width,
+    cat_filter,
+    output_base,
+    nprocs=1,
 ):
     """
     Divide the image into a number of bins, and calculate the median
@@ -328,6 +344,9 @@ def make_background_map(
     output_base: string
         base name (without extension) to be used for the output files
 
+    nprocs : int (default=1)
+        number of parallel processes for the background measurements
+
     Returns
     -------
     results: background_map, nsources_map: 2d ndarray, 2d ndarray
@@ -336,7 +355,7 @@ def make_background_map(
     # A list of background values for each source of the catalog will be
     # built up. Mask used is also returned.
     individual_backgrounds = measure_backgrounds(
-        cat, ref_im, mask_radius, ann_width, cat_filter
+        cat, ref_im, mask_radius, ann_width, cat_filter, nprocs=nprocs
     )
 
     w = make_wcs_for_map(ra_grid, dec_grid)
@@ -379,7 +398,9 @@ def make_background_map(
     return background_map, nsources_map
 
 
-def measure_backgrounds(cat_table, ref_im, mask_radius, ann_width, cat_filter):
+def measure_backgrounds(
+    cat_table, ref_im, mask_radius, ann_width, cat_filter, tile_size=1024, nprocs=1
+):
     """
     Measure the background for all the sources in cat_table, using
     ref_im.
@@ -405,6 +426,11 @@ def measure_backgrounds(cat_table, ref_im, mask_radius, ann_width, cat_filter):
         will not be masked.
         If None: all catalog entries will be considered.
 
+    tile_size : int (default=1024)
+        size (in pixels) of the image tiles used for the annulus photometry
+
+    nprocs : int (default=1)
+        number of parallel processes used for the annulus photometry
 
     Returns
     -------
@@ -417,8 +443,8 @@ def measure_backgrounds(cat_table, ref_im, mask_radius, ann_width, cat_filter):
     w = wcs.WCS(ref_im.header)
     shp = ref_im.data.shape
 
-    inner_rad = mask_radius * u.pixel
-    outer_rad = inner_rad + ann_width * u.pixel
+    inner_rad = mask_radius
+    outer_rad = inner_rad + ann_width
     mask_rad = inner_rad
 
     # More elaborate way using an actual image (do not care about the
@@ -427,76 +453,178 @@ def measure_backgrounds(cat_table, ref_im, mask_radius, ann_width, cat_filter):
     ra = cat_table["RA"]
     dec = cat_table["DEC"]
     c = astropy.coordinates.SkyCoord(ra * u.degree, dec * u.degree)
+    positions = np.column_stack(w.world_to_pixel(c))
 
     # Annuli, of which the counts per surface area will be used as
     # background measurements
-    annuli = pu.SkyCircularAnnulus(c, r_in=inner_rad, r_out=outer_rad)
-    area = annuli.to_pixel(w).area
+    annuli = pu.CircularAnnulus(positions, r_in=inner_rad, r_out=outer_rad)
+    area = annuli.area
 
     # A mask to make sure that no sources end up in the background
     # calculation
     if cat_filter is None:
-        circles = pu.SkyCircularAperture(c, mask_rad)
+        mask_positions = positions
     else:
-        circles = pu.SkyCircularAperture(
-            c[cat_table[cat_filter[0] + "_VEGA"] < float(cat_filter[1])], mask_rad
-        )
-    source_masks = circles.to_pixel(w).to_mask()
-    mask_union = np.zeros(shp)
-    for i, ap_mask in enumerate(source_masks):
-        # the masks have a bounding box which we need to take into
-        # account. Here we will calculate the overlap between the mask
-        # and the image (important if the mask is near the edge, so that
-        # the box might go outside of it).
-        data_slices = list(ap_mask.bbox.slices)
-        # These slices go outside of the box sometimes! In that case we
-        # will override the slices on both sides.
-
-        # Default slices (go over the whole mask)
-        mask_slices = [slice(None, None), slice(None, None)]
-
-        # Adjust the slices in each dimension
-        for j in range(2):
-            # DATA: . . a b c d e f
-            # index - - 0 1 2 3 4 5
-            # ---------------
-            # MASK: - + + + -
-            # index 0 1 2 3 4
-            # --> DATA_SLICE [0:stop]
-            # --> MASK_SLICE [2:]
-            data_start = data_slices[j].start
-            if data_start < 0:
-                # Move the start from negative n to zero
-                data_slices[j] = slice(0, data_slices[j].stop)
-                # Move the start from 0 to positive n
-                mask_slices[j] = slice(-data_start, mask_slices[j].stop)
-                # --> we slice over the part of the small mask that
-                # falls on the positive side of the axis
-
-            data_stop = data_slices[j].stop
-            if data_stop > shp[j]:
-                overflow = data_stop - shp[j]
-                # Move the stop 'overflow' to shp[j]
-                data_slices[j] = slice(data_slices[j].start, shp[j])
-                # Move the stop to 'overflow' pixels from the end
-                mask_slices[j] = slice(mask_slices[j].start, -overflow)
-                # --> slice over the part that falls below the maximum
-
-        mask_union[tuple(data_slices)] += ap_mask.data[tuple(mask_slices)]
-
-    # Threshold
-    mask_union = mask_union > 0
+        mask_positions = positions[
+            cat_table[cat_filter[0] + "_VEGA"] < float(cat_filter[1])
+        ]
+    mask_union = mask_circles(shp, mask_positions[:, 0], mask_positions[:, 1], mask_rad)
 
     # also mask NaNs
     mask_union[np.isnan(ref_im.data)] = True
 
     # Save the masked reference image
-    hdu = fits.PrimaryHDU(np.where(mask_union, 0, ref_im.data), header=ref_im.header)
+    masked_data = np.where(mask_union, 0, ref_im.data)
+    hdu = fits.PrimaryHDU(masked_data, header=ref_im.header)
     hdu.writeto("masked_reference_image.fits", overwrite=True)
 
-    # Do the measurements
-    phot = pu.aperture_photometry(ref_im.data, annuli, wcs=w, mask=mask_union)
-    return phot["aperture_sum"] / area
+    # Do the measurements (the masked pixels are set to zero)
+    ann_sums = annulus_sums(
+        masked_data,
+        positions,
+        inner_rad,
+        outer_rad,
+        tile_size=tile_size,
+        nprocs=nprocs,
+    )
+    return ann_sums / area
+
+
+def mask_circles(shape, x, y, radius):
+    """
+    Make the union of circular masks, flagging every pixel that overlaps
+    with at least one of the circles (same pixels as the union of the
+    photutils exact aperture masks)
+
+    Each circle is stamped as one span of pixels per image row, all the
+    circles being done at once for each row offset.  The spans are
+    accumulated as +1/-1 at their start/end in a difference image, and the
+    running sum along the rows gives the number of circles covering each
+    pixel.
+
+    Parameters
+    ----------
+    shape : tuple
+        (ny, nx) shape of the image
+
+    x, y : ndarray
+        pixel coordinates of the centers of the circles
+
+    radius : float
+        radius of the circles in pixels
+
+    Returns
+    -------
+    mask : 2D `bool` ndarray
+        True for the masked pixels
+    """
+    ny, nx = shape
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # difference image with an extra column for the ends of the spans
+    diff = np.zeros(ny * (nx + 1), dtype=np.int32)
+
+    # pixel (i, j) covers i-0.5..i+0.5, j-0.5..j+0.5 and overlaps a circle if
+    # its closest point to the center is at a distance < radius
+    j_first = np.floor(y - radius - 0.5).astype(int) + 1
+    for k in range(int(np.ceil(2 * radius + 1)) + 1):
+        j = j_first + k
+        dy = np.maximum(np.abs(j - y) - 0.5, 0.0)
+        h2 = radius ** 2 - dy ** 2
+        good = (h2 > 0) & (j >= 0) & (j < ny)
+        h = np.sqrt(h2[good])
+        i_start = np.floor(x[good] - h - 0.5).astype(int) + 1
+        i_end = np.ceil(x[good] + h + 0.5).astype(int)
+        i_start = np.clip(i_start, 0, nx)
+        i_end = np.clip(i_end, 0, nx)
+        span = i_start < i_end
+        row = j[good][span] * (nx + 1)
+        np.add.at(diff, row + i_start[span], 1)
+        np.add.at(diff, row + i_end[span], -1)
+
+    diff = diff.reshape(ny, nx + 1)
+    mask = np.zeros(shape, dtype=bool)
+    for j in range(0, ny, 1024):
+        mask[j : j + 1024] = np.cumsum(diff[j : j + 1024, :nx], axis=1) > 0
+    return mask
+
+
+def annulus_sums(data, positions, r_in, r_out, tile_size=1024, nprocs=1):
+    """
+    Exact circular annulus photometry, done per image tile
+
+    The sources are grouped by the tile their center falls in, and the
+    photometry for each tile is done on a cutout of the image that contains
+    the annuli of all its sources.  The tiles can be processed in parallel.
+
+    Parameters
+    ----------
+    data : 2D ndarray
+        image
+
+    positions : ndarray
+        (N, 2) pixel positions (x, y) of the annuli
+
+    r_in, r_out : float
+        inner and outer radius of the annuli in pixels
+
+    tile_size : int (default=1024)
+        size of the tiles in pixels
+
+    nprocs : int (default=1)
+        number of parallel processes
+
+    Returns
+    -------
+    sums : ndarray
+        the sums of the data in the annuli
+    """
+    ny, nx = data.shape
+    margin = int(np.ceil(r_out)) + 1
+
+    # tile of each source
+    tile_x = np.clip(np.floor(positions[:, 0] / tile_size), 0, None).astype(int)
+    tile_y = np.clip(np.floor(positions[:, 1] / tile_size), 0, None).astype(int)
+    tile_id = tile_y * (nx // tile_size + 1) + tile_x
+
+    args = []
+    source_indxs = []
+    for t in np.unique(tile_id):
+        (indxs,) = np.where(tile_id == t)
+        xy = positions[indxs]
+        x_lo = int(np.clip(np.floor(xy[:, 0].min()) - margin, 0, nx))
+        x_hi = int(np.clip(np.ceil(xy[:, 0].max()) + margin + 1, 0, nx))
+        y_lo = int(np.clip(np.floor(xy[:, 1].min()) - margin, 0, ny))
+        y_hi = int(np.clip(np.ceil(xy[:, 1].max()) + margin + 1, 0, ny))
+        args.append(
+            (
+                data[y_lo:y_hi, x_lo:x_hi],
+                xy - np.array([x_lo, y_lo]),
+                r_in,
+                r_out,
+            )
+        )
+        source_indxs.append(indxs)
+
+    if nprocs > 1:
+        with Pool(nprocs) as p:
+            tile_sums = p.starmap(_annulus_sums_cutout, args)
+    else:
+        tile_sums = [_annulus_sums_cutout(*a) for a in args]
+
+    sums = np.zeros(len(positions))
+    for indxs, tsums in zip(source_indxs, tile_sums):
+        sums[indxs] = tsums
+    return sums
+
+
+def _annulus_sums_cutout(cutout, positions, r_in, r_out):
+    """
+    Annulus photometry on an image cutout (helper for annulus_sums)
+    """
+    annuli = pu.CircularAnnulus(positions, r_in=r_in, r_out=r_out)
+    return np.atleast_1d(annuli.do_photometry(cutout)[0])
 
 
 def make_source_dens_map(
@@ -552,41 +680,36 @@ def make_source_dens_map(
 
     n_x = len(ra_grid) - 1
     n_y = len(dec_grid) - 1
-    npts_map = np.zeros([n_x, n_y], dtype=float)
-    source_dens = np.zeros(N_stars, dtype=float)
 
     # area of one pixel in square degrees
     pix_area = w.wcs.cdelt[0] * w.wcs.cdelt[1] * 3600 ** 2
 
-    for i, j in xyrange(n_x, n_y):
-        indxs = indices_for_pixel(pix_x, pix_y, i, j)
-
-        if flag_name is None:
-            (indxs_for_SD,) = np.where(
-                (cat[mag_name][indxs] >= mag_cut[0])
-                & (cat[mag_name][indxs] <= mag_cut[1])
-            )
-        else:
-            flag_name = flag_name.upper()
-            (indxs_for_SD,) = np.where(
-                (cat[mag_name][indxs] >= mag_cut[0])
-                & (cat[mag_name][indxs] <= mag_cut[1])
-                & (cat[flag_name][indxs] < 99)
-            )
-
-        n_indxs = len(indxs_for_SD)
-        if n_indxs > 0:
-            # make a box for the current SD map pixel
-            pix_box = geometry.box(i, j, i + 1, j + 1)
-            # find fractional overlap area
-            frac_area = catalog_boundary.intersection(pix_box).area
+    # map pixel of each source
+    i_x, i_y, in_map = pixel_indices(pix_x, pix_y, n_x, n_y)
 
-            if frac_area > 0.5:
-                # stars per unit area
-                npts_map[i, j] = n_indxs / (pix_area * frac_area)
+    # count the sources used for the source density in each pixel
+    use_for_SD = (np.asarray(cat[mag_name]) >= mag_cut[0]) & (
+        np.asarray(cat[mag_name]) <= mag_cut[1]
+    )
+    if flag_name is not None:
+        flag_name = flag_name.upper()
+        use_for_SD &= np.asarray(cat[flag_name]) < 99
+    use_for_SD &= in_map
+    n_indxs = np.bincount(
+        i_x[use_for_SD] * n_y + i_y[use_for_SD], minlength=n_x * n_y
+    ).reshape(n_x, n_y)
+
+    # fractional overlap area of the pixels with the catalog
+    frac_area = pixel_coverage(catalog_boundary, n_x, n_y, pixel_mask=n_indxs > 0)
+
+    # stars per unit area
+    npts_map = np.zeros([n_x, n_y], dtype=float)
+    good = (n_indxs > 0) & (frac_area > 0.5)
+    npts_map[good] = n_indxs[good] / (pix_area * frac_area[good])
 
-        # save the source density as an entry for each source
-        source_dens[indxs] = npts_map[i, j]
+    # save the source density as an entry for each source
+    source_dens = np.zeros(N_stars, dtype=float)
+    source_dens[in_map] = npts_map[i_x[in_map], i_y[in_map]]
 
     save_map_fits(npts_map, w, output_base + "_source_den_image.fits")
 
@@ -683,6 +806,92 @@ def xyrange(n_x, n_y):
     return it.product(range(n_x), range(n_y))
 
 
+def pixel_indices(pix_x, pix_y, n_x, n_y):
+    """
+    Return the indices of the pixel each source lies in, using the same
+    convention as `indices_for_pixel` (x < pix_x <= x + 1)
+
+    Parameters
+    ----------
+    pix_x, pix_y : ndarray
+        pixel coordinates of the sources
+
+    n_x, n_y : int
+        size of the map
+
+    Returns
+    -------
+    i_x, i_y : ndarray
+        pixel indices of the sources
+    in_map : ndarray
+        `bool` array, False for the sources outside of the map
+    """
+    i_x = np.ceil(np.asarray(pix_x)).astype(int) - 1
+    i_y = np.ceil(np.asarray(pix_y)).astype(int) - 1
+    in_map = (i_x >= 0) & (i_x < n_x) & (i_y >= 0) & (i_y < n_y)
+    return i_x, i_y, in_map
+
+
+def pixel_coverage(boundary, n_x, n_y, pixel_mask=None):
+    """
+    Fraction of the area of each map pixel that is covered by a convex
+    boundary polygon (in pixel coordinates, pixel (x, y) covers
+    x..x+1, y..y+1)
+
+    Pixels with all their corners inside the boundary are fully covered,
+    the exact overlap is only computed for the other pixels.
+
+    Parameters
+    ----------
+    boundary : shapely Polygon
+        convex boundary
+
+    n_x, n_y : int
+        size of the map
+
+    pixel_mask : 2D `bool` ndarray, optional
+        if set, only compute the partial coverage of these pixels (the
+        others are set to 0 if not fully covered)
+
+    Returns
+    -------
+    frac_area : 2D ndarray
+        (n_x, n_y) fractional coverage of each pixel
+    """
+    corner_x, corner_y = np.meshgrid(
+        np.arange(n_x + 1), np.arange(n_y + 1), indexing="ij"
+    )
+    corners_in = (
+        Path(np.asarray(boundary.exterior.coords))
+        .contains_points(np.column_stack([corner_x.ravel(), corner_y.ravel()]))
+        .reshape(n_x + 1, n_y + 1)
+    )
+    inside = (
+        corners_in[:-1, :-1]
+        & corners_in[1:, :-1]
+        & corners_in[:-1, 1:]
+        & corners_in[1:, 1:]
+    )
+    frac_area = inside.astype(float)
+
+    # partially covered pixels can only be within the bounding box
+    min_x, min_y, max_x, max_y = boundary.bounds
+    partial = np.zeros((n_x, n_y), dtype=bool)
+    partial[
+        max(int(np.floor(min_x)), 0) : max(int(np.ceil(max_x)), 0),
+        max(int(np.floor(min_y)), 0) : max(int(np.ceil(max_y)), 0),
+    ] = True
+    partial &= ~inside
+    if pixel_mask is not None:
+        partial &= pixel_mask
+
+    for i, j in zip(*np.nonzero(partial)):
+        pix_box = geometry.box(i, j, i + 1, j + 1)
+        frac_area[i, j] = boundary.intersection(pix_box).area
+
+    return frac_area
+
+
 def indices_for_pixel(pix_x, pix_y, x, y):
     """
     Return the indices of the sources for which the coordinates lie in
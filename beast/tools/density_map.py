@@ -49,10 +49,22 @@ class DensityMap:
         self.max_i_dec = max(self.tile_data["i_dec"])
 
         # map index pairs to table rows
-        self.tile_for_ij = {}
-        for r in range(len(self.tile_data)):
-            ij_ra_dec = (self.tile_data[r]["i_ra"], self.tile_data[r]["i_dec"])
-            self.tile_for_ij[ij_ra_dec] = r
+        i_ras = np.asarray(self.tile_data["i_ra"], dtype=int)
+        i_decs = np.asarray(self.tile_data["i_dec"], dtype=int)
+        self.tile_for_ij = dict(
+            zip(zip(i_ras.tolist(), i_decs.tolist()), range(len(self.tile_data)))
+        )
+
+        # same map as a dense (i_ra, i_dec) grid for array lookups
+        # (-1 where there is no tile)
+        self.tile_grid = np.full(
+            (self.max_i_ra - self.min_i_ra + 1, self.max_i_dec - self.min_i_dec + 1),
+            -1,
+            dtype=int,
+        )
+        self.tile_grid[i_ras - self.min_i_ra, i_decs - self.min_i_dec] = np.arange(
+            len(self.tile_data)
+        )
 
     def write(self, fname):
         """
@@ -64,17 +76,35 @@ class DensityMap:
         """
         Finds which tile a certain ra,dec fits into
         """
-        # Get index pair
-        i_ra = np.searchsorted(self.ra_grid[:-1], ra, side="right") - 1
-        i_ra = max(i_ra, self.min_i_ra)
-        i_ra = min(i_ra, self.max_i_ra)
+        return self.tiles_for_positions([ra], [dec])[0]
+
+    def tiles_for_positions(self, ra, dec):
+        """
+        Finds which tiles a set of ra,dec positions fit into
 
-        i_dec = np.searchsorted(self.dec_grid[:-1], dec, side="right") - 1
-        i_dec = max(i_dec, self.min_i_ra)
-        i_dec = min(i_dec, self.max_i_ra)
+        Parameters
+        ----------
+        ra, dec : array-like
+            coordinates of the positions
 
-        # Use index pair to row index map
-        return self.tile_for_ij[(i_ra, i_dec)]
+        Returns
+        -------
+        tiles : ndarray
+            index of the tile (table row) for each position
+        """
+        # Get index pairs (positions outside the map go to the edge tiles)
+        i_ra = np.searchsorted(np.asarray(self.ra_grid)[:-1], ra, side="right") - 1
+        i_ra = np.clip(i_ra, self.min_i_ra, self.max_i_ra)
+
+        i_dec = np.searchsorted(np.asarray(self.dec_grid)[:-1], dec, side="right") - 1
+        i_dec = np.clip(i_dec, self.min_i_dec, self.max_i_dec)
+
+        # Use the index pair to row index grid
+        tiles = self.tile_grid[i_ra - self.min_i_ra, i_dec - self.min_i_dec]
+        if np.any(tiles < 0):
+            k = np.argmax(tiles < 0)
+            raise KeyError((i_ra[k], i_dec[k]))
+        return tiles
 
     def min_ras_decs(self):
         """
@@ -254,6 +284,14 @@ class BinnedDensityMap(DensityMap):
         t = self.tile_for_position(ra, dec)
         return self.tile_data[bin_colname][t]
 
+    def bins_for_positions(self, ra, dec):
+        """
+        Finds which density bins a set of ra,dec positions fit into, and
+        returns their indices.
+        """
+        t = self.tiles_for_positions(ra, dec)
+        return np.asarray(self.tile_data[bin_colname])[t]
+
     def value_foreach_tile(self):
         return self.tile_data[input_column]
 
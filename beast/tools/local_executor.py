@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+
+"""
+Run the batch jobs of a BEAST production on the local machine
+
+The joblist files written by `setup_batch_beast_trim` and
+`setup_batch_beast_fit` split the work in a fixed number of files, each one
+run as a sequence by `at` or a SLURM array.  When one chunk is slower than
+the others, the cores that finished their chunk stay idle.  The executor
+reads the commands of the same joblist files and runs them on a pool of
+worker processes: a worker takes the next command as soon as it is free,
+the most expensive commands first.  The stages run in order (trimming,
+fitting, merging), a stage starts when all the commands of the previous
+stages are done.
+
+The state of the commands (pending, done, failed) is saved in a JSON file
+after each command, a new run with the same state file only runs the
+commands that are not done.
+"""
+import os
+import json
+import time
+import shlex
+import signal
+import argparse
+import subprocess
+
+from beast.tools.run import create_filenames
+
+__all__ = [
+    "STAGES",
+    "Task",
+    "read_joblist",
+    "merge_task",
+    "estimate_cost",
+    "LocalExecutor",
+]
+
+# order of the stages of the commands
+STAGES = ["trim", "fit", "merge"]
+
+# BEAST modules run by the commands of each stage
+_STAGE_MODULES = {
+    "beast.tools.trim_many_via_obsdata": "trim",
+    "beast.tools.run.run_fitting": "fit",
+    "beast.tools.run.merge_files": "merge",
+}
+
+
+class Task(object):
+    """
+    Command to run by the executor
+
+    Attributes
+    ----------
+    command : string
+        shell command, also used as the name of the task in the state file
+    stage : string
+        stage of the command, one of `STAGES`
+    prefix : string
+        commands to run before the command in the same shell (e.g., to
+        activate an environment)
+    cost : float
+        estimate of the run time, the tasks with the highest costs are run
+        first
+    """
+
+    def __init__(self, command, stage, prefix="", cost=None):
+        if stage not in STAGES:
+            raise ValueError("stage must be one of {}".format(STAGES))
+        self.command = command
+        self.stage = stage
+        self.prefix = prefix
+        self.cost = estimate_cost(command) if cost is None else cost
+
+    def script(self):
+        """ Shell script of the task """
+        if self.prefix:
+            return self.prefix + "\n" + self.command
+        return self.command
+
+
+def _command_stage(command):
+    """ Stage of a command, None if it does not run a BEAST stage """
+    for token in shlex.split(command):
+        if token in _STAGE_MODULES:
+            return _STAGE_MODULES[token]
+    return None
+
+
+def read_joblist(joblist_file, stage=None):
+    """
+    Read the commands of a joblist file
+
+    Parameters
+    ----------
+    joblist_file : string
+        file written by `setup_batch_beast_trim` or `setup_batch_beast_fit`
+    stage : string (default=None)
+        stage of all the commands, if None the stage is found from the BEAST
+        module run by the command and the lines that do not run a BEAST
+        stage are prefix lines, run before each command
+
+    Returns
+    -------
+    list of `Task`
+    """
+    with open(joblist_file, "r") as f:
+        lines = [line.strip() for line in f]
+
+    prefix = []
+    commands = []
+    for line in lines:
+        if (not line) or line.startswith("#"):
+            continue
+        cstage = stage if stage is not None else _command_stage(line)
+        if cstage is None:
+            if commands:
+                raise ValueError(
+                    "{}: unknown command after the first job: {}".format(
+                        joblist_file, line
+                    )
+                )
+            prefix.append(line)
+        else:
+            commands.append((line, cstage))
+
+    return [
+        Task(command, cstage, prefix="\n".join(prefix))
+        for command, cstage in commands
+    ]
+
+
+def merge_task(beast_settings_file, use_sd=True, nsubs=1, prefix=""):
+    """
+    Task merging the fitting outputs with `beast.tools.run.merge_files`
+
+    Parameters
+    ----------
+    beast_settings_file : string
+        file name with beast settings
+    use_sd : boolean (default=True)
+        set to True if the fitting used source density bins
+    nsubs : int (default=1)
+        number of subgrids used for the physics model
+    prefix : string (default="")
+        commands to run before the merging in the same shell
+
+    Returns
+    -------
+    `Task`
+    """
+    command = "python -m beast.tools.run.merge_files {0} --use_sd {1} --nsubs {2}"
+    return Task(
+        command.format(beast_settings_file, int(use_sd), nsubs), "merge", prefix
+    )
+
+
+def _file_size(fname):
+    """ Size of a file, 0 if it does not exist """
+    try:
+        return os.path.getsize(fname)
+    except OSError:
+        return 0
+
+
+def _option_values(tokens, option, nvals=1):
+    """ Values following an option in the tokens of a command """
+    if option not in tokens:
+        return None
+    k = tokens.index(option)
+    return tokens[k + 1 : k + 1 + nvals]
+
+
+def estimate_cost(command):
+    """
+    Estimate of the run time of a command from the size of its inputs
+
+    For a fit, the product of the sizes of the photometry catalog and of the
+    trimmed SED grid, for a trimming, the total size of the noise models
+    and catalogs to trim.  The costs are only compared within a stage.
+
+    Parameters
+    ----------
+    command : string
+        command of a joblist file
+
+    Returns
+    -------
+    float
+        cost, 0 if the inputs can not be found
+    """
+    tokens = shlex.split(command)
+    stage = _command_stage(command)
+    try:
+        if stage == "fit":
+            k = tokens.index("beast.tools.run.run_fitting")
+            sd_sub = _option_values(tokens, "--choose_sd_sub", 2)
+            subgrid = _option_values(tokens, "--choose_subgrid")
+            nsubs = _option_values(tokens, "--nsubs")
+            file_dict = create_filenames.create_filenames(
+                tokens[k + 1],
+                use_sd=sd_sub is not None,
+                nsubs=1 if nsubs is None else int(nsubs[0]),
+                choose_sd_sub=sd_sub,
+                choose_subgrid=None if subgrid is None else int(subgrid[0]),
+            )
+            return float(_file_size(file_dict["photometry_files"][0])) * float(
+                _file_size(file_dict["modelsedgrid_trim_files"][0])
+            )
+        if stage == "trim":
+            k = tokens.index("beast.tools.trim_many_via_obsdata")
+            with open(tokens[k + 1], "r") as f:
+                # first two lines: SED grid and filter names
+                lines = f.readlines()[2:]
+            return float(
+                sum(
+                    _file_size(fname)
+                    for line in lines
+                    for fname in line.split()[:2]
+                )
+            )
+    except (OSError, IndexError, ValueError, TypeError, KeyError):
+        pass
+    return 0.0
+
+
+class LocalExecutor(object):
+    """
+    Run tasks on a pool of local worker processes::
+
+        tasks = read_joblist("proj/trim_batch_jobs/BEAST_batch_trim.joblist")
+        for joblist in run_info_dict["files_to_run"]:
+            tasks += read_joblist(joblist)
+        LocalExecutor("proj/local_state.json", nprocs=8).run(tasks)
+
+    The fitting commands run with their own number of processes
+    (`nprocs` of `setup_batch_beast_fit`), use 1 there to have one fit per
+    worker.
+
+    Attributes
+    ----------
+    state_file : string
+        JSON file with the state of the tasks
+    nprocs : int
+        number of worker processes
+    retry_failed : boolean
+        if True, the tasks that failed in a previous run are run again
+    poll_interval : float
+        time in seconds between the checks of the running tasks
+    """
+
+    def __init__(self, state_file, nprocs=1, retry_failed=True, poll_interval=0.1):
+        self.state_file = state_file
+        self.nprocs = nprocs
+        self.retry_failed = retry_failed
+        self.poll_interval = poll_interval
+        self.state = {}
+        if os.path.isfile(state_file):
+            with open(state_file, "r") as f:
+                self.state = json.load(f)
+
+    def save_state(self):
+        """
+        Write the state of the tasks, through a temporary file so that an
+        interrupted write does not lose the previous state
+        """
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp_file, self.state_file)
+
+    def status(self, task):
+        """ Status of a task: 'pending', 'done' or 'failed' """
+        return self.state.get(task.command, {}).get("status", "pending")
+
+    def _set_state(self, task, status, **kwargs):
+        entry = {"stage": task.stage, "status": status}
+        entry.update(kwargs)
+        self.state[task.command] = entry
+        self.save_state()
+
+    def run(self, tasks):
+        """
+        Run the tasks that are not done yet
+
+        Parameters
+        ----------
+        tasks : list of `Task`
+            tasks, the tasks of a stage are run in the order of decreasing
+            costs (then in the order of the list)
+
+        Returns
+        -------
+        dict
+            number of tasks for each status at the end of the run
+        """
+        todo = []
+        for task in tasks:
+            status = self.status(task)
+            if status == "done" or (status == "failed" and not self.retry_failed):
+                continue
+            todo.append(task)
+
+        # next task: lowest stage, then highest cost (stable for equal costs)
+        todo.sort(key=lambda task: (STAGES.index(task.stage), -task.cost))
+
+        running = []
+        try:
+            while todo or running:
+                # the first task waits for the end of the previous stages, the
+                # later stages are not run after a failed task
+                stage = STAGES.index(todo[0].stage) if todo else None
+                failed = [
+                    STAGES.index(task.stage)
+                    for task in tasks
+                    if self.status(task) == "failed"
+                ]
+                while (
+                    todo
+                    and len(running) < self.nprocs
+                    and all(cstage >= stage for cstage in failed)
+                    and all(STAGES.index(task.stage) >= stage for task, _, _ in running)
+                ):
+                    task = todo.pop(0)
+                    proc = subprocess.Popen(
+                        task.script(),
+                        shell=True,
+                        executable="/bin/bash",
+                        start_new_session=True,
+                    )
+                    running.append((task, proc, time.time()))
+
+                if not running:
+                    # later stages blocked by failed tasks
+                    break
+
+                time.sleep(self.poll_interval)
+                for item in list(running):
+                    task, proc, start = item
+                    returncode = proc.poll()
+                    if returncode is None:
+                        continue
+                    running.remove(item)
+                    self._set_state(
+                        task,
+                        "done" if returncode == 0 else "failed",
+                        returncode=returncode,
+                        duration=time.time() - start,
+                    )
+                    if returncode != 0:
+                        print("failed (" + str(returncode) + "): " + task.command)
+        finally:
+            # interrupted: stop the running tasks, they stay pending
+            for task, proc, _ in running:
+                os.killpg(proc.pid, signal.SIGTERM)
+                proc.wait()
+
+        counts = {"done": 0, "failed": 0, "pending": 0}
+        for task in tasks:
+            counts[self.status(task)] += 1
+        return counts
+
+
+if __name__ == "__main__":  # pragma: no cover
+
+    # commandline parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "joblist_files",
+        type=str,
+        nargs="+",
+        help="joblist files from setup_batch_beast_trim/setup_batch_beast_fit",
+    )
+    parser.add_argument(
+        "--nprocs", default=1, type=int, help="number of worker processes",
+    )
+    parser.add_argument(
+        "--state_file",
+        default=None,
+        type=str,
+        help="JSON file with the state of the tasks (default: "
+        + "local_executor_state.json next to the first joblist file)",
+    )
+    parser.add_argument(
+        "--merge_settings_file",
+        default=None,
+        type=str,
+        help="if set, merge the fitting outputs of this beast settings file "
+        + "after the fits",
+    )
+    parser.add_argument(
+        "--use_sd",
+        default=1,
+        type=int,
+        help="set to True (1) if the fitting used source density bins",
+    )
+    parser.add_argument(
+        "--nsubs",
+        default=1,
+        type=int,
+        help="number of subgrids used for the physics model",
+    )
+    parser.add_argument(
+        "--no_retry_failed",
+        action="store_true",
+        help="do not run again the tasks that failed in a previous run",
+    )
+
+    args = parser.parse_args()
+
+    tasks = []
+    for joblist_file in args.joblist_files:
+        tasks += read_joblist(joblist_file)
+    if args.merge_settings_file is not None:
+        prefix = tasks[0].prefix if tasks else ""
+        tasks.append(
+            merge_task(
+                args.merge_settings_file,
+                use_sd=bool(args.use_sd),
+                nsubs=args.nsubs,
+                prefix=prefix,
+            )
+        )
+
+    state_file = args.state_file
+    if state_file is None:
+        state_file = os.path.join(
+            os.path.dirname(os.path.abspath(args.joblist_files[0])),
+            "local_executor_state.json",
+        )
+
+    counts = LocalExecutor(
+        state_file, nprocs=args.nprocs, retry_failed=not args.no_retry_failed
+    ).run(tasks)
+    print(counts)
@@ -4,8 +4,11 @@
 import os
 import stat
 import argparse
+from multiprocessing import Pool, shared_memory
 
+import numpy as np
 from astropy import constants as const
+from astropy.table import Table
 
 # BEAST imports
 from beast.physicsmodel.create_project_dir import create_project_dir
@@ -14,15 +17,22 @@ from beast.physicsmodel.model_grid import (
     make_spectral_grid,
     add_stellar_priors,
     make_extinguished_sed_grid,
+    dust_grid_values,
+    save_dust_grid_info,
 )
 from beast.physicsmodel.grid import SpectralGrid
+from beast.physicsmodel.creategrid import valid_dust_points
+from beast.physicsmodel.dust import extinction
+from beast.observationmodel import phot
 from beast.tools.run.helper_functions import parallel_wrapper
 
 # from beast.physicsmodel.stars.isochrone import ezIsoch
 from beast.tools import beast_settings, subgridding_tools
 
 
-def create_physicsmodel(beast_settings_info, nsubs=1, nprocs=1, subset=[None, None]):
+def create_physicsmodel(
+    beast_settings_info, nsubs=1, nprocs=1, subset=[None, None], shared_specgrid=False
+):
     """
     Create the physics model grid.  If nsubs > 1, this will make sub-grids.
 
@@ -44,6 +54,11 @@ def create_physicsmodel(beast_settings_info, nsubs=1, nprocs=1, subset=[None, No
         Only process subgrids in the range [start,stop].
         (only relevant if nsubs > 1)
 
+    shared_specgrid : boolean (default=False)
+        If True, the subgrids are generated from the spectral grid loaded
+        once in shared memory instead of split spectral grid files
+        (only relevant if nsubs > 1)
+
     """
 
     # process beast settings info
@@ -138,7 +153,26 @@ def create_physicsmodel(beast_settings_info, nsubs=1, nprocs=1, subset=[None, No
     # use subgrids
     # --------------------
 
-    if nsubs > 1:
+    if nsubs > 1 and shared_specgrid:
+        # the workers slice the spectral grid held in shared memory
+        make_shared_subgrids(
+            settings.project,
+            g_pspec,
+            settings.filters,
+            nsubs,
+            nprocs=nprocs,
+            subset=subset,
+            extLaw=settings.extLaw,
+            av=settings.avs,
+            rv=settings.rvs,
+            fA=settings.fAs,
+            rv_prior_model=settings.rv_prior_model,
+            av_prior_model=settings.av_prior_model,
+            fA_prior_model=settings.fA_prior_model,
+            add_spectral_properties_kwargs=extra_kwargs,
+        )
+
+    elif nsubs > 1:
         # Work with the whole grid up to there (otherwise, priors need a
         # rework - they don't like having only a subset of the parameter
         # space, especially when there's only one age for example)
@@ -146,12 +180,10 @@ def create_physicsmodel(beast_settings_info, nsubs=1, nprocs=1, subset=[None, No
         # Make subgrids, by splitting the spectral grid into equal sized pieces
         custom_sub_pspec = subgridding_tools.split_grid(pspec_fname, nsubs)
 
-        file_prefix = "{0}/{0}_".format(settings.project)
-
         # function to process the subgrids individually
         def gen_subgrid(i, sub_name):
             sub_g_pspec = SpectralGrid(sub_name)
-            sub_seds_fname = "{}seds.gridsub{}.hd5".format(file_prefix, i)
+            sub_seds_fname = subgrid_fname(settings.project, i)
 
             # generate the SED grid by integrating the filter response functions
             #   effect of dust extinction applied before filter integration
@@ -180,10 +212,9 @@ def create_physicsmodel(beast_settings_info, nsubs=1, nprocs=1, subset=[None, No
 
         parallel_wrapper(gen_subgrid, par_tuples, nprocs=nprocs)
 
+    if nsubs > 1:
         # Save a list of subgrid names that we expect to see
-        required_names = [
-            "{}seds.gridsub{}.hd5".format(file_prefix, i) for i in range(nsubs)
-        ]
+        required_names = [subgrid_fname(settings.project, i) for i in range(nsubs)]
 
         outdir = os.path.join(".", settings.project)
         subgrid_names_file = os.path.join(outdir, "subgrid_fnames.txt")
@@ -193,6 +224,199 @@ def create_physicsmodel(beast_settings_info, nsubs=1, nprocs=1, subset=[None, No
                 fname_file.write(fname + "\n")
 
 
+def subgrid_fname(project, i):
+    """
+    Name of the file of a SED subgrid
+
+    Parameters
+    ----------
+    project : string
+        project name
+
+    i : int
+        index of the subgrid
+
+    Returns
+    -------
+    string
+        the file name of the subgrid
+    """
+    return "{0}/{0}_seds.gridsub{1}.hd5".format(project, i)
+
+
+# spectral grid held in shared memory and seen by the subgrid workers
+_shared_specgrid = {}
+
+
+def _init_shared_specgrid(shm_name, shape, dtype, lamb, grid, curve_cache, photops):
+    """
+    Attach a worker to the spectral grid in shared memory and reuse the
+    extinction curves and photometric operators computed by the parent
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _shared_specgrid["shm"] = shm
+    _shared_specgrid["seds"] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _shared_specgrid["lamb"] = lamb
+    _shared_specgrid["grid"] = grid
+    extinction.curve_cache = curve_cache
+    phot._photometric_operators.update(photops)
+
+
+def _gen_shared_subgrid(project, i, slc, filters, sed_grid_kwargs):
+    """
+    Generate one SED subgrid from a slice of the shared spectral grid
+    """
+    sub_g_pspec = SpectralGrid(
+        _shared_specgrid["lamb"],
+        seds=_shared_specgrid["seds"][slc],
+        grid=Table(_shared_specgrid["grid"][slc]),
+        backend="memory",
+    )
+    (sub_seds_fname, sub_g_seds) = make_extinguished_sed_grid(
+        project,
+        sub_g_pspec,
+        filters,
+        seds_fname=subgrid_fname(project, i),
+        save_info=False,
+        **sed_grid_kwargs,
+    )
+    return sub_seds_fname
+
+
+def make_shared_subgrids(
+    project,
+    specgrid,
+    filters,
+    nsubs,
+    nprocs=1,
+    subset=[None, None],
+    av=[0.0, 5, 0.1],
+    rv=[0.0, 5, 0.2],
+    fA=None,
+    av_prior_model={"name": "flat"},
+    rv_prior_model={"name": "flat"},
+    fA_prior_model={"name": "flat"},
+    extLaw=None,
+    filterLib=None,
+    info_fname=None,
+    **kwargs,
+):
+    """
+    Generate the SED subgrids from one spectral grid held in shared memory.
+
+    The spectral grid is split in the same slices as
+    `subgridding_tools.split_grid` but no split spectral grid files are
+    written.  The extinction curves of the dust grid and the photometric
+    operator are computed once by the parent process and reused by the
+    workers, that write their SED subgrid directly.
+
+    Parameters
+    ----------
+    project : string
+        project name
+
+    specgrid : SpectralGrid object
+        spectral grid with the stellar priors
+
+    filters : list of strings
+        names of the filters
+
+    nsubs : int
+        number of subgrids to split the physics model into
+
+    nprocs : int (default=1)
+        Number of parallel processes to use
+
+    subset : list of two ints (default=[None,None])
+        Only process subgrids in the range [start,stop].
+
+    av, rv, fA, av_prior_model, rv_prior_model, fA_prior_model, extLaw,
+    filterLib, info_fname, **kwargs
+        see `make_extinguished_sed_grid`
+
+    Returns
+    -------
+    list of strings
+        the names of the generated subgrid files
+    """
+    sed_grid_kwargs = dict(
+        av=av,
+        rv=rv,
+        fA=fA,
+        av_prior_model=av_prior_model,
+        rv_prior_model=rv_prior_model,
+        fA_prior_model=fA_prior_model,
+        extLaw=extLaw,
+        filterLib=filterLib,
+        **kwargs,
+    )
+
+    seds = specgrid.seds[:]
+    lamb = np.array(specgrid.lamb[:])
+    grid = Table(specgrid.grid)
+
+    # extinction curves for each (Rv, fA) point of the dust grid and the
+    #   photometric operator, computed once
+    avs, rvs, fAs = dust_grid_values(av, rv, fA)
+    curve_law = extLaw or extinction.Cardelli()
+    if fA is None:
+        for Rv in rvs:
+            extinction.curve_cache(curve_law, lamb, Rv=float(Rv))
+    else:
+        for Av, Rv, f_A in valid_dust_points(avs[:1], rvs, fAs):
+            extinction.curve_cache(curve_law, lamb, Rv=Rv, f_A=f_A)
+    photop = phot.get_photometric_operator(filters, lamb, filterLib=filterLib)
+    photops = {
+        key: op for key, op in phot._photometric_operators.items() if op is photop
+    }
+
+    slices = subgridding_tools.uniform_slices(len(grid), nsubs)
+    par_tuples = [
+        (project, i, slc, filters, sed_grid_kwargs) for i, slc in enumerate(slices)
+    ][slice(subset[0], subset[1])]
+
+    # spectra copied once in shared memory
+    shm = shared_memory.SharedMemory(create=True, size=max(seds.nbytes, 1))
+    try:
+        np.ndarray(seds.shape, dtype=seds.dtype, buffer=shm.buf)[:] = seds
+        initargs = (
+            shm.name,
+            seds.shape,
+            seds.dtype,
+            lamb,
+            grid,
+            extinction.curve_cache,
+            photops,
+        )
+        del seds
+        if nprocs > 1:
+            with Pool(
+                nprocs, initializer=_init_shared_specgrid, initargs=initargs
+            ) as p:
+                sub_fnames = p.starmap(_gen_shared_subgrid, par_tuples)
+        else:
+            _init_shared_specgrid(*initargs)
+            sub_fnames = [_gen_shared_subgrid(*args) for args in par_tuples]
+    finally:
+        _shared_specgrid.clear()
+        shm.close()
+        shm.unlink()
+
+    # dust grid saved once
+    save_dust_grid_info(
+        project,
+        av,
+        rv,
+        fA,
+        av_prior_model=av_prior_model,
+        rv_prior_model=rv_prior_model,
+        fA_prior_model=fA_prior_model,
+        info_fname=info_fname,
+    )
+
+    return sub_fnames
+
+
 def split_create_physicsmodel(beast_settings_info, nsubs=1, nprocs=1):
     """
     Making the physics model grid takes a while for production runs.  This
@@ -290,6 +514,12 @@ if __name__ == "__main__":  # pragma: no cover
         help="""Only process subgrids in the range
                         [start, stop].""",
     )
+    parser.add_argument(
+        "--shared_specgrid",
+        action="store_true",
+        help="""Generate the subgrids from the spectral grid
+                        in shared memory (no split spectral grid files)""",
+    )
 
     args = parser.parse_args()
 
@@ -298,4 +528,5 @@ if __name__ == "__main__":  # pragma: no cover
         nsubs=args.nsubs,
         nprocs=args.nprocs,
         subset=args.subset,
+        shared_specgrid=args.shared_specgrid,
     )
@@ -24,6 +24,11 @@ def run_fitting(
     pdf2d_param_list=None,
     pdf_max_nbins=200,
     resume=False,
+    pdf2d_sparse=False,
+    pdf2d_threshold=0.0,
+    profile=False,
+    background_io=False,
+    grid_search="full",
 ):
     """
     Run the fitting.  If nsubs > 1, this will find existing subgrids.
@@ -69,6 +74,26 @@ def run_fitting(
     resume : boolean (default=False)
         choose whether to resume existing run or start over
 
+    pdf2d_sparse : boolean (default=False)
+        save the 2D PDFs in the sparse format (only the non-zero bins)
+
+    pdf2d_threshold : float (default=0.0)
+        for the sparse format, bins with values <= pdf2d_threshold times the
+        peak of the PDF of each star are not saved
+
+    profile : boolean (default=False)
+        save the time and memory spent in each stage of the fitting as a
+        JSON report next to each stats file (*_stats_profile.json)
+
+    background_io : boolean (default=False)
+        save the fitting outputs in a background thread while the fitting
+        of the next stars continues
+
+    grid_search : string (default="full")
+        "full" to compute the likelihoods of all the models or
+        "hierarchical" for a coarse-to-fine search of the models above the
+        likelihood threshold (same results, noise model without covariances)
+
     """
 
     # process beast settings info
@@ -179,6 +204,11 @@ def run_fitting(
                 lnp_files[i],
                 None,
                 resume,
+                pdf2d_sparse,
+                pdf2d_threshold,
+                profile,
+                background_io,
+                grid_search,
             )
             for i in range(n_files)
         ]
@@ -199,6 +229,11 @@ def run_fitting(
                 lnp_files[i],
                 gridpickle_files[i],
                 resume,
+                pdf2d_sparse,
+                pdf2d_threshold,
+                profile,
+                background_io,
+                grid_search,
             )
             for i in range(n_files)
         ]
@@ -225,6 +260,11 @@ def fit_submodel(
     lnp_file,
     grid_info_file=None,
     resume=False,
+    pdf2d_sparse=False,
+    pdf2d_threshold=0.0,
+    profile=False,
+    background_io=False,
+    grid_search="full",
 ):
     """
     Code to run the SED fitting
@@ -268,6 +308,24 @@ def fit_submodel(
     resume : boolean (default=False)
         choose whether to resume existing run or start over
 
+    pdf2d_sparse : boolean (default=False)
+        save the 2D PDFs in the sparse format (only the non-zero bins)
+
+    pdf2d_threshold : float (default=0.0)
+        for the sparse format, bins with values <= pdf2d_threshold times the
+        peak of the PDF of each star are not saved
+
+    profile : boolean (default=False)
+        save the time and memory spent in each stage of the fitting as a
+        JSON report next to the stats file
+
+    background_io : boolean (default=False)
+        save the fitting outputs in a background thread while the fitting
+        of the next stars continues
+
+    grid_search : string (default="full")
+        "full" or "hierarchical" search of the models above the likelihood
+        threshold
 
     Returns
     -------
@@ -308,10 +366,15 @@ def fit_submodel(
             pdf1d_outname=pdf_file,
             pdf2d_outname=pdf2d_file,
             pdf2d_param_list=pdf2d_param_list,
+            pdf2d_sparse=pdf2d_sparse,
+            pdf2d_threshold=pdf2d_threshold,
             grid_info_dict=grid_info_dict,
             lnp_outname=lnp_file,
             do_not_normalize=True,
             surveyname=settings.surveyname,
+            profile=profile,
+            background_io=background_io,
+            grid_search=grid_search,
         )
         print("Done fitting on grid " + modelsedgrid_file)
 
@@ -330,8 +393,13 @@ def fit_submodel(
             pdf1d_outname=pdf_file,
             pdf2d_outname=pdf2d_file,
             pdf2d_param_list=pdf2d_param_list,
+            pdf2d_sparse=pdf2d_sparse,
+            pdf2d_threshold=pdf2d_threshold,
             lnp_outname=lnp_file,
             surveyname=settings.surveyname,
+            profile=profile,
+            background_io=background_io,
+            grid_search=grid_search,
         )
         print("Done fitting on grid " + modelsedgrid_file)
 
@@ -389,6 +457,35 @@ if __name__ == "__main__":  # pragma: no cover
     parser.add_argument(
         "-r", "--resume", help="resume a fitting run", action="store_true"
     )
+    parser.add_argument(
+        "--pdf2d_sparse",
+        help="save the 2D PDFs in the sparse format",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--pdf2d_threshold",
+        type=float,
+        default=0.0,
+        help="with --pdf2d_sparse, bins with values <= this fraction of the "
+        + "peak of each 2D PDF are not saved",
+    )
+    parser.add_argument(
+        "--profile",
+        help="save a JSON report of the time and memory spent in each stage",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--background_io",
+        help="save the outputs in a background thread during the fitting",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--grid_search",
+        choices=["full", "hierarchical"],
+        default="full",
+        help="compute the likelihoods of all the models or only of those above "
+        + "the threshold with a coarse-to-fine search",
+    )
 
     args = parser.parse_args()
 
@@ -405,4 +502,9 @@ if __name__ == "__main__":  # pragma: no cover
         pdf2d_param_list=args.pdf2d_param_list,
         pdf_max_nbins=args.pdf_max_nbins,
         resume=args.resume,
+        pdf2d_sparse=args.pdf2d_sparse,
+        pdf2d_threshold=args.pdf2d_threshold,
+        profile=args.profile,
+        background_io=args.background_io,
+        grid_search=args.grid_search,
     )
@@ -1,14 +1,142 @@
+from contextlib import nullcontext
+
 import numpy as np
 import argparse
 import asdf
+import h5py
 
 from beast.physicsmodel.grid import SEDGrid
 import beast.observationmodel.noisemodel.generic_noisemodel as noisemodel
-from beast.observationmodel.observations import gen_SimObs_from_sedgrid
+from beast.observationmodel.observations import iter_SimObs_from_sedgrid
 
+from astropy.io import fits
 from astropy.table import vstack
 
 
+def _write_table_chunks(chunks, output_catalog):
+    """
+    Write tables given in chunks to a single FITS or HDF5 table, writing each
+    chunk when it is produced instead of stacking them in memory.
+
+    Parameters
+    ----------
+    chunks : iterable of astropy Tables
+        tables with the same (numerical) columns
+
+    output_catalog : string
+        name of the output file, FITS (.fits, .fit) or HDF5 (.hdf5, .hd5, .h5)
+        other formats are written after stacking the chunks
+
+    Returns
+    -------
+    nrows : int
+        number of rows written
+    """
+    ext = output_catalog.split(".")[-1].lower()
+    nrows = 0
+    header = None
+    dset = None
+
+    if ext in ["fits", "fit"]:
+        with open(output_catalog, "wb") as f:
+            f.write(fits.PrimaryHDU().header.tostring().encode("ascii"))
+            for chunk in chunks:
+                data = chunk.as_array()
+                if header is None:
+                    for cname in data.dtype.names:
+                        if data.dtype[cname].kind not in "iuf":
+                            raise ValueError(f"column {cname} is not numerical")
+                    header = fits.BinTableHDU(chunk[:0]).header
+                    disk_dtype = data.dtype.newbyteorder(">")
+                    header_pos = f.tell()
+                    f.write(header.tostring().encode("ascii"))
+                f.write(data.astype(disk_dtype).tobytes())
+                nrows += len(data)
+            if header is None:
+                raise ValueError("no table to write")
+            # pad the data and update the number of rows in the table header
+            f.write(b"\0" * (-f.tell() % 2880))
+            header["NAXIS2"] = nrows
+            f.seek(header_pos)
+            f.write(header.tostring().encode("ascii"))
+    elif ext in ["hdf5", "hd5", "h5"]:
+        with h5py.File(output_catalog, "w") as f:
+            for chunk in chunks:
+                data = chunk.as_array()
+                if dset is None:
+                    dset = f.create_dataset(
+                        "__astropy_table__",
+                        shape=(0,),
+                        maxshape=(None,),
+                        dtype=data.dtype,
+                        chunks=True,
+                    )
+                dset.resize((nrows + len(data),))
+                dset[nrows:] = data
+                nrows += len(data)
+    else:
+        table = vstack(list(chunks))
+        table.write(output_catalog, overwrite=True)
+        nrows = len(table)
+
+    return nrows
+
+
+def _simulated_tables(
+    physgrid_list, noise_model_list, beastinfo_list=None, chunksize=None, **kwargs
+):
+    """
+    Simulated observations for each physics model + noise model
+
+    Without chunksize, each physics model grid and noise model is read in
+    memory and gives one table.  Otherwise, they are read from disk and give
+    tables of chunksize stars.
+
+    Parameters
+    ----------
+    physgrid_list, noise_model_list, beastinfo_list, chunksize :
+        see :func:`simulate_obs`
+
+    **kwargs :
+        passed to :func:`iter_SimObs_from_sedgrid`
+
+    Returns
+    -------
+    simtables : generator of astropy Tables
+        simulated observations
+    """
+    for k, physgrid in enumerate(np.atleast_1d(physgrid_list)):
+        noise_model = str(np.atleast_1d(noise_model_list)[k])
+
+        if beastinfo_list is not None:
+            with asdf.open(np.atleast_1d(beastinfo_list)[k]) as af:
+                binfo = af.tree
+                age_prior_model = binfo["age_prior_model"]
+                mass_prior_model = binfo["mass_prior_model"]
+        else:
+            age_prior_model = None
+            mass_prior_model = None
+
+        # get the physics model grid - includes priors
+        # and the noise model - includes bias, unc, and completeness
+        if chunksize is None:
+            modelsedgrid = SEDGrid(str(physgrid))
+            noisegrid = nullcontext(noisemodel.get_noisemodelcat(noise_model))
+        else:
+            modelsedgrid = SEDGrid(str(physgrid), backend="disk")
+            noisegrid = h5py.File(noise_model, "r")
+
+        with noisegrid as cnoisegrid:
+            yield from iter_SimObs_from_sedgrid(
+                modelsedgrid,
+                cnoisegrid,
+                age_prior_model=age_prior_model,
+                mass_prior_model=mass_prior_model,
+                chunksize=chunksize,
+                **kwargs,
+            )
+
+
 def simulate_obs(
     physgrid_list,
     noise_model_list,
@@ -20,6 +148,7 @@ def simulate_obs(
     magcut=None,
     weight_to_use="weight",
     ranseed=None,
+    chunksize=None,
 ):
     """
     Simulate photometry based on a physicsmodel grid(s) and observation model(s).
@@ -69,6 +198,11 @@ def simulate_obs(
 
     ranseed : int
         seed for random number generator
+
+    chunksize : int (default=None)
+        set to simulate and write the observations in chunks of chunksize
+        stars, for FITS and HDF5 outputs this avoids having all the
+        simulated observations in memory
     """
     # numbers of samples to do
     # (ensure there are enough for even sampling of multiple model grids)
@@ -85,47 +219,28 @@ def simulate_obs(
     if ranseed is not None:
         ranseed = int(ranseed)
 
-    # list to hold all simulation tables
-    simtable_list = []
-
-    # make a table for each physics model + noise model
-    for k, physgrid in enumerate(np.atleast_1d(physgrid_list)):
-        noise_model = np.atleast_1d(noise_model_list)[k]
+    if chunksize is not None:
+        chunksize = int(chunksize)
 
-        # get the physics model grid - includes priors
-        modelsedgrid = SEDGrid(str(physgrid))
-
-        # read in the noise model - includes bias, unc, and completeness
-        noisegrid = noisemodel.get_noisemodelcat(str(noise_model))
-
-        if beastinfo_list is not None:
-            with asdf.open(np.atleast_1d(beastinfo_list)[k]) as af:
-                binfo = af.tree
-                age_prior_model = binfo["age_prior_model"]
-                mass_prior_model = binfo["mass_prior_model"]
-        else:
-            age_prior_model = None
-            mass_prior_model = None
-
-        # generate the table
-        simtable = gen_SimObs_from_sedgrid(
-            modelsedgrid,
-            noisegrid,
-            age_prior_model=age_prior_model,
-            mass_prior_model=mass_prior_model,
-            nsim=samples_per_grid,
-            compl_filter=compl_filter,
-            complcut=complcut,
-            magcut=magcut,
-            weight_to_use=weight_to_use,
-            ranseed=ranseed,
-        )
-
-        # append to the list
-        simtable_list.append(simtable)
+    simtables = _simulated_tables(
+        physgrid_list,
+        noise_model_list,
+        beastinfo_list=beastinfo_list,
+        chunksize=chunksize,
+        nsim=samples_per_grid,
+        compl_filter=compl_filter,
+        complcut=complcut,
+        magcut=magcut,
+        weight_to_use=weight_to_use,
+        ranseed=ranseed,
+    )
 
-    # stack all the tables into one and write it out
-    vstack(simtable_list).write(output_catalog, overwrite=True)
+    if chunksize is None:
+        # stack all the tables into one and write it out
+        vstack(list(simtables)).write(output_catalog, overwrite=True)
+    else:
+        # stream the chunks to the output
+        _write_table_chunks(simtables, output_catalog)
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -193,12 +308,18 @@ if __name__ == "__main__":  # pragma: no cover
         type=int,
         help="seed for random number generator"
     )
+    parser.add_argument(
+        "--chunksize",
+        default=None,
+        type=int,
+        help="simulate and write the observations in chunks of this size",
+    )
     args = parser.parse_args()
 
     # run observation simulator
     simulate_obs(
         args.physgrid_list,
-        args.noise_model_lists,
+        args.noise_model_list,
         args.output_catalog,
         beastinfo_list=args.beastinfo_list,
         nsim=args.nsim,
@@ -207,4 +328,5 @@ if __name__ == "__main__":  # pragma: no cover
         magcut=args.magcut,
         weight_to_use=args.weight_to_use,
         ranseed=args.ranseed,
+        chunksize=args.chunksize,
     )
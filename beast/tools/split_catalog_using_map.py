@@ -150,9 +150,7 @@ def split_catalog_using_map(
     ras = cat[ra_colname]
     decs = cat[dec_colname]
 
-    bin_foreach_source = np.zeros(len(cat), dtype=int)
-    for i in range(len(cat)):
-        bin_foreach_source[i] = binned_density_map.bin_for_position(ras[i], decs[i])
+    bin_foreach_source = binned_density_map.bins_for_positions(ras, decs)
 
     binnrs = np.unique(bin_foreach_source)
 
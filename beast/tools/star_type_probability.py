@@ -1,9 +1,12 @@
 import numpy as np
 from collections import defaultdict
+from scipy import sparse
 
 from astropy.table import Table
 from astropy.io import fits
 
+from beast.fitting.pdf2d import read_pdf2d
+
 
 def star_type_probability(
     pdf1d_files,
@@ -24,7 +27,9 @@ def star_type_probability(
 
     Note that if more functions for different stellar types are added (please
     add more!), `params_to_save` needs to be updated.  This variable ensures
-    that only the necessary parameters are stored in memory.
+    that only the necessary parameters are stored in memory.  As the PDFs of
+    all the stars are needed, the files are read by parameter rather than star
+    by star with `~beast.fitting.results.BeastResults`.
 
     Parameters
     ----------
@@ -81,19 +86,21 @@ def star_type_probability(
                     pdf1d_data[ext.name].append(ext.data[:-1, :])
                     pdf1d_bins[ext.name].append(ext.data[-1, :])
 
-        # 2D PDF data
+        # 2D PDF data (dense or sparse files)
+        #   kept as sparse matrices with shape (n_stars, nbin1 * nbin2)
         with fits.open(str(pdf2d_file)) as hdu:
-            for ext in hdu:
-                # skip extensions without '+'
-                if "+" not in ext.name:
-                    continue
-
-                # break up the name into the two parameters
-                p1, p2 = ext.name.split("+")
-                # only save the data if both parameters are in params_to_save
-                if (p1 in params_to_save) and (p2 in params_to_save):
-                    pdf2d_data[ext.name].append(ext.data[:-2, :, :])
-                    pdf2d_bins[ext.name].append(ext.data[-2:, :, :])
+            ext_names = [ext.name for ext in hdu]
+        qname_pairs = [
+            name
+            for name in ext_names
+            if ("+" in name) and all(p in params_to_save for p in name.split("+"))
+        ]
+        file_data, file_bins = read_pdf2d(
+            str(pdf2d_file), qname_pairs=qname_pairs, as_sparse=True
+        )
+        for name in file_data:
+            pdf2d_data[name].append(file_data[name])
+            pdf2d_bins[name].append(file_bins[name])
 
     # combine arrays from each file
 
@@ -123,7 +130,7 @@ def star_type_probability(
         # if so, just save the first one
         pdf2d_bins[key] = pdf2d_bins[key][0]
         # concatenate the PDFs
-        pdf2d_data[key] = np.concatenate(pdf2d_data[key])
+        pdf2d_data[key] = sparse.vstack(pdf2d_data[key], format="csr")
 
     # evaluate probabilities of things
     star_prob = {}
@@ -167,6 +174,7 @@ def ext_O_star(pdf2d_data, pdf2d_bins, min_M_ini=10, min_Av=0.5, max_Av=99):
     ----------
     pdf2d_data : dict
         2D PDF data, each key has an array with shape (n_stars, nbin1, nbin2)
+        or a sparse matrix with shape (n_stars, nbin1 * nbin2)
 
     pdf2d_bins : dict
         dictionary with corresponding bin values
@@ -201,7 +209,8 @@ def ext_O_star(pdf2d_data, pdf2d_bins, min_M_ini=10, min_Av=0.5, max_Av=99):
         return [np.nan] * tot_stars
 
     # reshape the arrays
-    prob_data = prob_data.reshape(prob_data.shape[0], -1)
+    if not sparse.issparse(prob_data):
+        prob_data = prob_data.reshape(prob_data.shape[0], -1)
     av_bins = av_bins.reshape(-1)
     mass_bins = mass_bins.reshape(-1)
 
@@ -209,7 +218,7 @@ def ext_O_star(pdf2d_data, pdf2d_bins, min_M_ini=10, min_Av=0.5, max_Av=99):
         (mass_bins >= min_M_ini) & (av_bins >= min_Av) & (av_bins <= max_Av)
     )[0]
 
-    return np.sum(prob_data[:, keep], axis=1)
+    return np.asarray(prob_data[:, keep].sum(axis=1)).ravel()
 
 
 def dusty_agb(pdf2d_data, pdf2d_bins, min_Av=7, min_logT=3.7, max_logT=4.2):
@@ -223,6 +232,7 @@ def dusty_agb(pdf2d_data, pdf2d_bins, min_Av=7, min_logT=3.7, max_logT=4.2):
     ----------
     pdf2d_data : dict
         2D PDF data, each key has an array with shape (n_stars, nbin1, nbin2)
+        or a sparse matrix with shape (n_stars, nbin1 * nbin2)
 
     pdf2d_bins : dict
         dictionary with corresponding bin values
@@ -255,7 +265,8 @@ def dusty_agb(pdf2d_data, pdf2d_bins, min_Av=7, min_logT=3.7, max_logT=4.2):
         return [np.nan] * tot_stars
 
     # reshape the arrays
-    prob_data = prob_data.reshape(prob_data.shape[0], -1)
+    if not sparse.issparse(prob_data):
+        prob_data = prob_data.reshape(prob_data.shape[0], -1)
     av_bins = av_bins.reshape(-1)
     logT_bins = logT_bins.reshape(-1)
 
@@ -263,4 +274,4 @@ def dusty_agb(pdf2d_data, pdf2d_bins, min_Av=7, min_logT=3.7, max_logT=4.2):
         (av_bins >= min_Av) & (logT_bins >= min_logT) & (logT_bins <= max_logT)
     )[0]
 
-    return np.sum(prob_data[:, keep], axis=1)
+    return np.asarray(prob_data[:, keep].sum(axis=1)).ravel()
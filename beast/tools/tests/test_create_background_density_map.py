@@ -0,0 +1,59 @@
+import numpy as np
+from photutils import aperture
+from shapely import geometry
+
+from beast.tools.create_background_density_map import (
+    annulus_sums,
+    indices_for_pixel,
+    mask_circles,
+    pixel_coverage,
+    pixel_indices,
+)
+
+
+def test_pixel_indices():
+    rng = np.random.default_rng(3)
+    pix_x = rng.uniform(-1.0, 6.0, 500)
+    pix_y = rng.uniform(-1.0, 4.0, 500)
+    pix_x[:3] = [0.0, 1.0, 5.0]
+    i_x, i_y, in_map = pixel_indices(pix_x, pix_y, 5, 3)
+    for x in range(5):
+        for y in range(3):
+            (indxs,) = np.nonzero(in_map & (i_x == x) & (i_y == y))
+            np.testing.assert_array_equal(indxs, indices_for_pixel(pix_x, pix_y, x, y))
+
+
+def test_pixel_coverage():
+    boundary = geometry.Polygon([(0.3, 0.2), (7.5, 1.1), (6.2, 5.7), (1.4, 4.9)])
+    frac_area = pixel_coverage(boundary, 8, 6)
+    for i in range(8):
+        for j in range(6):
+            np.testing.assert_allclose(
+                frac_area[i, j],
+                boundary.intersection(geometry.box(i, j, i + 1, j + 1)).area,
+                atol=1e-12,
+            )
+
+
+def test_mask_circles_and_annulus_sums():
+    rng = np.random.default_rng(8)
+    shape = (60, 80)
+    positions = np.column_stack(
+        [rng.uniform(-5.0, 85.0, 40), rng.uniform(-5.0, 65.0, 40)]
+    )
+
+    # same pixels as the union of the exact photutils masks
+    mask = mask_circles(shape, positions[:, 0], positions[:, 1], 4.3)
+    ref_mask = np.zeros(shape)
+    for ap_mask in aperture.CircularAperture(positions, 4.3).to_mask():
+        image = ap_mask.to_image(shape)
+        if image is not None:
+            ref_mask += image
+    np.testing.assert_array_equal(mask, ref_mask > 0)
+
+    # tiled photometry gives the photometry on the full image
+    data = rng.normal(size=shape)
+    annuli = aperture.CircularAnnulus(positions, r_in=4.3, r_out=7.0)
+    ref_sums = aperture.aperture_photometry(data, annuli)["aperture_sum"]
+    sums = annulus_sums(data, positions, 4.3, 7.0, tile_size=16)
+    np.testing.assert_allclose(sums, ref_sums, atol=1e-12)
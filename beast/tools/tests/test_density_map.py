@@ -0,0 +1,43 @@
+import numpy as np
+from astropy.table import Table
+
+from beast.tools.density_map import BinnedDensityMap
+
+
+def test_bins_for_positions():
+    # 4 x 3 map with an uneven number of RA and DEC tiles
+    ra_grid = np.linspace(10.0, 11.0, 5)
+    dec_grid = np.linspace(40.0, 40.6, 4)
+    i_ra, i_dec = [a.ravel() for a in np.meshgrid(range(4), range(3), indexing="ij")]
+    tile_data = Table(
+        {
+            "i_ra": i_ra,
+            "i_dec": i_dec,
+            "value": np.arange(len(i_ra), dtype=float),
+            "min_ra": ra_grid[i_ra],
+            "max_ra": ra_grid[i_ra + 1],
+            "min_dec": dec_grid[i_dec],
+            "max_dec": dec_grid[i_dec + 1],
+        }
+    )
+    tile_data.meta["ra_grid"] = ra_grid
+    tile_data.meta["dec_grid"] = dec_grid
+    bdm = BinnedDensityMap.create(tile_data, N_bins=3)
+
+    rng = np.random.default_rng(5)
+    ras = rng.uniform(9.9, 11.1, 200)
+    decs = rng.uniform(39.9, 40.7, 200)
+    tiles = bdm.tiles_for_positions(ras, decs)
+
+    # positions inside the map are in the tile that contains them
+    inside = (ras > 10.0) & (ras < 11.0) & (decs > 40.0) & (decs < 40.6)
+    assert np.all(ras[inside] >= tile_data["min_ra"][tiles[inside]])
+    assert np.all(ras[inside] < tile_data["max_ra"][tiles[inside]])
+    assert np.all(decs[inside] >= tile_data["min_dec"][tiles[inside]])
+    assert np.all(decs[inside] < tile_data["max_dec"][tiles[inside]])
+
+    # consistent with the single position versions
+    bins = bdm.bins_for_positions(ras, decs)
+    for k in range(0, 200, 17):
+        assert bdm.tile_for_position(ras[k], decs[k]) == tiles[k]
+        assert bdm.bin_for_position(ras[k], decs[k]) == bins[k]
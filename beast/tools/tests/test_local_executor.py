@@ -0,0 +1,77 @@
+import sys
+import json
+
+from beast.tools.local_executor import read_joblist, LocalExecutor, Task
+
+
+def _write_joblist(fname, lines):
+    with open(fname, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _append_command(fname, text, returncode=0):
+    code = "open({0!r}, 'a').write({1!r}); raise SystemExit({2})".format(
+        fname, text + "\n", returncode
+    )
+    return '"{0}" -c "{1}"'.format(sys.executable, code)
+
+
+def test_local_executor(tmpdir):
+    out_file = str(tmpdir.join("out.txt"))
+    state_file = str(tmpdir.join("state.json"))
+
+    # joblist with a prefix line
+    joblist_file = str(tmpdir.join("fit.joblist"))
+    _write_joblist(
+        joblist_file,
+        ["export BEAST_TEST=1"]
+        + [
+            _append_command(out_file, "fit{}".format(k))
+            + " --choose_subgrid {} beast.tools.run.run_fitting".format(k)
+            for k in range(4)
+        ],
+    )
+    tasks = read_joblist(joblist_file)
+    assert [task.stage for task in tasks] == ["fit"] * 4
+    assert tasks[0].prefix == "export BEAST_TEST=1"
+
+    # the most expensive tasks first, the merging after all the fits
+    for k, task in enumerate(tasks):
+        task.cost = k
+    tasks.append(Task(_append_command(out_file, "merge"), "merge", cost=0))
+
+    counts = LocalExecutor(state_file, nprocs=1, poll_interval=0.01).run(tasks)
+    assert counts == {"done": 5, "failed": 0, "pending": 0}
+    with open(out_file) as f:
+        assert f.read().split() == ["fit3", "fit2", "fit1", "fit0", "merge"]
+
+    # resumed run: nothing to do
+    counts = LocalExecutor(state_file, nprocs=2, poll_interval=0.01).run(tasks)
+    assert counts["done"] == 5
+    with open(out_file) as f:
+        assert len(f.read().split()) == 5
+    with open(state_file) as f:
+        state = json.load(f)
+    assert all(entry["status"] == "done" for entry in state.values())
+
+
+def test_local_executor_failed(tmpdir):
+    out_file = str(tmpdir.join("out.txt"))
+    state_file = str(tmpdir.join("state.json"))
+    tasks = [
+        Task(_append_command(out_file, "trim0"), "trim", cost=0),
+        Task(_append_command(out_file, "trim1", returncode=1), "trim", cost=0),
+        Task(_append_command(out_file, "fit"), "fit", cost=0),
+    ]
+
+    # the fit waits for the trimming, that failed
+    counts = LocalExecutor(state_file, nprocs=2, poll_interval=0.01).run(tasks)
+    assert counts == {"done": 1, "failed": 1, "pending": 1}
+    with open(out_file) as f:
+        assert "fit" not in f.read().split()
+
+    # no retry of the failed task, the fit is still blocked
+    executor = LocalExecutor(
+        state_file, nprocs=2, retry_failed=False, poll_interval=0.01
+    )
+    assert executor.run(tasks) == {"done": 1, "failed": 1, "pending": 1}
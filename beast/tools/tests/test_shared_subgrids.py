@@ -0,0 +1,142 @@
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+import tables
+from astropy.table import Table
+
+from beast.physicsmodel.grid import SpectralGrid, SEDGrid
+from beast.physicsmodel.model_grid import make_extinguished_sed_grid
+from beast.physicsmodel.dust import extinction
+from beast.observationmodel import phot
+from beast.benchmarks.synthetic import make_filter_library
+from beast.tools import subgridding_tools
+from beast.tools.run.create_physicsmodel import (
+    _init_shared_specgrid,
+    make_shared_subgrids,
+    subgrid_fname,
+)
+
+
+def test_shared_subgrids(tmp_path, monkeypatch):
+    """
+    Subgrids from the shared spectral grid are the same as the ones from
+    the split spectral grid files
+    """
+    monkeypatch.chdir(tmp_path)
+    project = "proj"
+    (tmp_path / project).mkdir()
+
+    # small filter library
+    lamb = np.linspace(2000.0, 20000.0, 300)
+    filters = ["F1", "F2", "F3"]
+    filterLib = str(tmp_path / "filters.hd5")
+    with tables.open_file(filterLib, "w") as ffile:
+        group = ffile.create_group("/", "filters")
+        for k, cname in enumerate(filters):
+            desc = {
+                "WAVELENGTH": tables.Float64Col(pos=0),
+                "THROUGHPUT": tables.Float64Col(pos=1),
+            }
+            ftab = ffile.create_table(group, cname, desc)
+            flamb = np.linspace(3000.0, 6000.0, 50) * (1.0 + k)
+            ftab.append(list(zip(flamb, np.exp(-0.5 * np.linspace(-3, 3, 50) ** 2))))
+
+    rng = np.random.default_rng(3)
+    n_models = 23
+    gtable = Table(
+        {
+            "logA": rng.uniform(6.0, 10.0, n_models),
+            "distance": np.full(n_models, 1e6),
+        }
+    )
+    for ckey in ["weight", "prior_weight", "grid_weight"]:
+        gtable[ckey] = rng.random(n_models)
+    specgrid = SpectralGrid(
+        lamb, seds=rng.uniform(1.0, 2.0, (n_models, len(lamb))), grid=gtable
+    )
+    pspec_fname = f"{project}/{project}_spec_w_priors.grid.hd5"
+    specgrid.write(pspec_fname)
+
+    kwargs = {
+        "extLaw": extinction.Gordon16_RvFALaw(),
+        "av": [0.0, 2.0, 1.0],
+        "rv": [2.5, 4.5, 1.0],
+        "fA": [0.0, 1.0, 0.5],
+        "filterLib": filterLib,
+    }
+    nsubs = 4
+
+    # subgrids from the split spectral grid files
+    ref_seds = []
+    for i, sub_name in enumerate(subgridding_tools.split_grid(pspec_fname, nsubs)):
+        sub_fname, sub_g = make_extinguished_sed_grid(
+            project,
+            SpectralGrid(sub_name),
+            filters,
+            seds_fname=f"{project}/ref_sub{i}.hd5",
+            **kwargs,
+        )
+        ref_seds.append(sub_g)
+
+    sub_fnames = make_shared_subgrids(
+        project, specgrid, filters, nsubs, nprocs=2, **kwargs
+    )
+    assert sub_fnames == [subgrid_fname(project, i) for i in range(nsubs)]
+    for sub_fname, ref_g in zip(sub_fnames, ref_seds):
+        sub_g = SEDGrid(sub_fname, backend="memory")
+        assert np.all(np.isfinite(sub_g.seds))
+        np.testing.assert_array_equal(sub_g.seds, ref_g.seds)
+        assert sub_g.grid.colnames == ref_g.grid.colnames
+        for cname in ref_g.grid.colnames:
+            np.testing.assert_array_equal(sub_g.grid[cname], ref_g.grid[cname])
+
+
+def _worker_cache_hits(lamb, filterLib):
+    """ Extinction curve and photometric operator found in the worker caches """
+    extinction.curve_cache(extinction.Gordon16_RvFALaw(), lamb, Rv=3.1, f_A=0.5)
+    nops = len(phot._photometric_operators)
+    phot.get_photometric_operator(["F1", "F2"], lamb, filterLib=filterLib)
+    return extinction.curve_cache.hits, len(phot._photometric_operators) == nops
+
+
+def test_shared_caches_spawn(tmp_path, monkeypatch):
+    """
+    The extinction curves and photometric operators computed by the parent
+    are found by workers started with spawn, which use another hash seed
+    """
+    filterLib = str(tmp_path / "filters.hd5")
+    make_filter_library(filterLib, ["F1", "F2"])
+    lamb = np.linspace(1000.0, 30000.0, 300)
+
+    extinction.curve_cache.clear()
+    extinction.curve_cache(extinction.Gordon16_RvFALaw(), lamb, Rv=3.1, f_A=0.5)
+    photop = phot.get_photometric_operator(["F1", "F2"], lamb, filterLib=filterLib)
+    photops = {
+        key: op for key, op in phot._photometric_operators.items() if op is photop
+    }
+
+    hashseed = os.environ.get("PYTHONHASHSEED", "0")
+    hashseed = str(int(hashseed) + 1) if hashseed.isdigit() else "1"
+    monkeypatch.setenv("PYTHONHASHSEED", hashseed)
+
+    shm = shared_memory.SharedMemory(create=True, size=8)
+    try:
+        initargs = (
+            shm.name,
+            (1,),
+            np.float64,
+            lamb,
+            Table({"logA": [6.0]}),
+            extinction.curve_cache,
+            photops,
+        )
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(1, initializer=_init_shared_specgrid, initargs=initargs) as p:
+            hits, op_found = p.apply(_worker_cache_hits, (lamb, filterLib))
+    finally:
+        shm.close()
+        shm.unlink()
+    assert hits == 1
+    assert op_found